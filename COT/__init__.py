@@ -18,8 +18,12 @@ Utility modules
 .. autosummary::
   :toctree:
 
+  COT.checksum_cache
+  COT.compression
   COT.data_validation
   COT.file_reference
+  COT.file_transfer
+  COT.stream_io
   COT.utilities
   COT.xml_file
 
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+#
+# checksum_cache.py - Persistent cache of file checksums
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Persistent cache of file checksums, shared between COT invocations.
+
+Checksumming a multi-gigabyte disk image is expensive, and users often run
+COT against its own output over and over. When enabled, the
+:class:`ChecksumCache` stores the checksums of each file that COT writes in
+an SQLite database (by default under ``$XDG_CACHE_HOME/cot/``), keyed by
+the file's path and its device, inode, size, and modification time, so that
+any change to the file invalidates its entry. SQLite's own locking makes it
+safe for several COT processes to use the cache at once.
+
+Only files written by COT itself are ever entered in the cache, and it is
+never used to verify a file against the checksum in a manifest; such
+verification always reads the file itself.
+
+The cache is a pure optimization: if it cannot be read or written for any
+reason, COT simply computes checksums as usual.
+
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  ChecksumCache
+
+**Functions**
+
+.. autosummary::
+  :nosignatures:
+
+  file_key
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def file_key(path, member=""):
+    """Get the cache key identifying the current contents of a file.
+
+    Args:
+      path (str): Path to a file.
+      member (str): Name of a member within the file (such as a file within
+        a TAR archive), if applicable.
+
+    Returns:
+      tuple: (realpath, member, device, inode, size, mtime in nanoseconds),
+      or ``None`` if the file cannot be examined.
+    """
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    mtime_ns = getattr(stat_result, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat_result.st_mtime * 1e9)
+    return (os.path.realpath(path), member, stat_result.st_dev,
+            stat_result.st_ino, stat_result.st_size, mtime_ns)
+
+
+class ChecksumCache(object):
+    """Persistent cache of file checksums stored in an SQLite database.
+
+    Use :meth:`get` to obtain the process-wide cache, honoring the class
+    attributes :attr:`enabled` and :attr:`directory`, which may be set (for
+    example from the CLI) to enable or relocate the cache.
+    """
+
+    enabled = False
+    """Whether :meth:`get` returns a cache at all."""
+
+    directory = None
+    """Directory to store the cache in; ``None`` for the default."""
+
+    FILENAME = "checksums.sqlite3"
+
+    _initialized = set()
+    _lock = threading.Lock()
+
+    @classmethod
+    def default_directory(cls):
+        """Get the default cache directory, ``$XDG_CACHE_HOME/cot``.
+
+        Returns:
+          str: Directory path.
+        """
+        base = (os.environ.get('XDG_CACHE_HOME') or
+                os.path.join(os.path.expanduser('~'), '.cache'))
+        return os.path.join(base, 'cot')
+
+    @classmethod
+    def default_path(cls):
+        """Get the path of the process-wide cache database.
+
+        Returns:
+          str: Database path, under :attr:`directory` if set, else under
+          :meth:`default_directory`.
+        """
+        return os.path.join(cls.directory or cls.default_directory(),
+                            cls.FILENAME)
+
+    @classmethod
+    def get(cls):
+        """Get the process-wide checksum cache, if enabled.
+
+        Returns:
+          ChecksumCache: Cache instance, or ``None`` if disabled.
+        """
+        if not cls.enabled:
+            return None
+        return cls(cls.default_path())
+
+    def __init__(self, path):
+        """Create a cache backed by the given database file.
+
+        Args:
+          path (str): Path to the SQLite database; created if needed.
+        """
+        self.path = path
+
+    def _connect(self):
+        """Open a connection to the database, creating it if needed.
+
+        Each operation uses its own short-lived connection, so this class
+        can be used freely from multiple threads.
+
+        Returns:
+          sqlite3.Connection: Database connection.
+        """
+        with self._lock:
+            if self.path not in self._initialized:
+                directory = os.path.dirname(self.path)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                conn = sqlite3.connect(self.path, timeout=30)
+                try:
+                    # WAL lets readers proceed while another process writes
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    with conn:
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS checksums ("
+                            " path TEXT NOT NULL,"
+                            " member TEXT NOT NULL,"
+                            " device INTEGER NOT NULL,"
+                            " inode INTEGER NOT NULL,"
+                            " size INTEGER NOT NULL,"
+                            " mtime_ns INTEGER NOT NULL,"
+                            " algorithm TEXT NOT NULL,"
+                            " checksum TEXT NOT NULL,"
+                            " PRIMARY KEY (path, member, algorithm))")
+                finally:
+                    conn.close()
+                self._initialized.add(self.path)
+        return sqlite3.connect(self.path, timeout=30)
+
+    def lookup(self, key, algorithm):
+        """Look up the checksum of a file.
+
+        Args:
+          key (tuple): Key from :func:`file_key`.
+          algorithm (str): Checksum algorithm, such as 'sha1'.
+
+        Returns:
+          str: Cached checksum, or ``None`` if not found.
+        """
+        if key is None:
+            return None
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT checksum FROM checksums WHERE path = ? AND"
+                    " member = ? AND device = ? AND inode = ? AND size = ?"
+                    " AND mtime_ns = ? AND algorithm = ?",
+                    key + (algorithm,)).fetchone()
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError) as exc:
+            logger.debug("Unable to read checksum cache %s: %s",
+                         self.path, exc)
+            return None
+        if row is None:
+            return None
+        logger.debug("Found %s checksum of %s in cache", algorithm,
+                     os.path.join(key[0], key[1]))
+        return row[0]
+
+    def store(self, key, algorithm, checksum):
+        """Record the checksum of a file.
+
+        Any older entry for the same file and algorithm is replaced.
+        Nothing is stored if the file has changed since ``key`` was obtained,
+        as the checksum may not match either version of the file.
+
+        Args:
+          key (tuple): Key from :func:`file_key`, obtained *before*
+            computing the checksum.
+          algorithm (str): Checksum algorithm, such as 'sha1'.
+          checksum (str): Checksum of the file.
+        """
+        if key is None or file_key(key[0], key[1]) != key:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO checksums VALUES"
+                        " (?, ?, ?, ?, ?, ?, ?, ?)",
+                        key + (algorithm, checksum))
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError) as exc:
+            logger.debug("Unable to update checksum cache %s: %s",
+                         self.path, exc)
+
+    def purge(self):
+        """Delete all entries from the cache."""
+        if not os.path.exists(self.path):
+            return
+        logger.info("Purging checksum cache %s", self.path)
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM checksums")
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError) as exc:
+            logger.warning("Unable to purge checksum cache %s: %s",
+                           self.path, exc)
@@ -236,7 +236,9 @@ otherwise, will create a new disk entry.""")
                            help="""Show this help message and exit""")
         group.add_argument('-o', '--output',
                            help="""Name/path of new OVF/OVA package to """
-                           """create instead of updating the existing OVF""")
+                           """create instead of updating the existing OVF"""
+                           """ (or "-" to write an OVA to stdout)""")
+        self._add_output_options(group)
 
         group = parser.add_argument_group("disk-related options")
 
@@ -276,7 +278,8 @@ otherwise, will create a new disk entry.""")
         parser.add_argument('DISK_IMAGE',
                             help="""Disk image file to add to the package""")
         parser.add_argument('PACKAGE',
-                            help="""OVF descriptor or OVA file to edit""")
+                            help="""OVF descriptor or OVA file to edit"""
+                            """ (or "-" to read an OVA from stdin)""")
         parser.set_defaults(instance=self)
 
 
@@ -125,13 +125,16 @@ create a new file entry.""")
 
         parser.add_argument('-o', '--output',
                             help="""Name/path of new VM package to create """
-                            """instead of updating the existing package""")
+                            """instead of updating the existing package"""
+                            """ (or "-" to write an OVA to stdout)""")
+        self._add_output_options(parser)
         parser.add_argument('-f', '--file-id',
                             help="""File ID string within the package """
                             """(default: same as filename)""")
         parser.add_argument('FILE', help="""File to add to the package""")
         parser.add_argument('PACKAGE',
-                            help="Package, OVF descriptor or OVA file to edit")
+                            help="""Package, OVF descriptor or OVA file to """
+                            """edit (or "-" to read an OVA from stdin)""")
         parser.set_defaults(instance=self)
 
 
@@ -29,7 +29,7 @@
 import os.path
 import logging
 
-from COT.data_validation import InvalidInputError
+from COT.data_validation import InvalidInputError, positive_int
 from COT.vm_description import VMDescription
 from COT.utilities import available_bytes_at_path, pretty_bytes
 
@@ -70,8 +70,10 @@ class Command(object):
         Returns:
           tuple: ``(True, ready_message)`` or ``(False, reason_why_not)``
         """
-        if self.vm and not self.check_disk_space(
-                self.working_dir_disk_space_required(),
+        # Only check (and hence create) the working directory if needed
+        required = self.working_dir_disk_space_required()
+        if self.vm and required and not self.check_disk_space(
+                required,
                 self.vm.working_dir,
                 label="Temporary storage",
                 context="You can choose a different location by setting"
@@ -261,7 +263,10 @@ class ReadWriteCommand(ReadCommand):
 
     Attributes:
     :attr:`package`,
-    :attr:`output`
+    :attr:`output`,
+    :attr:`compress`,
+    :attr:`chunk_size`,
+    :attr:`chunk`
     """
 
     def __init__(self, ui):
@@ -273,6 +278,9 @@ class ReadWriteCommand(ReadCommand):
         super(ReadWriteCommand, self).__init__(ui)
         # Default to an unspecified output rather than no output
         self._output = ""
+        self._compress = None
+        self._chunk_size = None
+        self._chunk = None
 
     # Overriding a parent class's property is a bit ugly in Python.
     # Also, Pylint bug: https://github.com/PyCQA/pylint/issues/844
@@ -284,13 +292,17 @@ class ReadWriteCommand(ReadCommand):
         Calls :meth:`COT.vm_description.VMDescription.factory` to instantiate
         :attr:`self.vm` from the provided file.
 
+        The special value ``-`` reads an OVA from stdin; unless ``output``
+        is set, the result is then streamed to stdout.
+
         Raises:
           InvalidInputError: if the file does not exist.
           SystemExit: if available disk space versus predicted amount required
             for output is insufficient, and the user declines to continue
             in response to this information.
         """
-        if value is not None and not os.path.exists(value):
+        if (value is not None and value != "-" and
+                not os.path.exists(value)):
             raise InvalidInputError("Specified package {0} does not exist!"
                                     .format(value))
         if self.vm is not None:
@@ -299,6 +311,7 @@ class ReadWriteCommand(ReadCommand):
         if value is not None:
             # Unlike ReadCommand, we pass self.output to the VM factory
             self.vm = VMDescription.factory(value, self.output)
+            self._configure_vm()
         self._package = value
 
     @property
@@ -308,18 +321,20 @@ class ReadWriteCommand(ReadCommand):
         If the specified file already exists,  will prompt the user
         (:meth:`~COT.ui.UI.confirm_or_die`) to
         confirm overwriting the existing file.
+
+        The special value ``-`` streams the output to stdout as an OVA.
         """
         return self._output
 
     @output.setter
     def output(self, value):
-        if value:
+        if value and value != "-":
             value = os.path.abspath(value)
 
         if value == self._output:
             return
 
-        if value:
+        if value and value != "-":
             if os.path.exists(value):
                 if not os.path.isfile(value):
                     raise InvalidInputError(
@@ -343,6 +358,97 @@ class ReadWriteCommand(ReadCommand):
         if self.vm is not None:
             self.vm.output_file = value
 
+    @property
+    def compress(self):
+        """Names (or :mod:`fnmatch` patterns) of files to compress on output.
+
+        If ``None`` (the default), the VM's own default applies
+        (:attr:`COT.vm_description.ovf.OVF.compress_patterns`).
+        """
+        return self._compress
+
+    @compress.setter
+    def compress(self, value):
+        self._compress = value
+        self._configure_vm()
+
+    @property
+    def chunk_size(self):
+        """Split files larger than this many MiB into chunks on output.
+
+        If ``None`` (the default), the VM's own default applies
+        (:attr:`COT.vm_description.ovf.OVF.chunk_size`).
+        """
+        return self._chunk_size
+
+    @chunk_size.setter
+    def chunk_size(self, value):
+        self._chunk_size = value
+        self._configure_vm()
+
+    @property
+    def chunk(self):
+        """Names (or :mod:`fnmatch` patterns) of files to split into chunks.
+
+        Only these files are split according to :attr:`chunk_size`. If
+        ``None`` (the default), the VM's own default applies
+        (:attr:`COT.vm_description.ovf.OVF.chunk_patterns`).
+        """
+        return self._chunk
+
+    @chunk.setter
+    def chunk(self, value):
+        self._chunk = value
+        self._configure_vm()
+
+    def _configure_vm(self):
+        """Pass the options for writing the package on to :attr:`vm`."""
+        if self.vm is None:
+            return
+        if self.compress is not None:
+            self.vm.compress_patterns = tuple(self.compress)
+        if self.chunk_size is not None:
+            self.vm.chunk_size = self.chunk_size * 1024 * 1024
+        if self.chunk is not None:
+            self.vm.chunk_patterns = tuple(self.chunk)
+
+    @staticmethod
+    def _add_output_options(group):
+        """Add the CLI options controlling how the package is written.
+
+        Args:
+          group (argparse._ActionsContainer): Parser or argument group to
+              add the options to, alongside ``--output``.
+        """
+        group.add_argument('--compress', metavar='PATTERN', action='append',
+                           help="""Gzip-compress files in the output whose """
+                           """names match PATTERN, such as '*.img' """
+                           """(repeatable)""")
+        group.add_argument('--chunk-size', metavar='MIB', type=positive_int,
+                           help="""Split files in the output larger than """
+                           """MIB megabytes into chunks of that size""")
+        group.add_argument('--chunk', metavar='PATTERN', action='append',
+                           help="""Only split files whose names match """
+                           """PATTERN into chunks (repeatable; default: """
+                           """all files)""")
+
+    def _output_space_required(self, output_loc):
+        """Estimate the disk space needed to write to the given location.
+
+        Args:
+          output_loc (str): Output file path.
+
+        Returns:
+          int: Required free space, in bytes.
+        """
+        if output_loc == "-":
+            # Streamed, rather than written to disk
+            return 0
+        in_place_size = self.vm.in_place_update_size(output_loc)
+        if in_place_size is not None:
+            return in_place_size
+        return 2 * self.vm.predicted_output_size()
+
     def ready_to_run(self):
         """Check whether the module is ready to :meth:`run`.
 
@@ -354,9 +460,10 @@ class ReadWriteCommand(ReadCommand):
             output_loc = self.output
             if not output_loc:
                 output_loc = self.package
-            if not self.check_disk_space(2 * self.vm.predicted_output_size(),
-                                         output_loc,
-                                         label="VM output"):
+            if not self.check_disk_space(
+                    self._output_space_required(output_loc),
+                    output_loc,
+                    label="VM output"):
                 return (False,
                         "Insufficient disk space available to guarantee"
                         " successful output to {0}. You may wish to specify"
@@ -384,7 +491,7 @@ class ReadWriteCommand(ReadCommand):
         # do any command-specific work here, then:
         if self.vm is not None:
             # One more sanity check
-            self.check_disk_space(2 * self.vm.predicted_output_size(),
+            self.check_disk_space(self._output_space_required(self.output),
                                   self.output, label="VM output", die=True)
             self.vm.write()
         super(ReadWriteCommand, self).finished()
@@ -644,7 +644,9 @@ class COTEditHardware(ReadWriteCommand):
                            help="Show this help message and exit")
         group.add_argument('-o', '--output',
                            help="Name/path of new OVF/OVA package to create "
-                           "instead of updating the existing OVF")
+                           "instead of updating the existing OVF"
+                           ' (or "-" to write an OVA to stdout)')
+        self._add_output_options(group)
         group.add_argument('-v', '--virtual-system-type',
                            action='append', nargs='+',
                            type=no_whitespace, metavar=('TYPE', 'TYPE2'),
@@ -725,7 +727,8 @@ class COTEditHardware(ReadWriteCommand):
             " subtype will be removed.")
 
         parser.add_argument('PACKAGE',
-                            help="OVF descriptor or OVA file to edit")
+                            help="""OVF descriptor or OVA file to edit"""
+                            """ (or "-" to read an OVA from stdin)""")
         parser.set_defaults(instance=self)
 
 
@@ -159,7 +159,9 @@ Edit product information attributes of the given OVF or OVA""")
 
         parser.add_argument('-o', '--output',
                             help="Name/path of new OVF/OVA package to create "
-                            "instead of updating the existing OVF")
+                            "instead of updating the existing OVF"
+                            ' (or "-" to write an OVA to stdout)')
+        self._add_output_options(parser)
         parser.add_argument('-c', '--product-class',
                             help='Product class, such as "com.cisco.csr1000v"')
         parser.add_argument('-p', '--product',
@@ -182,7 +184,8 @@ Edit product information attributes of the given OVF or OVA""")
             '-l', '--application-url',
             help='Application URL, such as "https://router1:530/"')
         parser.add_argument('PACKAGE',
-                            help="OVF descriptor or OVA file to edit")
+                            help="""OVF descriptor or OVA file to edit"""
+                            """ (or "-" to read an OVA from stdin)""")
         parser.set_defaults(instance=self)
 
 
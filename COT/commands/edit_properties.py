@@ -336,7 +336,8 @@ the program will run interactively.""",
         )
 
         parser.add_argument('PACKAGE',
-                            help="""OVF descriptor or OVA file to edit""")
+                            help="""OVF descriptor or OVA file to edit"""
+                            """ (or "-" to read an OVA from stdin)""")
 
         group = parser.add_argument_group("general options")
 
@@ -344,7 +345,9 @@ the program will run interactively.""",
                            help="""Show this help message and exit""")
         group.add_argument('-o', '--output',
                            help="Name/path of new OVF/OVA package to create "
-                           "instead of updating the existing OVF")
+                           "instead of updating the existing OVF"
+                           ' (or "-" to write an OVA to stdout)')
+        self._add_output_options(group)
 
         group = parser.add_argument_group("property setting options")
 
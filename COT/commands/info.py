@@ -36,7 +36,8 @@ class COTInfo(Command):
 
     Attributes:
     :attr:`package_list`,
-    :attr:`verbosity`
+    :attr:`verbosity`,
+    :attr:`verify`
     """
 
     def __init__(self, ui):
@@ -48,16 +49,23 @@ class COTInfo(Command):
         super(COTInfo, self).__init__(ui)
         self._package_list = None
         self._verbosity = None
+        self.verify = False
+        """Whether to verify file checksums against the package manifest.
+
+        Off by default, as this requires reading every file in full."""
 
     @property
     def package_list(self):
-        """List of VM definitions to get information for."""
+        """List of VM definitions to get information for.
+
+        The special value ``-`` reads an OVA from stdin.
+        """
         return self._package_list
 
     @package_list.setter
     def package_list(self, value):
         for package in value:
-            if not os.path.exists(package):
+            if package != "-" and not os.path.exists(package):
                 raise InvalidInputError("Specified package {0} does not exist!"
                                         .format(package))
         self._package_list = value
@@ -99,7 +107,10 @@ class COTInfo(Command):
             if not first:
                 print("")
             try:
-                with VMDescription.factory(package, None) as vm:
+                with VMDescription.factory(
+                        package, None,
+                        verify=(VMDescription.VERIFY_ON_LOAD if self.verify
+                                else VMDescription.VERIFY_NEVER)) as vm:
                     print(vm.info_string(self.ui.terminal_width - 1,
                                          self.verbosity))
             except VMInitError as exc:
@@ -115,7 +126,7 @@ class COTInfo(Command):
             help="""Generate a description of an OVF package""",
             usage="""
   cot info --help
-  cot info [-b | -v] PACKAGE [PACKAGE ...]""",
+  cot info [-b | -v] [--verify] PACKAGE [PACKAGE ...]""",
             description="""
 Show a summary of the contents of the given OVF(s) and/or OVA(s).""")
 
@@ -130,9 +141,15 @@ Show a summary of the contents of the given OVF(s) and/or OVA(s).""")
                            dest='verbosity',
                            help="""Verbose output (longer)""")
 
+        parser.add_argument('--verify', action='store_true',
+                            help="""Verify the checksums of all files """
+                            """in the package against its manifest """
+                            """(slower, as every file must be read)""")
+
         parser.add_argument(
             'PACKAGE_LIST', nargs='+', metavar='PACKAGE [PACKAGE ...]',
-            help="OVF descriptor(s) and/or OVA file(s) to describe")
+            help="""OVF descriptor(s) and/or OVA file(s) to describe"""
+            """ (or "-" to read an OVA from stdin)""")
         parser.set_defaults(instance=self)
 
 
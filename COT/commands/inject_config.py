@@ -279,7 +279,9 @@ be included as-is and will not be renamed.""")
 
         parser.add_argument('-o', '--output',
                             help="Name/path of new VM package to create "
-                            "instead of updating the existing package")
+                            "instead of updating the existing package"
+                            ' (or "-" to write an OVA to stdout)')
+        self._add_output_options(parser)
 
         parser.add_argument(
             '-c', '--config-file',
@@ -292,7 +294,8 @@ be included as-is and will not be renamed.""")
                             metavar=('EXTRA_FILE', 'EXTRA_FILE2'),
                             help="Additional file(s) to include as-is")
         parser.add_argument('PACKAGE',
-                            help="Package, OVF descriptor or OVA file to edit")
+                            help="""Package, OVF descriptor or OVA file to """
+                            """edit (or "-" to read an OVA from stdin)""")
         parser.set_defaults(instance=self)
 
 
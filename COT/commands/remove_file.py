@@ -135,7 +135,9 @@ Remove a file from the given OVF. Will prompt for confirmation unless
                            help="""Show this help message and exit""")
         group.add_argument('-o', '--output',
                            help="""Name/path of new OVF/OVA package to """
-                           """create instead of updating the existing OVF""")
+                           """create instead of updating the existing OVF"""
+                           """ (or "-" to write an OVA to stdout)""")
+        self._add_output_options(group)
 
         group = parser.add_argument_group("file selection options")
 
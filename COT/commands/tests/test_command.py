@@ -17,12 +17,14 @@
 """Test cases for COT.commands.Command class and generic subclasses."""
 
 import os.path
+import tarfile
 import mock
 
 from COT.commands.tests.command_testcase import CommandTestCase
 from COT.commands import Command, ReadCommand, ReadWriteCommand
 from COT.data_validation import InvalidInputError
 from COT.vm_description import VMInitError
+from COT.vm_description.ovf import OVF
 
 # pylint: disable=missing-param-doc,missing-type-doc,protected-access
 
@@ -227,6 +229,54 @@ class TestReadWriteCommand(TestReadCommand):
         self.command.run()
         self.assertEqual(self.command.output, self.input_ovf)
 
+    def test_set_compress(self):
+        """The compress option is passed to the VM whenever it is loaded."""
+        self.command.compress = ['*.img']
+        self.command.package = self.input_ovf
+        self.assertEqual(self.command.vm.compress_patterns, ('*.img',))
+        self.command.compress = ['*.vmdk', '*.iso']
+        self.assertEqual(self.command.vm.compress_patterns,
+                         ('*.vmdk', '*.iso'))
+        # Only this VM is affected
+        self.assertEqual(OVF.compress_patterns, ())
+
+    def test_set_chunk(self):
+        """The chunking options are passed to the VM, in bytes."""
+        self.command.package = self.input_ovf
+        self.command.chunk_size = 4
+        self.command.chunk = ['*.vmdk']
+        self.assertEqual(self.command.vm.chunk_size, 4 * 1024 * 1024)
+        self.assertEqual(self.command.vm.chunk_patterns, ('*.vmdk',))
+        self.assertIsNone(OVF.chunk_size)
+
+    def test_set_output_stdout(self):
+        """Output '-' streams an OVA to stdout and needs no disk space."""
+        self.command.output = "-"
+        self.command.package = self.input_ovf
+        self.assertEqual(self.command.output, "-")
+        self.assertEqual(self.command.vm.output_file, "-")
+        self.assertEqual(self.command.vm.output_extension, ".ova")
+        self.assertEqual(self.command._output_space_required("-"), 0)
+        ready, _ = self.command.ready_to_run()
+        self.assertTrue(ready)
+
+    def test_set_package_stdin(self):
+        """Package '-' reads an OVA from stdin and defaults to stdout."""
+        ova_file = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_file, 'w') as tarf:
+            for path in [self.input_ovf, self.input_manifest,
+                         self.input_vmdk, self.input_iso, self.sample_cfg]:
+                tarf.add(path, os.path.basename(path))
+        self.command.output = ""
+        with open(ova_file, 'rb') as fileobj:
+            with mock.patch('sys.stdin') as stdin:
+                stdin.buffer = fileobj
+                self.command.package = "-"
+        self.assertEqual(self.command.vm.input_file, "-")
+        self.command.run()
+        self.assertEqual(self.command.output, "-")
+        self.assertEqual(self.command.vm.output_extension, ".ova")
+
     def test_finished_no_vm(self):
         """Verify that finished() can be successful if no VM was set."""
         self.command.finished()
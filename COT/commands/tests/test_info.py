@@ -16,6 +16,8 @@
 
 """Unit test cases for the COT.info.COTInfo class."""
 
+import mock
+
 from COT.commands.tests.command_testcase import CommandTestCase
 from COT.commands.info import COTInfo
 from COT.data_validation import InvalidInputError
@@ -47,6 +49,20 @@ class TestCOTInfo(CommandTestCase):
         with self.assertRaises(InvalidInputError):
             self.command.verbosity = 0
 
+    def test_verify(self):
+        """Checksums are only verified if requested."""
+        self.command.package_list = [self.input_ovf]
+        self.command.verbosity = 'brief'
+        with mock.patch("COT.file_reference.FileReference.verify_checksum",
+                        return_value=True) as mock_verify, \
+                mock.patch('sys.stdout'):
+            self.command.run()
+            mock_verify.assert_not_called()
+
+            self.command.verify = True
+            self.command.run()
+            self.assertEqual(mock_verify.call_count, 4)
+
     def test_minimal_ovf(self):
         """Get info for minimal OVF with no real content."""
         # For an OVF this simple, standard/brief/verbose output are the same
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+#
+# compression.py - Gzip compression of file data
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Gzip compression of file data, for compressed files in an OVF package.
+
+An OVF may mark any of its files as gzip-compressed
+(``ovf:compression="gzip"``). Decompressing such a file is inherently
+sequential and is handled by the standard :mod:`gzip` module, but
+compressing a multi-gigabyte disk image in a single thread is painfully
+slow. :func:`gzip_compress` therefore splits the data into blocks and
+deflates them in several threads at once (:mod:`zlib` releases the GIL
+while compressing), in the manner of ``pigz``. Every block ends on a byte
+boundary with an empty stored block (a "sync flush"), so the compressed
+blocks simply concatenate into a single deflate stream that any gzip
+implementation can read. Each block is primed with the last 32 KiB of the
+data preceding it, so very little compression is lost by splitting it.
+
+**Functions**
+
+.. autosummary::
+  :nosignatures:
+
+  gzip_compress
+
+**Constants**
+
+.. autosummary::
+  BLOCK_SIZE
+"""
+
+import logging
+import multiprocessing
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+try:
+    import queue
+except ImportError:  # Python 2.x
+    import Queue as queue
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 1024 * 1024
+"""Amount of data deflated by each thread at a time."""
+
+_WINDOW = 32 * 1024
+"""Size of the deflate history window, used to prime each block."""
+
+
+def _deflate(data, level, dictionary=None):
+    """Deflate one block of data, ending with a sync flush.
+
+    Args:
+      data (bytes): Data to compress.
+      level (int): Compression level, 1-9.
+      dictionary (bytes): Data immediately preceding ``data``, if any.
+
+    Returns:
+      bytes: Raw deflate data (with no gzip header or trailer).
+    """
+    args = (level, zlib.DEFLATED, -zlib.MAX_WBITS, 8,
+            zlib.Z_DEFAULT_STRATEGY)
+    try:
+        if dictionary:
+            compressor = zlib.compressobj(*args, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(*args)
+    except TypeError:  # Python 2.x doesn't support zdict
+        compressor = zlib.compressobj(*args)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _gzip_header(level):
+    """Construct a gzip header with no file name.
+
+    Args:
+      level (int): Compression level, 1-9.
+
+    Returns:
+      bytes: Header data.
+    """
+    xfl = 2 if level == 9 else (4 if level == 1 else 0)
+    return struct.pack("<BBBBIBB", 0x1f, 0x8b, 8, 0, int(time.time()),
+                       xfl, 255)
+
+
+class _Job(object):
+    """One block of data to be compressed by a worker thread."""
+
+    def __init__(self, data, dictionary):
+        """Create a job for the given data.
+
+        Args:
+          data (bytes): Data to compress.
+          dictionary (bytes): Data immediately preceding ``data``, if any.
+        """
+        self.data = data
+        self.dictionary = dictionary
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def _worker(jobs, level):
+    """Worker thread body - compress blocks until told to stop.
+
+    Args:
+      jobs (queue.Queue): Jobs to process; ``None`` means stop.
+      level (int): Compression level, 1-9.
+    """
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        try:
+            job.result = _deflate(job.data, level, job.dictionary)
+        except Exception as exc:  # pylint: disable=broad-except
+            job.error = exc
+        finally:
+            job.done.set()
+
+
+def gzip_compress(src, write, level=6, workers=None, block_size=BLOCK_SIZE):
+    """Compress data from a file object into gzip format.
+
+    Args:
+      src (file): File object to read data from, until EOF.
+      write (function): Function to call with each chunk of compressed
+        data, such as the ``write`` method of a file object.
+      level (int): Compression level, 1 (fastest) to 9 (smallest).
+      workers (int): Number of threads to compress with. Defaults to the
+        number of CPUs.
+      block_size (int): Amount of data each thread compresses at a time.
+
+    Returns:
+      tuple: (uncompressed size, compressed size), in bytes.
+    """
+    if workers is None:
+        try:
+            workers = multiprocessing.cpu_count()
+        except NotImplementedError:
+            workers = 1
+    workers = max(1, workers)
+
+    header = _gzip_header(level)
+    write(header)
+    in_size = 0
+    out_size = len(header)
+    crc = 0
+
+    jobs = queue.Queue()
+    threads = [threading.Thread(target=_worker, args=(jobs, level))
+               for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    # Limit the amount of data in memory at once, but keep all threads busy
+    pending = deque()
+    try:
+        dictionary = None
+        while True:
+            data = src.read(block_size)
+            if data:
+                crc = zlib.crc32(data, crc)
+                in_size += len(data)
+                job = _Job(data, dictionary)
+                jobs.put(job)
+                pending.append(job)
+                dictionary = data[-_WINDOW:]
+            while pending and (not data or len(pending) > 2 * workers):
+                job = pending.popleft()
+                job.done.wait()
+                if job.error is not None:
+                    raise job.error
+                write(job.result)
+                out_size += len(job.result)
+            if not data:
+                break
+    finally:
+        for _ in threads:
+            jobs.put(None)
+    logger.debug("Compressed %d bytes to %d with %d threads",
+                 in_size, out_size, workers)
+
+    # An empty final block, followed by the gzip trailer
+    final = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS).flush()
+    trailer = final + struct.pack("<II", crc & 0xffffffff,
+                                  in_size & 0xffffffff)
+    write(trailer)
+    return (in_size, out_size + len(trailer))
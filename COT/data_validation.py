@@ -27,6 +27,13 @@
   ValueTooLowError
   ValueTooHighError
 
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  MultiHash
+
 **Functions**
 
 .. autosummary::
@@ -38,8 +45,10 @@
   canonicalize_nic_subtype
   canonicalize_scsi_subtype
   check_for_conflict
+  checksum_hash
   device_address
   file_checksum
+  file_checksums
   mac_address
   match_or_die
   natural_sort
@@ -56,10 +65,14 @@
 """
 
 import hashlib
+import io
+import os
 import re
+import stat
 from collections import namedtuple
 from distutils.util import strtobool
 
+from COT.stream_io import SequentialReader, read_ahead
 from COT.utilities import to_string
 
 
@@ -318,49 +331,196 @@ def check_for_conflict(label, refs):
     return obj
 
 
-def file_checksum(path_or_obj, checksum_type):
-    """Get the checksum of the given file.
+def checksum_hash(checksum_type):
+    """Get a new hash object for the given checksum type.
 
     Args:
-      path_or_obj (str): File path to checksum OR an opened file object
       checksum_type (str): Supported values are 'md5', 'sha1', 'sha256'.
     Returns:
-      str: Hexadecimal file checksum
+      object: Hash object from :mod:`hashlib`.
+    Raises:
+      NotImplementedError: if ``checksum_type`` is not supported.
     """
     # pylint: disable=redefined-variable-type
     if checksum_type == 'md5':
-        hash_obj = hashlib.md5()
+        return hashlib.md5()
     elif checksum_type == 'sha1':
-        hash_obj = hashlib.sha1()
+        return hashlib.sha1()
     elif checksum_type == 'sha256':
-        hash_obj = hashlib.sha256()
-    else:
-        raise NotImplementedError(
-            "No support for generating checksum type {0}"
-            .format(checksum_type))
+        return hashlib.sha256()
+    raise NotImplementedError(
+        "No support for generating checksum type {0}"
+        .format(checksum_type))
 
-    # Is it a file or do we need to open it?
-    try:
-        path_or_obj.read(0)
-        file_obj = path_or_obj
-    except AttributeError:
-        file_obj = open(path_or_obj, 'rb')
 
-    blocksize = 65536
+def _hash_file_obj(file_obj, hash_obj, blocksize=None):
+    """Feed the remaining contents of an open file into a hash object.
 
-    try:
+    Args:
+      file_obj (file): File object to read from.
+      hash_obj (object): Hash object (from :mod:`hashlib`) to update.
+      blocksize (int): Number of bytes to read at a time. Defaults to
+        :attr:`SequentialReader.buffer_size
+        <COT.stream_io.SequentialReader.buffer_size>`.
+    """
+    if blocksize is None:
+        blocksize = SequentialReader.buffer_size
+    if hasattr(file_obj, 'readinto'):
+        # Read ahead into a ring of reusable buffers rather than allocating
+        # a new bytes object for every block.
+        buffers = [bytearray(blocksize)
+                   for _ in range(SequentialReader.pipeline_depth)]
+        for data in read_ahead(file_obj.readinto, buffers):
+            hash_obj.update(data)
+    else:
         while True:
             buf = file_obj.read(blocksize)
             if len(buf) == 0:
                 break
             hash_obj.update(buf)
-    finally:
-        if file_obj != path_or_obj:
-            file_obj.close()
 
+
+class MultiHash(object):
+    """Hash-like object computing several types of checksum at once.
+
+    Can be passed anywhere a single :mod:`hashlib` object is updated with
+    data, so that a single read of a file yields all desired checksums.
+
+    Examples:
+      ::
+
+        >>> hash_obj = MultiHash(['md5', 'sha1'])
+        >>> hash_obj.update(b"hello")
+        >>> digests = hash_obj.hexdigests()
+        >>> digests['md5']
+        '5d41402abc4b2a76b9719d911017c592'
+        >>> digests['sha1']
+        'aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d'
+    """
+
+    def __init__(self, checksum_types):
+        """Create a hash object for each of the given checksum types.
+
+        Args:
+          checksum_types (list): Checksum types such as 'md5', 'sha1'.
+        Raises:
+          NotImplementedError: if any checksum type is not supported.
+        """
+        self.hash_objs = dict((checksum_type, checksum_hash(checksum_type))
+                              for checksum_type in checksum_types)
+
+    def update(self, data):
+        """Feed the given data into each of the hash objects.
+
+        Args:
+          data (bytes): Data to hash.
+        """
+        for hash_obj in self.hash_objs.values():
+            hash_obj.update(data)
+
+    def hexdigests(self):
+        """Get the checksums of all data passed to :meth:`update` so far.
+
+        Returns:
+          dict: Checksum type --> hexadecimal checksum.
+        """
+        return dict((checksum_type, hash_obj.hexdigest())
+                    for checksum_type, hash_obj in self.hash_objs.items())
+
+
+def _hash_fd(fd, offset, hash_obj, path=None):
+    """Feed the contents of an open regular file into a hash object.
+
+    The data is read with a :class:`~COT.stream_io.SequentialReader`, so
+    that hashing a large file doesn't flood the page cache.
+
+    Args:
+      fd (int): File descriptor to read from.
+      offset (int): Position to start reading from, until end of file.
+      hash_obj (object): Hash object (from :mod:`hashlib`) to update.
+      path (str): Path of the file, if known.
+    """
+    with SequentialReader(fd, offset, path=path) as reader:
+        for data in reader:
+            hash_obj.update(data)
+
+
+def _regular_file_descriptor(file_obj):
+    """Get the descriptor of a binary file object that reads a regular file.
+
+    Args:
+      file_obj (file): File object.
+
+    Returns:
+      int: File descriptor, or ``None`` if the object is anything else,
+      such as a pipe or a wrapper that transforms the data.
+    """
+    if not isinstance(getattr(file_obj, 'raw', file_obj), io.FileIO):
+        return None
+    try:
+        fd = file_obj.fileno()
+    except (io.UnsupportedOperation, ValueError, OSError):
+        return None
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        return None
+    return fd
+
+
+def _hash_path_or_obj(path_or_obj, hash_obj):
+    """Feed the contents of the given file into a hash object.
+
+    Args:
+      path_or_obj (str): File path OR an opened file object
+      hash_obj (object): Hash object to update.
+    """
+    # Is it a file or do we need to open it?
+    try:
+        path_or_obj.read(0)
+    except AttributeError:
+        with open(path_or_obj, 'rb') as file_obj:
+            _hash_path_or_obj(file_obj, hash_obj)
+        return
+
+    fd = _regular_file_descriptor(path_or_obj)
+    if fd is None:
+        _hash_file_obj(path_or_obj, hash_obj)
+        return
+    path = getattr(path_or_obj, 'name', None)
+    if not isinstance(path, str):
+        path = None
+    _hash_fd(fd, path_or_obj.tell(), hash_obj, path=path)
+    # Leave the file object at the end of the data, as if it had been read
+    path_or_obj.seek(0, io.SEEK_END)
+
+
+def file_checksum(path_or_obj, checksum_type):
+    """Get the checksum of the given file.
+
+    Args:
+      path_or_obj (str): File path to checksum OR an opened file object
+      checksum_type (str): Supported values are 'md5', 'sha1', 'sha256'.
+    Returns:
+      str: Hexadecimal file checksum
+    """
+    hash_obj = checksum_hash(checksum_type)
+    _hash_path_or_obj(path_or_obj, hash_obj)
     return hash_obj.hexdigest()
 
 
+def file_checksums(path_or_obj, checksum_types):
+    """Get several types of checksum of the given file from a single read.
+
+    Args:
+      path_or_obj (str): File path to checksum OR an opened file object
+      checksum_types (list): Any of 'md5', 'sha1', 'sha256'.
+    Returns:
+      dict: Checksum type --> hexadecimal file checksum
+    """
+    hash_obj = MultiHash(checksum_types)
+    _hash_path_or_obj(path_or_obj, hash_obj)
+    return hash_obj.hexdigests()
+
+
 def mac_address(string):
     """Parser helper function for MAC address arguments.
 
@@ -21,23 +21,707 @@
 .. autosummary::
   :nosignatures:
 
+  ChunkedFile
+  FileChunk
   FileReference
   FileOnDisk
   FileInTAR
+  FileInStream
+  TARIndex
+  TARMember
+  TARMemberReader
+  TARStream
+  TransferScheduler
 """
 
+import gzip
+import io
 import logging
+import multiprocessing
 import os
 import shutil
 import tarfile
+import threading
 
+from collections import defaultdict, namedtuple, OrderedDict
 from contextlib import contextmanager, closing
 
-from COT.data_validation import file_checksum
+from COT.checksum_cache import ChecksumCache, file_key
+from COT.data_validation import file_checksums, MultiHash
+from COT.file_transfer import (
+    copy_file, copy_fileobj, copy_range, COPY_REFLINK, TARWriter,
+)
+from COT.stream_io import SequentialReader
 
 logger = logging.getLogger(__name__)
 
 
+TARMember = namedtuple('TARMember', ['name', 'header_offset', 'data_offset',
+                                     'size', 'mode', 'tarinfo'])
+"""Location and metadata of a single member of a TAR archive.
+
+* ``name`` - member name as stored in the archive
+* ``header_offset`` - byte offset of the member's (first) header block
+* ``data_offset`` - byte offset of the member's data
+* ``size`` - size of the member's data, in bytes
+* ``mode`` - permission bits of the member
+* ``tarinfo`` - :class:`tarfile.TarInfo` describing the member
+"""
+
+
+class TARIndex(object):
+    """Index of the members of a TAR archive, built from one header scan.
+
+    Instances are shared process-wide; use :meth:`get` rather than
+    instantiating this class directly, so that every :class:`FileInTAR`
+    referencing the same archive can reuse the same scan results.
+    A cached index is automatically discarded and rebuilt if the archive's
+    identity (inode, size, modification time) changes.
+    """
+
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    @staticmethod
+    def _identity(stat_result):
+        """Get the attributes identifying a particular version of a file.
+
+        Args:
+          stat_result (os.stat_result): Result of :func:`os.stat`.
+
+        Returns:
+          tuple: ``(inode, size, mtime_ns)``
+        """
+        # st_mtime_ns is not available in Python 2.x
+        return (stat_result.st_ino, stat_result.st_size,
+                getattr(stat_result, 'st_mtime_ns', stat_result.st_mtime))
+
+    @classmethod
+    def get(cls, tarfile_path):
+        """Get the (possibly cached) index for the given TAR archive.
+
+        Args:
+          tarfile_path (str): Path to a TAR archive.
+
+        Returns:
+          TARIndex: Index of the archive's current contents.
+
+        Raises:
+          OSError: if the archive cannot be accessed.
+          tarfile.TarError: if the file is not a valid TAR archive.
+        """
+        path = os.path.realpath(tarfile_path)
+        identity = cls._identity(os.stat(path))
+        with cls._cache_lock:
+            index = cls._cache.get(path)
+            if index is not None and index.identity == identity:
+                return index
+        index = cls(path, identity)
+        with cls._cache_lock:
+            cls._cache[path] = index
+        return index
+
+    @classmethod
+    def invalidate(cls, tarfile_path):
+        """Discard any cached index for the given TAR archive.
+
+        Should be called after the archive is rewritten, in case the rewrite
+        did not perceptibly change the file identity.
+
+        Args:
+          tarfile_path (str): Path to a TAR archive.
+        """
+        with cls._cache_lock:
+            cls._cache.pop(os.path.realpath(tarfile_path), None)
+
+    def __init__(self, tarfile_path, identity):
+        """Scan the headers of the given TAR archive.
+
+        Args:
+          tarfile_path (str): Real path to a TAR archive.
+          identity (tuple): Value of :meth:`_identity` for this archive.
+
+        Raises:
+          tarfile.TarError: if the file is not a valid TAR archive.
+        """
+        self.path = tarfile_path
+        self.identity = identity
+        self.members = OrderedDict()
+        """Ordered dictionary of member name to :class:`TARMember`."""
+        self._normalized_names = {}
+        logger.debug("Indexing members of TAR file %s", tarfile_path)
+        with tarfile.open(tarfile_path, 'r') as tarf:
+            for tarinfo in tarf:
+                self.members[tarinfo.name] = TARMember(
+                    name=tarinfo.name,
+                    header_offset=tarinfo.offset,
+                    data_offset=tarinfo.offset_data,
+                    size=tarinfo.size,
+                    mode=tarinfo.mode,
+                    tarinfo=tarinfo)
+                self._normalized_names.setdefault(
+                    os.path.normpath(tarinfo.name), tarinfo.name)
+        logger.spam("Indexed %d members of %s",
+                    len(self.members), tarfile_path)
+
+    @property
+    def names(self):
+        """List of member names, in archive order."""
+        return list(self.members.keys())
+
+    def lookup(self, filename):
+        """Look up the given file in this archive.
+
+        Tolerates differences such as 'foo.txt' versus './foo.txt'.
+
+        Args:
+          filename (str): Name of the desired member.
+
+        Returns:
+          TARMember: Matching member, or ``None`` if not found.
+        """
+        member = self.members.get(filename)
+        if member is None:
+            name = self._normalized_names.get(os.path.normpath(filename))
+            if name is not None:
+                member = self.members[name]
+        return member
+
+
+class TARMemberReader(io.RawIOBase):
+    """Read-only binary file object serving a TAR member in place.
+
+    Rather than going through :meth:`tarfile.TarFile.extractfile` and its
+    intermediate buffering, data is read with positioned reads at the
+    member's known offset within the archive. Sequential reads go through a
+    :class:`~COT.stream_io.SequentialReader`, which reads directly into the
+    caller's buffer where possible and keeps the page cache in check.
+    """
+
+    def __init__(self, tarfile_path, member):
+        """Open the given TAR archive for reading the given member.
+
+        Args:
+          tarfile_path (str): Path to the TAR archive.
+          member (TARMember): Member of the archive to read.
+        """
+        super(TARMemberReader, self).__init__()
+        self.name = member.name
+        self._start = member.data_offset
+        self._size = member.size
+        self._pos = 0
+        self._path = tarfile_path
+        self._reader = None
+        self._fd = os.open(tarfile_path,
+                           os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+
+    def readable(self):
+        """Always True."""
+        return True
+
+    def seekable(self):
+        """Always True."""
+        return True
+
+    def readinto(self, buf):
+        """Read bytes into the given writable buffer.
+
+        Args:
+          buf (bytearray): Buffer (or memoryview) to read into.
+
+        Returns:
+          int: Number of bytes read; 0 at end of the member.
+        """
+        self._check_open()
+        offset = self._start + self._pos
+        if self._reader is None or self._reader.pos != offset:
+            # Starting out, or the caller has seeked elsewhere
+            if self._reader is not None:
+                self._reader.close()
+            self._reader = SequentialReader(
+                self._fd, offset, max(0, self._size - self._pos),
+                path=self._path)
+        count = self._reader.readinto(buf)
+        self._pos += count
+        return count
+
+    def readall(self):
+        """Read all remaining bytes of the member in a single call.
+
+        Returns:
+          bytes: Remaining data.
+        """
+        self._check_open()
+        count = self._size - self._pos
+        if count <= 0:
+            return b''
+        data = self._pread(count, self._start + self._pos)
+        self._pos += len(data)
+        return data
+
+    def _check_open(self):
+        """Make sure this file has not been closed.
+
+        Raises:
+          ValueError: if it has been.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+    def _pread(self, count, offset):
+        """Read up to ``count`` bytes at the given absolute offset.
+
+        Args:
+          count (int): Number of bytes to read.
+          offset (int): Byte offset within the archive.
+
+        Returns:
+          bytes: Data read.
+        """
+        if hasattr(os, 'pread'):
+            return os.pread(self._fd, count, offset)
+        # Python 2.x has no pread; the file offset is ours alone to move.
+        os.lseek(self._fd, offset, os.SEEK_SET)
+        return os.read(self._fd, count)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Change the current position within the member.
+
+        Args:
+          offset (int): Position relative to ``whence``.
+          whence (int): :data:`io.SEEK_SET`, :data:`io.SEEK_CUR`, or
+            :data:`io.SEEK_END`.
+
+        Returns:
+          int: The new absolute position within the member.
+
+        Raises:
+          ValueError: if ``whence`` is invalid or the resulting
+            position would be negative.
+        """
+        self._check_open()
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError("Invalid whence ({0})".format(whence))
+        if pos < 0:
+            raise ValueError("Negative seek position {0}".format(pos))
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        """Get the current position within the member.
+
+        Returns:
+          int: Byte offset relative to the start of the member.
+        """
+        return self._pos
+
+    def close(self):
+        """Close the underlying archive file descriptor."""
+        if not self.closed:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            os.close(self._fd)
+        super(TARMemberReader, self).close()
+
+
+class TARStream(object):
+    """Reader for a TAR archive that can only be read once, from start to end.
+
+    Used for an OVA arriving on a pipe such as standard input, where
+    :class:`TARIndex` can't seek around in the archive. The data of each
+    member can only be read when the stream reaches it. When the stream has
+    to move past a member that is still :attr:`wanted`, that member is first
+    spilled to a file in :attr:`spill_dir`; any other member is skipped
+    without being stored anywhere.
+    """
+
+    def __init__(self, fileobj, spill_dir, name=None):
+        """Begin reading a TAR archive from the given stream.
+
+        Args:
+          fileobj (file): Readable binary file object.
+          spill_dir (str): Directory in which to save members that are
+            needed after the stream has moved past them.
+          name (str): Name of the stream, for logging; defaults to the
+            name of ``fileobj``, if any.
+
+        Raises:
+          IOError: if the stream does not contain a valid TAR archive.
+        """
+        if name is None:
+            name = getattr(fileobj, 'name', None)
+            if not isinstance(name, str):
+                name = "<stream>"
+        self.name = name
+        self.spill_dir = spill_dir
+        self.wanted = None
+        """Function ``wanted(name)`` reporting whether a member that the
+        stream is about to move past should be spilled, or ``None`` to spill
+        every such member."""
+        self.spilled = OrderedDict()
+        """Normalized member name --> path of its spilled copy."""
+        self.current = None
+        """:class:`tarfile.TarInfo` of the member at the current position
+        of the stream, or ``None`` at the end of the archive."""
+        self._passed = set()
+        self._lock = threading.RLock()
+        try:
+            self._tarf = tarfile.open(fileobj=fileobj, mode='r|')
+        except (EOFError, tarfile.TarError) as exc:
+            raise IOError("{0} is not a valid TAR stream: {1}"
+                          .format(name, exc))
+        self._advance()
+
+    def _advance(self):
+        """Move on to the next regular file in the archive.
+
+        Raises:
+          IOError: if the archive is corrupt or contains an unsafe path.
+        """
+        if self.current is not None:
+            self._passed.add(os.path.normpath(self.current.name))
+        try:
+            member = self._tarf.next()
+            while member is not None and not member.isfile():
+                member = self._tarf.next()
+        except (EOFError, tarfile.TarError) as exc:
+            raise IOError("Unable to read TAR stream {0}: {1}"
+                          .format(self.name, exc))
+        # Make sure the member can't escape spill_dir if spilled.
+        if member is not None and (
+                os.path.isabs(member.name) or
+                os.path.normpath(member.name).split(os.sep)[0] == os.pardir):
+            raise IOError("TAR stream {0} contains unsafe file path '{1}'"
+                          .format(self.name, member.name))
+        self.current = member
+
+    def available(self, name):
+        """Check whether the data of the named member can still be read.
+
+        Members that the stream has not yet reached are assumed to exist.
+
+        Args:
+          name (str): Member name.
+
+        Returns:
+          bool: True if the member has been spilled or not yet passed.
+        """
+        key = os.path.normpath(name)
+        with self._lock:
+            return key in self.spilled or (self.current is not None and
+                                           key not in self._passed)
+
+    def _seek(self, name):
+        """Move forward to the named member, spilling or skipping others.
+
+        Args:
+          name (str): Member name.
+
+        Returns:
+          tarfile.TarInfo: The member, now at the current position,
+          or ``None`` if the stream has already passed it or has ended.
+        """
+        key = os.path.normpath(name)
+        if key in self._passed:
+            return None
+        while (self.current is not None and
+               os.path.normpath(self.current.name) != key):
+            if self.wanted is None or self.wanted(self.current.name):
+                self._spill_current()
+            else:
+                logger.debug("Skipping %s in %s as it is not needed",
+                             self.current.name, self.name)
+                self._advance()
+        return self.current
+
+    def _spill_current(self):
+        """Save the member at the current position to :attr:`spill_dir`."""
+        member = self.current
+        path = os.path.join(self.spill_dir, member.name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        logger.debug("Saving %s from %s to %s", member.name, self.name, path)
+        with open(path, 'wb') as dst:
+            copy_fileobj(self._tarf.extractfile(member), dst.write,
+                         member.size)
+        os.chmod(path, member.mode)
+        os.utime(path, (member.mtime, member.mtime))
+        self.spilled[os.path.normpath(member.name)] = path
+        self._advance()
+
+    def spill(self, name):
+        """Make sure the named member is saved in :attr:`spill_dir`.
+
+        Args:
+          name (str): Member name.
+
+        Returns:
+          str: Path to the spilled copy of the member, or ``None`` if the
+          stream has already moved past the member without spilling it.
+        """
+        key = os.path.normpath(name)
+        with self._lock:
+            if key not in self.spilled and self._seek(name) is not None:
+                self._spill_current()
+            return self.spilled.get(key)
+
+    @contextmanager
+    def open_member(self, name):
+        """Move forward to the named member and read its data directly.
+
+        The data can only be read this way once; afterwards the member is
+        no longer :meth:`available` unless it was spilled previously.
+
+        Args:
+          name (str): Member name.
+
+        Yields:
+          tuple: (:class:`tarfile.TarInfo`, binary file object)
+
+        Raises:
+          IOError: if the stream has already moved past the member.
+        """
+        with self._lock:
+            member = self._seek(name)
+            if member is None:
+                raise IOError("File '{0}' is no longer available in TAR"
+                              " stream {1}".format(name, self.name))
+            try:
+                yield (member, self._tarf.extractfile(member))
+            finally:
+                self._advance()
+
+
+_WORKER = threading.local()
+"""Per-thread flag set in :class:`TransferScheduler` worker threads."""
+
+
+class _TransferRun(object):
+    """State of a single call to :meth:`TransferScheduler.map`."""
+
+    def __init__(self, func, pending, per_device):
+        """Prepare to process the given files.
+
+        Args:
+          func (function): Function to call for each file reference.
+          pending (list): (index, file_ref, devices) for each file.
+          per_device (int): Maximum number of files to handle at once per
+            storage device.
+        """
+        self.func = func
+        self.pending = pending
+        self.per_device = per_device
+        self.results = [None] * len(pending)
+        self.active = defaultdict(int)
+        self.errors = []
+        self.cond = threading.Condition()
+
+    def claim(self):
+        """Claim the next pending file whose device has spare capacity.
+
+        Blocks until such a file is available.
+
+        Returns:
+          tuple: (index, file_ref, devices), or ``None`` if there is no more
+          work to do.
+        """
+        with self.cond:
+            while self.pending and not self.errors:
+                for position, item in enumerate(self.pending):
+                    if all(self.active[device] < self.per_device
+                           for device in item[2] if device is not None):
+                        del self.pending[position]
+                        for device in item[2]:
+                            self.active[device] += 1
+                        return item
+                self.cond.wait()
+            return None
+
+    def work(self):
+        """Worker thread body - process files until none are left."""
+        _WORKER.active = True
+        item = self.claim()
+        while item is not None:
+            (index, file_ref, devices) = item
+            try:
+                self.results[index] = self.func(file_ref)
+            except Exception as exc:  # pylint: disable=broad-except
+                with self.cond:
+                    self.errors.append(exc)
+            finally:
+                with self.cond:
+                    for device in devices:
+                        self.active[device] -= 1
+                    self.cond.notify_all()
+            item = self.claim()
+
+
+class TransferScheduler(object):
+    """Run per-file operations, such as checksums and copies, on many files.
+
+    :mod:`hashlib` releases the GIL while hashing, as do file reads and
+    writes, so checksumming or copying several files in separate threads
+    scales with the number of CPUs as long as the storage keeps up. To avoid
+    thrashing any one disk, the number of files handled concurrently per
+    storage device is also limited.
+
+    A scheduler may be used by several threads at once. Work scheduled from
+    within a worker thread (such as the chunks of a
+    :class:`ChunkedFile` being copied by :meth:`copy_all`) is run inline
+    in that worker, which already holds the device slots for it, rather than
+    starting more threads.
+
+    The class attributes :attr:`max_workers` and :attr:`per_device` provide
+    the defaults for new instances, and may be set (for example from the CLI)
+    to change the behavior process-wide.
+    """
+
+    max_workers = None
+    """Default maximum number of worker threads, or ``None`` for CPU count."""
+
+    per_device = 4
+    """Default maximum number of files to handle at once per device."""
+
+    def __init__(self, max_workers=None, per_device=None):
+        """Create a scheduler with the given limits.
+
+        Args:
+          max_workers (int): Maximum number of worker threads. Defaults to
+            the class attribute :attr:`max_workers`.
+          per_device (int): Maximum number of files to handle at once per
+            storage device. Defaults to the class attribute
+            :attr:`per_device`.
+        """
+        if max_workers is None:
+            max_workers = TransferScheduler.max_workers
+        if max_workers is None:
+            try:
+                max_workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                max_workers = 1
+        if per_device is None:
+            per_device = TransferScheduler.per_device
+        self.max_workers = max(1, max_workers)
+        self.per_device = max(1, per_device)
+
+    @staticmethod
+    def _device(file_ref):
+        """Get the storage device containing the given file.
+
+        Args:
+          file_ref (FileReference): File to locate.
+
+        Returns:
+          int: Device number, or ``None`` if unknown.
+        """
+        try:
+            return os.stat(file_ref.container_path).st_dev
+        except OSError:
+            return None
+
+    def map(self, func, file_refs, dest_dir=None):
+        """Call ``func(file_ref)`` for each of the given file references.
+
+        All worker threads have finished by the time this returns or raises.
+
+        Args:
+          func (function): Function to call for each file reference.
+          file_refs (list): :class:`FileReference` objects to process.
+          dest_dir (str): Directory that ``func`` writes to, if any. Files
+            handled at once then count against the limit for the device
+            containing this directory as well as for their own device.
+
+        Returns:
+          list: Return values of ``func``, in the same order as
+          ``file_refs``.
+
+        Raises:
+          Exception: the first exception raised by ``func``, if any;
+            remaining work is abandoned in that case.
+        """
+        file_refs = list(file_refs)
+        workers = min(self.max_workers, len(file_refs))
+        if workers <= 1 or getattr(_WORKER, 'active', False):
+            return [func(file_ref) for file_ref in file_refs]
+
+        logger.debug("Processing %d files with %d threads, up to %d per"
+                     " device", len(file_refs), workers, self.per_device)
+        dest_device = None
+        if dest_dir is not None:
+            try:
+                dest_device = os.stat(dest_dir).st_dev
+            except OSError:
+                pass
+        run = _TransferRun(func,
+                           [(index, file_ref,
+                             set([self._device(file_ref), dest_device]))
+                            for index, file_ref in enumerate(file_refs)],
+                           self.per_device)
+
+        threads = [threading.Thread(target=run.work)
+                   for _ in range(workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if run.errors:
+            raise run.errors[0]
+        return run.results
+
+    def copy_all(self, file_refs, dest_dir):
+        """Copy the given files to a directory, several at a time.
+
+        Files in the same TAR archive, such as an input OVA, are extracted by
+        a single worker in one sequential pass over the archive (see
+        :meth:`FileInTAR.extract_all`), and likewise files in the same input
+        stream are copied one after another. Other files are each copied by
+        their own worker, limited per source and destination device.
+
+        Args:
+          file_refs (list): :class:`FileReference` objects to copy.
+          dest_dir (str): Destination directory.
+
+        Returns:
+          list: How each file was copied (see :meth:`FileReference.copy_to`),
+          in the same order as ``file_refs``.
+        """
+        file_refs = list(file_refs)
+        groups = OrderedDict()
+        for file_ref in file_refs:
+            if isinstance(file_ref, FileInTAR):
+                key = file_ref.container_path
+            elif isinstance(file_ref, FileInStream):
+                key = id(file_ref.stream)
+            else:
+                key = id(file_ref)
+            groups.setdefault(key, []).append(file_ref)
+        heads = dict((id(group[0]), group) for group in groups.values())
+
+        def copy_group(head):
+            """Copy the group of files headed by the given file."""
+            group = heads[id(head)]
+            if isinstance(head, FileInTAR):
+                return FileInTAR.extract_all(group, dest_dir)
+            return [file_ref.copy_to(dest_dir) for file_ref in group]
+
+        results = self.map(copy_group,
+                           [group[0] for group in groups.values()],
+                           dest_dir=dest_dir)
+        methods = {}
+        for group, group_methods in zip(groups.values(), results):
+            for file_ref, method in zip(group, group_methods):
+                methods[id(file_ref)] = method
+        return [methods[id(file_ref)] for file_ref in file_refs]
+
+
 class FileReference(object):
     """Semi-abstract base class for file references."""
 
@@ -47,13 +731,15 @@ class FileReference(object):
 
         Args:
           container_path (str): Absolute path to a container such as a
-            directory or a TAR file.
+            directory or a TAR file. May also be a :class:`TARStream`.
           filename (str): Name of file within the container in question.
           **kwargs: See :meth:__init__()
 
         Returns:
           FileReference: instance of appropriate subclass
         """
+        if isinstance(container_path, TARStream):
+            return FileInStream(container_path, filename, **kwargs)
         if not os.path.isabs(container_path):
             logger.warning("Only absolute paths are accepted, but "
                            'got apparent relative path "%s".'
@@ -76,7 +762,8 @@ class FileReference(object):
                  filename,
                  checksum_algorithm=None,
                  expected_checksum=None,
-                 expected_size=None):
+                 expected_size=None,
+                 compression=None):
         """Common initialization and validation logic.
 
         Args:
@@ -85,6 +772,9 @@ class FileReference(object):
           checksum_algorithm (str): 'sha1', 'sha256', etc.
           expected_checksum (str): Expected checksum of the file, if any.
           expected_size (int): Expected size of the file, in bytes, if any.
+          compression (str): How the file's contents are compressed, such as
+            ``"gzip"``, if at all. As in an OVF, the file's size and checksum
+            are those of the compressed data.
 
         Raises:
           IOError: if the file does not actually exist or is not readable.
@@ -98,7 +788,16 @@ class FileReference(object):
         self.container_path = container_path
         self.filename = os.path.normpath(filename)
         self.checksum_algorithm = checksum_algorithm
-        self._checksum = None
+        if compression == "identity":
+            compression = None
+        self.compression = compression
+        self._checksums = {}
+        """Dictionary of checksum type --> known checksum of the file."""
+        self._checksum_identity = None
+        self._cached_algorithms = set()
+        """Checksum types in :attr:`_checksums` that came from the cache."""
+        self._extra_algorithms = set()
+        self._deferred_checksums = {}
         self._size = None
         self.force_refresh = False
 
@@ -110,15 +809,8 @@ class FileReference(object):
             raise IOError("File '{0}' does not exist in {1}"
                           .format(self.filename, self.container_path))
 
-        if expected_checksum is not None and (self.checksum !=
-                                              expected_checksum):
-            logger.error("The %s checksum for file '%s' is expected to be:"
-                         "\n%s\nbut is actually:\n%s\n"
-                         "This file may have been tampered with!",
-                         self.checksum_algorithm,
-                         self.filename,
-                         expected_checksum,
-                         self.checksum)
+        if expected_checksum is not None:
+            self.verify_checksum(expected_checksum)
 
         if expected_size is not None and self.size != int(expected_size):
             logger.warning("The size of file '%s' is expected to be %s bytes,"
@@ -129,82 +821,400 @@ class FileReference(object):
         assert self.exists
 
     @property
-    def checksum(self):
-        """Checksum of the referenced file."""
-        if self.checksum_algorithm is None:
-            return None
-        if self._checksum is None or self.force_refresh:
-            with self.open('rb') as file_obj:
-                self._checksum = file_checksum(file_obj,
-                                               self.checksum_algorithm)
-        return self._checksum
+    def checksum_algorithms(self):
+        """Set of all checksum types computed whenever this file is read.
 
-    @property
-    def exists(self):
-        """Report whether this file actually exists."""
-        raise NotImplementedError
+        Includes :attr:`checksum_algorithm` as well as any types requested
+        through :meth:`add_checksum_algorithm` or :meth:`get_checksum`.
+        """
+        algorithms = set(self._extra_algorithms)
+        if self.checksum_algorithm is not None:
+            algorithms.add(self.checksum_algorithm)
+        return algorithms
 
-    @property
-    def file_path(self):
-        """Actual path to a real file, if any."""
-        return None
+    def add_checksum_algorithm(self, algorithm):
+        """Also compute the given type of checksum when this file is read.
+
+        Args:
+          algorithm (str): 'md5', 'sha1', 'sha256', etc.
+        """
+        self._extra_algorithms.add(algorithm)
 
     @property
-    def size(self):
-        """Size of the referenced file, in bytes."""
-        raise NotImplementedError
+    def checksum(self):
+        """Checksum of the referenced file, of type :attr:`checksum_algorithm`.
 
-    @contextmanager
-    def open(self, mode):
-        """Open the file and yield a reference to the file object.
+        Computed on first access, or as a side effect of copying the file,
+        and only recomputed if the file has changed since then.
+        """
+        if self.checksum_algorithm is None:
+            return None
+        return self.get_checksum(self.checksum_algorithm)
 
-        Automatically closes the file when done.
-        Some subclasses may not support all modes.
+    def get_checksum(self, algorithm, use_cache=True):
+        """Get the checksum of the given type for the referenced file.
+
+        All checksum types in :attr:`checksum_algorithms` that aren't already
+        known are computed together, so that the file is read at most once.
 
         Args:
-          mode (str): Mode such as 'r', 'w', 'a', 'w+', etc.
-        Yields:
-          file: File object
+          algorithm (str): 'md5', 'sha1', 'sha256', etc.
+          use_cache (bool): If False, any checksums previously taken from
+            the persistent :class:`~COT.checksum_cache.ChecksumCache` are
+            discarded, and the checksum is computed from the file itself.
+
+        Returns:
+          str: Hexadecimal checksum.
         """
-        raise NotImplementedError
+        self.add_checksum_algorithm(algorithm)
+        if use_cache:
+            missing = self._load_cached_checksums(self._missing_algorithms())
+        else:
+            for cached in self._cached_algorithms:
+                del self._checksums[cached]
+            self._cached_algorithms = set()
+            missing = self._missing_algorithms()
+        if missing:
+            identity = self._identity()
+            with self.open('rb') as file_obj:
+                checksums = file_checksums(file_obj, missing)
+            self._record_checksums(checksums, identity)
+        self._verify_deferred_checksums()
+        return self._checksums[algorithm]
 
-    def refresh(self):
-        """Make sure all information in this reference is still valid."""
-        # Cache the previously known values
-        exp_size = self.size
-        exp_checksum = self.checksum
-        logger.spam("Refreshing FileReference for '%s', "
-                    "expected size %s, cksum %s",
-                    self.filename, exp_size, exp_checksum)
-        result = True
+    def _missing_algorithms(self):
+        """Get the checksum types that need to be (re)computed.
 
-        self.force_refresh = True
+        Known checksums are discarded if the file has changed since they
+        were computed.
 
-        if not self.exists:
-            logger.error("File '%s' no longer exists!", self.filename)
-            # keep force_refresh as True since we're in a bad state
-            return False
+        Returns:
+          list: Sorted checksum types.
+        """
+        identity = self._identity()
+        if self._checksum_identity != identity:
+            self._checksums = {}
+            self._cached_algorithms = set()
+            self._checksum_identity = identity
+        return sorted(self.checksum_algorithms - set(self._checksums))
 
-        # Refresh the attributes and see if they've changed
-        if self.size != exp_size and exp_size is not None:
-            logger.warning("Size of file '%s' has changed"
-                           " from %s bytes to %s bytes.",
-                           self.filename, exp_size, self.size)
-            result = False
+    def _record_checksums(self, checksums, identity):
+        """Save newly computed checksums of this file.
 
-        if self.checksum != exp_checksum and exp_checksum is not None:
-            logger.error("The %s checksum of file '%s' has changed"
-                         " from\n%s\nto\n%s\n"
-                         "This file may have been tampered with!",
-                         self.checksum_algorithm, self.filename,
-                         exp_checksum, self.checksum)
-            result = False
+        Args:
+          checksums (dict): Checksum type --> hexadecimal checksum.
+          identity (tuple): Value of :meth:`_identity` from before the
+            checksums were computed.
+        """
+        if self._checksum_identity != identity:
+            self._checksums = {}
+            self._cached_algorithms = set()
+            self._checksum_identity = identity
+        self._checksums.update(checksums)
+        self._cached_algorithms -= set(checksums)
 
-        return result
+    def cache_checksums(self, path, member=""):
+        """Record this file's known checksums for a copy of it COT has written.
 
+        Only files written by COT itself are entered in the persistent
+        :class:`~COT.checksum_cache.ChecksumCache`, so that reading them
+        back (for example to build the manifest of a package that contains
+        them) doesn't require checksumming them again.
 
-class FileOnDisk(FileReference):
-    """Wrapper for a 'real' file on disk."""
+        Args:
+          path (str): Path to the copy of this file, or to the TAR archive
+            containing it.
+          member (str): Name of the copy within the archive, if any.
+        """
+        cache = ChecksumCache.get()
+        if cache is None or not self._checksums:
+            return
+        cache_key = file_key(path, member)
+        for algorithm, checksum in self._checksums.items():
+            cache.store(cache_key, algorithm, checksum)
+
+    def _cache_key(self):
+        """Get the key for this file in the persistent checksum cache.
+
+        Returns:
+          tuple: See :func:`COT.checksum_cache.file_key`.
+        """
+        raise NotImplementedError
+
+    def _load_cached_checksums(self, algorithms):
+        """Try to get this file's checksums from the persistent cache.
+
+        Checksum types awaiting verification (see :meth:`defer_verification`)
+        are never looked up, as the file itself must be verified.
+
+        Args:
+          algorithms (list): Checksum types to look up.
+
+        Returns:
+          list: Those checksum types that were not found in the cache.
+        """
+        cache = ChecksumCache.get()
+        if cache is None or not algorithms:
+            return algorithms
+        cache_key = self._cache_key()
+        missing = []
+        for algorithm in algorithms:
+            checksum = None
+            if algorithm not in self._deferred_checksums:
+                checksum = cache.lookup(cache_key, algorithm)
+            if checksum is None:
+                missing.append(algorithm)
+            else:
+                self._checksums[algorithm] = checksum
+                self._cached_algorithms.add(algorithm)
+        return missing
+
+    def verify_checksum(self, expected_checksum, algorithm=None):
+        """Check whether the file matches the given checksum.
+
+        The checksum is always that of the file's current contents, never
+        one from the persistent :class:`~COT.checksum_cache.ChecksumCache`.
+
+        Args:
+          expected_checksum (str): Expected checksum of the file.
+          algorithm (str): Type of the expected checksum, if other than
+            :attr:`checksum_algorithm`.
+
+        Returns:
+          bool: True if the checksum matches, else False (and logs an error).
+        """
+        algorithm = algorithm or self.checksum_algorithm
+        actual_checksum = self.get_checksum(algorithm, use_cache=False)
+        if actual_checksum == expected_checksum:
+            return True
+        logger.error("The %s checksum for file '%s' is expected to be:"
+                     "\n%s\nbut is actually:\n%s\n"
+                     "This file may have been tampered with!",
+                     algorithm,
+                     self.filename,
+                     expected_checksum,
+                     actual_checksum)
+        return False
+
+    def defer_verification(self, expected_checksum, algorithm=None):
+        """Verify the file against the given checksum once it is known.
+
+        Rather than reading the file now, the comparison is made the next
+        time the file's checksums are computed for any other reason, such as
+        when the file is copied.
+
+        Args:
+          expected_checksum (str): Expected checksum of the file.
+          algorithm (str): Type of the expected checksum, if other than
+            :attr:`checksum_algorithm`.
+        """
+        algorithm = algorithm or self.checksum_algorithm
+        self.add_checksum_algorithm(algorithm)
+        self._deferred_checksums[algorithm] = expected_checksum
+
+    def _verify_deferred_checksums(self):
+        """Perform any verification requested by :meth:`defer_verification`.
+
+        Only checksums that are already known are verified.
+
+        Returns:
+          bool: False if a deferred verification failed, else True.
+        """
+        ready = [(algorithm, self._deferred_checksums.pop(algorithm))
+                 for algorithm in list(self._deferred_checksums)
+                 if algorithm in self._checksums]
+        result = True
+        for algorithm, expected_checksum in ready:
+            if not self.verify_checksum(expected_checksum, algorithm):
+                result = False
+        return result
+
+    def _identity(self):
+        """Get a value that changes whenever the file's contents may have.
+
+        Returns:
+          tuple: Identifying attributes of the underlying file.
+        """
+        raise NotImplementedError
+
+    def _checksum_needed(self):
+        """Check whether the checksum needs to be (re)computed.
+
+        Returns:
+          bool: True if the checksum is unknown or the file has changed
+          since it was computed.
+        """
+        if self.checksum_algorithm is None:
+            return False
+        return (self.checksum_algorithm not in self._checksums or
+                self._checksum_identity != self._identity())
+
+    def _copy_hash(self):
+        """Get a hash object with which to checksum this file as it's copied.
+
+        Returns:
+          tuple: (:class:`~COT.data_validation.MultiHash`, or ``None`` if all
+          checksums are already known and current; state of the file before
+          copying). Pass both to :meth:`_copied` once the copy is complete.
+        """
+        state = self._identity()
+        missing = self._load_cached_checksums(self._missing_algorithms())
+        if not missing:
+            return (None, state)
+        return (MultiHash(missing), state)
+
+    def _copied(self, hash_obj, state):
+        """Record the checksums computed while copying this file, if any.
+
+        Args:
+          hash_obj (object): Hash object returned by :meth:`_copy_hash`.
+          state (tuple): State returned by :meth:`_copy_hash`.
+        """
+        if hash_obj is not None:
+            logger.debug("Computed %s checksum(s) of %s while copying it",
+                         ", ".join(sorted(hash_obj.hash_objs)),
+                         self.filename)
+            self._record_checksums(hash_obj.hexdigests(), state)
+        self._verify_deferred_checksums()
+
+    @property
+    def exists(self):
+        """Report whether this file actually exists."""
+        raise NotImplementedError
+
+    @property
+    def file_path(self):
+        """Actual path to a real file, if any."""
+        return None
+
+    @property
+    def data_location(self):
+        """Real file containing this file's data, and where, if any.
+
+        Returns:
+          tuple: ``(path, offset)``, or ``None`` if the data is not simply
+          a byte range in a file on disk.
+        """
+        return None
+
+    @property
+    def size(self):
+        """Size of the referenced file, in bytes."""
+        raise NotImplementedError
+
+    @contextmanager
+    def open(self, mode):
+        """Open the file and yield a reference to the file object.
+
+        Automatically closes the file when done.
+        Some subclasses may not support all modes.
+
+        Args:
+          mode (str): Mode such as 'r', 'w', 'a', 'w+', etc.
+        Yields:
+          file: File object
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def open_payload(self):
+        """Open the file to read its contents, decompressing them if needed.
+
+        Unlike :meth:`open`, which always provides the data as stored, this
+        transparently decompresses a file with a :attr:`compression`.
+
+        Yields:
+          file: Binary file object, readable sequentially.
+
+        Raises:
+          NotImplementedError: if the :attr:`compression` is not supported.
+        """
+        if self.compression not in (None, "gzip"):
+            raise NotImplementedError("Unsupported compression '{0}' for {1}"
+                                      .format(self.compression,
+                                              self.filename))
+        with self.open('rb') as obj:
+            if self.compression is None:
+                yield obj
+            else:
+                with gzip.GzipFile(fileobj=obj, mode='rb') as payload:
+                    yield payload
+
+    def fill_archive(self, tarf, offset):
+        """Copy this file into space reserved for it in a TAR archive.
+
+        Unlike :meth:`add_to_archive`, this may be called from several
+        threads at once for different files. If needed, the file's checksum
+        is computed from the copied data.
+
+        Args:
+          tarf (TARWriter): Archive to copy this file into.
+          offset (int): Offset returned by :meth:`TARWriter.reserve`.
+
+        Raises:
+          NotImplementedError: if this file has no :attr:`data_location`.
+        """
+        location = self.data_location
+        if location is None:
+            raise NotImplementedError("Data of {0} is not in a file on disk"
+                                      .format(self.filename))
+        (path, start) = location
+        hash_obj, state = self._copy_hash()
+        with open(path, 'rb') as src:
+            tarf.fill_range(offset, src.fileno(), start, self.size,
+                            hash_obj=hash_obj)
+        self._copied(hash_obj, state)
+
+    def refresh(self):
+        """Make sure all information in this reference is still valid.
+
+        The file is only re-read to verify its checksum if it has changed
+        since the checksum was last computed.
+        """
+        # Cache the previously known values; if the checksum isn't known,
+        # there's no need to read the file now just to compare against it.
+        exp_size = self.size
+        exp_checksum = self._checksums.get(self.checksum_algorithm)
+        logger.spam("Refreshing FileReference for '%s', "
+                    "expected size %s, cksum %s",
+                    self.filename, exp_size, exp_checksum)
+        result = True
+
+        self.force_refresh = True
+
+        if not self.exists:
+            logger.error("File '%s' no longer exists!", self.filename)
+            # keep force_refresh as True since we're in a bad state
+            return False
+
+        # Refresh the attributes and see if they've changed
+        if self.size != exp_size and exp_size is not None:
+            logger.warning("Size of file '%s' has changed"
+                           " from %s bytes to %s bytes.",
+                           self.filename, exp_size, self.size)
+            result = False
+
+        if (exp_checksum is not None and self._checksum_needed() and
+                self.checksum != exp_checksum):
+            logger.error("The %s checksum of file '%s' has changed"
+                         " from\n%s\nto\n%s\n"
+                         "This file may have been tampered with!",
+                         self.checksum_algorithm, self.filename,
+                         exp_checksum, self.checksum)
+            result = False
+
+        return result
+
+
+class FileOnDisk(FileReference):
+    """Wrapper for a 'real' file on disk."""
+
+    copy_strategies = (COPY_REFLINK,)
+    """Ways to try sharing data with a copy, see :func:`copy_file`.
+
+    May be set (for example from the CLI) to change the behavior of
+    :meth:`copy_to` process-wide.
+    """
 
     @property
     def file_path(self):
@@ -216,6 +1226,29 @@ class FileOnDisk(FileReference):
         """True if the file exists on disk, else False."""
         return os.path.exists(self.file_path)
 
+    @property
+    def data_location(self):
+        """The file on disk, from its start."""
+        if self.file_path is None:
+            return None
+        return (self.file_path, 0)
+
+    def _identity(self):
+        """Get a value that changes whenever the file's contents may have.
+
+        Returns:
+          tuple: Inode, size, and modification time of the file.
+        """
+        return TARIndex._identity(os.stat(self.file_path))
+
+    def _cache_key(self):
+        """Get the key for this file in the persistent checksum cache.
+
+        Returns:
+          tuple: See :func:`COT.checksum_cache.file_key`.
+        """
+        return file_key(self.file_path)
+
     @property
     def size(self):
         """The size of this file, in bytes."""
@@ -238,23 +1271,52 @@ class FileOnDisk(FileReference):
     def copy_to(self, dest_dir):
         """Copy this file to the given destination directory.
 
+        If possible, the copy shares its data with this file, as configured
+        by :attr:`copy_strategies`. Otherwise the data is copied, preserving
+        any holes in a sparse file. If needed, the file's checksum is
+        computed along the way.
+
         Args:
           dest_dir (str): Destination directory or filename.
+
+        Returns:
+          str: How the file was copied (see :func:`copy_file`), or ``None``
+          if it is already in place.
         """
-        if self.file_path == os.path.join(dest_dir, self.filename):
-            return
+        dest_path = dest_dir
+        if os.path.isdir(dest_dir):
+            dest_path = os.path.join(dest_dir,
+                                     os.path.basename(self.file_path))
+        # Compare real paths, as the destination may be this very file by
+        # way of a symbolic link or relative path
+        if os.path.realpath(self.file_path) == os.path.realpath(dest_path):
+            return None
         logger.debug("Copying %s to %s", self.file_path, dest_dir)
-        shutil.copy(self.file_path, dest_dir)
+        hash_obj, state = self._copy_hash()
+        strategy = copy_file(self.file_path, dest_path,
+                             strategies=self.copy_strategies,
+                             hash_obj=hash_obj)
+        shutil.copymode(self.file_path, dest_path)
+        self._copied(hash_obj, state)
+        return strategy
 
     def add_to_archive(self, tarf):
         """Copy this file into the given tarfile object.
 
         Args:
           tarf (tarfile.TarFile): Add this file to that archive.
+            May also be a :class:`~COT.file_transfer.TARWriter`, in which
+            case the file's checksum is computed from the copied data if
+            needed.
         """
         logger.debug("Adding %s to TAR file as %s",
                      self.file_path, self.filename)
-        tarf.add(self.file_path, self.filename)
+        if not isinstance(tarf, TARWriter):
+            tarf.add(self.file_path, self.filename)
+            return
+        hash_obj, state = self._copy_hash()
+        tarf.add(self.file_path, self.filename, hash_obj=hash_obj)
+        self._copied(hash_obj, state)
 
 
 class FileInTAR(FileReference):
@@ -278,36 +1340,68 @@ class FileInTAR(FileReference):
                            "\nAttempting to convert it to an absolute path.",
                            tarfile_path)
             tarfile_path = os.path.abspath(tarfile_path)
-        if not tarfile.is_tarfile(tarfile_path):
+        try:
+            TARIndex.get(tarfile_path)
+        except (OSError, EOFError, tarfile.TarError):
             raise IOError("{0} is not a valid TAR file.".format(tarfile_path))
-        self.tarf = None
         super(FileInTAR, self).__init__(tarfile_path, filename, **kwargs)
 
+    @property
+    def member(self):
+        """The :class:`TARMember` describing this file, or ``None``.
+
+        Raises:
+          IOError: if the TAR file is no longer readable.
+        """
+        try:
+            return TARIndex.get(self.container_path).lookup(self.filename)
+        except (OSError, EOFError, tarfile.TarError) as exc:
+            raise IOError("Unable to read TAR file {0}: {1}"
+                          .format(self.container_path, exc))
+
     @property
     def exists(self):
         """True if the file exists in the TAR archive, else False."""
-        with tarfile.open(self.container_path, 'r') as tarf:
-            try:
-                tarf.getmember(self.filename)
-                return True
-            except KeyError:
-                # Perhaps an issue with 'foo.txt' versus './foo.txt'?
-                for mem in tarf.getmembers():
-                    if os.path.normpath(mem.name) == self.filename:
-                        logger.debug("Found %s at %s in TAR file",
-                                     self.filename, mem.name)
-                        self.filename = mem.name
-                        return True
-                return False
+        member = self.member
+        if member is None:
+            return False
+        if member.name != self.filename:
+            # Perhaps an issue with 'foo.txt' versus './foo.txt'?
+            logger.debug("Found %s at %s in TAR file",
+                         self.filename, member.name)
+            self.filename = member.name
+        return True
 
     @property
     def size(self):
         """The size of this file in bytes."""
         if self._size is None or self.force_refresh:
-            with tarfile.open(self.container_path, 'r') as tarf:
-                self._size = tarf.getmember(self.filename).size
+            self._size = self.member.size
         return self._size
 
+    @property
+    def data_location(self):
+        """The TAR file, at the offset of this file's data within it."""
+        return (self.container_path, self.member.data_offset)
+
+    def _identity(self):
+        """Get a value that changes whenever the file's contents may have.
+
+        Returns:
+          tuple: Inode, size, and modification time of the TAR file,
+          and the offset of this file within it.
+        """
+        return (TARIndex._identity(os.stat(self.container_path)) +
+                (self.member.data_offset,))
+
+    def _cache_key(self):
+        """Get the key for this file in the persistent checksum cache.
+
+        Returns:
+          tuple: See :func:`COT.checksum_cache.file_key`.
+        """
+        return file_key(self.container_path, self.member.name)
+
     @contextmanager
     def open(self, mode):
         """Open the TAR and return a reference to the relevant file object.
@@ -315,38 +1409,680 @@ class FileInTAR(FileReference):
         Args:
           mode (str): Only 'r' and 'rb' modes are supported.
         Yields:
-          file: File object
+          TARMemberReader: Binary file object reading directly from the TAR.
         Raises:
           ValueError: if ``mode`` is not valid.
         """
         # We can only extract a file object from a TAR file in read mode.
         if mode != 'r' and mode != 'rb':
             raise ValueError("FileInTar.open() only supports 'r'/'rb' mode")
-        # actually tarf.extractfile is always a binary object...
-        with tarfile.open(self.container_path, 'r') as tarf:
-            self.tarf = tarf
-            with closing(tarf.extractfile(self.filename)) as obj:
-                yield obj
-        self.tarf = None
+        # Like tarf.extractfile, this is always a binary object
+        with closing(TARMemberReader(self.container_path,
+                                     self.member)) as obj:
+            yield obj
 
     def copy_to(self, dest_dir):
         """Extract this file to the given destination directory.
 
+        Any holes in the file's data within the TAR are preserved in the
+        extracted copy.
+
         Args:
-          dest_dir (str): Destination directory or filename.
+          dest_dir (str): Destination directory.
+
+        Returns:
+          str: How the data was copied, see :func:`copy_range`.
+        """
+        with open(self.container_path, 'rb') as src:
+            return self._extract(src.fileno(), dest_dir)
+
+    @staticmethod
+    def extract_all(file_refs, dest_dir):
+        """Extract several files from the same TAR archive in a single pass.
+
+        The archive is opened once, and the files are extracted in the order
+        they appear in it, so that it is read from start to end rather than
+        once per file.
+
+        Args:
+          file_refs (list): :class:`FileInTAR` objects, all in one archive.
+          dest_dir (str): Destination directory.
+
+        Returns:
+          list: How each file was copied (see :func:`copy_range`), in the
+          same order as ``file_refs``.
         """
-        with tarfile.open(self.container_path, 'r') as tarf:
-            logger.debug("Extracting %s from %s to %s",
-                         self.filename, self.container_path, dest_dir)
-            tarf.extract(self.filename, dest_dir)
+        if not file_refs:
+            return []
+        methods = {}
+        with open(file_refs[0].container_path, 'rb') as src:
+            for file_ref in sorted(file_refs,
+                                   key=lambda ref: ref.member.data_offset):
+                # pylint: disable=protected-access
+                methods[id(file_ref)] = file_ref._extract(src.fileno(),
+                                                          dest_dir)
+        return [methods[id(file_ref)] for file_ref in file_refs]
+
+    def _extract(self, src_fd, dest_dir):
+        """Extract this file to the given directory from the open archive.
+
+        Args:
+          src_fd (int): File descriptor of the TAR archive.
+          dest_dir (str): Destination directory.
+
+        Returns:
+          str: How the data was copied, see :func:`copy_range`.
+        """
+        member = self.member
+        dest_path = os.path.join(dest_dir, member.name)
+        if not os.path.isdir(os.path.dirname(dest_path)):
+            os.makedirs(os.path.dirname(dest_path))
+        logger.debug("Extracting %s from %s to %s",
+                     self.filename, self.container_path, dest_dir)
+        hash_obj, state = self._copy_hash()
+        with open(dest_path, 'wb') as dst:
+            method = copy_range(src_fd, member.data_offset,
+                                dst.fileno(), 0, member.size,
+                                hash_obj=hash_obj, sparse=True)
+        self._copied(hash_obj, state)
+        os.chmod(dest_path, member.mode)
+        os.utime(dest_path, (member.tarinfo.mtime, member.tarinfo.mtime))
+        return method
 
     def add_to_archive(self, tarf):
         """Copy this file into the given tarfile object.
 
         Args:
           tarf (tarfile.TarFile): Add this file to that archive.
+            May also be a :class:`~COT.file_transfer.TARWriter`, in which
+            case the data is copied directly from its offset in this archive
+            and the file's checksum is computed from the copied data if
+            needed.
         """
-        with self.open('r') as obj:
+        member = self.member
+        if isinstance(tarf, TARWriter):
+            logger.debug("Copying %s directly from %s to TAR file",
+                         self.filename, self.container_path)
+            hash_obj, state = self._copy_hash()
+            with open(self.container_path, 'rb') as src:
+                tarf.add_range(self.filename, src.fileno(),
+                               member.data_offset, member.size,
+                               mtime=member.tarinfo.mtime, mode=member.mode,
+                               hash_obj=hash_obj)
+            self._copied(hash_obj, state)
+            return
+        with self.open('rb') as obj:
             logger.debug("Copying %s directly from %s to TAR file",
                          self.filename, self.container_path)
-            tarf.addfile(self.tarf.getmember(self.filename), obj)
+            tarf.addfile(member.tarinfo, obj)
+
+
+class FileInStream(FileOnDisk):
+    """Wrapper for a file in a :class:`TARStream`, such as an OVA on stdin.
+
+    Until the file is needed, it is left in the stream. It is then either
+    copied directly from the stream to its destination, or spilled to
+    the stream's :attr:`~TARStream.spill_dir` and treated like any other
+    file on disk from then on.
+    """
+
+    def __init__(self, stream, filename, **kwargs):
+        """Create a reference to a file contained in a TAR stream.
+
+        Args:
+          stream (TARStream): Stream containing the file.
+          filename (str): File name in the TAR archive.
+          **kwargs: Passed through to :meth:`FileReference.__init__`.
+            The ``expected_size`` is reported as the :attr:`size` of the
+            file until it is read from the stream.
+
+        Raises:
+          IOError: if the stream has already passed ``filename`` by.
+        """
+        self.stream = stream
+        self._expected_size = kwargs.get('expected_size')
+        super(FileInStream, self).__init__(stream.spill_dir, filename,
+                                           **kwargs)
+
+    @property
+    def file_path(self):
+        """Path to the spilled copy of this file, or ``None`` if not spilled.
+
+        Use :meth:`spill` to make sure the file is on disk.
+        """
+        return self.stream.spilled.get(self.filename)
+
+    @property
+    def exists(self):
+        """True if the file is on disk or its data is still in the stream."""
+        return self.stream.available(self.filename)
+
+    def spill(self):
+        """Save this file from the stream to disk, if not done already.
+
+        Returns:
+          str: :attr:`file_path`
+
+        Raises:
+          IOError: if the stream has already passed this file by.
+        """
+        path = self.stream.spill(self.filename)
+        if path is None:
+            raise IOError("File '{0}' is no longer available in TAR stream {1}"
+                          .format(self.filename, self.stream.name))
+        return path
+
+    def _identity(self):
+        """Get a value that changes whenever the file's contents may have.
+
+        Returns:
+          tuple: Constant, as data read from a stream can't change.
+        """
+        return (id(self.stream), self.filename)
+
+    def _cache_key(self):
+        """Get the key for this file in the persistent checksum cache.
+
+        Returns:
+          None: a stream has no stable identity to cache checksums under.
+        """
+        return None
+
+    @property
+    def size(self):
+        """The size of this file in bytes.
+
+        Until the file has been read from the stream, this is the expected
+        size (if known) rather than the actual size.
+        """
+        if self._size is None or self.force_refresh:
+            if self.file_path is None and self._expected_size is not None:
+                self._size = int(self._expected_size)
+            else:
+                self._size = os.path.getsize(self.spill())
+        return self._size
+
+    @property
+    def checksum(self):
+        """Checksum of the referenced file, of type :attr:`checksum_algorithm`.
+
+        If the file hasn't been read from the stream yet, but verification
+        of its checksum has been deferred (:meth:`defer_verification`), the
+        expected checksum is reported rather than spilling the file to disk
+        to compute it. It is verified once the file is read.
+        """
+        algorithm = self.checksum_algorithm
+        if (algorithm in self._deferred_checksums and
+                algorithm not in self._checksums and self.file_path is None):
+            return self._deferred_checksums[algorithm]
+        return super(FileInStream, self).checksum
+
+    @contextmanager
+    def open(self, mode):
+        """Spill the file to disk, then open it.
+
+        Args:
+          mode (str): Mode such as 'r', 'w', 'a', 'w+', etc.
+        Yields:
+          file: File object
+        """
+        self.spill()
+        with super(FileInStream, self).open(mode) as obj:
+            yield obj
+
+    def copy_to(self, dest_dir):
+        """Copy this file to the given destination directory.
+
+        If the file hasn't been spilled to disk, it is copied directly from
+        the stream, and can't be read again afterwards.
+
+        Args:
+          dest_dir (str): Destination directory.
+
+        Returns:
+          str: How the file was copied (see :meth:`FileOnDisk.copy_to`).
+        """
+        if self.file_path is not None:
+            return super(FileInStream, self).copy_to(dest_dir)
+        dest_path = os.path.join(dest_dir, self.filename)
+        if not os.path.isdir(os.path.dirname(dest_path)):
+            os.makedirs(os.path.dirname(dest_path))
+        logger.debug("Copying %s from %s to %s",
+                     self.filename, self.stream.name, dest_dir)
+        hash_obj, state = self._copy_hash()
+        with self.stream.open_member(self.filename) as (member, src):
+            with open(dest_path, 'wb') as dst:
+                copy_fileobj(src, dst.write, member.size, hash_obj=hash_obj)
+        self._copied(hash_obj, state)
+        os.chmod(dest_path, member.mode)
+        os.utime(dest_path, (member.mtime, member.mtime))
+        return "userspace"
+
+    def add_to_archive(self, tarf):
+        """Copy this file into the given tarfile object.
+
+        If the file hasn't been spilled to disk, it is copied directly from
+        the stream, and can't be read again afterwards.
+
+        Args:
+          tarf (tarfile.TarFile): Add this file to that archive.
+            May also be a :class:`~COT.file_transfer.TARWriter`, in which
+            case the file's checksum is computed from the copied data if
+            needed.
+        """
+        if self.file_path is not None:
+            super(FileInStream, self).add_to_archive(tarf)
+            return
+        logger.debug("Copying %s directly from %s to TAR file",
+                     self.filename, self.stream.name)
+        hash_obj, state = self._copy_hash()
+        with self.stream.open_member(self.filename) as (member, src):
+            if isinstance(tarf, TARWriter):
+                tarf.add_fileobj(self.filename, src, member.size,
+                                 mtime=member.mtime, mode=member.mode,
+                                 hash_obj=hash_obj)
+            else:
+                hash_obj = None
+                tarf.addfile(member, src)
+        self._copied(hash_obj, state)
+
+
+class FileChunk(FileReference):
+    """A byte range of a file on disk, treated as a file in its own right.
+
+    Used to split a file into chunks (see :meth:`ChunkedFile.split`) without
+    copying any of its data until the chunks are written out.
+    """
+
+    def __init__(self, path, filename, offset, length, **kwargs):
+        """Create a reference to a byte range of the given file.
+
+        Args:
+          path (str): Path to the file containing the data.
+          filename (str): Name of this chunk, such as ``foo.vmdk.000000001``.
+          offset (int): Position of the chunk's data within ``path``.
+          length (int): Size of the chunk, in bytes.
+          **kwargs: Passed through to :meth:`FileReference.__init__`.
+        """
+        self.offset = offset
+        self.length = length
+        super(FileChunk, self).__init__(path, filename, **kwargs)
+
+    @property
+    def exists(self):
+        """True if the file containing this chunk is (still) big enough."""
+        return (os.path.isfile(self.container_path) and
+                (os.path.getsize(self.container_path) >=
+                 self.offset + self.length))
+
+    @property
+    def size(self):
+        """The size of this chunk in bytes."""
+        return self.length
+
+    @property
+    def data_location(self):
+        """The containing file, at the offset of this chunk."""
+        return (self.container_path, self.offset)
+
+    def _identity(self):
+        """Get a value that changes whenever the file's contents may have.
+
+        Returns:
+          tuple: Inode, size, and modification time of the containing file,
+          and the offset and size of this chunk within it.
+        """
+        return (TARIndex._identity(os.stat(self.container_path)) +
+                (self.offset, self.length))
+
+    def _cache_key(self):
+        """Chunks are not cached, as they only exist while being written.
+
+        Returns:
+          None: always
+        """
+        return None
+
+    @contextmanager
+    def open(self, mode):
+        """Open the chunk for reading.
+
+        Args:
+          mode (str): Must be 'r' or 'rb'
+        Yields:
+          TARMemberReader: File object limited to the chunk's data.
+        Raises:
+          ValueError: if ``mode`` is not valid.
+        """
+        if mode != 'r' and mode != 'rb':
+            raise ValueError("FileChunk.open() only supports 'r'/'rb' mode")
+        member = TARMember(name=self.filename, header_offset=None,
+                           data_offset=self.offset, size=self.length,
+                           mode=0o644, tarinfo=None)
+        with closing(TARMemberReader(self.container_path, member)) as obj:
+            yield obj
+
+    def copy_to(self, dest_dir):
+        """Copy this chunk to a file in the given destination directory.
+
+        Args:
+          dest_dir (str): Destination directory.
+
+        Returns:
+          str: How the data was copied, see :func:`copy_range`.
+        """
+        dest_path = os.path.join(dest_dir, self.filename)
+        if not os.path.isdir(os.path.dirname(dest_path)):
+            os.makedirs(os.path.dirname(dest_path))
+        logger.debug("Copying %s from %s to %s",
+                     self.filename, self.container_path, dest_dir)
+        hash_obj, state = self._copy_hash()
+        with open(self.container_path, 'rb') as src:
+            with open(dest_path, 'wb') as dst:
+                method = copy_range(src.fileno(), self.offset,
+                                    dst.fileno(), 0, self.length,
+                                    hash_obj=hash_obj, sparse=True)
+        self._copied(hash_obj, state)
+        return method
+
+    def add_to_archive(self, tarf):
+        """Copy this chunk into the given tarfile object.
+
+        Args:
+          tarf (tarfile.TarFile): Add this chunk to that archive.
+            May also be a :class:`~COT.file_transfer.TARWriter`, in which
+            case the chunk's checksum is computed from the copied data if
+            needed.
+        """
+        logger.debug("Copying %s from %s to TAR file",
+                     self.filename, self.container_path)
+        if not isinstance(tarf, TARWriter):
+            tarinfo = tarfile.TarInfo(self.filename)
+            tarinfo.size = self.length
+            with self.open('rb') as obj:
+                tarf.addfile(tarinfo, obj)
+            return
+        hash_obj, state = self._copy_hash()
+        with open(self.container_path, 'rb') as src:
+            tarf.add_range(self.filename, src.fileno(), self.offset,
+                           self.length, hash_obj=hash_obj)
+        self._copied(hash_obj, state)
+
+
+class _ChunkedReader(io.RawIOBase):
+    """Read-only binary file object reading several files one after another.
+
+    Helper for :meth:`ChunkedFile.open`.
+    """
+
+    def __init__(self, file_refs):
+        """Prepare to read the given files.
+
+        Args:
+          file_refs (list): :class:`FileReference` objects to read, in order.
+        """
+        super(_ChunkedReader, self).__init__()
+        self._pending = list(file_refs)
+        self._context = None
+        self._current = None
+
+    def readable(self):
+        """Always True."""
+        return True
+
+    def readinto(self, buf):
+        """Read bytes into the given writable buffer.
+
+        Args:
+          buf (bytearray): Buffer (or memoryview) to read into.
+
+        Returns:
+          int: Number of bytes read; 0 at the end of the last file.
+        """
+        while True:
+            if self._current is None:
+                if not self._pending:
+                    return 0
+                self._context = self._pending.pop(0).open('rb')
+                self._current = self._context.__enter__()
+            count = self._current.readinto(buf)
+            if count:
+                return count
+            self._close_current()
+
+    def _close_current(self):
+        """Close the file currently being read, if any."""
+        if self._context is not None:
+            self._context.__exit__(None, None, None)
+        self._context = None
+        self._current = None
+
+    def close(self):
+        """Close the file currently being read, if any."""
+        self._close_current()
+        super(_ChunkedReader, self).close()
+
+
+class ChunkedFile(FileReference):
+    """A file split into numbered chunks, presented as a single file.
+
+    As with ``ovf:chunkSize`` in an OVF, chunk *N* of a file ``foo.vmdk`` is
+    named ``foo.vmdk.00000000N``, and every chunk but the last is exactly
+    :attr:`chunk_size` bytes. Each of the :attr:`chunks` is a
+    :class:`FileReference` in its own right, with its own checksum, so the
+    chunks are checksummed and copied in parallel. Reading this file reads
+    the chunks one after another.
+    """
+
+    @staticmethod
+    def chunk_name(filename, index):
+        """Get the name of the given chunk of a file.
+
+        Args:
+          filename (str): Name of the whole file.
+          index (int): Chunk number, starting from 0.
+
+        Returns:
+          str: Chunk file name.
+
+        Examples:
+          ::
+
+            >>> ChunkedFile.chunk_name("foo.vmdk", 12)
+            'foo.vmdk.000000012'
+        """
+        return "{0}.{1:09d}".format(filename, index)
+
+    @classmethod
+    def split(cls, file_ref, chunk_size):
+        """Split the given file into chunks, without copying any data yet.
+
+        Args:
+          file_ref (FileReference): File to split. A :class:`FileInStream`
+            is spilled to disk.
+          chunk_size (int): Maximum size of each chunk, in bytes.
+
+        Returns:
+          ChunkedFile: Chunked file, made of :class:`FileChunk` references.
+
+        Raises:
+          ValueError: if the file's data is not in a file on disk.
+        """
+        if isinstance(file_ref, FileInStream):
+            file_ref.spill()
+        location = file_ref.data_location
+        if location is None:
+            raise ValueError("Unable to split {0} into chunks"
+                             .format(file_ref.filename))
+        (path, start) = location
+        size = file_ref.size
+        chunks = [FileChunk(path, cls.chunk_name(file_ref.filename, index),
+                            start + offset, min(chunk_size, size - offset),
+                            checksum_algorithm=file_ref.checksum_algorithm)
+                  for index, offset in
+                  enumerate(range(0, max(size, 1), chunk_size))]
+        return cls(file_ref.container_path, file_ref.filename, chunk_size,
+                   chunks=chunks,
+                   checksum_algorithm=file_ref.checksum_algorithm,
+                   compression=file_ref.compression)
+
+    def __init__(self, container_path, filename, chunk_size, chunks=None,
+                 **kwargs):
+        """Create a reference to a file made up of chunks.
+
+        Args:
+          container_path (str): Container of the chunks, as for
+            :meth:`FileReference.create`.
+          filename (str): Name of the whole file.
+          chunk_size (int): Size of each chunk (except the last), in bytes.
+          chunks (list): :class:`FileReference` to each chunk, in order.
+            By default, references are created to the chunks found in the
+            container - as many as ``expected_size`` calls for, if given.
+          **kwargs: Passed through to :meth:`FileReference.__init__`.
+            The ``checksum_algorithm`` also applies to each chunk.
+
+        Raises:
+          IOError: if any of the chunks do not exist.
+        """
+        self.chunk_size = int(chunk_size)
+        if chunks is None:
+            chunks = self._find_chunks(container_path, filename,
+                                       self.chunk_size,
+                                       kwargs.get('expected_size'),
+                                       kwargs.get('checksum_algorithm'))
+        self.chunks = list(chunks)
+        """List of :class:`FileReference` to each chunk, in order."""
+        super(ChunkedFile, self).__init__(
+            getattr(container_path, 'spill_dir', container_path), filename,
+            **kwargs)
+
+    @classmethod
+    def _find_chunks(cls, container_path, filename, chunk_size,
+                     expected_size, checksum_algorithm):
+        """Create references to the chunks of a file.
+
+        Args:
+          container_path (str): Container of the chunks.
+          filename (str): Name of the whole file.
+          chunk_size (int): Size of each chunk (except the last), in bytes.
+          expected_size (int): Size of the whole file, if known.
+          checksum_algorithm (str): 'sha1', 'sha256', etc.
+
+        Returns:
+          list: :class:`FileReference` objects.
+
+        Raises:
+          IOError: if no chunks, or not enough chunks, exist.
+        """
+        count = None
+        if expected_size is not None:
+            count = max(1, -(-int(expected_size) // chunk_size))
+        elif isinstance(container_path, TARStream):
+            # Every chunk not yet reached in a stream appears to exist
+            raise IOError("Size of chunked file '{0}' must be known to read"
+                          " it from a stream".format(filename))
+        chunks = []
+        while count is None or len(chunks) < count:
+            size = None
+            if count is not None:
+                size = min(chunk_size,
+                           int(expected_size) - len(chunks) * chunk_size)
+            try:
+                chunks.append(FileReference.create(
+                    container_path, cls.chunk_name(filename, len(chunks)),
+                    checksum_algorithm=checksum_algorithm,
+                    expected_size=size))
+            except IOError:
+                if count is not None or not chunks:
+                    raise
+                break
+        return chunks
+
+    @property
+    def exists(self):
+        """True if all of the chunks exist."""
+        return all(chunk.exists for chunk in self.chunks)
+
+    @property
+    def size(self):
+        """The total size of the chunks in bytes."""
+        return sum(chunk.size for chunk in self.chunks)
+
+    def _identity(self):
+        """Get a value that changes whenever the file's contents may have.
+
+        Returns:
+          tuple: Identities of all of the chunks.
+        """
+        # pylint: disable=protected-access
+        return tuple(chunk._identity() for chunk in self.chunks)
+
+    def _cache_key(self):
+        """The whole file is not cached, only its chunks.
+
+        Returns:
+          None: always
+        """
+        return None
+
+    @contextmanager
+    def open(self, mode):
+        """Open the file for reading, from the start of its first chunk.
+
+        Args:
+          mode (str): Must be 'r' or 'rb'
+        Yields:
+          io.RawIOBase: File object reading each chunk in turn.
+        Raises:
+          ValueError: if ``mode`` is not valid.
+        """
+        if mode != 'r' and mode != 'rb':
+            raise ValueError("ChunkedFile.open() only supports 'r'/'rb' mode")
+        with closing(_ChunkedReader(self.chunks)) as obj:
+            yield obj
+
+    def refresh(self):
+        """Make sure all information about the chunks is still valid.
+
+        Returns:
+          bool: True if all chunks are unchanged.
+        """
+        return all([chunk.refresh() for chunk in self.chunks])
+
+    def copy_to(self, dest_dir):
+        """Copy the chunks, in parallel, to the given destination directory.
+
+        Args:
+          dest_dir (str): Destination directory.
+
+        Returns:
+          str: How the chunks were copied, or ``None`` if they are already
+          in place.
+        """
+        methods = TransferScheduler().map(
+            lambda chunk: chunk.copy_to(dest_dir), self.chunks,
+            dest_dir=dest_dir)
+        return ", ".join(sorted(set(m for m in methods if m))) or None
+
+    def add_to_archive(self, tarf):
+        """Copy the chunks into the given tarfile object.
+
+        When possible, space is reserved in the archive for all of the chunks
+        and they are then copied in parallel.
+
+        Args:
+          tarf (tarfile.TarFile): Add the chunks to that archive.
+            May also be a :class:`~COT.file_transfer.TARWriter`, in which
+            case the chunks' checksums are computed from the copied data if
+            needed.
+        """
+        if (not isinstance(tarf, TARWriter) or tarf.sequential or
+                any(chunk.data_location is None for chunk in self.chunks)):
+            for chunk in self.chunks:
+                chunk.add_to_archive(tarf)
+            return
+        offsets = dict((chunk, tarf.reserve(chunk.filename, chunk.size))
+                       for chunk in self.chunks)
+        TransferScheduler().map(
+            lambda chunk: chunk.fill_archive(tarf, offsets[chunk]),
+            self.chunks)
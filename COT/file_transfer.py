@@ -0,0 +1,926 @@
+#!/usr/bin/env python
+#
+# file_transfer.py - Efficient copying of file data
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Helpers for moving file data around efficiently.
+
+Where the platform supports it, data is copied within the kernel
+(:func:`os.copy_file_range` or :func:`os.sendfile`) rather than being read
+into Python and written back out again, and holes in sparse files (found
+with :data:`os.SEEK_DATA` and :data:`os.SEEK_HOLE`) are skipped rather than
+being copied as zeros. Otherwise these helpers fall back to ordinary reads
+and writes, so they are safe to use on any platform.
+
+Whole files can also be "copied" without duplicating their data at all, by
+cloning them on file systems that support copy-on-write (such as btrfs and
+XFS) or, for read-only files, by hard-linking them; see :func:`copy_file`.
+
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  TARLayout
+  TARWriter
+
+**Functions**
+
+.. autosummary::
+  :nosignatures:
+
+  copy_file
+  copy_fileobj
+  copy_range
+  parse_copy_strategies
+
+**Constants**
+
+.. autosummary::
+  COPY_HARDLINK
+  COPY_REFLINK
+"""
+
+import errno
+import io
+import logging
+import os
+import shutil
+import stat
+import tarfile
+
+from COT.data_validation import ValueUnsupportedError
+from COT.stream_io import (
+    SequentialReader, drop_cache, fadvise, read_ahead,
+)
+from COT.utilities import tar_header
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+"""Maximum number of bytes to copy in a single system call."""
+
+_FALLBACK_ERRNOS = set([errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ESPIPE,
+                        errno.ENOTTY,
+                        getattr(errno, 'EOPNOTSUPP', errno.ENOSYS),
+                        getattr(errno, 'ENOTSUP', errno.ENOSYS)])
+"""Errors from in-kernel copies that indicate we should do it ourselves."""
+
+_FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+"""Linux ioctl request to clone a whole file (from ``<linux/fs.h>``)."""
+
+COPY_REFLINK = "reflink"
+"""Strategy for :func:`copy_file` - make a copy-on-write clone of the file.
+
+Only possible within a single file system that supports it, such as btrfs
+or XFS; the copy shares the original's data until either one is modified.
+"""
+
+COPY_HARDLINK = "hardlink"
+"""Strategy for :func:`copy_file` - hard-link to the file, if read-only.
+
+Only possible within a single file system. As the "copy" *is* the original,
+this is only done for a file with no write permissions.
+"""
+
+
+def _pwrite(fd, data, offset):
+    """Write all of ``data`` at ``offset`` to the given descriptor.
+
+    Args:
+      fd (int): File descriptor.
+      data (bytes): Data to write.
+      offset (int): Absolute position to write to, or ``None`` to write
+        at the current file position (as is required for a pipe).
+    """
+    view = memoryview(data)
+    while view:
+        if offset is None:
+            written = os.write(fd, view)
+        elif hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        if offset is not None:
+            offset += written
+
+
+def _copy_range_userspace(src_fd, src_offset, dst_fd, dst_offset, count,
+                          hash_obj=None):
+    """Copy a byte range by reading it into memory and writing it back out.
+
+    The data is read with a :class:`~COT.stream_io.SequentialReader`, a
+    buffer at a time.
+
+    Args:
+      src_fd (int): File descriptor to read from.
+      src_offset (int): Position in ``src_fd`` to read from.
+      dst_fd (int): File descriptor to write to.
+      dst_offset (int): Position in ``dst_fd`` to write to, or ``None``.
+      count (int): Number of bytes to copy.
+      hash_obj (object): If set, hash object (from :mod:`hashlib`) to update
+        with the data as it is copied.
+
+    Raises:
+      EOFError: if ``src_fd`` ends before ``count`` bytes are copied.
+    """
+    with SequentialReader(src_fd, src_offset, count) as reader:
+        for data in reader:
+            if hash_obj is not None:
+                hash_obj.update(data)
+            _pwrite(dst_fd, data, dst_offset)
+            if dst_offset is not None:
+                dst_offset += len(data)
+        if reader.remaining:
+            raise EOFError("Unexpected end of file with {0} bytes left to copy"
+                           .format(reader.remaining))
+
+
+def _copy_range_copy_file_range(src_fd, src_offset, dst_fd, dst_offset,
+                                count):
+    """Copy a byte range using :func:`os.copy_file_range`.
+
+    Args:
+      src_fd (int): File descriptor to read from.
+      src_offset (int): Position in ``src_fd`` to read from.
+      dst_fd (int): File descriptor to write to.
+      dst_offset (int): Position in ``dst_fd`` to write to, or ``None``.
+      count (int): Number of bytes to copy.
+
+    Raises:
+      EOFError: if ``src_fd`` ends before ``count`` bytes are copied.
+    """
+    while count > 0:
+        copied = os.copy_file_range(src_fd, dst_fd,
+                                    min(count, COPY_CHUNK_SIZE),
+                                    src_offset, dst_offset)
+        if copied == 0:
+            raise EOFError("Unexpected end of file with {0} bytes left to copy"
+                           .format(count))
+        src_offset += copied
+        if dst_offset is not None:
+            dst_offset += copied
+        count -= copied
+
+
+def _copy_range_sendfile(src_fd, src_offset, dst_fd, dst_offset, count):
+    """Copy a byte range using :func:`os.sendfile`.
+
+    Unlike :func:`os.copy_file_range`, this writes at the current position of
+    ``dst_fd``, so the destination file position is moved as a side effect.
+
+    Args:
+      src_fd (int): File descriptor to read from.
+      src_offset (int): Position in ``src_fd`` to read from.
+      dst_fd (int): File descriptor to write to.
+      dst_offset (int): Position in ``dst_fd`` to write to, or ``None``.
+      count (int): Number of bytes to copy.
+
+    Raises:
+      EOFError: if ``src_fd`` ends before ``count`` bytes are copied.
+    """
+    if dst_offset is not None:
+        os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    while count > 0:
+        copied = os.sendfile(dst_fd, src_fd, src_offset,
+                             min(count, COPY_CHUNK_SIZE))
+        if copied == 0:
+            raise EOFError("Unexpected end of file with {0} bytes left to copy"
+                           .format(count))
+        src_offset += copied
+        count -= copied
+
+
+def _seek_extent(fd, offset, file_end):
+    """Find where the data or hole at the given offset of a file ends.
+
+    The file position of ``fd`` is restored afterward.
+
+    Args:
+      fd (int): File descriptor.
+      offset (int): Offset within the file.
+      file_end (int): Size of the file.
+
+    Returns:
+      tuple: ``(data, hole)``, where ``data`` is the offset of the next
+      data at or after ``offset`` and, if that is ``offset`` itself,
+      ``hole`` is the offset of the next hole after it (else ``None``).
+
+    Raises:
+      OSError: if the platform or file system can't report holes.
+    """
+    position = os.lseek(fd, 0, os.SEEK_CUR)
+    try:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as exc:
+            if exc.errno != errno.ENXIO:
+                raise
+            # Nothing but a hole from here to the end of the file
+            data = file_end
+        hole = None
+        if data == offset:
+            hole = os.lseek(fd, offset, os.SEEK_HOLE)
+        return (data, hole)
+    finally:
+        os.lseek(fd, position, os.SEEK_SET)
+
+
+def _data_extents(fd, offset, count):
+    """Find the data and the holes within a byte range of a sparse file.
+
+    Args:
+      fd (int): File descriptor.
+      offset (int): Start of the range.
+      count (int): Length of the range.
+
+    Yields:
+      tuple: ``(offset, length, is_data)`` for each consecutive extent of
+      data or hole in the range. If the platform or file system can't
+      report holes, the whole range is reported as data.
+
+    The file position of ``fd`` is unchanged.
+    """
+    end = offset + count
+    file_end = os.fstat(fd).st_size
+    while offset < end:
+        if offset >= file_end:
+            # Let the copy itself report the unexpected end of file
+            yield (offset, end - offset, True)
+            return
+        try:
+            (data, hole) = _seek_extent(fd, offset, file_end)
+        except OSError as exc:
+            if exc.errno not in _FALLBACK_ERRNOS:
+                raise
+            yield (offset, end - offset, True)
+            return
+        if data > offset:
+            next_offset = min(data, end)
+            yield (offset, next_offset - offset, False)
+        else:
+            next_offset = min(hole, end)
+            yield (offset, next_offset - offset, True)
+        offset = next_offset
+
+
+def _copy_range_sparse(src_fd, src_offset, dst_fd, dst_offset, count,
+                       hash_obj=None):
+    """Copy a byte range, skipping over any holes in the source.
+
+    Holes are left unwritten in the destination, which is extended to the
+    full size of the range if it ends in a hole.
+
+    Args:
+      src_fd (int): File descriptor to read from.
+      src_offset (int): Position in ``src_fd`` to read from.
+      dst_fd (int): File descriptor to write to.
+      dst_offset (int): Position in ``dst_fd`` to write to.
+      count (int): Number of bytes to copy.
+      hash_obj (object): See :func:`copy_range`. Holes are hashed as zeros.
+
+    Returns:
+      str: See :func:`copy_range`.
+
+    Raises:
+      EOFError: if ``src_fd`` ends before ``count`` bytes are copied.
+    """
+    skipped = 0
+    method = "sparse"
+    for offset, length, is_data in _data_extents(src_fd, src_offset, count):
+        dst_pos = dst_offset + offset - src_offset
+        if is_data:
+            method = copy_range(src_fd, offset, dst_fd, dst_pos, length,
+                                hash_obj=hash_obj)
+            continue
+        skipped += length
+        if dst_pos + length > os.fstat(dst_fd).st_size:
+            os.ftruncate(dst_fd, dst_pos + length)
+        if hash_obj is not None:
+            zeros = b'\0' * min(length, 1024 * 1024)
+            while length > 0:
+                hash_obj.update(zeros[:length])
+                length -= len(zeros)
+    if skipped:
+        logger.debug("Skipped %d bytes of holes while copying", skipped)
+    return method
+
+
+def copy_range(src_fd, src_offset, dst_fd, dst_offset, count, hash_obj=None,
+               sparse=False):
+    """Copy a byte range between two files, in the kernel if possible.
+
+    The two descriptors may refer to the same file, provided that the
+    source and destination ranges do not overlap. The file position of
+    ``src_fd`` is not used or changed; that of ``dst_fd`` may be.
+
+    Args:
+      src_fd (int): File descriptor to read from.
+      src_offset (int): Position in ``src_fd`` to read from.
+      dst_fd (int): File descriptor to write to.
+      dst_offset (int): Position in ``dst_fd`` to write to, or ``None`` to
+        write sequentially from its current position, such as to a pipe.
+      count (int): Number of bytes to copy.
+      hash_obj (object): If set, hash object (from :mod:`hashlib`) to update
+        with the data as it is copied. The data then has to pass through
+        userspace, so this disables in-kernel copying.
+      sparse (bool): If True, don't copy holes in the source, leaving the
+        corresponding parts of the destination unwritten. Only use this if
+        the destination range is known to read as zeros already, such as
+        past the end of a newly created file. Ignored if ``dst_offset`` is
+        ``None``, as skipping data in a sequential stream isn't possible.
+
+    Returns:
+      str: How the data was copied - "copy_file_range", "sendfile", or
+      "userspace" - or "sparse" if the range consisted entirely of holes.
+
+    Raises:
+      EOFError: if ``src_fd`` ends before ``count`` bytes are copied.
+    """
+    if (sparse and dst_offset is not None and
+            hasattr(os, 'SEEK_DATA') and hasattr(os, 'SEEK_HOLE')):
+        return _copy_range_sparse(src_fd, src_offset, dst_fd, dst_offset,
+                                  count, hash_obj)
+    if hash_obj is not None:
+        _copy_range_userspace(src_fd, src_offset, dst_fd, dst_offset, count,
+                              hash_obj)
+        return "userspace"
+    methods = []
+    if hasattr(os, 'copy_file_range'):
+        methods.append(("copy_file_range", _copy_range_copy_file_range))
+    if hasattr(os, 'sendfile') and src_fd != dst_fd:
+        methods.append(("sendfile", _copy_range_sendfile))
+    if methods:
+        fadvise(src_fd, src_offset, count, "SEQUENTIAL")
+    for name, method in methods:
+        try:
+            method(src_fd, src_offset, dst_fd, dst_offset, count)
+            drop_cache(src_fd, src_offset, count)
+            return name
+        except OSError as exc:
+            if exc.errno not in _FALLBACK_ERRNOS:
+                raise
+            logger.debug("%s not usable (%s)", name, exc.strerror)
+    logger.debug("Falling back to userspace copy")
+    _copy_range_userspace(src_fd, src_offset, dst_fd, dst_offset, count)
+    return "userspace"
+
+
+def parse_copy_strategies(string):
+    """Parser helper function for a list of :func:`copy_file` strategies.
+
+    Args:
+      string (str): Comma-separated list of :data:`COPY_REFLINK` and/or
+        :data:`COPY_HARDLINK`, or "none" to always copy the data.
+    Returns:
+      tuple: Strategies in the order given.
+    Raises:
+      ValueUnsupportedError: if any strategy is not recognized.
+    """
+    if string.strip().lower() == "none":
+        return ()
+    strategies = []
+    for strategy in string.split(","):
+        strategy = strategy.strip().lower()
+        if strategy not in (COPY_REFLINK, COPY_HARDLINK):
+            raise ValueUnsupportedError(
+                "copy strategy", strategy,
+                [COPY_REFLINK, COPY_HARDLINK, "none"])
+        if strategy not in strategies:
+            strategies.append(strategy)
+    return tuple(strategies)
+
+
+def _reflink(src_fd, dst_path):
+    """Try to create ``dst_path`` as a copy-on-write clone of ``src_fd``.
+
+    Args:
+      src_fd (int): File descriptor of the file to clone.
+      dst_path (str): Path of the clone to create or overwrite.
+
+    Returns:
+      bool: True if successful, False if the platform or file system(s)
+      don't support it.
+    """
+    if fcntl is None:
+        return False
+    dst_fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+        return True
+    except (IOError, OSError) as exc:
+        if exc.errno not in _FALLBACK_ERRNOS:
+            raise
+        logger.debug("Unable to clone to %s (%s)", dst_path, exc.strerror)
+        return False
+    finally:
+        os.close(dst_fd)
+
+
+def _hardlink(src_path, dst_path):
+    """Try to create ``dst_path`` as a hard link to a read-only file.
+
+    Args:
+      src_path (str): Path of the file to link to.
+      dst_path (str): Path of the link to create, replacing any existing
+        file.
+
+    Returns:
+      bool: True if successful, False if ``src_path`` is writable or the
+      file system(s) don't permit it.
+    """
+    if os.stat(src_path).st_mode & (stat.S_IWUSR | stat.S_IWGRP |
+                                    stat.S_IWOTH):
+        logger.debug("Not hard-linking to %s as it is writable", src_path)
+        return False
+    if os.path.lexists(dst_path):
+        os.remove(dst_path)
+    try:
+        os.link(src_path, dst_path)
+        return True
+    except OSError as exc:
+        if exc.errno not in _FALLBACK_ERRNOS | set([errno.EPERM,
+                                                    errno.EACCES,
+                                                    errno.EMLINK]):
+            raise
+        logger.debug("Unable to hard-link %s to %s (%s)",
+                     dst_path, src_path, exc.strerror)
+        return False
+
+
+def copy_file(src_path, dst_path, strategies=(COPY_REFLINK,), hash_obj=None):
+    """Copy a file, sharing data with the copy where possible.
+
+    Each of the given strategies is tried in turn. If none of them is
+    possible, the data is copied with :func:`copy_range` (within the kernel
+    if possible, and preserving any holes).
+
+    Args:
+      src_path (str): Path of the file to copy.
+      dst_path (str): Path of the copy, which is replaced if it exists.
+      strategies (list): Any of :data:`COPY_REFLINK` and
+        :data:`COPY_HARDLINK`, in the order to try them.
+      hash_obj (object): See :func:`copy_range`. If the data is shared
+        rather than copied, it is instead read from ``src_path`` just to
+        update the hash object.
+
+    Returns:
+      str: :data:`COPY_REFLINK`, :data:`COPY_HARDLINK`, or how
+      :func:`copy_range` copied the data.
+
+    Raises:
+      ValueError: if ``strategies`` contains an unknown strategy.
+      shutil.Error: if ``dst_path`` is ``src_path`` itself, such as by way
+        of a symbolic link (:exc:`shutil.SameFileError` where available).
+    """
+    if os.path.exists(dst_path) and os.path.samefile(src_path, dst_path):
+        if (os.path.realpath(src_path) == os.path.realpath(dst_path) or
+                os.stat(dst_path).st_nlink < 2):
+            raise getattr(shutil, 'SameFileError', shutil.Error)(
+                "{0} and {1} are the same file".format(src_path, dst_path))
+        # A separate hard link to the source, which is replaced rather than
+        # overwriting the source with itself
+        os.remove(dst_path)
+    with open(src_path, 'rb') as src:
+        size = os.fstat(src.fileno()).st_size
+        for strategy in strategies:
+            if strategy == COPY_REFLINK:
+                if _reflink(src.fileno(), dst_path):
+                    break
+            elif strategy == COPY_HARDLINK:
+                if _hardlink(src_path, dst_path):
+                    break
+            else:
+                raise ValueError("Unknown copy strategy '{0}'"
+                                 .format(strategy))
+        else:
+            with open(dst_path, 'wb') as dst:
+                return copy_range(src.fileno(), 0, dst.fileno(), 0, size,
+                                  hash_obj=hash_obj, sparse=True)
+        if hash_obj is not None:
+            # The data wasn't read while copying, but is still needed.
+            copy_fileobj(src, lambda data: None, size, hash_obj=hash_obj)
+    return strategy
+
+
+def copy_fileobj(src, write, size, hash_obj=None):
+    """Copy data from a file object that can only be read sequentially.
+
+    Used for sources such as a pipe, which can't be read at an offset and
+    have no data to be copied within the kernel.
+
+    Args:
+      src (file): Readable binary file object.
+      write (function): Function to call with each chunk of data read.
+      size (int): Number of bytes to copy.
+      hash_obj (object): See :func:`copy_range`.
+
+    Raises:
+      EOFError: if ``src`` ends before ``size`` bytes are copied.
+    """
+    remaining = size
+    for data in _read_fileobj(src, size):
+        if hash_obj is not None:
+            hash_obj.update(data)
+        write(data)
+        remaining -= len(data)
+    if remaining:
+        raise EOFError("Unexpected end of file with {0} bytes left"
+                       " to copy".format(remaining))
+
+
+def _read_fileobj(src, size):
+    """Read up to ``size`` bytes from a file object, a buffer at a time.
+
+    The data is read ahead in a background thread by
+    :func:`~COT.stream_io.read_ahead`.
+
+    Args:
+      src (file): Readable binary file object.
+      size (int): Maximum number of bytes to read.
+
+    Returns:
+      iterator: Each block of data read, valid only until the next
+      iteration.
+    """
+    readinto = getattr(src, 'readinto', None)
+    if readinto is None:
+        def readinto(buf):
+            """Read into the given buffer from a file object without one."""
+            data = src.read(len(buf))
+            buf[:len(data)] = data
+            return len(data)
+    buffer_size = max(1, min(size, SequentialReader.buffer_size))
+    depth = SequentialReader.pipeline_depth if size > buffer_size else 1
+    return read_ahead(readinto,
+                      [bytearray(buffer_size) for _ in range(depth)], size)
+
+
+class TARLayout(object):
+    """The exact layout of a TAR archive as :class:`TARWriter` writes it.
+
+    Add each file with :meth:`add`, in the order the files will be written;
+    the position of every file in the archive, and the size of the archive
+    as a whole, are then known before any data has been written.
+    """
+
+    def __init__(self):
+        """Create an empty layout."""
+        self.entries = []
+        """List of ``(name, header_offset, data_offset, size)`` tuples."""
+        self.end = 0
+        """Offset just past the last file, before the end-of-archive marker."""
+
+    def add(self, name, size):
+        """Add the next file in the archive to the layout.
+
+        Args:
+          name (str): Name of the file within the archive.
+          size (int): Size of the file data, in bytes.
+
+        Returns:
+          int: Offset of the file's data within the archive.
+        """
+        header_offset = self.end
+        data_offset = header_offset + len(tar_header(name, size))
+        self.entries.append((name, header_offset, data_offset, size))
+        self.end = (data_offset + size +
+                    (tarfile.BLOCKSIZE - size) % tarfile.BLOCKSIZE)
+        return data_offset
+
+    @property
+    def size(self):
+        """Size of the finalized archive, in bytes."""
+        size = self.end + 2 * tarfile.BLOCKSIZE
+        return size + (tarfile.RECORDSIZE - size) % tarfile.RECORDSIZE
+
+
+class TARWriter(object):
+    """Write a TAR archive, copying member data within the kernel if possible.
+
+    Unlike :mod:`tarfile`, which reads each member's data into Python and
+    writes it back out, this writes the TAR headers itself and moves member
+    data with :func:`copy_range`, both for files on disk and for members of
+    other TAR archives. It only supports regular files, which is all an OVA
+    contains.
+
+    The archive may also be written to an already open stream, such as a
+    pipe or :data:`sys.stdout`, in which case it is written strictly
+    sequentially and :meth:`reserve` is unavailable.
+
+    Can be used as a context manager, in which case the archive is finalized
+    on successful exit from the context.
+    """
+
+    def __init__(self, path, sequential=False):
+        """Create a new, empty TAR archive.
+
+        Args:
+          path (str): Path of the TAR file to create, or a writable binary
+            file object to stream the archive to. The caller remains
+            responsible for closing any such file object.
+          sequential (bool): Write the TAR file at ``path`` strictly
+            sequentially too, as if to a stream, such as when the exact
+            sizes of its members aren't known in advance.
+        """
+        self.path = path
+        self.stream = None
+        self._owned_stream = None
+        if sequential and not hasattr(path, 'write'):
+            path = self._owned_stream = open(path, 'wb')
+        if hasattr(path, 'write'):
+            self.stream = path
+            self.path = getattr(path, 'name', '<stream>')
+            try:
+                self.stream.flush()
+                self.fd = self.stream.fileno()
+            except (AttributeError, io.UnsupportedOperation):
+                # In-memory stream; everything has to go through write()
+                self.fd = None
+        else:
+            self.fd = os.open(path,
+                              os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        self.offset = 0
+
+    @property
+    def sequential(self):
+        """Whether the archive is being written as a sequential stream."""
+        return self.stream is not None
+
+    def __enter__(self):
+        """Use this object as a context manager.
+
+        Returns:
+          TARWriter: self
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace):
+        """Finalize the archive unless an error occurred, then close it.
+
+        Args:
+          exc_type (type): Exception type, if any
+          exc_value (Exception): Exception, if any
+          trace (traceback): Traceback, if any
+        """
+        try:
+            if exc_type is None:
+                self.finalize()
+        finally:
+            self.close()
+
+    def _write(self, data):
+        """Append the given data to the archive.
+
+        Args:
+          data (bytes): Data to write.
+        """
+        if self.fd is None:
+            self.stream.write(data)
+        else:
+            _pwrite(self.fd, data, None if self.sequential else self.offset)
+        self.offset += len(data)
+
+    def _pad(self):
+        """Pad the archive with zeros to the next 512-byte block boundary."""
+        remainder = self.offset % tarfile.BLOCKSIZE
+        if remainder:
+            self._write(b'\0' * (tarfile.BLOCKSIZE - remainder))
+
+    def add_range(self, name, src_fd, src_offset, size, mtime=None,
+                  mode=0o644, hash_obj=None):
+        """Add a file whose data is a byte range in an open file.
+
+        Args:
+          name (str): Name of the file within the archive.
+          src_fd (int): File descriptor to copy data from.
+          src_offset (int): Position in ``src_fd`` where the data starts.
+          size (int): Size of the file data.
+          mtime (float): Modification time of the file; defaults to now.
+          mode (int): Permission bits of the file.
+          hash_obj (object): See :func:`copy_range`.
+        """
+        self._write(tar_header(name, size, mtime=mtime, mode=mode))
+        if self.fd is None:
+            self._copy_to_stream(src_fd, src_offset, size, hash_obj)
+        else:
+            # Past the end of a new archive, so holes can be skipped
+            copy_range(src_fd, src_offset, self.fd,
+                       None if self.sequential else self.offset, size,
+                       hash_obj=hash_obj, sparse=True)
+        self.offset += size
+        self._pad()
+
+    def _copy_to_stream(self, src_fd, src_offset, size, hash_obj=None):
+        """Copy a byte range to a stream that has no file descriptor.
+
+        Args:
+          src_fd (int): File descriptor to copy data from.
+          src_offset (int): Position in ``src_fd`` where the data starts.
+          size (int): Number of bytes to copy.
+          hash_obj (object): See :func:`copy_range`.
+
+        Raises:
+          EOFError: if ``src_fd`` ends before ``size`` bytes are copied.
+        """
+        with SequentialReader(src_fd, src_offset, size) as reader:
+            for data in reader:
+                if hash_obj is not None:
+                    hash_obj.update(data)
+                self.stream.write(data)
+            if reader.remaining:
+                raise EOFError("Unexpected end of file with {0} bytes left"
+                               " to copy".format(reader.remaining))
+
+    def add_fileobj(self, name, fileobj, size, mtime=None, mode=0o644,
+                    hash_obj=None):
+        """Add a file whose data is read sequentially from a file object.
+
+        Args:
+          name (str): Name of the file within the archive.
+          fileobj (file): Readable binary file object to copy data from.
+          size (int): Size of the file data.
+          mtime (float): Modification time of the file; defaults to now.
+          mode (int): Permission bits of the file.
+          hash_obj (object): See :func:`copy_range`.
+        """
+        self._write(tar_header(name, size, mtime=mtime, mode=mode))
+        copy_fileobj(fileobj, self._write, size, hash_obj=hash_obj)
+        self._pad()
+
+    def add_data(self, name, data, mtime=None, mode=0o644):
+        """Add a file with the given contents.
+
+        Args:
+          name (str): Name of the file within the archive.
+          data (bytes): Contents of the file.
+          mtime (float): Modification time of the file; defaults to now.
+          mode (int): Permission bits of the file.
+        """
+        self._write(tar_header(name, len(data), mtime=mtime, mode=mode))
+        self._write(data)
+        self._pad()
+
+    def reserve(self, name, size, mtime=None, mode=0o644):
+        """Add a file whose data will be provided later via :meth:`fill`.
+
+        Args:
+          name (str): Name of the file within the archive.
+          size (int): Exact size of the file data to be provided later.
+          mtime (float): Modification time of the file; defaults to now.
+          mode (int): Permission bits of the file.
+
+        Returns:
+          int: Offset of the reserved space, to pass to :meth:`fill`.
+
+        Raises:
+          ValueError: if the archive is being written to a stream.
+        """
+        if self.sequential:
+            raise ValueError("Can't reserve space in a sequential stream")
+        self._write(tar_header(name, size, mtime=mtime, mode=mode))
+        offset = self.offset
+        # Leave a hole rather than writing zeros, and make sure the archive
+        # extends past it so that filling it can't change the archive size.
+        self.offset += size
+        if os.fstat(self.fd).st_size < self.offset:
+            os.ftruncate(self.fd, self.offset)
+        self._pad()
+        return offset
+
+    def fill(self, offset, data):
+        """Write data into space previously set aside by :meth:`reserve`.
+
+        Args:
+          offset (int): Offset returned by :meth:`reserve`.
+          data (bytes): Data to write. Must be exactly the reserved size.
+        """
+        _pwrite(self.fd, data, offset)
+
+    def preallocate(self, layout, skip=()):
+        """Allocate disk space for the whole archive before writing it.
+
+        Allocating all of the space up front keeps the archive from being
+        fragmented, and fails immediately, rather than part way through
+        writing, if there isn't enough free space. Does nothing when writing
+        to a stream, or if the platform does not support it.
+
+        Args:
+          layout (TARLayout): Planned layout of the archive.
+          skip (set): Names of files whose data space should not be
+            allocated, such as sparse files whose holes should be preserved.
+
+        Raises:
+          OSError: if there is not enough free space (``ENOSPC``).
+        """
+        if self.sequential or not hasattr(os, 'posix_fallocate'):
+            return
+        ranges = []
+        start = 0
+        for (name, _, data_offset, size) in layout.entries:
+            if name in skip:
+                ranges.append((start, data_offset - start))
+                start = data_offset + size
+        ranges.append((start, layout.size - start))
+        logger.debug("Preallocating %d bytes for %s",
+                     sum(length for _, length in ranges), self.path)
+        for (offset, length) in ranges:
+            if length <= 0:
+                continue
+            try:
+                os.posix_fallocate(self.fd, offset, length)
+            except OSError as exc:
+                if exc.errno not in _FALLBACK_ERRNOS:
+                    raise
+                logger.debug("Unable to preallocate space for %s: %s",
+                             self.path, exc)
+                return
+
+    def fill_range(self, offset, src_fd, src_offset, size, hash_obj=None):
+        """Copy data into space previously set aside by :meth:`reserve`.
+
+        Unlike the methods that add files to the archive, this may be called
+        from several threads at once, to fill different reserved spaces.
+
+        Args:
+          offset (int): Offset returned by :meth:`reserve`.
+          src_fd (int): File descriptor to copy data from.
+          src_offset (int): Position in ``src_fd`` where the data starts.
+          size (int): Size of the data. Must be exactly the reserved size.
+          hash_obj (object): See :func:`copy_range`.
+        """
+        copy_range(src_fd, src_offset, self.fd, offset, size,
+                   hash_obj=hash_obj, sparse=True)
+
+    def add(self, path, arcname=None, hash_obj=None):
+        """Add the given file on disk to the archive.
+
+        Symbolic links are followed, and hard links are stored as regular
+        files, like :meth:`tarfile.TarFile.add` with ``dereference=True``.
+
+        Args:
+          path (str): Path of the file to add.
+          arcname (str): Name of the file within the archive; defaults to
+            ``path``.
+          hash_obj (object): See :func:`copy_range`.
+
+        Raises:
+          ValueError: if ``path`` is not a regular file.
+        """
+        if arcname is None:
+            arcname = path
+        src_fd = os.open(path, os.O_RDONLY)
+        try:
+            stat_info = os.fstat(src_fd)
+            if not stat.S_ISREG(stat_info.st_mode):
+                raise ValueError("{0} is not a regular file".format(path))
+            self.add_range(arcname, src_fd, 0, stat_info.st_size,
+                           mtime=stat_info.st_mtime,
+                           mode=stat.S_IMODE(stat_info.st_mode),
+                           hash_obj=hash_obj)
+        finally:
+            os.close(src_fd)
+
+    def finalize(self):
+        """Write the end-of-archive marker and pad to a full TAR record.
+
+        Any space allocated (see :meth:`preallocate`) past the end of the
+        archive as written is released.
+        """
+        self._write(b'\0' * (2 * tarfile.BLOCKSIZE))
+        remainder = self.offset % tarfile.RECORDSIZE
+        if remainder:
+            self._write(b'\0' * (tarfile.RECORDSIZE - remainder))
+        if not self.sequential and os.fstat(self.fd).st_size > self.offset:
+            os.ftruncate(self.fd, self.offset)
+
+    def close(self):
+        """Close the archive file, without finalizing it.
+
+        A stream passed to :meth:`__init__` is flushed but not closed.
+        """
+        if self._owned_stream is not None:
+            self._owned_stream.close()
+            self._owned_stream = None
+        elif self.sequential:
+            self.stream.flush()
+        elif self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
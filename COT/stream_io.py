@@ -0,0 +1,557 @@
+#!/usr/bin/env python
+#
+# stream_io.py - Page-cache-friendly sequential reads of large files
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Sequential reads of large files that are kind to the page cache.
+
+Hashing or copying a multi-gigabyte disk image reads every byte of it
+exactly once. Left to itself, the kernel keeps all of that data cached,
+evicting everything else on the system to make room for pages that will
+never be read again, while only reading ahead a little at a time.
+:class:`SequentialReader` instead tells the kernel how the data will be
+used (with :func:`os.posix_fadvise`): the whole range is read sequentially,
+the next :attr:`~SequentialReader.readahead` bytes will be needed soon,
+and the pages already consumed can be dropped. Optionally it bypasses the
+page cache altogether with ``O_DIRECT``, reading into suitably aligned
+buffers.
+
+Where the platform or file system doesn't support any of this, the reader
+quietly falls back to ordinary reads, so it is safe to use everywhere.
+
+Reading and consuming the data (hashing it, or writing it elsewhere) are
+overlapped by :func:`read_ahead`, which reads in a background thread into a
+small ring of preallocated buffers while the caller works through the ones
+already filled. Both :mod:`hashlib` and the file I/O release the GIL, so
+throughput approaches that of the slower of the two rather than being
+limited by their sum.
+
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  SequentialReader
+
+**Functions**
+
+.. autosummary::
+  :nosignatures:
+
+  drop_cache
+  fadvise
+  read_ahead
+
+**Constants**
+
+.. autosummary::
+  DIRECT_IO_ALIGNMENT
+"""
+
+import errno
+import logging
+import mmap
+import os
+import threading
+
+try:
+    import queue
+except ImportError:  # Python 2.x
+    import Queue as queue
+
+logger = logging.getLogger(__name__)
+
+DIRECT_IO_ALIGNMENT = 4096
+"""Alignment of offsets, sizes, and buffers for ``O_DIRECT`` reads.
+
+This is the logical block size of nearly every modern disk, and a multiple
+of that of the rest.
+"""
+
+_UNSUPPORTED_ERRNOS = set([errno.ENOSYS, errno.EINVAL, errno.ESPIPE,
+                           getattr(errno, 'EOPNOTSUPP', errno.ENOSYS),
+                           getattr(errno, 'ENOTSUP', errno.ENOSYS)])
+"""Errors indicating that a file doesn't support advice or direct I/O."""
+
+
+def fadvise(fd, offset, length, advice):
+    """Advise the kernel how a range of a file will be accessed, if possible.
+
+    Args:
+      fd (int): File descriptor.
+      offset (int): Start of the range.
+      length (int): Length of the range; 0 means to the end of the file.
+      advice (str): Name of the advice, such as "SEQUENTIAL" for
+        :data:`os.POSIX_FADV_SEQUENTIAL`.
+
+    Returns:
+      bool: True if the advice was given, False if the platform or file
+      doesn't support it.
+    """
+    value = getattr(os, 'POSIX_FADV_' + advice, None)
+    if value is None or not hasattr(os, 'posix_fadvise'):
+        return False
+    try:
+        os.posix_fadvise(fd, offset, length, value)
+        return True
+    except OSError as exc:
+        if exc.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+        return False
+
+
+def drop_cache(fd, offset, length):
+    """Drop the cached pages of a range of a file that has been read.
+
+    Only done if :attr:`SequentialReader.drop_behind` is set and the range
+    is at least :attr:`SequentialReader.drop_behind_min_size` bytes, so that
+    small files that are likely to be read again stay cached.
+
+    Args:
+      fd (int): File descriptor.
+      offset (int): Start of the range.
+      length (int): Length of the range.
+
+    Returns:
+      bool: True if the pages were dropped.
+    """
+    if (not SequentialReader.drop_behind or
+            length < SequentialReader.drop_behind_min_size):
+        return False
+    return fadvise(fd, offset, length, "DONTNEED")
+
+
+def _aligned_buffer(size):
+    """Allocate a buffer suitably aligned for ``O_DIRECT`` reads.
+
+    Args:
+      size (int): Minimum size of the buffer, in bytes.
+
+    Returns:
+      mmap.mmap: Anonymous page-aligned memory.
+    """
+    size = max(DIRECT_IO_ALIGNMENT,
+               size - size % DIRECT_IO_ALIGNMENT)
+    return mmap.mmap(-1, size)
+
+
+def _open_direct(fd, path):
+    """Open a second, ``O_DIRECT``, descriptor on the same file as ``fd``.
+
+    Args:
+      fd (int): File descriptor of a regular file.
+      path (str): Path of the same file, if known. Otherwise, on Linux,
+        the file is reopened through ``/proc/self/fd``.
+
+    Returns:
+      int: New file descriptor, or ``None`` if direct I/O isn't possible.
+    """
+    flag = getattr(os, 'O_DIRECT', None)
+    if flag is None or not (hasattr(os, 'preadv') or hasattr(os, 'readv')):
+        return None
+    if path is None:
+        path = "/proc/self/fd/{0}".format(fd)
+    try:
+        direct_fd = os.open(path, os.O_RDONLY | flag)
+    except OSError as exc:
+        logger.debug("Unable to open %s for direct I/O (%s)",
+                     path, exc.strerror)
+        return None
+    if not os.path.samestat(os.fstat(fd), os.fstat(direct_fd)):
+        os.close(direct_fd)
+        return None
+    return direct_fd
+
+
+def _release(buffers):
+    """Free any memory-mapped buffers in the given list.
+
+    Args:
+      buffers (list): Buffers, such as from :meth:`SequentialReader.allocate`.
+    """
+    for buf in buffers:
+        if isinstance(buf, mmap.mmap):
+            try:
+                buf.close()
+            except BufferError:
+                # Data is still being viewed; leave it to the garbage collector
+                pass
+
+
+def _fill(readinto, size, free, full):
+    """Background thread body for :func:`read_ahead`.
+
+    Args:
+      readinto (function): Function to read data into a buffer.
+      size (int): Number of bytes to read, or ``None`` to read until EOF.
+      free (queue.Queue): Buffers ready to be filled; ``None`` means stop.
+      full (queue.Queue): ``(buffer, count)`` for each buffer filled, or
+        ``(None, exception)`` if reading failed.
+    """
+    while True:
+        buf = free.get()
+        if buf is None:
+            return
+        view = memoryview(buf)
+        if size is not None:
+            view = view[:min(len(view), size)]
+        try:
+            count = readinto(view) if len(view) else 0
+        except Exception as exc:  # pylint: disable=broad-except
+            full.put((None, exc))
+            return
+        full.put((buf, count or 0))
+        if not count:
+            return
+        if size is not None:
+            size -= count
+
+
+def read_ahead(readinto, buffers, size=None):
+    """Read data in a background thread, ahead of the caller consuming it.
+
+    The reader thread fills each of the given buffers in turn, waiting for
+    the caller to finish with one before refilling it. With a single buffer
+    there is nothing to overlap, so the data is read in the calling thread.
+    The caller should finish iterating (or close the iterator) before doing
+    anything else with the underlying file.
+
+    Args:
+      readinto (function): Function to read data into a buffer and return
+        the number of bytes read, 0 at the end of the data, such as the
+        ``readinto`` method of a binary file object.
+      buffers (list): Writable buffers, such as :class:`bytearray`, to read
+        into. Each must be at least one byte long.
+      size (int): Maximum number of bytes to read, or ``None`` to read
+        until ``readinto`` returns 0.
+
+    Returns:
+      iterator: :class:`memoryview` of each block of data read, valid only
+      until the next iteration.
+
+    Examples:
+      ::
+
+        >>> import io
+        >>> obj = io.BytesIO(b"hello, world")
+        >>> buffers = [bytearray(4) for _ in range(3)]
+        >>> [bytes(data) for data in read_ahead(obj.readinto, buffers, 10)]
+        [b'hell', b'o, w', b'or']
+    """
+    if len(buffers) > 1:
+        return _read_pipelined(readinto, buffers, size)
+    return _read_serially(readinto, buffers[0], size)
+
+
+def _read_serially(readinto, buf, size):
+    """Read data into a single buffer in the calling thread.
+
+    Args:
+      readinto (function): See :func:`read_ahead`.
+      buf (object): Writable buffer to read into.
+      size (int): See :func:`read_ahead`.
+
+    Yields:
+      memoryview: Data read, valid only until the next iteration.
+    """
+    view = memoryview(buf)
+    while size is None or size > 0:
+        want = view if size is None else view[:min(len(view), size)]
+        count = readinto(want)
+        if not count:
+            return
+        if size is not None:
+            size -= count
+        yield view[:count]
+
+
+def _read_pipelined(readinto, buffers, size):
+    """Read data into a ring of buffers in a background thread.
+
+    Args:
+      readinto (function): See :func:`read_ahead`.
+      buffers (list): Writable buffers to read into.
+      size (int): See :func:`read_ahead`.
+
+    Yields:
+      memoryview: Data read, valid only until the next iteration.
+    """
+    free = queue.Queue()
+    full = queue.Queue()
+    for buf in buffers:
+        free.put(buf)
+    thread = threading.Thread(target=_fill, args=(readinto, size, free, full))
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            (buf, result) = full.get()
+            if buf is None:
+                raise result
+            if not result:
+                return
+            yield memoryview(buf)[:result]
+            free.put(buf)
+    finally:
+        free.put(None)
+        thread.join()
+
+
+class SequentialReader(object):
+    """Read a range of a file from start to end, managing the page cache.
+
+    The class attributes control the behavior of all readers, and may be
+    set (for example, from the CLI) before any data is read.
+
+    Examples:
+      ::
+
+        >>> import tempfile
+        >>> with tempfile.TemporaryFile() as obj:
+        ...     _ = obj.write(b"hello, world")
+        ...     obj.flush()
+        ...     with SequentialReader(obj.fileno(), 7, 5) as reader:
+        ...         b"".join(bytes(view) for view in reader)
+        b'world'
+    """
+
+    buffer_size = 1024 * 1024
+    """Number of bytes to read at a time."""
+
+    readahead = 32 * 1024 * 1024
+    """Number of bytes ahead of the reader to ask the kernel to prefetch."""
+
+    drop_behind = True
+    """Whether to drop data from the page cache once it has been read."""
+
+    drop_behind_min_size = 64 * 1024 * 1024
+    """Size of the smallest range to drop from the cache once it is read."""
+
+    direct = False
+    """Whether to bypass the page cache altogether using ``O_DIRECT``.
+
+    Only used where the platform and file system support it; reads fall
+    back to the page cache otherwise.
+    """
+
+    pipeline_depth = 4
+    """Number of buffers to read ahead into when iterating over a reader.
+
+    See :func:`read_ahead`; 1 reads each buffer only once the previous one
+    has been consumed.
+    """
+
+    def __init__(self, fd, offset=0, count=None, path=None):
+        """Prepare to read the given range of an open file.
+
+        Args:
+          fd (int): File descriptor, which is not closed by this reader.
+            Its file position is not used or changed.
+          offset (int): Position to start reading from.
+          count (int): Number of bytes to read, or ``None`` to read to the
+            end of the file.
+          path (str): Path of the file, if known, for use with
+            :attr:`direct`.
+        """
+        self.fd = fd
+        self.pos = offset
+        self._start = offset
+        if count is None:
+            count = max(0, os.fstat(fd).st_size - offset)
+        self.end = offset + count
+        self._advised = offset
+        self._dropped = offset
+        self._direct_fd = None
+        self._buf = None
+        self._ring = []
+        self._iterator = None
+        if self.direct and count > 0:
+            self._direct_fd = _open_direct(fd, path)
+        if self._direct_fd is None:
+            fadvise(fd, offset, count, "SEQUENTIAL")
+
+    def __enter__(self):
+        """Use as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace):
+        """Close the reader when leaving the context."""
+        self.close()
+
+    def __iter__(self):
+        """Read the rest of the range, a buffer at a time.
+
+        Up to :attr:`pipeline_depth` buffers are read ahead in a background
+        thread (see :func:`read_ahead`), unless the data fits in one.
+
+        Returns:
+          iterator: :class:`memoryview` of each block of data read, valid
+          only until the next iteration.
+        """
+        if not self._ring:
+            depth = self.pipeline_depth
+            if self.remaining <= self.buffer_size:
+                depth = 1
+            self._ring = [self.allocate(self.buffer_size)
+                          for _ in range(max(1, depth))]
+        self._iterator = read_ahead(self.readinto, self._ring)
+        return self._iterator
+
+    @property
+    def remaining(self):
+        """Number of bytes in the range not yet read."""
+        return self.end - self.pos
+
+    def allocate(self, size):
+        """Allocate a buffer suitable for :meth:`readinto`.
+
+        Args:
+          size (int): Size of the buffer, in bytes. For direct I/O, this is
+            rounded down to a multiple of :data:`DIRECT_IO_ALIGNMENT`.
+
+        Returns:
+          object: Writable buffer, such as a :class:`bytearray`.
+        """
+        if self._direct_fd is not None:
+            return _aligned_buffer(size)
+        return bytearray(size)
+
+    def readinto(self, buf):
+        """Read the next data in the range into the given buffer.
+
+        For direct I/O, the data is read straight into the buffer if it came
+        from :meth:`allocate`, and otherwise copied into it from an aligned
+        buffer of the reader's own.
+
+        Args:
+          buf (object): Writable buffer (or memoryview) to read into.
+
+        Returns:
+          int: Number of bytes read; 0 at the end of the range or the file.
+        """
+        count = min(len(buf), self.remaining)
+        if count <= 0:
+            return 0
+        view = memoryview(buf)
+        if self._direct_fd is not None:
+            misalignment = self.pos % DIRECT_IO_ALIGNMENT
+            if misalignment:
+                # Read up to the next aligned offset through the page cache
+                count = min(count, DIRECT_IO_ALIGNMENT - misalignment)
+            else:
+                read = self._read_direct(view, count)
+                if read is not None:
+                    self.pos += read
+                    return read
+        self._advise()
+        if hasattr(os, 'preadv'):
+            read = os.preadv(self.fd, [view[:count]], self.pos)
+        else:
+            if hasattr(os, 'pread'):
+                data = os.pread(self.fd, count, self.pos)
+            else:
+                os.lseek(self.fd, self.pos, os.SEEK_SET)
+                data = os.read(self.fd, count)
+            read = len(data)
+            view[:read] = data
+        self.pos += read
+        self._drop(False)
+        return read
+
+    def _read_direct(self, view, count):
+        """Try to read data at an aligned offset with ``O_DIRECT``.
+
+        Args:
+          view (memoryview): Buffer to read into.
+          count (int): Number of bytes wanted.
+
+        Returns:
+          int: Number of bytes read, or ``None`` if direct I/O turned out
+          not to be possible and the read must be done through the page
+          cache instead.
+        """
+        align = DIRECT_IO_ALIGNMENT
+        target = view
+        if not isinstance(getattr(view, 'obj', None), mmap.mmap):
+            if self._buf is None:
+                self._buf = _aligned_buffer(self.buffer_size)
+            target = memoryview(self._buf)
+        # Round up the final partial block, if the buffer has room for it
+        want = min(len(target) - len(target) % align,
+                   count + (-count) % align)
+        if want <= 0:
+            return None
+        try:
+            if hasattr(os, 'preadv'):
+                read = os.preadv(self._direct_fd, [target[:want]], self.pos)
+            else:
+                os.lseek(self._direct_fd, self.pos, os.SEEK_SET)
+                read = os.readv(self._direct_fd, [target[:want]])
+        except OSError as exc:
+            if exc.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            logger.debug("Direct I/O not usable (%s); falling back to the"
+                         " page cache", exc.strerror)
+            os.close(self._direct_fd)
+            self._direct_fd = None
+            fadvise(self.fd, self.pos, self.remaining, "SEQUENTIAL")
+            return None
+        read = min(read, count, len(view))
+        if target is not view:
+            view[:read] = target[:read]
+        return read
+
+    def _advise(self):
+        """Ask the kernel to prefetch the next window of data, if due."""
+        if self._advised >= self.end:
+            return
+        if self._advised - self.pos > self.readahead // 2:
+            return
+        stop = min(self.end, self.pos + self.readahead)
+        if stop > self._advised:
+            fadvise(self.fd, self._advised, stop - self._advised, "WILLNEED")
+            self._advised = stop
+
+    def _drop(self, final):
+        """Drop the pages that have been read from the page cache, if due.
+
+        Args:
+          final (bool): If True, drop everything read so far; otherwise
+            wait until at least a readahead window's worth has been read.
+        """
+        if (not self.drop_behind or
+                self.end - self._start < self.drop_behind_min_size):
+            return
+        done = self.pos - self._dropped
+        if done <= 0 or (not final and done < self.readahead):
+            return
+        fadvise(self.fd, self._dropped, done, "DONTNEED")
+        self._dropped = self.pos
+
+    def close(self):
+        """Drop the remaining data read from the cache and release resources.
+
+        The file descriptor passed to the constructor is left open.
+        """
+        if self._iterator is not None:
+            # Stop any background reads before pulling the rug out
+            self._iterator.close()
+            self._iterator = None
+        if self._direct_fd is not None:
+            os.close(self._direct_fd)
+            self._direct_fd = None
+        else:
+            self._drop(True)
+        _release(self._ring + [self._buf])
+        self._ring = []
+        self._buf = None
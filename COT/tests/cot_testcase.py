@@ -32,6 +32,7 @@ from logging import NullHandler
 
 from pkg_resources import resource_filename
 
+from COT.checksum_cache import ChecksumCache
 from COT.helpers import helpers, HelperError
 
 try:
@@ -335,17 +336,30 @@ class COTTestCase(unittest.TestCase):  # noqa: N801
         logging.getLogger('COT').addHandler(self.logging_handler)
 
         self.start_time = time.time()
+        # Give each test its own directory for temporary files, so that
+        # checking that COT cleans up after itself isn't thrown off by other
+        # processes (such as a concurrent test run) creating their own.
+        tmp_root = tempfile.mkdtemp(prefix="cot_ut_tmp")
+        self.addCleanup(shutil.rmtree, tmp_root, ignore_errors=True)
+        self.addCleanup(setattr, tempfile, 'tempdir', tempfile.tempdir)
+        tempfile.tempdir = tmp_root
         # Set a temporary directory for us to write our OVF to
         self.temp_dir = tempfile.mkdtemp(prefix="cot_ut")
         self.temp_file = os.path.join(self.temp_dir, "out.ovf")
         logger.debug("Created temp dir %s", self.temp_dir)
-        # Monitor the global temp directory to make sure COT cleans up
+        # Monitor the temp directory to make sure COT cleans up
         self.tmps = set(glob.glob(os.path.join(tempfile.gettempdir(), 'cot*')))
 
         self.validate_output_with_ovftool = True
 
+        # Don't let results cached by one test affect another
+        self.checksum_cache_enabled = ChecksumCache.enabled
+        ChecksumCache.enabled = False
+
     def tearDown(self):
         """Test case cleanup function called automatically after each test."""
+        ChecksumCache.enabled = self.checksum_cache_enabled
+
         # Fail if any WARNING/ERROR/CRITICAL logs were generated
         self.logging_handler.assertNoLogsOver(logging.INFO)
 
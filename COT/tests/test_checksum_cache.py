@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+# test_checksum_cache.py - Unit test cases for COT.checksum_cache module
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Unit test cases for COT.checksum_cache module."""
+
+import os
+import shutil
+import threading
+
+import mock
+
+from COT.tests import COTTestCase
+from COT.checksum_cache import ChecksumCache, file_key
+from COT.data_validation import file_checksum
+from COT.file_reference import FileOnDisk
+
+
+class TestChecksumCache(COTTestCase):
+    """Test cases for ChecksumCache class."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestChecksumCache, self).setUp()
+        self.path = os.path.join(self.temp_dir, "input.ovf")
+        shutil.copy(self.input_ovf, self.path)
+        self.cache = ChecksumCache(os.path.join(self.temp_dir, "cache",
+                                                "test.sqlite3"))
+
+    def test_default_directory(self):
+        """Cache is under $XDG_CACHE_HOME, or ~/.cache if unset."""
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': '/foo/bar'}):
+            self.assertEqual(ChecksumCache.default_directory(),
+                             os.path.join('/foo/bar', 'cot'))
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': ''}):
+            self.assertEqual(ChecksumCache.default_directory(),
+                             os.path.join(os.path.expanduser('~'),
+                                          '.cache', 'cot'))
+
+    def test_get(self):
+        """The process-wide cache honors the class attributes."""
+        self.assertIsNone(ChecksumCache.get())
+        ChecksumCache.enabled = True
+        with mock.patch.object(ChecksumCache, 'directory', self.temp_dir):
+            self.assertEqual(ChecksumCache.get().path,
+                             os.path.join(self.temp_dir,
+                                          ChecksumCache.FILENAME))
+
+    def test_store_lookup(self):
+        """Store and retrieve a checksum."""
+        key = file_key(self.path)
+        self.assertIsNone(self.cache.lookup(key, 'sha1'))
+        self.cache.store(key, 'sha1', 'abcd')
+        self.assertEqual(self.cache.lookup(key, 'sha1'), 'abcd')
+        self.assertIsNone(self.cache.lookup(key, 'md5'))
+        self.cache.store(key, 'sha1', 'efgh')
+        self.assertEqual(self.cache.lookup(key, 'sha1'), 'efgh')
+        self.assertEqual(self.cache.lookup(file_key(self.input_ovf), 'sha1'),
+                         None)
+
+    def test_file_changed(self):
+        """Entries are invalidated by changes to the file."""
+        key = file_key(self.path)
+        self.cache.store(key, 'sha1', 'abcd')
+        with open(self.path, 'ab') as fileobj:
+            fileobj.write(b"hello")
+        self.assertNotEqual(file_key(self.path), key)
+        self.assertIsNone(self.cache.lookup(file_key(self.path), 'sha1'))
+
+        # Not stored if the file changed after obtaining the key
+        key = file_key(self.path)
+        with open(self.path, 'ab') as fileobj:
+            fileobj.write(b"hello")
+        self.cache.store(key, 'sha1', 'abcd')
+        self.assertIsNone(self.cache.lookup(key, 'sha1'))
+
+    def test_missing_file(self):
+        """No key for a nonexistent file, and nothing is cached."""
+        key = file_key(os.path.join(self.temp_dir, "foo"))
+        self.assertIsNone(key)
+        self.cache.store(key, 'sha1', 'abcd')
+        self.assertIsNone(self.cache.lookup(key, 'sha1'))
+
+    def test_purge(self):
+        """Purge all entries from the cache."""
+        key = file_key(self.path)
+        self.cache.store(key, 'sha1', 'abcd')
+        self.cache.purge()
+        self.assertIsNone(self.cache.lookup(key, 'sha1'))
+
+    def test_unusable(self):
+        """Errors accessing the cache are not fatal."""
+        with open(os.path.join(self.temp_dir, "file"), 'w') as fileobj:
+            fileobj.write("hello")
+        cache = ChecksumCache(os.path.join(self.temp_dir, "file", "x.db"))
+        key = file_key(self.path)
+        cache.store(key, 'sha1', 'abcd')
+        self.assertIsNone(cache.lookup(key, 'sha1'))
+
+    def test_concurrent(self):
+        """Multiple threads can update the cache at once."""
+        paths = []
+        for i in range(8):
+            paths.append(os.path.join(self.temp_dir, "file{0}".format(i)))
+            shutil.copy(self.input_ovf, paths[-1])
+        threads = [threading.Thread(target=self.cache.store,
+                                    args=(file_key(path), 'sha1', path))
+                   for path in paths]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for path in paths:
+            self.assertEqual(self.cache.lookup(file_key(path), 'sha1'), path)
+
+    def test_file_reference(self):
+        """Only the checksums of copies COT wrote are taken from the cache."""
+        ChecksumCache.enabled = True
+        with mock.patch.object(ChecksumCache, 'directory', self.temp_dir):
+            expected = file_checksum(self.path, 'sha1')
+            ref = FileOnDisk(self.temp_dir, "input.ovf",
+                             checksum_algorithm='sha1')
+            self.assertEqual(ref.checksum, expected)
+            cache = ChecksumCache.get()
+            self.assertIsNone(cache.lookup(file_key(self.path), 'sha1'))
+
+            copy_dir = os.path.join(self.temp_dir, "copy")
+            os.mkdir(copy_dir)
+            ref.copy_to(copy_dir)
+            ref.cache_checksums(os.path.join(copy_dir, "input.ovf"))
+
+            with mock.patch("COT.file_reference.file_checksums") as cksum:
+                copy_ref = FileOnDisk(copy_dir, "input.ovf",
+                                      checksum_algorithm='sha1')
+                self.assertEqual(copy_ref.checksum, expected)
+                cksum.assert_not_called()
+
+    def test_verify_uncached(self):
+        """Verification of a file never relies on the cache."""
+        ChecksumCache.enabled = True
+        with mock.patch.object(ChecksumCache, 'directory', self.temp_dir):
+            expected = file_checksum(self.path, 'sha1')
+            ChecksumCache.get().store(file_key(self.path), 'sha1', 'abcd')
+
+            ref = FileOnDisk(self.temp_dir, "input.ovf",
+                             checksum_algorithm='sha1')
+            self.assertEqual(ref.checksum, 'abcd')
+            self.assertTrue(ref.verify_checksum(expected))
+            self.assertEqual(ref.checksum, expected)
+
+            ref = FileOnDisk(self.temp_dir, "input.ovf",
+                             checksum_algorithm='sha1')
+            ref.defer_verification('abcd')
+            self.assertEqual(ref.checksum, expected)
+            self.assertLogged(levelname='ERROR',
+                              msg="The %s checksum for file '%s' is "
+                              "expected to be")
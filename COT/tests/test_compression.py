@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# test_compression.py - Unit test cases for COT.compression module
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Unit test cases for COT.compression module."""
+
+import gzip
+import io
+import os
+
+import mock
+
+from COT.tests import COTTestCase
+from COT.compression import gzip_compress
+
+
+class TestGzipCompress(COTTestCase):
+    """Test cases for gzip_compress function."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestGzipCompress, self).setUp()
+        # A mix of compressible and incompressible data
+        self.data = (b"0123456789abcdef" * 10000 + os.urandom(50000) +
+                     b"\0" * 100000)
+
+    def decompress(self, data):
+        """Decompress the given gzip data with the standard library.
+
+        Args:
+          data (bytes): Compressed data.
+        Returns:
+          bytes: Decompressed data.
+        """
+        with gzip.GzipFile(fileobj=io.BytesIO(data), mode='rb') as obj:
+            return obj.read()
+
+    def test_single_thread(self):
+        """Data compressed by a single thread round-trips."""
+        out = io.BytesIO()
+        sizes = gzip_compress(io.BytesIO(self.data), out.write, workers=1)
+        self.assertEqual(sizes, (len(self.data), len(out.getvalue())))
+        self.assertLess(sizes[1], sizes[0])
+        self.assertEqual(self.decompress(out.getvalue()), self.data)
+
+    def test_multiple_threads(self):
+        """Blocks compressed in parallel form a single valid gzip stream."""
+        out = io.BytesIO()
+        sizes = gzip_compress(io.BytesIO(self.data), out.write, level=9,
+                              workers=3, block_size=4096)
+        self.assertEqual(sizes, (len(self.data), len(out.getvalue())))
+        self.assertEqual(self.decompress(out.getvalue()), self.data)
+
+        # The output (after the header's timestamp) is the same regardless
+        # of how many threads compressed it
+        single = io.BytesIO()
+        gzip_compress(io.BytesIO(self.data), single.write, level=9,
+                      workers=1, block_size=4096)
+        self.assertEqual(out.getvalue()[10:], single.getvalue()[10:])
+
+    def test_empty(self):
+        """An empty file compresses to a valid, empty gzip stream."""
+        out = io.BytesIO()
+        gzip_compress(io.BytesIO(b""), out.write, workers=2)
+        self.assertEqual(self.decompress(out.getvalue()), b"")
+
+    def test_error(self):
+        """Errors while compressing are raised to the caller."""
+        with mock.patch("COT.compression._deflate",
+                        side_effect=MemoryError):
+            self.assertRaises(MemoryError, gzip_compress,
+                              io.BytesIO(self.data), io.BytesIO().write,
+                              workers=2, block_size=4096)
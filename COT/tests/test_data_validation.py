@@ -16,10 +16,11 @@
 
 """Unit test cases for COT.data_validation module."""
 
+import hashlib
 import re
 
 from COT.data_validation import (
-    match_or_die, file_checksum,
+    match_or_die, file_checksum, file_checksums,
     canonicalize_helper, canonicalize_nic_subtype, NIC_TYPES,
     mac_address, device_address, no_whitespace, truth_value,
     validate_int, non_negative_int, positive_int,
@@ -54,6 +55,32 @@ class TestFileChecksum(COTTestCase):
                          "0d25f7544be720ec07d9a7e09516d07b"
                          "a89d2efdc53f8b4c76a8375854d3a578")
 
+    def test_file_checksums(self):
+        """Test case for file_checksums() with several types at once."""
+        with open(self.input_ovf, 'rb') as fileobj:
+            checksums = file_checksums(fileobj, ['md5', 'sha1', 'sha256'])
+        self.assertEqual(sorted(checksums.keys()), ['md5', 'sha1', 'sha256'])
+        self.assertEqual(checksums['md5'], "4e7a3ba0b70f6784a3a91b18336296c7")
+        self.assertEqual(checksums['sha1'],
+                         "c3bd2579c2edc76ea35b5bde7d4f4e41eab08963")
+        self.assertEqual(checksums['sha256'],
+                         file_checksum(self.input_ovf, 'sha256'))
+
+        self.assertEqual(file_checksums(self.input_ovf, []), {})
+        self.assertRaises(NotImplementedError,
+                          file_checksums,
+                          self.input_ovf,
+                          ['sha1', 'crc'])
+
+    def test_file_checksum_remaining(self):
+        """file_checksum() of an open file only hashes the remaining data."""
+        with open(self.input_ovf, 'rb') as fileobj:
+            data = fileobj.read()
+            fileobj.seek(100)
+            checksum = file_checksum(fileobj, 'sha1')
+            self.assertEqual(fileobj.tell(), len(data))
+        self.assertEqual(checksum, hashlib.sha1(data[100:]).hexdigest())
+
     def test_file_checksum_unsupported(self):
         """Test invalid options to file_checksum()."""
         self.assertRaises(NotImplementedError,
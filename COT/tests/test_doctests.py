@@ -32,5 +32,6 @@ def load_tests(*_):
     """
     suite = TestSuite()
     suite.addTests(DocTestSuite('COT.data_validation'))
+    suite.addTests(DocTestSuite('COT.stream_io'))
     suite.addTests(DocTestSuite('COT.utilities'))
     return suite
@@ -16,13 +16,25 @@
 
 """Unit test cases for COT.file_reference classes."""
 
+import filecmp
+import gzip
+import io
+import logging
 import os
+import shutil
 import tarfile
+import threading
 
+import mock
 from pkg_resources import resource_filename
 
 from COT.tests import COTTestCase
-from COT.file_reference import FileReference, FileOnDisk, FileInTAR
+from COT.data_validation import file_checksum
+from COT.file_transfer import TARWriter
+from COT.file_reference import (
+    TransferScheduler, ChunkedFile, FileReference, FileOnDisk, FileInStream,
+    FileInTAR, TARIndex, TARMemberReader, TARStream,
+)
 
 
 class TestFileReference(COTTestCase):
@@ -101,9 +113,153 @@ class TestFileOnDisk(COTTestCase):
 
     def test_copy_to(self):
         """Test the copy_to() API."""
-        FileOnDisk(os.path.dirname(self.input_ovf),
-                   os.path.basename(self.input_ovf)).copy_to(self.temp_dir)
+        ref = FileOnDisk(os.path.dirname(self.input_ovf),
+                         os.path.basename(self.input_ovf))
+        self.assertIsNotNone(ref.copy_to(self.temp_dir))
         self.check_diff("", file2=os.path.join(self.temp_dir, 'input.ovf'))
+        # Already in place
+        self.assertIsNone(FileOnDisk(self.temp_dir,
+                                     'input.ovf').copy_to(self.temp_dir))
+
+    def test_copy_to_symlinked_dir(self):
+        """Copying a file onto itself by way of a symlink is a no-op."""
+        real_dir = os.path.join(self.temp_dir, "real")
+        os.makedirs(real_dir)
+        path = os.path.join(real_dir, "input.ovf")
+        shutil.copy(self.input_ovf, path)
+        link_dir = os.path.join(self.temp_dir, "link")
+        os.symlink(real_dir, link_dir)
+        ref = FileOnDisk(real_dir, "input.ovf")
+        self.assertIsNone(ref.copy_to(link_dir))
+        self.assertIsNone(ref.copy_to(os.path.join(real_dir, "..", "link")))
+        self.check_diff("", file2=path)
+
+    def test_open_payload(self):
+        """Compressed files are transparently decompressed on request."""
+        path = os.path.join(self.temp_dir, "input.ovf")
+        with open(self.input_ovf, 'rb') as src:
+            expected = src.read()
+        with gzip.GzipFile(path, 'wb') as dst:
+            dst.write(expected)
+        ref = FileOnDisk(self.temp_dir, "input.ovf", compression="gzip")
+        self.assertEqual(ref.size, os.path.getsize(path))
+        with ref.open_payload() as obj:
+            self.assertEqual(obj.read(), expected)
+        with ref.open('rb') as obj:
+            self.assertNotEqual(obj.read(), expected)
+
+        ref = FileOnDisk(os.path.dirname(self.input_ovf), "input.ovf",
+                         compression="identity")
+        self.assertIsNone(ref.compression)
+        with ref.open_payload() as obj:
+            self.assertEqual(obj.read(), expected)
+
+        ref.compression = "bzip2"
+        with self.assertRaises(NotImplementedError):
+            with ref.open_payload():
+                pass
+
+    def test_copy_to_hardlink(self):
+        """A read-only file can be hard-linked if so configured."""
+        path = os.path.join(self.temp_dir, "input.ovf")
+        shutil.copy(self.input_ovf, path)
+        os.chmod(path, 0o444)
+        dest_dir = os.path.join(self.temp_dir, "out")
+        os.makedirs(dest_dir)
+        ref = FileOnDisk(self.temp_dir, "input.ovf",
+                         checksum_algorithm='sha1')
+        self.addCleanup(setattr, FileOnDisk, 'copy_strategies',
+                        FileOnDisk.copy_strategies)
+        FileOnDisk.copy_strategies = ('hardlink',)
+        self.assertEqual(ref.copy_to(dest_dir), 'hardlink')
+        self.assertTrue(os.path.samefile(path,
+                                         os.path.join(dest_dir, "input.ovf")))
+        self.assertEqual(ref.checksum, file_checksum(path, 'sha1'))
+
+    def test_checksum_while_copying(self):
+        """The checksum is computed from the data being copied."""
+        ref = FileOnDisk(os.path.dirname(self.input_ovf),
+                         os.path.basename(self.input_ovf),
+                         checksum_algorithm='sha1')
+        with mock.patch("COT.file_reference.file_checksums") as mock_cksum:
+            ref.copy_to(self.temp_dir)
+            self.assertEqual(ref.checksum,
+                             file_checksum(self.input_ovf, 'sha1'))
+            mock_cksum.assert_not_called()
+
+    def test_multiple_checksums(self):
+        """Several types of checksum are computed from a single read."""
+        ref = FileOnDisk(os.path.dirname(self.input_ovf),
+                         os.path.basename(self.input_ovf),
+                         checksum_algorithm='sha1')
+        ref.add_checksum_algorithm('md5')
+        self.assertEqual(ref.checksum_algorithms, set(['sha1', 'md5']))
+        with mock.patch.object(ref, 'open', wraps=ref.open) as mock_open:
+            self.assertEqual(ref.checksum,
+                             file_checksum(self.input_ovf, 'sha1'))
+            self.assertEqual(ref.get_checksum('md5'),
+                             file_checksum(self.input_ovf, 'md5'))
+            self.assertEqual(mock_open.call_count, 1)
+            # Not previously requested, so the file must be read again
+            self.assertEqual(ref.get_checksum('sha256'),
+                             file_checksum(self.input_ovf, 'sha256'))
+            self.assertEqual(mock_open.call_count, 2)
+
+        # All requested checksums are computed while copying
+        ref = FileOnDisk(os.path.dirname(self.input_ovf),
+                         os.path.basename(self.input_ovf),
+                         checksum_algorithm='sha1')
+        ref.add_checksum_algorithm('sha256')
+        with mock.patch("COT.file_reference.file_checksums") as mock_cksum:
+            ref.copy_to(self.temp_dir)
+            self.assertEqual(ref.get_checksum('sha256'),
+                             file_checksum(self.input_ovf, 'sha256'))
+            self.assertEqual(ref.checksum,
+                             file_checksum(self.input_ovf, 'sha1'))
+            mock_cksum.assert_not_called()
+
+        self.assertTrue(ref.verify_checksum(
+            file_checksum(self.input_ovf, 'sha256'), 'sha256'))
+        self.assertFalse(ref.verify_checksum("0" * 64, 'sha256'))
+        self.assertLogged(levelname="ERROR",
+                          msg="The %s checksum for file '%s' is expected.*",
+                          args=('sha256', 'input.ovf', "0" * 64,
+                                file_checksum(self.input_ovf, 'sha256')))
+
+    def test_defer_verification(self):
+        """Deferred verification happens once the checksum is computed."""
+        ref = FileOnDisk(os.path.dirname(self.input_ovf),
+                         os.path.basename(self.input_ovf),
+                         checksum_algorithm='sha1')
+        with mock.patch("COT.file_reference.file_checksums") as mock_cksum:
+            ref.defer_verification("0" * 40)
+            mock_cksum.assert_not_called()
+        self.assertNoLogsOver(logging.INFO)
+
+        ref.copy_to(self.temp_dir)
+        self.assertLogged(levelname="ERROR",
+                          msg="The %s checksum for file '%s' is expected.*")
+        # Only verified once
+        self.assertEqual(ref.checksum, file_checksum(self.input_ovf, 'sha1'))
+
+    def test_refresh(self):
+        """Files are only re-read by refresh() if changed."""
+        path = os.path.join(self.temp_dir, "input.ovf")
+        shutil.copy(self.input_ovf, path)
+        ref = FileOnDisk(self.temp_dir, "input.ovf",
+                         checksum_algorithm='sha1',
+                         expected_checksum=file_checksum(path, 'sha1'))
+        with mock.patch("COT.file_reference.file_checksums") as mock_cksum:
+            self.assertTrue(ref.refresh())
+            self.assertTrue(ref.refresh())
+            mock_cksum.assert_not_called()
+
+        with open(path, 'ab') as fileobj:
+            fileobj.write(b"hello")
+        self.assertFalse(ref.refresh())
+        self.assertEqual(ref.checksum, file_checksum(path, 'sha1'))
+        self.assertLogged(levelname="ERROR",
+                          msg="The %s checksum of file '%s' has changed.*")
 
     def test_add_to_archive(self):
         """Test the add_to_archive() API."""
@@ -115,6 +271,18 @@ class TestFileOnDisk(COTTestCase):
             tarf.extract('input.ovf', self.temp_dir)
         self.check_diff("", file2=os.path.join(self.temp_dir, 'input.ovf'))
 
+    def test_add_to_tar_writer(self):
+        """Test the add_to_archive() API with a TARWriter."""
+        output_tarfile = os.path.join(self.temp_dir, 'test_output.tar')
+        with TARWriter(output_tarfile) as tarf:
+            FileOnDisk(os.path.dirname(self.input_ovf),
+                       os.path.basename(self.input_ovf)).add_to_archive(tarf)
+        with tarfile.open(output_tarfile, 'r') as tarf:
+            self.assertEqual(tarf.getmember('input.ovf').mtime,
+                             int(os.stat(self.input_ovf).st_mtime))
+            tarf.extract('input.ovf', self.temp_dir)
+        self.check_diff("", file2=os.path.join(self.temp_dir, 'input.ovf'))
+
 
 class TestFileInTAR(COTTestCase):
     """Test cases for FileInTAR class."""
@@ -174,6 +342,32 @@ class TestFileInTAR(COTTestCase):
         # obj should be closed now
         self.assertRaises(ValueError, obj.read)
 
+    def test_open_seek(self):
+        """Test random access within a file opened with open()."""
+        with open(resource_filename(__name__, 'sample_cfg.txt'), 'rb') as exp:
+            expected = exp.read()
+        with self.valid_ref.open('rb') as obj:
+            self.assertIsInstance(obj, TARMemberReader)
+            self.assertEqual(obj.read(), expected)
+            self.assertEqual(obj.read(), b'')
+            self.assertEqual(obj.seek(-6, os.SEEK_END), len(expected) - 6)
+            self.assertEqual(obj.read(), expected[-6:])
+            obj.seek(2)
+            buf = bytearray(10)
+            self.assertEqual(obj.readinto(buf), 10)
+            self.assertEqual(bytes(buf), expected[2:12])
+            self.assertEqual(obj.tell(), 12)
+            self.assertRaises(ValueError, obj.seek, -1)
+
+    def test_checksum(self):
+        """Test checksum computation reading directly from the TAR."""
+        ref = FileInTAR(self.tarfile, "sample_cfg.txt",
+                        checksum_algorithm='sha1')
+        self.assertEqual(
+            ref.checksum,
+            file_checksum(resource_filename(__name__, 'sample_cfg.txt'),
+                          'sha1'))
+
     def test_copy_to(self):
         """Test the copy_to() API."""
         self.valid_ref.copy_to(self.temp_dir)
@@ -181,6 +375,26 @@ class TestFileInTAR(COTTestCase):
                         file1=resource_filename(__name__, 'sample_cfg.txt'),
                         file2=os.path.join(self.temp_dir, 'sample_cfg.txt'))
 
+    def test_checksum_while_copying(self):
+        """The checksum is computed from the data being copied."""
+        expected = file_checksum(resource_filename(__name__, 'sample_cfg.txt'),
+                                 'sha256')
+        ref = FileInTAR(self.tarfile, "sample_cfg.txt",
+                        checksum_algorithm='sha256')
+        with mock.patch("COT.file_reference.file_checksums") as mock_cksum:
+            ref.copy_to(self.temp_dir)
+            self.assertEqual(ref.checksum, expected)
+            mock_cksum.assert_not_called()
+
+        ref = FileInTAR(self.tarfile, "sample_cfg.txt",
+                        checksum_algorithm='sha256')
+        output_tarfile = os.path.join(self.temp_dir, 'test_output.tar')
+        with mock.patch("COT.file_reference.file_checksums") as mock_cksum:
+            with TARWriter(output_tarfile) as tarf:
+                ref.add_to_archive(tarf)
+            self.assertEqual(ref.checksum, expected)
+            mock_cksum.assert_not_called()
+
     def test_add_to_archive(self):
         """Test the add_to_archive() API."""
         output_tarfile = os.path.join(self.temp_dir, 'test_output.tar')
@@ -191,3 +405,365 @@ class TestFileInTAR(COTTestCase):
         self.check_diff("",
                         file1=resource_filename(__name__, 'sample_cfg.txt'),
                         file2=os.path.join(self.temp_dir, 'sample_cfg.txt'))
+
+    def test_add_to_tar_writer(self):
+        """Test the add_to_archive() API with a TARWriter."""
+        output_tarfile = os.path.join(self.temp_dir, 'test_output.tar')
+        with TARWriter(output_tarfile) as tarf:
+            self.valid_ref.add_to_archive(tarf)
+            tarf.add(self.input_ovf, 'input.ovf')
+        self.assertEqual(os.stat(output_tarfile).st_size % tarfile.RECORDSIZE,
+                         0)
+        with tarfile.open(output_tarfile, 'r') as tarf:
+            self.assertEqual(tarf.getnames(), ['sample_cfg.txt', 'input.ovf'])
+            self.assertEqual(tarf.getmember('sample_cfg.txt').mtime,
+                             self.valid_ref.member.tarinfo.mtime)
+            tarf.extract('sample_cfg.txt', self.temp_dir)
+        self.check_diff("",
+                        file1=resource_filename(__name__, 'sample_cfg.txt'),
+                        file2=os.path.join(self.temp_dir, 'sample_cfg.txt'))
+
+
+class TestFileInStream(COTTestCase):
+    """Test cases for FileInStream and TARStream classes."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestFileInStream, self).setUp()
+        self.tarfile = resource_filename(__name__, "test.tar")
+        self.sample_cfg = resource_filename(__name__, "sample_cfg.txt")
+        self.fileobj = open(self.tarfile, 'rb')
+        self.stream = TARStream(self.fileobj, self.temp_dir)
+
+    def tearDown(self):
+        """Test case cleanup function called automatically."""
+        self.fileobj.close()
+        super(TestFileInStream, self).tearDown()
+
+    def test_create(self):
+        """FileReference.create() accepts a TARStream as container."""
+        ref = FileReference.create(self.stream, "sample_cfg.txt",
+                                   expected_size=78)
+        self.assertIsInstance(ref, FileInStream)
+        self.assertTrue(ref.exists)
+        self.assertIsNone(ref.file_path)
+        self.assertEqual(ref.size, 78)
+        # Nothing has been read from the stream yet
+        self.assertEqual(self.stream.current.name, "input.mf")
+
+    def test_not_tarfile(self):
+        """Test error handling when the stream is not a TAR archive."""
+        with open(self.input_ovf, 'rb') as fileobj:
+            self.assertRaises(IOError, TARStream, fileobj, self.temp_dir)
+
+    def test_spill(self):
+        """Files needed after the stream has passed them are spilled."""
+        ref = FileInStream(self.stream, "sample_cfg.txt",
+                           checksum_algorithm='sha1')
+        # Reading input.mf first means sample_cfg.txt is spilled
+        mf_ref = FileInStream(self.stream, "input.mf")
+        self.stream.wanted = lambda name: name == "input.mf"
+        ref.copy_to(self.temp_dir)
+        self.assertFalse(self.stream.available("sample_cfg.txt"))
+        self.assertFalse(ref.exists)
+        self.assertRaises(IOError, ref.spill)
+        self.check_diff("", file1=self.sample_cfg,
+                        file2=os.path.join(self.temp_dir, "sample_cfg.txt"))
+        self.assertEqual(ref.checksum, file_checksum(self.sample_cfg, 'sha1'))
+
+        self.assertEqual(mf_ref.file_path,
+                         os.path.join(self.temp_dir, "input.mf"))
+        with mf_ref.open('rb') as obj:
+            self.assertEqual(obj.read(2), b"SH")
+        self.assertEqual(mf_ref.size, 175)
+
+    def test_skip(self):
+        """Files that are no longer wanted are skipped, not spilled."""
+        mf_ref = FileInStream(self.stream, "input.mf")
+        ref = FileInStream(self.stream, "sample_cfg.txt")
+        self.stream.wanted = lambda name: False
+        self.assertEqual(ref.spill(),
+                         os.path.join(self.temp_dir, "sample_cfg.txt"))
+        self.assertTrue(ref.exists)
+        self.assertFalse(mf_ref.exists)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir,
+                                                     "input.mf")))
+        self.assertIsNone(self.stream.current)
+        self.assertRaises(IOError, FileInStream, self.stream, "foo.bar")
+
+    def test_deferred_checksum(self):
+        """An expected checksum is reported until the file is read."""
+        actual = file_checksum(self.sample_cfg, 'sha1')
+        ref = FileInStream(self.stream, "sample_cfg.txt",
+                           checksum_algorithm='sha1')
+        ref.defer_verification("0123")
+        self.assertEqual(ref.checksum, "0123")
+        output_tarfile = os.path.join(self.temp_dir, 'test_output.tar')
+        with TARWriter(output_tarfile) as tarf:
+            ref.add_to_archive(tarf)
+        self.assertLogged(levelname="ERROR",
+                          msg="The %s checksum for file '%s' is expected to"
+                          " be:\n%s\nbut is actually:\n%s\n"
+                          "This file may have been tampered with!",
+                          args=('sha1', 'sample_cfg.txt', "0123", actual))
+        self.assertEqual(ref.checksum, actual)
+        with tarfile.open(output_tarfile, 'r') as tarf:
+            self.assertEqual(tarf.getnames(), ['sample_cfg.txt'])
+            tarf.extract('sample_cfg.txt', self.temp_dir)
+        self.check_diff("", file1=self.sample_cfg,
+                        file2=os.path.join(self.temp_dir, 'sample_cfg.txt'))
+
+
+class TestChunkedFile(COTTestCase):
+    """Test cases for ChunkedFile class."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestChunkedFile, self).setUp()
+        with open(self.input_vmdk, 'rb') as fileobj:
+            self.data = fileobj.read()
+        self.original = FileOnDisk(os.path.dirname(self.input_vmdk),
+                                   os.path.basename(self.input_vmdk),
+                                   checksum_algorithm='sha1')
+        self.chunk_size = len(self.data) // 3 + 1
+
+    def test_split(self):
+        """Split a file into chunks and read it back as a whole."""
+        chunked = ChunkedFile.split(self.original, self.chunk_size)
+        self.assertEqual([chunk.filename for chunk in chunked.chunks],
+                         ["input.vmdk.000000000", "input.vmdk.000000001",
+                          "input.vmdk.000000002"])
+        self.assertEqual(chunked.size, len(self.data))
+        self.assertEqual(chunked.chunks[-1].size,
+                         len(self.data) - 2 * self.chunk_size)
+        with chunked.open('rb') as fileobj:
+            self.assertEqual(fileobj.read(), self.data)
+        self.assertEqual(chunked.chunks[1].checksum,
+                         file_checksum(
+                             io.BytesIO(self.data[self.chunk_size:
+                                                  2 * self.chunk_size]),
+                             'sha1'))
+
+    def test_copy_to(self):
+        """Copy chunks to a directory and read them back."""
+        ChunkedFile.split(self.original, self.chunk_size).copy_to(
+            self.temp_dir)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)),
+                         ["input.vmdk.000000000", "input.vmdk.000000001",
+                          "input.vmdk.000000002"])
+        chunked = ChunkedFile(self.temp_dir, "input.vmdk", self.chunk_size)
+        self.assertEqual(len(chunked.chunks), 3)
+        with chunked.open('rb') as fileobj:
+            self.assertEqual(fileobj.read(), self.data)
+
+        # Missing chunks are detected if the size is known
+        os.remove(os.path.join(self.temp_dir, "input.vmdk.000000002"))
+        self.assertRaises(IOError, ChunkedFile, self.temp_dir, "input.vmdk",
+                          self.chunk_size, expected_size=len(self.data))
+
+    def test_add_to_tar_writer(self):
+        """Chunks are added to an archive, and can be read from it."""
+        output_tarfile = os.path.join(self.temp_dir, 'test_output.tar')
+        with TARWriter(output_tarfile) as tarf:
+            ChunkedFile.split(self.original,
+                              self.chunk_size).add_to_archive(tarf)
+        chunked = ChunkedFile(output_tarfile, "input.vmdk", self.chunk_size,
+                              expected_size=len(self.data))
+        self.assertTrue(all(isinstance(chunk, FileInTAR)
+                            for chunk in chunked.chunks))
+        with chunked.open('rb') as fileobj:
+            self.assertEqual(fileobj.read(), self.data)
+
+
+class TestTARIndex(COTTestCase):
+    """Test cases for TARIndex class."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestTARIndex, self).setUp()
+        self.tarfile = os.path.join(self.temp_dir, "test.tar")
+        shutil.copy(resource_filename(__name__, "test.tar"), self.tarfile)
+
+    def test_members(self):
+        """Test that the index agrees with the tarfile module."""
+        index = TARIndex.get(self.tarfile)
+        self.assertEqual(index.names, ['input.mf', 'sample_cfg.txt'])
+        with tarfile.open(self.tarfile, 'r') as tarf:
+            for tarinfo in tarf.getmembers():
+                member = index.lookup(tarinfo.name)
+                self.assertEqual(member.header_offset, tarinfo.offset)
+                self.assertEqual(member.data_offset, tarinfo.offset_data)
+                self.assertEqual(member.size, tarinfo.size)
+                self.assertEqual(member.mode, tarinfo.mode)
+        self.assertEqual(index.lookup('./sample_cfg.txt').name,
+                         'sample_cfg.txt')
+        self.assertEqual(index.lookup('foo.bar'), None)
+
+    def test_shared(self):
+        """Test that the same index is reused until the archive changes."""
+        index = TARIndex.get(self.tarfile)
+        self.assertIs(index, TARIndex.get(self.tarfile))
+        self.assertEqual(FileInTAR(self.tarfile, "sample_cfg.txt").member,
+                         index.lookup("sample_cfg.txt"))
+
+        with tarfile.open(self.tarfile, 'a') as tarf:
+            tarf.add(self.input_ovf, 'input.ovf')
+        new_index = TARIndex.get(self.tarfile)
+        self.assertIsNot(index, new_index)
+        self.assertEqual(new_index.names,
+                         ['input.mf', 'sample_cfg.txt', 'input.ovf'])
+
+    def test_invalidate(self):
+        """Test explicit invalidation of a cached index."""
+        index = TARIndex.get(self.tarfile)
+        TARIndex.invalidate(self.tarfile)
+        self.assertIsNot(index, TARIndex.get(self.tarfile))
+
+    def test_not_tarfile(self):
+        """Test error handling when file is not a TAR file."""
+        self.assertRaises(tarfile.TarError, TARIndex.get, self.input_ovf)
+
+
+class TestTransferScheduler(COTTestCase):
+    """Test cases for TransferScheduler class."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestTransferScheduler, self).setUp()
+        self.refs = [FileOnDisk(os.path.dirname(path), os.path.basename(path),
+                                checksum_algorithm='sha1')
+                     for path in [self.input_ovf, self.input_iso,
+                                  self.input_vmdk, self.sample_cfg,
+                                  self.minimal_ovf, self.iosv_ovf]]
+
+    def test_map(self):
+        """Results are returned in order."""
+        results = TransferScheduler(max_workers=4).map(
+            lambda ref: ref.checksum, self.refs)
+        self.assertEqual(results, [file_checksum(ref.file_path, 'sha1')
+                                   for ref in self.refs])
+
+    def track_concurrency(self, limit):
+        """Make a function that records how many calls overlap.
+
+        Each call waits (briefly) until ``limit`` calls are running at once,
+        so that the maximum recorded is deterministic rather than depending
+        on thread timing.
+
+        Args:
+          limit (int): Number of concurrent calls expected.
+
+        Returns:
+          tuple: (function, list whose second element is the maximum
+          number of concurrent calls seen)
+        """
+        lock = threading.Lock()
+        reached = threading.Event()
+        active = [0, 0]
+
+        def func(ref):
+            """Track the maximum number of concurrent calls."""
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+                if active[0] >= limit:
+                    reached.set()
+            reached.wait(5)
+            with lock:
+                active[0] -= 1
+            return ref.filename
+
+        return func, active
+
+    def test_per_device(self):
+        """Concurrency is limited per device."""
+        func, active = self.track_concurrency(2)
+        results = TransferScheduler(max_workers=6, per_device=2).map(
+            func, self.refs)
+        self.assertEqual(results, [ref.filename for ref in self.refs])
+        self.assertEqual(active[1], 2)
+
+    def test_error(self):
+        """Exceptions are propagated to the caller."""
+        def func(ref):
+            """Fail on one particular file."""
+            if ref.filename == 'input.iso':
+                raise IOError("oops")
+            return ref.filename
+
+        self.assertRaises(IOError,
+                          TransferScheduler(max_workers=3).map,
+                          func, self.refs)
+
+    def test_reentrant(self):
+        """One scheduler can be used by several threads at once."""
+        scheduler = TransferScheduler(max_workers=3)
+        results = {}
+
+        def run(name):
+            """Map over the files from a separate thread."""
+            results[name] = scheduler.map(
+                lambda ref: (name, ref.filename), self.refs)
+
+        threads = [threading.Thread(target=run, args=(name,))
+                   for name in ("a", "b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for name in ("a", "b"):
+            self.assertEqual(results[name], [(name, ref.filename)
+                                             for ref in self.refs])
+
+    def test_nested(self):
+        """Work scheduled from a worker runs inline in that worker."""
+        scheduler = TransferScheduler(max_workers=3)
+        threads = set()
+
+        def inner(ref):
+            """Record the thread doing the work."""
+            threads.add(threading.current_thread())
+            return ref.filename
+
+        def outer(ref):
+            """Schedule more work from within a worker."""
+            this_thread = threading.current_thread()
+            self.assertEqual(scheduler.map(inner, self.refs[:3]),
+                             [ref.filename for ref in self.refs[:3]])
+            return this_thread
+
+        outer_threads = set(scheduler.map(outer, self.refs))
+        self.assertEqual(threads, outer_threads)
+        self.assertLessEqual(len(threads), 3)
+
+    def test_per_destination_device(self):
+        """Concurrency is also limited per destination device."""
+        func, active = self.track_concurrency(2)
+        # Each source file on its own device, but all copied to one device
+        devices = dict((id(ref), index) for index, ref in enumerate(self.refs))
+        with mock.patch.object(TransferScheduler, '_device',
+                               side_effect=lambda ref: devices[id(ref)]):
+            TransferScheduler(max_workers=6, per_device=2).map(
+                func, self.refs, dest_dir=self.temp_dir)
+        self.assertEqual(active[1], 2)
+
+    def test_copy_all(self):
+        """Files in one archive are extracted together in a single pass."""
+        tar_path = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(tar_path, 'w') as tarf:
+            for path in [self.input_ovf, self.input_vmdk, self.input_iso]:
+                tarf.add(path, os.path.basename(path))
+        refs = [FileInTAR(tar_path, "input.iso"), self.refs[3],
+                FileInTAR(tar_path, "input.vmdk")]
+        dest_dir = os.path.join(self.temp_dir, "out")
+        os.makedirs(dest_dir)
+        with mock.patch.object(FileInTAR, 'extract_all',
+                               wraps=FileInTAR.extract_all) as extract_all:
+            results = TransferScheduler(max_workers=4).copy_all(refs,
+                                                                dest_dir)
+        extract_all.assert_called_once_with([refs[0], refs[2]], dest_dir)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(results))
+        for path in [self.input_iso, self.sample_cfg, self.input_vmdk]:
+            self.assertTrue(filecmp.cmp(path, os.path.join(
+                dest_dir, os.path.basename(path)), shallow=False))
@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+#
+# test_file_transfer.py - Unit test cases for COT.file_transfer module
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Unit test cases for COT.file_transfer module."""
+
+import errno
+import hashlib
+import io
+import os
+import shutil
+import tarfile
+import threading
+
+import mock
+
+from COT.tests import COTTestCase
+from COT.data_validation import ValueUnsupportedError
+from COT.file_transfer import (
+    copy_file, copy_range, parse_copy_strategies, TARLayout,
+    TARWriter, COPY_HARDLINK, COPY_REFLINK,
+)
+
+
+class TestFileTransfer(COTTestCase):
+    """Test cases for COT.file_transfer module."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestFileTransfer, self).setUp()
+        self.path = os.path.join(self.temp_dir, "data.bin")
+        with open(self.path, 'wb') as fileobj:
+            fileobj.write(bytearray(range(256)) * 16)
+
+    def read(self):
+        """Get the current contents of the test file."""
+        with open(self.path, 'rb') as fileobj:
+            return fileobj.read()
+
+    def test_copy_range(self):
+        """Copy a range of bytes within a file."""
+        original = self.read()
+        with open(self.path, 'r+b') as fileobj:
+            copy_range(fileobj.fileno(), 0, fileobj.fileno(), 4096, 100)
+        self.assertEqual(self.read(), original + original[:100])
+
+    def test_copy_range_fallback(self):
+        """Fall back to a userspace copy if the kernel refuses."""
+        if not hasattr(os, 'copy_file_range'):
+            self.skipTest("os.copy_file_range not available")
+        original = self.read()
+        with mock.patch("os.copy_file_range",
+                        side_effect=OSError(errno.EXDEV, "Cross-device")):
+            with open(self.path, 'r+b') as fileobj:
+                copy_range(fileobj.fileno(), 10, fileobj.fileno(), 4096, 20)
+        self.assertEqual(self.read(), original + original[10:30])
+
+    def test_copy_range_hash(self):
+        """Hash the data while copying it."""
+        original = self.read()
+        dest = os.path.join(self.temp_dir, "dest.bin")
+        hash_obj = hashlib.sha1()
+        with open(self.path, 'rb') as src, open(dest, 'wb') as dst:
+            copy_range(src.fileno(), 0, dst.fileno(), 0, len(original),
+                       hash_obj=hash_obj)
+        with open(dest, 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), original)
+        self.assertEqual(hash_obj.hexdigest(),
+                         hashlib.sha1(original).hexdigest())
+
+    def test_copy_range_eof(self):
+        """Copying past the end of the source is an error."""
+        dest = os.path.join(self.temp_dir, "dest.bin")
+        with open(self.path, 'rb') as src, open(dest, 'wb') as dst:
+            self.assertRaises(EOFError, copy_range,
+                              src.fileno(), 4000, dst.fileno(), 0, 200)
+
+    def test_copy_range_sendfile(self):
+        """Use sendfile if copy_file_range is unavailable."""
+        if not hasattr(os, 'sendfile'):
+            self.skipTest("os.sendfile not available")
+        original = self.read()
+        dest = os.path.join(self.temp_dir, "dest.bin")
+        with mock.patch("os.copy_file_range", create=True,
+                        side_effect=OSError(errno.ENOSYS, "Not supported")):
+            with mock.patch("COT.file_transfer._copy_range_userspace") as usr:
+                with open(self.path, 'rb') as src, open(dest, 'wb') as dst:
+                    dst.write(b'x' * 10)
+                    dst.flush()
+                    copy_range(src.fileno(), 100, dst.fileno(), 10, 1000)
+                usr.assert_not_called()
+        with open(dest, 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), b'x' * 10 + original[100:1100])
+
+    def make_sparse_file(self):
+        """Create a file with some data surrounded by holes.
+
+        Returns:
+          str: Path to the file.
+        """
+        path = os.path.join(self.temp_dir, "sparse.img")
+        with open(path, 'wb') as fileobj:
+            fileobj.write(os.urandom(65536))
+            fileobj.seek(4 * 1024 * 1024)
+            fileobj.write(os.urandom(65536))
+            fileobj.truncate(8 * 1024 * 1024)
+        return path
+
+    def test_copy_range_sparse(self):
+        """Holes in the source are skipped, but hashed as zeros."""
+        path = self.make_sparse_file()
+        with open(path, 'rb') as fileobj:
+            original = fileobj.read()
+        dest = os.path.join(self.temp_dir, "dest.img")
+        hash_obj = hashlib.sha1()
+        with open(path, 'rb') as src, open(dest, 'wb') as dst:
+            src.seek(1234)
+            copy_range(src.fileno(), 0, dst.fileno(), 0, len(original),
+                       hash_obj=hash_obj, sparse=True)
+            # The file position of the source is untouched
+            self.assertEqual(os.lseek(src.fileno(), 0, os.SEEK_CUR), 1234)
+        with open(dest, 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), original)
+        self.assertEqual(hash_obj.hexdigest(),
+                         hashlib.sha1(original).hexdigest())
+        if os.stat(path).st_blocks * 512 < len(original):
+            # The file system supports holes, so dest should have them too
+            self.assertLess(os.stat(dest).st_blocks * 512,
+                            1024 * 1024)
+
+        with open(path, 'rb') as src, open(dest, 'wb') as dst:
+            self.assertRaises(EOFError, copy_range, src.fileno(), 0,
+                              dst.fileno(), 0, len(original) + 10,
+                              sparse=True)
+
+    def test_copy_range_sparse_unsupported(self):
+        """If holes can't be found, everything is copied as data."""
+        path = self.make_sparse_file()
+        with open(path, 'rb') as fileobj:
+            original = fileobj.read()
+        dest = os.path.join(self.temp_dir, "dest.img")
+        with mock.patch("os.lseek",
+                        side_effect=OSError(errno.EINVAL, "Invalid")):
+            with open(path, 'rb') as src, open(dest, 'wb') as dst:
+                copy_range(src.fileno(), 0, dst.fileno(), 0, len(original),
+                           sparse=True)
+        with open(dest, 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), original)
+
+    def test_copy_file(self):
+        """Copy a file with each strategy, falling back as needed."""
+        src = os.path.join(self.temp_dir, "src.img")
+        data = os.urandom(100000)
+        with open(src, 'wb') as fileobj:
+            fileobj.write(data)
+        dest = os.path.join(self.temp_dir, "dest.img")
+        expected = hashlib.sha256(data).hexdigest()
+
+        for strategies in [(), (COPY_REFLINK,), (COPY_HARDLINK,),
+                           (COPY_HARDLINK, COPY_REFLINK)]:
+            hash_obj = hashlib.sha256()
+            method = copy_file(src, dest, strategies, hash_obj=hash_obj)
+            # Not read-only, so never hard-linked
+            self.assertNotEqual(method, COPY_HARDLINK)
+            if method != COPY_REFLINK:
+                self.assertIn(method, ["copy_file_range", "sendfile",
+                                       "userspace"])
+            self.assertFalse(os.path.samefile(src, dest))
+            with open(dest, 'rb') as fileobj:
+                self.assertEqual(fileobj.read(), data)
+            self.assertEqual(hash_obj.hexdigest(), expected)
+
+        self.assertRaises(ValueError, copy_file, src, dest, ["symlink"])
+
+    def test_copy_file_reflink_unsupported(self):
+        """If cloning fails, the data is copied instead."""
+        src = os.path.join(self.temp_dir, "src.img")
+        with open(src, 'wb') as fileobj:
+            fileobj.write(b"hello")
+        dest = os.path.join(self.temp_dir, "dest.img")
+        with mock.patch("fcntl.ioctl",
+                        side_effect=IOError(errno.EOPNOTSUPP, "Unsupported")):
+            self.assertNotEqual(copy_file(src, dest, [COPY_REFLINK]),
+                                COPY_REFLINK)
+        with open(dest, 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), b"hello")
+
+    def test_copy_file_hardlink(self):
+        """A read-only file may be hard-linked instead of copied."""
+        src = os.path.join(self.temp_dir, "src.img")
+        with open(src, 'wb') as fileobj:
+            fileobj.write(b"hello")
+        os.chmod(src, 0o444)
+        dest = os.path.join(self.temp_dir, "dest.img")
+        hash_obj = hashlib.sha1()
+        self.assertEqual(copy_file(src, dest, [COPY_HARDLINK], hash_obj),
+                         COPY_HARDLINK)
+        self.assertTrue(os.path.samefile(src, dest))
+        self.assertEqual(hash_obj.hexdigest(),
+                         hashlib.sha1(b"hello").hexdigest())
+
+        # Copying onto the source itself fails without touching it
+        link_dir = os.path.join(self.temp_dir, "link")
+        os.symlink(self.temp_dir, link_dir)
+        self.assertRaises(shutil.Error, copy_file,
+                          src, os.path.join(link_dir, "src.img"), [])
+        with open(src, 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), b"hello")
+
+        # Copying again with another strategy doesn't truncate the source
+        copy_file(src, dest, [])
+        self.assertFalse(os.path.samefile(src, dest))
+        with open(src, 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), b"hello")
+        with open(dest, 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), b"hello")
+
+    def test_parse_copy_strategies(self):
+        """Parse copy strategies given on the CLI."""
+        self.assertEqual(parse_copy_strategies("reflink"), (COPY_REFLINK,))
+        self.assertEqual(parse_copy_strategies(" Hardlink, reflink"),
+                         (COPY_HARDLINK, COPY_REFLINK))
+        self.assertEqual(parse_copy_strategies("none"), ())
+        self.assertRaises(ValueUnsupportedError,
+                          parse_copy_strategies, "reflink,symlink")
+
+
+class TestTARWriter(COTTestCase):
+    """Test cases for TARWriter class."""
+
+    def test_write(self):
+        """Write a TAR file and read it back with tarfile."""
+        tar_path = os.path.join(self.temp_dir, "out.tar")
+        with TARWriter(tar_path) as tarw:
+            tarw.add(self.input_ovf, "input.ovf")
+            tarw.add(self.input_vmdk, "input.vmdk")
+        with tarfile.open(tar_path, 'r') as tarf:
+            self.assertEqual(tarf.getnames(), ["input.ovf", "input.vmdk"])
+            with open(self.input_vmdk, 'rb') as fileobj:
+                self.assertEqual(tarf.extractfile("input.vmdk").read(),
+                                 fileobj.read())
+        self.assertEqual(os.stat(tar_path).st_size % tarfile.RECORDSIZE, 0)
+
+    def test_write_error(self):
+        """The archive is not finalized if an error occurs."""
+        tar_path = os.path.join(self.temp_dir, "out.tar")
+        with self.assertRaises(ValueError):
+            with TARWriter(tar_path) as tarw:
+                tarw.add(self.input_ovf, "input.ovf")
+                tarw.add(self.temp_dir, "foo")
+        self.assertEqual(os.stat(tar_path).st_size % tarfile.BLOCKSIZE, 0)
+        self.assertNotEqual(os.stat(tar_path).st_size % tarfile.RECORDSIZE, 0)
+
+    def test_reserve(self):
+        """Reserve space for a file and fill it in later."""
+        tar_path = os.path.join(self.temp_dir, "out.tar")
+        with TARWriter(tar_path) as tarw:
+            offset = tarw.reserve("later.txt", 5)
+            tarw.add(self.input_ovf, "input.ovf")
+            tarw.fill(offset, b"hello")
+        with tarfile.open(tar_path, 'r') as tarf:
+            self.assertEqual(tarf.getnames(), ["later.txt", "input.ovf"])
+            self.assertEqual(tarf.extractfile("later.txt").read(), b"hello")
+
+    def test_fill_range(self):
+        """Fill several reserved spaces with file data concurrently."""
+        path = os.path.join(self.temp_dir, "data.bin")
+        data = os.urandom(100000)
+        with open(path, 'wb') as fileobj:
+            fileobj.write(data)
+        tar_path = os.path.join(self.temp_dir, "out.tar")
+        with TARWriter(tar_path) as tarw, open(path, 'rb') as src:
+            offsets = [tarw.reserve("part{0}".format(i), 40000)
+                       for i in range(2)]
+            offsets.append(tarw.reserve("part2", 20000))
+            # Reserved space is left as a hole until filled
+            self.assertLess(os.fstat(tarw.fd).st_blocks * 512, 100000)
+            hash_obj = hashlib.sha1()
+            threads = [threading.Thread(target=tarw.fill_range,
+                                        args=(offset, src.fileno(),
+                                              i * 40000,
+                                              min(40000, 100000 - i * 40000)),
+                                        kwargs={'hash_obj': (hash_obj if
+                                                             i == 1 else
+                                                             None)})
+                       for i, offset in enumerate(offsets)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(hash_obj.hexdigest(),
+                         hashlib.sha1(data[40000:80000]).hexdigest())
+        with tarfile.open(tar_path, 'r') as tarf:
+            self.assertEqual(tarf.getnames(), ["part0", "part1", "part2"])
+            self.assertEqual(b"".join(tarf.extractfile(name).read()
+                                      for name in tarf.getnames()), data)
+
+    def test_layout(self):
+        """The planned layout of an archive matches what is written."""
+        long_name = "x" * 150 + ".txt"
+        layout = TARLayout()
+        layout.add("input.ovf", os.path.getsize(self.input_ovf))
+        layout.add(long_name, 5)
+        layout.add("input.vmdk", os.path.getsize(self.input_vmdk))
+        tar_path = os.path.join(self.temp_dir, "out.tar")
+        with TARWriter(tar_path) as tarw:
+            tarw.add(self.input_ovf, "input.ovf")
+            tarw.add_data(long_name, b"hello")
+            tarw.add(self.input_vmdk, "input.vmdk")
+        self.assertEqual(os.path.getsize(tar_path), layout.size)
+        with tarfile.open(tar_path, 'r') as tarf:
+            self.assertEqual(
+                [(name, data_offset, size)
+                 for (name, _, data_offset, size) in layout.entries],
+                [(member.name, member.offset_data, member.size)
+                 for member in tarf.getmembers()])
+        # The long name needs an extended header
+        self.assertGreater(layout.entries[2][1] - layout.entries[1][1], 1024)
+
+    def test_preallocate(self):
+        """Space for the whole archive can be allocated up front."""
+        layout = TARLayout()
+        layout.add("a.txt", 5000)
+        layout.add("b.img", 20000)
+        tar_path = os.path.join(self.temp_dir, "out.tar")
+        with mock.patch("os.posix_fallocate", create=True) as fallocate:
+            with TARWriter(tar_path) as tarw:
+                tarw.preallocate(layout, skip=set(["b.img"]))
+            fallocate.assert_has_calls([
+                mock.call(mock.ANY, 0, layout.entries[1][2]),
+                mock.call(mock.ANY, layout.entries[1][2] + 20000,
+                          layout.size - layout.entries[1][2] - 20000),
+            ])
+
+            # Lack of space is reported...
+            fallocate.side_effect = OSError(errno.ENOSPC, "No space")
+            with TARWriter(tar_path) as tarw:
+                self.assertRaises(OSError, tarw.preallocate, layout)
+            # ...but lack of support is not
+            fallocate.side_effect = OSError(errno.EOPNOTSUPP, "Unsupported")
+            with TARWriter(tar_path) as tarw:
+                tarw.preallocate(layout)
+            fallocate.reset_mock()
+            with TARWriter(io.BytesIO()) as tarw:
+                tarw.preallocate(layout)
+            fallocate.assert_not_called()
+
+    def test_preallocate_excess(self):
+        """Space allocated beyond what is actually written is released."""
+        layout = TARLayout()
+        layout.add("a.txt", 50000)
+        tar_path = os.path.join(self.temp_dir, "out.tar")
+        with TARWriter(tar_path) as tarw:
+            tarw.preallocate(layout)
+            tarw.add_data("a.txt", b"hello")
+        self.assertLess(tarw.offset, layout.size)
+        self.assertEqual(os.path.getsize(tar_path), tarw.offset)
+        with tarfile.open(tar_path, 'r') as tarf:
+            self.assertEqual(tarf.extractfile("a.txt").read(), b"hello")
+
+    def check_stream(self, data):
+        """Check the given TAR data against the expected contents."""
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r') as tarf:
+            self.assertEqual(tarf.getnames(),
+                             ["input.ovf", "input.mf", "input.vmdk"])
+            self.assertEqual(tarf.extractfile("input.mf").read(), b"hello")
+            with open(self.input_vmdk, 'rb') as fileobj:
+                self.assertEqual(tarf.extractfile("input.vmdk").read(),
+                                 fileobj.read())
+        self.assertEqual(len(data) % tarfile.RECORDSIZE, 0)
+
+    def write_stream(self, stream):
+        """Write a TAR archive to the given stream."""
+        with TARWriter(stream) as tarw:
+            self.write_stream_contents(tarw)
+
+    def write_stream_contents(self, tarw):
+        """Write the contents of a TAR archive to a sequential TARWriter."""
+        self.assertTrue(tarw.sequential)
+        self.assertRaises(ValueError, tarw.reserve, "input.mf", 5)
+        tarw.add(self.input_ovf, "input.ovf")
+        tarw.add_data("input.mf", b"hello")
+        tarw.add(self.input_vmdk, "input.vmdk")
+
+    def test_write_sequential_path(self):
+        """Write a TAR file strictly sequentially to a path."""
+        tar_path = os.path.join(self.temp_dir, "out.tar")
+        with TARWriter(tar_path, sequential=True) as tarw:
+            self.write_stream_contents(tarw)
+        self.assertEqual(tarw.path, tar_path)
+        with open(tar_path, 'rb') as fileobj:
+            self.check_stream(fileobj.read())
+
+    def test_write_sparse(self):
+        """Holes in files added to the archive are preserved."""
+        path = os.path.join(self.temp_dir, "sparse.img")
+        with open(path, 'wb') as fileobj:
+            fileobj.write(b'x' * 1000)
+            fileobj.truncate(4 * 1024 * 1024)
+        output_tarfile = os.path.join(self.temp_dir, 'test_output.tar')
+        with TARWriter(output_tarfile) as tarw:
+            tarw.add(path, "sparse.img")
+            tarw.add(self.input_ovf, "input.ovf")
+        with tarfile.open(output_tarfile, 'r') as tarf:
+            self.assertEqual(tarf.getnames(), ["sparse.img", "input.ovf"])
+            self.assertEqual(tarf.extractfile("sparse.img").read(),
+                             b'x' * 1000 + b'\0' * (4 * 1024 * 1024 - 1000))
+        if os.stat(path).st_blocks * 512 < 4 * 1024 * 1024:
+            self.assertLess(os.stat(output_tarfile).st_blocks * 512,
+                            1024 * 1024)
+
+    def test_write_stream(self):
+        """Write a TAR archive to a stream with no file descriptor."""
+        stream = io.BytesIO()
+        self.write_stream(stream)
+        self.assertFalse(stream.closed)
+        self.check_stream(stream.getvalue())
+
+    def test_add_fileobj(self):
+        """Add a file whose data can only be read sequentially."""
+        output_tarfile = os.path.join(self.temp_dir, 'test_output.tar')
+        with open(self.input_vmdk, 'rb') as src:
+            with TARWriter(output_tarfile) as tarw:
+                tarw.add_fileobj("input.vmdk", src,
+                                 os.path.getsize(self.input_vmdk))
+        with tarfile.open(output_tarfile, 'r') as tarf:
+            with open(self.input_vmdk, 'rb') as fileobj:
+                self.assertEqual(tarf.extractfile("input.vmdk").read(),
+                                 fileobj.read())
+
+        with TARWriter(output_tarfile) as tarw:
+            self.assertRaises(EOFError, tarw.add_fileobj, "input.mf",
+                              io.BytesIO(b"hello"), 10)
+
+    def test_write_pipe(self):
+        """Write a TAR archive sequentially to a pipe."""
+        read_fd, write_fd = os.pipe()
+        chunks = []
+
+        def reader():
+            """Drain the pipe."""
+            with io.open(read_fd, 'rb') as fileobj:
+                chunks.append(fileobj.read())
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        with io.open(write_fd, 'wb') as fileobj:
+            self.write_stream(fileobj)
+        thread.join()
+        self.check_stream(chunks[0])
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+#
+# test_stream_io.py - Unit test cases for COT.stream_io module
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Unit test cases for COT.stream_io module."""
+
+import errno
+import io
+import os
+import threading
+
+import mock
+
+from COT.tests import COTTestCase
+from COT.stream_io import (
+    SequentialReader, drop_cache, fadvise, read_ahead,
+)
+
+
+class TestSequentialReader(COTTestCase):
+    """Test cases for SequentialReader class."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestSequentialReader, self).setUp()
+        for attr in ('buffer_size', 'readahead', 'drop_behind',
+                     'drop_behind_min_size', 'direct', 'pipeline_depth'):
+            self.addCleanup(setattr, SequentialReader, attr,
+                            getattr(SequentialReader, attr))
+        SequentialReader.buffer_size = 4096
+        self.data = os.urandom(100000)
+        self.path = os.path.join(self.temp_dir, "data.bin")
+        with open(self.path, 'wb') as fileobj:
+            fileobj.write(self.data)
+        self.fd = os.open(self.path, os.O_RDONLY)
+        self.addCleanup(os.close, self.fd)
+
+    def read(self, offset=0, count=None, path=None):
+        """Read a range of the test file by iterating over a reader.
+
+        Returns:
+          bytes: Data read.
+        """
+        with SequentialReader(self.fd, offset, count, path=path) as reader:
+            return b"".join(bytes(data) for data in reader)
+
+    def test_read_range(self):
+        """Read all or part of a file."""
+        self.assertEqual(self.read(), self.data)
+        self.assertEqual(self.read(1000), self.data[1000:])
+        self.assertEqual(self.read(1000, 5000), self.data[1000:6000])
+        self.assertEqual(self.read(len(self.data)), b"")
+        # Reading past the end of the file just stops early
+        with SequentialReader(self.fd, 99000, 5000) as reader:
+            buf = bytearray(10000)
+            self.assertEqual(reader.readinto(buf), 1000)
+            self.assertEqual(reader.readinto(buf), 0)
+            self.assertEqual(reader.remaining, 4000)
+        # The file position is untouched
+        self.assertEqual(os.lseek(self.fd, 0, os.SEEK_CUR), 0)
+
+    def test_advice(self):
+        """The kernel is told how the data is read and when it's done with."""
+        SequentialReader.readahead = 16384
+        SequentialReader.drop_behind_min_size = 0
+        with mock.patch('os.posix_fadvise') as mock_fadvise:
+            self.assertEqual(self.read(1000, 50000),
+                             self.data[1000:51000])
+        calls = [call[0] for call in mock_fadvise.call_args_list]
+        self.assertEqual(calls[0],
+                         (self.fd, 1000, 50000, os.POSIX_FADV_SEQUENTIAL))
+        willneed = [(offset, length) for (_, offset, length, advice) in calls
+                    if advice == os.POSIX_FADV_WILLNEED]
+        dontneed = [(offset, length) for (_, offset, length, advice) in calls
+                    if advice == os.POSIX_FADV_DONTNEED]
+        # The prefetched windows are contiguous and cover the whole range
+        self.assertEqual(willneed[0][0], 1000)
+        for (offset, length), (next_offset, _) in zip(willneed,
+                                                      willneed[1:]):
+            self.assertEqual(offset + length, next_offset)
+        self.assertEqual(sum(length for _, length in willneed), 50000)
+        # As do the dropped pages
+        self.assertEqual(dontneed[0][0], 1000)
+        self.assertEqual(sum(length for _, length in dontneed), 50000)
+
+    def test_keep_page_cache(self):
+        """Small files, or any if so configured, are left in the cache."""
+        with mock.patch('os.posix_fadvise') as mock_fadvise:
+            self.read()
+            SequentialReader.drop_behind_min_size = 0
+            SequentialReader.drop_behind = False
+            self.read()
+            self.assertFalse(drop_cache(self.fd, 0, len(self.data)))
+        for call in mock_fadvise.call_args_list:
+            self.assertNotEqual(call[0][3], os.POSIX_FADV_DONTNEED)
+
+    def test_fadvise_unsupported(self):
+        """Advice is skipped where unsupported, but other errors are raised."""
+        with mock.patch('os.posix_fadvise',
+                        side_effect=OSError(errno.ESPIPE, "Illegal seek")):
+            self.assertFalse(fadvise(self.fd, 0, 0, "SEQUENTIAL"))
+            self.assertEqual(self.read(), self.data)
+        with mock.patch('os.posix_fadvise',
+                        side_effect=OSError(errno.EBADF, "Bad fd")):
+            self.assertRaises(OSError, fadvise, self.fd, 0, 0, "SEQUENTIAL")
+
+    def test_direct(self):
+        """Direct I/O reads the same data, from any offset."""
+        SequentialReader.direct = True
+        self.assertEqual(self.read(), self.data)
+        self.assertEqual(self.read(path=self.path), self.data)
+        self.assertEqual(self.read(1000, 50000), self.data[1000:51000])
+        with SequentialReader(self.fd, 10) as reader:
+            # Any buffer will do, aligned or not
+            buf = bytearray(5000)
+            data = b""
+            while True:
+                count = reader.readinto(buf)
+                if not count:
+                    break
+                data += bytes(buf[:count])
+        self.assertEqual(data, self.data[10:])
+
+    def test_pipeline_depth(self):
+        """Read ahead into any number of buffers, direct or not."""
+        for depth in (1, 2, 8):
+            SequentialReader.pipeline_depth = depth
+            for direct in (False, True):
+                SequentialReader.direct = direct
+                self.assertEqual(self.read(10, 90000), self.data[10:90010])
+
+    def test_direct_fallback(self):
+        """If direct I/O fails, reads fall back to the page cache."""
+        SequentialReader.direct = True
+        real_preadv = os.preadv
+        direct_fds = []
+
+        def fake_preadv(fd, buffers, offset):
+            """Fail any read other than from the file itself."""
+            if fd != self.fd:
+                direct_fds.append(fd)
+                raise OSError(errno.EINVAL, "Invalid argument")
+            return real_preadv(fd, buffers, offset)
+
+        with mock.patch('os.preadv', side_effect=fake_preadv):
+            self.assertEqual(self.read(), self.data)
+        if direct_fds:
+            # Only tried once, and the extra descriptor was closed
+            self.assertEqual(len(direct_fds), 1)
+            self.assertRaises(OSError, os.fstat, direct_fds[0])
+
+
+class TestReadAhead(COTTestCase):
+    """Test cases for read_ahead function."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestReadAhead, self).setUp()
+        self.data = os.urandom(10000)
+
+    def test_read_ahead(self):
+        """All the data is read, in order, with any number of buffers."""
+        for depth in (1, 2, 5):
+            obj = io.BytesIO(self.data)
+            buffers = [bytearray(999) for _ in range(depth)]
+            self.assertEqual(
+                b"".join(bytes(data)
+                         for data in read_ahead(obj.readinto, buffers)),
+                self.data)
+
+    def test_size(self):
+        """Nothing is read past the requested size."""
+        for depth in (1, 3):
+            obj = io.BytesIO(self.data)
+            buffers = [bytearray(1000) for _ in range(depth)]
+            self.assertEqual(
+                b"".join(bytes(data)
+                         for data in read_ahead(obj.readinto, buffers, 2500)),
+                self.data[:2500])
+            self.assertEqual(obj.tell(), 2500)
+
+    def test_overlap(self):
+        """The next buffer is filled while the caller uses the last one."""
+        obj = io.BytesIO(self.data)
+        second_read = threading.Event()
+        calls = []
+
+        def readinto(buf):
+            """Record each read."""
+            calls.append(len(buf))
+            if len(calls) == 2:
+                second_read.set()
+            return obj.readinto(buf)
+
+        buffers = [bytearray(1000) for _ in range(2)]
+        iterator = read_ahead(readinto, buffers)
+        next(iterator)
+        self.assertTrue(second_read.wait(5))
+        iterator.close()
+
+    def test_error(self):
+        """Errors while reading are raised to the caller."""
+        def readinto(buf):
+            """Fail on the second read."""
+            if readinto.calls:
+                raise IOError(errno.EIO, "I/O error")
+            readinto.calls += 1
+            return len(buf)
+        readinto.calls = 0
+
+        threads = threading.active_count()
+        iterator = read_ahead(readinto, [bytearray(10), bytearray(10)])
+        self.assertEqual(len(next(iterator)), 10)
+        self.assertRaises(IOError, next, iterator)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_stop_early(self):
+        """The background thread stops if the caller stops iterating."""
+        threads = threading.active_count()
+        iterator = read_ahead(io.BytesIO(self.data).readinto,
+                              [bytearray(100) for _ in range(3)])
+        next(iterator)
+        iterator.close()
+        self.assertEqual(threading.active_count(), threads)
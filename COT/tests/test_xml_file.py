@@ -14,9 +14,15 @@
 
 """Unit test cases for the COT.xml_file.XML class."""
 
-from COT.xml_file import XML
+import os
+
+import mock
+
+from COT.xml_file import BACKEND, ET, ParseError, XML
 from COT.tests import COTTestCase
 
+# pylint: disable=protected-access
+
 
 class TestXMLClass(COTTestCase):
     """Test cases for XML class methods."""
@@ -107,3 +113,201 @@ class TestXMLInstance(COTTestCase):
         )
         self.assertLogged(levelname="WARNING",
                           msg="Found unexpected child element")
+
+    def test_xml_size(self):
+        """The predicted size of the XML matches what is written out."""
+        self.xml.set_or_make_child(self.xml.root, self.OVF + "Strings",
+                                   text=u"caf\u00e9 & co")
+        size = self.xml.xml_size()
+        self.xml.write_xml(self.temp_file)
+        self.assertEqual(size, os.path.getsize(self.temp_file))
+
+    def test_parse_error(self):
+        """Invalid XML raises ParseError, whichever library is in use."""
+        self.assertTrue(BACKEND in ("lxml", "etree"))
+        with open(self.temp_file, 'w') as fileobj:
+            fileobj.write("<Envelope><References></Envelope>")
+        self.assertRaises(ParseError, XML, self.temp_file)
+
+    def test_comments_dropped(self):
+        """Comments in the input are not kept in the tree."""
+        with open(self.temp_file, 'w') as fileobj:
+            fileobj.write("<Envelope><!-- comment --><References/>"
+                          "</Envelope>")
+        xml = XML(self.temp_file)
+        self.assertEqual([child.tag for child in xml.root], ["References"])
+
+    def test_index_children(self):
+        """Indexed lookups stay correct however the children change."""
+        references = self.xml.find_child(self.xml.root,
+                                         self.OVF + "References")
+        file_tag = self.OVF + "File"
+        file_id = self.OVF + "id"
+        href = self.OVF + "href"
+        self.xml.index_children(references, file_tag, [file_id, href])
+
+        # Whichever the XML backend, indexed lookups don't scan the children
+        with mock.patch.object(XML, '_children',
+                               side_effect=AssertionError("not indexed")):
+            for elem in references.findall(file_tag):
+                self.assertEqual(
+                    self.xml.find_child(references, file_tag,
+                                        attrib={file_id: elem.get(file_id)}),
+                    elem)
+                self.assertEqual(
+                    self.xml.find_child(references, file_tag,
+                                        attrib={href: elem.get(href),
+                                                file_id: elem.get(file_id)}),
+                    elem)
+        # Both indexed and other attributes must match
+        elem = references.find(file_tag)
+        self.assertEqual(None, self.xml.find_child(
+            references, file_tag,
+            attrib={file_id: elem.get(file_id), href: "nonesuch"}))
+
+        # Added and removed through this class
+        new = self.xml.set_or_make_child(references, file_tag,
+                                         attrib={file_id: "new"})
+        self.assertEqual(new, self.xml.find_child(references, file_tag,
+                                                  attrib={file_id: "new"}))
+        self.xml.remove_child(references, new)
+        self.assertEqual(None, self.xml.find_child(references, file_tag,
+                                                   attrib={file_id: "new"}))
+
+        # Changed directly, then reindexed
+        old_id = elem.get(file_id)
+        elem.set(file_id, "renamed")
+        self.xml.reindex_child(references, elem)
+        self.assertEqual(elem, self.xml.find_child(
+            references, file_tag, attrib={file_id: "renamed"}))
+        self.assertEqual(None, self.xml.find_child(
+            references, file_tag, attrib={file_id: old_id}))
+
+        # Changed behind the index's back
+        elem.set(file_id, old_id)
+        self.assertEqual(None, self.xml.find_child(
+            references, file_tag, attrib={file_id: "renamed"}))
+        references.remove(elem)
+        self.assertEqual(None, self.xml.find_child(
+            references, file_tag, attrib={file_id: old_id}))
+        references.append(elem)
+        self.assertEqual(elem, self.xml.find_child(
+            references, file_tag, attrib={file_id: old_id}))
+
+    def test_index_lifetime(self):
+        """Indexes belong to their instance and go with their parent."""
+        references = self.xml.find_child(self.xml.root,
+                                         self.OVF + "References")
+        file_tag = self.OVF + "File"
+        file_id = self.OVF + "id"
+        self.xml.index_children(references, file_tag, [file_id])
+        self.assertIsNotNone(XML._index(references, file_tag))
+
+        # Another parse of the same file isn't indexed
+        other = XML(self.input_ovf)
+        other_refs = other.find_child(other.root, self.OVF + "References")
+        self.assertIsNone(XML._index(other_refs, file_tag))
+
+        self.xml.remove_child(self.xml.root, references)
+        self.assertIsNone(XML._index(references, file_tag))
+        self.assertEqual({}, self.xml._child_indexes)
+
+
+class TestXMLRewrite(COTTestCase):
+    """Test cases for writing back a parsed XML file."""
+
+    SOURCE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Envelope>
+  <A x="1">
+      <!-- unusual indentation -->
+      <B>text</B>
+      <D   y = "2"/>
+  </A>
+  <C  />
+</Envelope>
+"""
+
+    def parse(self, source):
+        """Parse the given XML from a file.
+
+        Returns:
+          XML: Parsed file.
+        """
+        path = os.path.join(self.temp_dir, "input.xml")
+        with open(path, 'wb') as fileobj:
+            fileobj.write(source)
+        return XML(path)
+
+    def write(self, xml):
+        """Write the given XML to a file, checking its predicted size.
+
+        Returns:
+          bytes: Contents written.
+        """
+        size = xml.xml_size()
+        xml.write_xml(self.temp_file)
+        with open(self.temp_file, 'rb') as fileobj:
+            data = fileobj.read()
+        self.assertEqual(size, len(data))
+        return data
+
+    def test_unchanged(self):
+        """Unmodified elements are written exactly as they were read."""
+        xml = self.parse(self.SOURCE)
+        data = self.write(xml)
+        self.assertEqual(data.split(b"\n", 1)[1],
+                         self.SOURCE.split(b"\n", 1)[1])
+        # Writing again (or after a no-op change) makes no difference
+        xml.root[0].set("x", "1")
+        self.assertEqual(self.write(xml), data)
+
+    def test_changed(self):
+        """Only modified elements are re-indented and re-serialized."""
+        xml = self.parse(self.SOURCE)
+        xml.root[0][0].text = "changed"
+        data = self.write(xml)
+        self.assertEqual(data.split(b"\n", 1)[1], b"""<Envelope>
+  <A x="1">
+    <B>changed</B>
+    <D   y = "2"/>
+  </A>
+  <C  />
+</Envelope>
+""")
+        # Likewise for added and removed elements
+        ET.SubElement(xml.root, "E").text = "new"
+        xml.root.remove(xml.root[1])
+        data = self.write(xml)
+        self.assertTrue(b'<D   y = "2"/>' in data)
+        self.assertFalse(b"<C" in data)
+        self.assertTrue(b"<E>new</E>" in data)
+
+    def test_same_output(self):
+        """New elements are written the same way whichever library is used."""
+        xml = self.parse(self.SOURCE)
+        ET.SubElement(xml.root, "{urn:new}F")
+        ET.SubElement(xml.root, "{urn:new}G").text = "new"
+        data = self.write(xml)
+        self.assertTrue(data.startswith(
+            b"<?xml version='1.0' encoding='utf-8'?>\n"
+            b'<Envelope xmlns:ns0="urn:new">\n'))
+        self.assertEqual(data.count(b"xmlns"), 1)
+        self.assertTrue(b"<ns0:F />" in data)
+        self.assertTrue(b"<ns0:G>new</ns0:G>" in data)
+
+    def test_default_namespace(self):
+        """Elements relying on an undeclared default namespace are rewritten.
+
+        ElementTree always declares namespaces with a prefix, so unprefixed
+        elements in the default namespace can't be reused as they were;
+        lxml keeps the original declarations, so they can.
+        """
+        xml = self.parse(self.SOURCE.replace(
+            b"<Envelope>", b'<Envelope xmlns="urn:example">'))
+        data = self.write(xml)
+        if BACKEND == "lxml":
+            self.assertTrue(b'<Envelope xmlns="urn:example">' in data)
+            self.assertTrue(b"<C  />" in data)
+        else:
+            self.assertFalse(b"<C  />" in data)
+        self.assertEqual(self.parse(data).root[1].tag, "{urn:example}C")
@@ -19,6 +19,7 @@ API
 .. autosummary::
   :nosignatures:
 
+  Settings
   UI
 
 Implementation modules
@@ -28,13 +29,16 @@ Implementation modules
   :toctree:
 
   COT.ui.cli
+  COT.ui.settings
 """
 
+from .settings import Settings
 from .ui import UI
 
 # flake8: noqa: F401
 from .cli import CLI
 
 __all__ = (
+    'Settings',
     'UI',
 )
@@ -46,8 +46,15 @@ except ImportError:
     from backports.shutil_get_terminal_size import get_terminal_size
 
 from COT import __version_long__
-from COT.data_validation import InvalidInputError, ValueMismatchError
+from COT.data_validation import (
+    InvalidInputError, ValueMismatchError, positive_int,
+)
+from COT.checksum_cache import ChecksumCache
+from COT.file_reference import TransferScheduler
+from COT.file_transfer import parse_copy_strategies
+from COT.stream_io import SequentialReader
 from COT.commands import command_classes
+from .settings import Settings
 from .ui import UI
 
 logger = logging.getLogger(__name__)
@@ -70,6 +77,7 @@ class CLI(UI):
       parse_args
       run
       set_verbosity
+      settings
       terminal_width
     """
 
@@ -431,6 +439,61 @@ class CLI(UI):
                             action='store_true',
                             help="""Perform requested actions without """
                             """prompting for confirmation""")
+        parser.add_argument('-j', '--jobs', dest='_jobs', metavar='N',
+                            type=positive_int,
+                            help="""Checksum or copy up to N files """
+                            """concurrently (default: number of CPUs)""")
+        parser.add_argument('--jobs-per-device', dest='_jobs_per_device',
+                            metavar='N', type=positive_int,
+                            help="""Checksum or copy up to N files """
+                            """concurrently per storage device """
+                            """(default: {0})"""
+                            .format(TransferScheduler.per_device))
+        parser.add_argument('--checksum-cache', dest='_checksum_cache',
+                            action='store_true',
+                            help="""Keep a persistent cache of the """
+                            """checksums of files written, to avoid """
+                            """checksumming them again when reused""")
+        parser.add_argument('--purge-checksum-cache',
+                            dest='_purge_checksum_cache', action='store_true',
+                            help="""Empty the persistent cache of file """
+                            """checksums before proceeding""")
+        parser.add_argument('--model-cache', dest='_model_cache',
+                            action='store_true',
+                            help="""Keep a persistent cache of the hardware """
+                            """definitions of OVF descriptors read, to """
+                            """open unchanged descriptors faster""")
+        parser.add_argument('--copy-strategies', dest='_copy_strategies',
+                            metavar='LIST', type=parse_copy_strategies,
+                            help="""When writing an OVF, try to share data """
+                            """with copied files by "reflink" and/or """
+                            """read-only "hardlink", in the given order, """
+                            """or "none" (default: reflink)""")
+        parser.add_argument('--io-buffer-size', dest='_io_buffer_size',
+                            metavar='KIB', type=positive_int,
+                            help="""Read file data KIB kilobytes at a time """
+                            """(default: {0})"""
+                            .format(SequentialReader.buffer_size // 1024))
+        parser.add_argument('--readahead', dest='_readahead',
+                            metavar='MIB', type=positive_int,
+                            help="""Ask the OS to prefetch MIB megabytes """
+                            """ahead of each sequential read (default: """
+                            """{0})"""
+                            .format(SequentialReader.readahead //
+                                    (1024 * 1024)))
+        parser.add_argument('--io-buffers', dest='_io_buffers',
+                            metavar='N', type=positive_int,
+                            help="""Read up to N buffers ahead of the data """
+                            """being hashed or copied (default: {0})"""
+                            .format(SequentialReader.pipeline_depth))
+        parser.add_argument('--keep-page-cache', dest='_keep_page_cache',
+                            action='store_true',
+                            help="""Don't drop large files from the OS """
+                            """page cache once they have been read""")
+        parser.add_argument('--direct-io', dest='_direct_io',
+                            action='store_true',
+                            help="""Bypass the OS page cache when reading """
+                            """file data, where supported""")
 
         debug_group = parser.add_mutually_exclusive_group()
         debug_group.add_argument(
@@ -526,7 +589,10 @@ class CLI(UI):
         arg_dict = vars(args)
         del arg_dict["_verbosity"]
         del arg_dict["_force"]
+        del arg_dict["_purge_checksum_cache"]
         del arg_dict["_subcommand"]
+        for (dest, _, _) in CLI.SETTINGS:
+            del arg_dict[dest]
         for (arg, value) in arg_dict.items():
             # When argparse is using both "nargs='+'" and "action=append",
             # this allows some flexibility in the user CLI, but the parsed
@@ -557,11 +623,50 @@ class CLI(UI):
             if not arg[0].isupper() and value is not None:
                 setattr(arg_dict["instance"], arg, value)
 
+    SETTINGS = (
+        ('_jobs', 'jobs', None),
+        ('_jobs_per_device', 'jobs_per_device', None),
+        ('_checksum_cache', 'checksum_cache', None),
+        ('_model_cache', 'model_cache', None),
+        ('_copy_strategies', 'copy_strategies', None),
+        ('_io_buffer_size', 'io_buffer_size', lambda kib: kib * 1024),
+        ('_readahead', 'readahead', lambda mib: mib * 1024 * 1024),
+        ('_io_buffers', 'io_buffers', None),
+        ('_keep_page_cache', 'drop_behind', lambda keep: not keep),
+        ('_direct_io', 'direct_io', None),
+    )
+    """Global CLI options (dest, :class:`~COT.ui.settings.Settings` name,
+    and conversion from the option's units) that map to process settings."""
+
+    @classmethod
+    def settings(cls, args):
+        """Get the process-wide settings requested by the global CLI options.
+
+        Options that were not given (``None``, or ``False`` for flags) are
+        omitted, so that the corresponding settings keep their defaults.
+
+        Args:
+          args (argparse.Namespace): Parser namespace object returned from
+              :func:`parse_args`.
+        Returns:
+          Settings: Settings to apply while running the command.
+        """
+        values = {}
+        for (dest, name, convert) in cls.SETTINGS:
+            value = getattr(args, dest)
+            if value is None or value is False:
+                continue
+            values[name] = convert(value) if convert else value
+        return Settings(**values)
+
     def main(self, args):
         """Main worker function for COT when invoked from the CLI.
 
         * Calls :meth:`adjust_verbosity` with the appropriate verbosity level
           derived from the args.
+        * Purges the checksum cache if requested.
+        * Looks up the process-wide :meth:`settings` requested by the global
+          options, to apply for the duration of the command.
         * Looks up the appropriate :class:`~COT.commands.Command`
           instance corresponding to the subcommand that was invoked.
         * Converts :attr:`args` to a dict and calls
@@ -584,6 +689,9 @@ class CLI(UI):
         """
         # pylint: disable=protected-access
         self.force = args._force
+        if args._purge_checksum_cache:
+            ChecksumCache(ChecksumCache.default_path()).purge()
+        settings = self.settings(args)
 
         # Verbosity level adjusted by -v and -q options
         self.adjust_verbosity(args._verbosity - args._quietude)
@@ -596,6 +704,7 @@ class CLI(UI):
 
         # Call the appropriate command and handle any resulting errors
         arg_dict = self.args_to_dict(args)
+        settings.apply()
         try:
             self.set_instance_attributes(arg_dict)
             args.instance.run()
@@ -622,6 +731,7 @@ class CLI(UI):
             sys.exit("\nAborted by user.")
         finally:
             args.instance.destroy()
+            settings.restore()
             if self.master_logger:
                 self.master_logger.removeHandler(self.handler)
                 self.master_logger = None
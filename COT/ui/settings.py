@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+#
+# settings.py - Process-wide settings of the Common OVF Tool suite
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Process-wide settings of COT, such as those set by the global CLI options.
+
+Settings such as the number of checksum jobs or whether to use the checksum
+cache are class attributes of the classes they affect (for example
+:attr:`TransferScheduler.max_workers
+<COT.file_reference.TransferScheduler.max_workers>`). A :class:`Settings`
+object gathers the values for any number of them, so that they can be applied
+for the duration of a single command and then restored; one command, or one
+call to :meth:`CLI.run <COT.ui.cli.CLI.run>`, therefore never inherits the
+settings of another.
+
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  Settings
+"""
+
+from COT.checksum_cache import ChecksumCache
+from COT.file_reference import TransferScheduler, FileOnDisk
+from COT.stream_io import SequentialReader
+from COT.vm_description.ovf.model_cache import OVFModelCache
+
+
+class Settings(object):
+    """Values of process-wide settings, applied and restored as a group.
+
+    Settings not given keep whatever value they have when applied.
+    Values are in the units of the underlying attribute (bytes, not MiB).
+
+    Examples:
+      ::
+
+        >>> default = SequentialReader.buffer_size
+        >>> with Settings(io_buffer_size=4096, model_cache=True):
+        ...     (SequentialReader.buffer_size, OVFModelCache.enabled)
+        (4096, True)
+        >>> SequentialReader.buffer_size == default
+        True
+        >>> OVFModelCache.enabled
+        False
+        >>> Settings(foo=1)
+        Traceback (most recent call last):
+          ...
+        TypeError: Unknown setting(s): foo
+    """
+
+    ATTRIBUTES = {
+        'jobs': (TransferScheduler, 'max_workers'),
+        'jobs_per_device': (TransferScheduler, 'per_device'),
+        'checksum_cache': (ChecksumCache, 'enabled'),
+        'model_cache': (OVFModelCache, 'enabled'),
+        'copy_strategies': (FileOnDisk, 'copy_strategies'),
+        'io_buffer_size': (SequentialReader, 'buffer_size'),
+        'readahead': (SequentialReader, 'readahead'),
+        'io_buffers': (SequentialReader, 'pipeline_depth'),
+        'drop_behind': (SequentialReader, 'drop_behind'),
+        'direct_io': (SequentialReader, 'direct'),
+    }
+    """Mapping of setting name to the (class, attribute) implementing it."""
+
+    def __init__(self, **values):
+        """Create a group of settings, without applying them yet.
+
+        Args:
+          **values: Setting names (keys of :attr:`ATTRIBUTES`) and values.
+        Raises:
+          TypeError: if any setting name is unknown.
+        """
+        unknown = sorted(set(values) - set(self.ATTRIBUTES))
+        if unknown:
+            raise TypeError("Unknown setting(s): {0}"
+                            .format(", ".join(unknown)))
+        self.values = values
+        self._saved = []
+
+    def __repr__(self):
+        """Representation string for debugging."""
+        return "Settings({0})".format(", ".join(
+            "{0}={1!r}".format(name, value)
+            for name, value in sorted(self.values.items())))
+
+    def apply(self):
+        """Apply these settings, remembering the values they replace."""
+        for name, value in sorted(self.values.items()):
+            (owner, attr) = self.ATTRIBUTES[name]
+            self._saved.append((owner, attr, getattr(owner, attr)))
+            setattr(owner, attr, value)
+
+    def restore(self):
+        """Restore the values replaced by the last :meth:`apply`."""
+        while self._saved:
+            (owner, attr, value) = self._saved.pop()
+            setattr(owner, attr, value)
+
+    def __enter__(self):
+        """Apply these settings for the duration of a ``with`` block."""
+        self.apply()
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace):
+        """Restore the previous settings on leaving a ``with`` block.
+
+        For the parameters, see :mod:`contextlib`.
+        """
+        self.restore()
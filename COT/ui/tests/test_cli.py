@@ -35,7 +35,13 @@ import mock
 from COT import __version_long__
 from COT.tests import COTTestCase
 from COT.ui.cli import CLI
+from COT.ui.settings import Settings
 from COT.data_validation import InvalidInputError
+from COT.checksum_cache import ChecksumCache, file_key
+from COT.file_reference import TransferScheduler
+from COT.stream_io import SequentialReader
+from COT.vm_description.ovf import OVF
+from COT.vm_description.ovf.model_cache import OVFModelCache
 
 # pylint: disable=missing-param-doc,missing-type-doc
 
@@ -329,31 +335,54 @@ class TestCLIGeneral(TestCOTCLI):
         self.assertMultiLineEqual(out1, out2)
         if sys.hexversion < 0x03020000:
             args_str = """
-  -h, --help       show this help message and exit
-  -V, --version    show program's version number and exit
-  -f, --force      Perform requested actions without prompting for
-                   confirmation
-  -q, --quiet      Decrease verbosity of the program (repeatable)
-  -v, --verbose    Increase verbosity of the program (repeatable)
+  -h, --help            show this help message and exit
+  -V, --version         show program's version number and exit
+  -f, --force           Perform requested actions without prompting for
+                        confirmation
+  -j N, --jobs N        Checksum or copy up to N files concurrently (default:
+                        number of CPUs)
+  --jobs-per-device N   Checksum or copy up to N files concurrently per
+                        storage device (default: 4)
+  --checksum-cache      Keep a persistent cache of the checksums of files
+                        written, to avoid checksumming them again when reused
+  --purge-checksum-cache
+                        Empty the persistent cache of file checksums before
+                        proceeding
+  --model-cache         Keep a persistent cache of the hardware definitions of
+                        OVF descriptors read, to open unchanged descriptors
+                        faster
+  --copy-strategies LIST
+                        When writing an OVF, try to share data with copied
+                        files by "reflink" and/or read-only "hardlink", in the
+                        given order, or "none" (default: reflink)
+  --io-buffer-size KIB  Read file data KIB kilobytes at a time (default: 1024)
+  --readahead MIB       Ask the OS to prefetch MIB megabytes ahead of each
+                        sequential read (default: 32)
+  --io-buffers N        Read up to N buffers ahead of the data being hashed or
+                        copied (default: 4)
+  --keep-page-cache     Don't drop large files from the OS page cache once
+                        they have been read
+  --direct-io           Bypass the OS page cache when reading file data, where
+                        supported
+  -q, --quiet           Decrease verbosity of the program (repeatable)
+  -v, --verbose         Increase verbosity of the program (repeatable)
 """
             # No command aliases before Python 3.2
             command_str = """
-    add-disk       Add a disk image to an OVF package and map it as a disk in
-                   the guest environment
-    add-file       Add a file to an OVF package
-    deploy         Create a new VM on the target hypervisor from the given OVF
-                   or OVA
-    edit-hardware  Edit virtual machine hardware properties of an OVF
-    edit-product   Edit product info in an OVF
-    edit-properties
-                   Edit or create environment properties of an OVF
-    help           Print help for a command
-    info           Generate a description of an OVF package
-    inject-config  Inject a configuration file into an OVF package
-    install-helpers
-                   Install/verify COT manual pages and any third-party helper
-                   programs that COT may require
-    remove-file    Remove a file from an OVF package
+    add-disk            Add a disk image to an OVF package and map it as a
+                        disk in the guest environment
+    add-file            Add a file to an OVF package
+    deploy              Create a new VM on the target hypervisor from the
+                        given OVF or OVA
+    edit-hardware       Edit virtual machine hardware properties of an OVF
+    edit-product        Edit product info in an OVF
+    edit-properties     Edit or create environment properties of an OVF
+    help                Print help for a command
+    info                Generate a description of an OVF package
+    inject-config       Inject a configuration file into an OVF package
+    install-helpers     Install/verify COT manual pages and any third-party
+                        helper programs that COT may require
+    remove-file         Remove a file from an OVF package
 """
         else:
             # Spacing in args_str is a bit different due to subcommand aliases
@@ -362,6 +391,31 @@ class TestCLIGeneral(TestCOTCLI):
   -V, --version         show program's version number and exit
   -f, --force           Perform requested actions without prompting for
                         confirmation
+  -j N, --jobs N        Checksum or copy up to N files concurrently (default:
+                        number of CPUs)
+  --jobs-per-device N   Checksum or copy up to N files concurrently per
+                        storage device (default: 4)
+  --checksum-cache      Keep a persistent cache of the checksums of files
+                        written, to avoid checksumming them again when reused
+  --purge-checksum-cache
+                        Empty the persistent cache of file checksums before
+                        proceeding
+  --model-cache         Keep a persistent cache of the hardware definitions of
+                        OVF descriptors read, to open unchanged descriptors
+                        faster
+  --copy-strategies LIST
+                        When writing an OVF, try to share data with copied
+                        files by "reflink" and/or read-only "hardlink", in the
+                        given order, or "none" (default: reflink)
+  --io-buffer-size KIB  Read file data KIB kilobytes at a time (default: 1024)
+  --readahead MIB       Ask the OS to prefetch MIB megabytes ahead of each
+                        sequential read (default: 32)
+  --io-buffers N        Read up to N buffers ahead of the data being hashed or
+                        copied (default: 4)
+  --keep-page-cache     Don't drop large files from the OS page cache once
+                        they have been read
+  --direct-io           Bypass the OS page cache when reading file data, where
+                        supported
   -q, --quiet           Decrease verbosity of the program (repeatable)
   -v, --verbose         Increase verbosity of the program (repeatable)
 """
@@ -414,6 +468,113 @@ commands:
         self.call_cot(['-V'])
         self.call_cot(['--version'])
 
+    def settings_during(self, argv, result=0):
+        """Invoke ``cot <argv> info``, getting the settings while it runs.
+
+        Also checks that the settings are restored afterward.
+
+        Returns:
+          dict: Setting name to value, as seen by the command.
+        """
+        def current():
+            """Get the current value of each setting."""
+            return dict((name, getattr(owner, attr)) for (name, (owner, attr))
+                        in Settings.ATTRIBUTES.items())
+
+        before = current()
+        seen = {}
+        with mock.patch('COT.commands.info.COTInfo.run',
+                        side_effect=lambda: seen.update(current())):
+            self.call_cot(argv + ['info', self.input_ovf], result=result)
+        self.assertEqual(current(), before)
+        return seen
+
+    def test_jobs(self):
+        """Verify the checksum concurrency options."""
+        seen = self.settings_during(['-j', '3', '--jobs-per-device', '2'])
+        self.assertEqual(seen['jobs'], 3)
+        self.assertEqual(seen['jobs_per_device'], 2)
+        self.assertEqual(self.settings_during(['-j', '0'], result=2), {})
+
+    def test_copy_strategies(self):
+        """Verify the file copy strategy option."""
+        seen = self.settings_during(['--copy-strategies', 'hardlink,reflink'])
+        self.assertEqual(seen['copy_strategies'], ('hardlink', 'reflink'))
+        seen = self.settings_during(['--copy-strategies', 'none'])
+        self.assertEqual(seen['copy_strategies'], ())
+        self.settings_during(['--copy-strategies', 'symlink'], result=2)
+
+    def test_output_options_not_global(self):
+        """Options for writing a package belong to the commands that do."""
+        self.call_cot(['--compress', '*.img', 'info', self.input_ovf],
+                      result=2)
+        self.call_cot(['info', '--compress', '*.img', self.input_ovf],
+                      result=2)
+        self.call_cot(['--chunk-size', '512', '--chunk', '*.vmdk',
+                       'info', self.input_ovf], result=2)
+
+    def test_io_options(self):
+        """Verify the options for reading file data."""
+        seen = self.settings_during(['--io-buffer-size', '256',
+                                     '--readahead', '64', '--io-buffers', '2',
+                                     '--keep-page-cache', '--direct-io'])
+        self.assertEqual(seen['io_buffer_size'], 256 * 1024)
+        self.assertEqual(seen['readahead'], 64 * 1024 * 1024)
+        self.assertEqual(seen['io_buffers'], 2)
+        self.assertFalse(seen['drop_behind'])
+        self.assertTrue(seen['direct_io'])
+
+        self.settings_during(['--io-buffer-size', '0'], result=2)
+
+    def test_default_settings(self):
+        """Settings not given on the CLI keep their defaults."""
+        seen = self.settings_during([])
+        self.assertEqual(seen['io_buffer_size'], SequentialReader.buffer_size)
+        self.assertEqual(seen['jobs_per_device'], TransferScheduler.per_device)
+        self.assertFalse(seen['checksum_cache'])
+        self.assertFalse(seen['model_cache'])
+        self.assertTrue(seen['drop_behind'])
+
+    def test_checksum_cache_options(self):
+        """Verify the checksum cache options."""
+        self.addCleanup(setattr, ChecksumCache, 'directory',
+                        ChecksumCache.directory)
+        ChecksumCache.directory = self.temp_dir
+        cache = ChecksumCache(ChecksumCache.default_path())
+        key = file_key(self.input_ovf)
+        cache.store(key, 'sha1', 'abcd')
+        self.assertEqual(cache.lookup(key, 'sha1'), 'abcd')
+
+        # Cache is disabled by default
+        self.assertFalse(self.settings_during([])['checksum_cache'])
+
+        # Bogus entry is purged, and input files are not entered in the cache
+        self.call_cot(['--checksum-cache', '--purge-checksum-cache',
+                       'info', '--verify', self.input_ovf])
+        self.assertIsNone(cache.lookup(key, 'sha1'))
+        self.assertTrue(
+            self.settings_during(['--checksum-cache'])['checksum_cache'])
+
+    def test_model_cache_option(self):
+        """Verify the OVF model cache option."""
+        self.addCleanup(setattr, OVFModelCache, 'directory',
+                        OVFModelCache.directory)
+        OVFModelCache.directory = os.path.join(self.temp_dir, "models")
+        self.call_cot(['info', self.input_ovf])
+        self.assertFalse(os.path.exists(OVFModelCache.directory))
+        self.call_cot(['--model-cache', 'info', self.input_ovf])
+        with open(self.input_ovf, 'rb') as fileobj:
+            self.assertEqual(os.listdir(OVFModelCache.directory),
+                             [OVFModelCache.key(fileobj.read())])
+
+        # A later run (or other use of COT in this process) doesn't
+        # inherit the option
+        self.assertFalse(OVFModelCache.enabled)
+        os.remove(os.path.join(OVFModelCache.directory,
+                               os.listdir(OVFModelCache.directory)[0]))
+        self.call_cot(['info', self.input_ovf])
+        self.assertEqual(os.listdir(OVFModelCache.directory), [])
+
     def test_incomplete_cli(self):
         """Verify command with no subcommand is not valid."""
         # No args at all
@@ -760,6 +921,33 @@ class TestCLIEditProduct(TestCOTCLI):
         self.call_cot(['edit-product', self.input_ovf, '-V'], result=2)
         self.call_cot(['edit-product', self.input_ovf, '-V', '-v'], result=2)
 
+    def test_compress(self):
+        """The --compress option applies to the package being written."""
+        seen = []
+        with mock.patch.object(OVF, 'write', autospec=True,
+                               side_effect=lambda ovf: seen.append(
+                                   ovf.compress_patterns)):
+            self.call_cot(['edit-product', self.input_ovf, '-o',
+                           self.temp_file, '-v', '1.0', '--compress', '*.img',
+                           '--compress', 'foo.iso'])
+        self.assertEqual(seen, [('*.img', 'foo.iso')])
+        self.assertEqual(OVF.compress_patterns, ())
+
+    def test_chunk(self):
+        """The chunking options apply to the package being written."""
+        seen = []
+        with mock.patch.object(OVF, 'write', autospec=True,
+                               side_effect=lambda ovf: seen.append(
+                                   (ovf.chunk_size, ovf.chunk_patterns))):
+            self.call_cot(['edit-product', self.input_ovf, '-o',
+                           self.temp_file, '-v', '1.0',
+                           '--chunk-size', '512', '--chunk', '*.vmdk'])
+        self.assertEqual(seen, [(512 * 1024 * 1024, ('*.vmdk',))])
+        self.assertIsNone(OVF.chunk_size)
+
+        self.call_cot(['edit-product', self.input_ovf, '-o', self.temp_file,
+                       '--chunk-size', '0'], result=2)
+
 
 class TestCLIEditProperties(TestCOTCLI):
     """CLI test cases for "cot edit-properties" command."""
@@ -32,4 +32,5 @@ def load_tests(*_):
     """
     suite = TestSuite()
     suite.addTests(DocTestSuite('COT.ui.cli'))
+    suite.addTests(DocTestSuite('COT.ui.settings'))
     return suite
@@ -0,0 +1,61 @@
+# test_settings.py - Unit test cases for the Settings class
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Unit test cases for COT.ui.settings.Settings class."""
+
+from COT.checksum_cache import ChecksumCache
+from COT.file_reference import TransferScheduler
+from COT.tests import COTTestCase
+from COT.ui.settings import Settings
+
+
+class TestSettings(COTTestCase):
+    """Test cases for the COT.ui.settings.Settings class."""
+
+    def test_apply_restore(self):
+        """Settings are applied and then restored to their prior values."""
+        workers = TransferScheduler.max_workers
+        settings = Settings(jobs=5, checksum_cache=True)
+        settings.apply()
+        try:
+            self.assertEqual(TransferScheduler.max_workers, 5)
+            self.assertTrue(ChecksumCache.enabled)
+        finally:
+            settings.restore()
+        self.assertEqual(TransferScheduler.max_workers, workers)
+        self.assertFalse(ChecksumCache.enabled)
+        # Restoring again is harmless
+        settings.restore()
+        self.assertEqual(TransferScheduler.max_workers, workers)
+
+    def test_nested(self):
+        """Nested settings restore the values of the enclosing settings."""
+        workers = TransferScheduler.max_workers
+        with Settings(jobs=7):
+            with Settings(jobs=2, jobs_per_device=1):
+                self.assertEqual(TransferScheduler.max_workers, 2)
+            self.assertEqual(TransferScheduler.max_workers, 7)
+        self.assertEqual(TransferScheduler.max_workers, workers)
+
+    def test_restore_on_error(self):
+        """Settings are restored even if the ``with`` block fails."""
+        with self.assertRaises(ValueError):
+            with Settings(checksum_cache=True):
+                raise ValueError("oops")
+        self.assertFalse(ChecksumCache.enabled)
+
+    def test_unknown(self):
+        """Unknown setting names are rejected."""
+        self.assertRaises(TypeError, Settings, jobs=1, job_count=2)
+        self.assertEqual(repr(Settings(jobs=1, direct_io=True)),
+                         "Settings(direct_io=True, jobs=1)")
@@ -24,6 +24,7 @@
   directory_size
   pretty_bytes
   tar_entry_size
+  tar_header
   to_string
 """
 
@@ -31,8 +32,10 @@ import errno
 import logging
 import os
 import sys
+import tarfile
+import time
 
-import xml.etree.ElementTree as ET
+from COT.xml_file import ET
 
 logger = logging.getLogger(__name__)
 
@@ -179,6 +182,31 @@ def tar_entry_size(filesize):
     return 512 + filesize + ((512 - filesize) % 512)
 
 
+def tar_header(name, size, mtime=None, mode=0o644):
+    """Construct the TAR header block(s) for a regular file.
+
+    Args:
+      name (str): Name of the file within the archive.
+      size (int): Size of the file data, in bytes.
+      mtime (float): Modification time of the file; defaults to now.
+      mode (int): Permission bits of the file.
+
+    Returns:
+      bytes: Header data, always a multiple of 512 bytes long.
+
+    Examples:
+      ::
+
+        >>> len(tar_header("foo.ovf", 1234))
+        512
+    """
+    tarinfo = tarfile.TarInfo(name)
+    tarinfo.size = size
+    tarinfo.mtime = int(time.time() if mtime is None else mtime)
+    tarinfo.mode = mode
+    return tarinfo.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+
+
 def to_string(obj):
     """Get string representation of an object, special-case for XML Element.
 
@@ -196,8 +224,8 @@ def to_string(obj):
         >>> e = ET.Element('hello', attrib={'key': 'value'})
         >>> print(e)   # doctest: +ELLIPSIS
         <Element ...hello... at ...>
-        >>> print(to_string(e))
-        <hello key="value" />
+        >>> to_string(e).startswith('<hello key="value"')
+        True
     """
     if ET.iselement(obj):
         if sys.version_info[0] >= 3:
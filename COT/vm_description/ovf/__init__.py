@@ -42,6 +42,7 @@ Modules
 
   COT.vm_description.ovf.hardware
   COT.vm_description.ovf.item
+  COT.vm_description.ovf.model_cache
   COT.vm_description.ovf.name_helper
   COT.vm_description.ovf.utilities
 """
@@ -51,17 +51,29 @@ class OVFHardware(object):
     with a bunch of helper methods.
     """
 
-    def __init__(self, ovf):
+    def __init__(self, ovf, state=None):
         """Construct an OVFHardware object describing all Items in the OVF.
 
         Args:
           ovf (OVF): OVF instance to extract hardware information from.
+          state (list): :meth:`state` of the hardware of an identical OVF
+              (such as from the
+              :class:`~COT.vm_description.ovf.model_cache.OVFModelCache`),
+              to restore rather than reading the Items again.
 
         Raises:
           OVFHardwareDataError: if any data errors are seen
         """
         self.ovf = ovf
         self.item_dict = {}
+        if state is not None:
+            for (instance, namespace, properties) in state:
+                ovfitem = OVFItem(self.ovf)
+                ovfitem.namespace = namespace
+                ovfitem.properties = properties
+                self.item_dict[instance] = ovfitem
+            logger.debug("Restored %s hardware devices", len(self.item_dict))
+            return
         valid_profiles = set(ovf.config_profiles)
         item_count = 0
         for item in ovf.virtual_hw_section:
@@ -99,6 +111,17 @@ class OVFHardware(object):
         for ovfitem in self.item_dict.values():
             ovfitem.modified = False
 
+    def state(self):
+        """Get the contents of all items, for restoring with ``state``.
+
+        Returns:
+          list: ``(instance, namespace, properties)`` for each
+          :class:`~COT.vm_description.ovf.item.OVFItem`, made only of
+          types supported by :mod:`marshal`.
+        """
+        return [(instance, ovfitem.namespace, ovfitem.properties)
+                for (instance, ovfitem) in self.item_dict.items()]
+
     def update_xml(self):
         """Regenerate all Items under the VirtualHardwareSection, if needed.
 
@@ -37,10 +37,9 @@ hardware configuration profiles.
 
 import re
 import logging
-import xml.etree.ElementTree as ET
 
 from COT.data_validation import natural_sort, ValueUnsupportedError
-from COT.xml_file import XML
+from COT.xml_file import ET, XML
 
 from .name_helper import name_helper
 
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+# model_cache.py - Persistent cache of OVF hardware models
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Persistent cache of OVF hardware models, shared between COT invocations.
+
+Building the :class:`~COT.vm_description.ovf.hardware.OVFHardware` model
+of a descriptor, which merges and sanity-checks every ``Item`` under every
+configuration profile, takes far longer than parsing its XML. Tools that
+open the same packages over and over can enable the :class:`OVFModelCache`
+to store each model (by default under ``$XDG_CACHE_HOME/cot/ovf-models/``),
+keyed by the SHA256 checksum of the descriptor and the COT version, so that
+reopening an unchanged descriptor restores the model instead of rebuilding
+it.
+
+Entries are written with :mod:`marshal`, which (unlike :mod:`pickle`)
+cannot execute code when read back. As with the
+:class:`~COT.checksum_cache.ChecksumCache`, the cache is a pure
+optimization: if it cannot be read or written for any reason, COT simply
+builds the model as usual.
+
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  OVFModelCache
+"""
+
+import hashlib
+import logging
+import marshal
+import os
+import sys
+import tempfile
+
+from COT import __version__
+from COT.checksum_cache import ChecksumCache
+
+logger = logging.getLogger(__name__)
+
+
+class OVFModelCache(object):
+    """Persistent cache of OVF hardware models, one file per descriptor.
+
+    Use :meth:`get` to obtain the process-wide cache, honoring the class
+    attributes :attr:`enabled` and :attr:`directory`, which may be set (for
+    example from the CLI) to enable or relocate the cache.
+    """
+
+    enabled = False
+    """Whether :meth:`get` returns a cache at all."""
+
+    directory = None
+    """Directory to store the cache in; ``None`` for the default."""
+
+    SUBDIRECTORY = "ovf-models"
+
+    VERSION = (__version__, tuple(sys.version_info[:2]))
+    """Entries written by any other version of COT or Python are ignored."""
+
+    @classmethod
+    def default_directory(cls):
+        """Get the default cache directory, ``$XDG_CACHE_HOME/cot/ovf-models``.
+
+        Returns:
+          str: Directory path.
+        """
+        return os.path.join(ChecksumCache.default_directory(),
+                            cls.SUBDIRECTORY)
+
+    @classmethod
+    def get(cls):
+        """Get the process-wide model cache, if enabled.
+
+        Returns:
+          OVFModelCache: Cache instance, or ``None`` if disabled.
+        """
+        if not cls.enabled:
+            return None
+        return cls(cls.directory or cls.default_directory())
+
+    def __init__(self, directory):
+        """Create a cache stored in the given directory.
+
+        Args:
+          directory (str): Directory path; created if needed.
+        """
+        self.directory = directory
+
+    @staticmethod
+    def key(descriptor_data):
+        """Get the cache key for the given OVF descriptor.
+
+        Args:
+          descriptor_data (bytes): Contents of the descriptor.
+
+        Returns:
+          str: SHA256 checksum of the descriptor.
+        """
+        return hashlib.sha256(descriptor_data).hexdigest()
+
+    def lookup(self, key):
+        """Look up the hardware model of a descriptor.
+
+        Args:
+          key (str): Key from :meth:`key`.
+
+        Returns:
+          object: Cached model, as passed to :meth:`store`, or ``None`` if
+          not found.
+        """
+        path = os.path.join(self.directory, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as fileobj:
+                (version, model) = marshal.load(fileobj)
+        except (IOError, OSError, EOFError, ValueError, TypeError) as exc:
+            logger.debug("Unable to read OVF model cache entry %s: %s",
+                         path, exc)
+            return None
+        if version != self.VERSION:
+            logger.debug("Ignoring OVF model cache entry %s written by %s",
+                         path, version)
+            return None
+        logger.debug("Found OVF model in cache as %s", path)
+        return model
+
+    def store(self, key, model):
+        """Record the hardware model of a descriptor.
+
+        Any older entry for the same descriptor is replaced. The entry is
+        written to a temporary file and renamed into place, so concurrent
+        COT processes never read a partial entry.
+
+        Args:
+          key (str): Key from :meth:`key`.
+          model (object): Hardware model, made only of types supported by
+              :mod:`marshal`.
+        """
+        path = os.path.join(self.directory, key)
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            (fd, temp_path) = tempfile.mkstemp(dir=self.directory,
+                                               prefix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as fileobj:
+                    marshal.dump((self.VERSION, model), fileobj)
+                os.rename(temp_path, path)
+            except Exception:
+                os.remove(temp_path)
+                raise
+        except (IOError, OSError, ValueError) as exc:
+            logger.debug("Unable to update OVF model cache entry %s: %s",
+                         path, exc)
@@ -22,37 +22,133 @@
   :nosignatures:
 
   OVF
+
+**Constants**
+
+.. autosummary::
+  STDIN
+  STDOUT
 """
 
+import fnmatch
 import logging
 import os
 import os.path
 import re
+import sys
 import tarfile
-import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import ParseError
 import textwrap
 
-from COT.xml_file import XML
+from COT.compression import gzip_compress
+from COT.xml_file import ET, ParseError, XML
 from COT.data_validation import (
-    match_or_die, check_for_conflict, file_checksum,
-    ValueTooHighError, ValueUnsupportedError, canonicalize_nic_subtype,
+    match_or_die, check_for_conflict, checksum_hash, file_checksum,
+    ValueMismatchError, ValueTooHighError, ValueUnsupportedError,
+    canonicalize_nic_subtype,
+)
+from COT.file_reference import (
+    TransferScheduler, ChunkedFile, FileReference, FileOnDisk, FileInStream,
+    FileInTAR, TARIndex, TARStream,
 )
-from COT.file_reference import FileReference, FileOnDisk
+from COT.file_transfer import TARLayout, TARWriter
 from COT.platforms import Platform
 from COT.disks import DiskRepresentation
-from COT.utilities import pretty_bytes, tar_entry_size
+from COT.utilities import pretty_bytes, tar_entry_size, tar_header
 
 from ..vm_description import VMDescription, VMInitError
 from .name_helper import name_helper, CIM_URI
 from .hardware import OVFHardware, OVFHardwareDataError
 from .item import list_union
+from .model_cache import OVFModelCache
 from .utilities import (
     int_bytes_to_programmatic_units, parse_manifest, programmatic_bytes_to_int,
 )
 
 logger = logging.getLogger(__name__)
 
+STDIN = "-"
+"""Value of :attr:`OVF.input_file` meaning to read an OVA from stdin."""
+
+STDOUT = "-"
+"""Value of :attr:`OVF.output_file` meaning to stream an OVA to stdout."""
+
+
+def _input_stream(input_file):
+    """Get the stream, if any, that the given input file refers to.
+
+    Args:
+      input_file (object): Input file path, :data:`STDIN`, or a readable
+        binary file object.
+
+    Returns:
+      object: Readable binary file object, or ``None`` if ``input_file``
+      is an ordinary file path.
+    """
+    if input_file == STDIN:
+        # Python 3 needs the underlying binary buffer
+        return getattr(sys.stdin, 'buffer', sys.stdin)
+    if hasattr(input_file, 'read'):
+        return input_file
+    return None
+
+
+def _output_stream(output_file):
+    """Get the stream, if any, that the given output file refers to.
+
+    Args:
+      output_file (object): Output file path, :data:`STDOUT`, or a writable
+        binary file object.
+
+    Returns:
+      object: Writable binary file object, or ``None`` if ``output_file``
+      is an ordinary file path.
+    """
+    if output_file == STDOUT:
+        # Python 3 needs the underlying binary buffer
+        return getattr(sys.stdout, 'buffer', sys.stdout)
+    if hasattr(output_file, 'write'):
+        return output_file
+    return None
+
+
+def _same_file(path1, path2):
+    """Check whether the two paths refer to the same file.
+
+    Issue #66 - need to detect any of the possible scenarios:
+
+    1) the two paths are the same real path (not just string-equal!)
+    2) the two paths are the same file (including links)
+
+    but not error out if (common case) either file doesn't exist yet.
+
+    Args:
+      path1 (str): File path
+      path2 (str): File path
+
+    Returns:
+      bool: True if the paths refer to the same file.
+    """
+    return (os.path.realpath(path1) == os.path.realpath(path2) or
+            (os.path.exists(path1) and os.path.exists(path2) and
+             os.path.samefile(path1, path2)))
+
+
+def _check_layout(what, expected, actual):
+    """Check that an OVA being written matches its planned layout.
+
+    Args:
+      what (str): Description of the value being checked.
+      expected (int): Value according to the planned layout.
+      actual (int): Value as actually written.
+
+    Raises:
+      ValueMismatchError: if ``actual`` differs from ``expected``.
+    """
+    if actual != expected:
+        raise ValueMismatchError(
+            "{0} is {1} bytes, but the planned OVA layout expected {2}"
+            .format(what, actual, expected))
+
 
 class OVF(VMDescription, XML):
     """Representation of the contents of an OVF or OVA.
@@ -78,6 +174,28 @@ class OVF(VMDescription, XML):
       version_long
     """
 
+    compress_patterns = ()
+    """Names (or :mod:`fnmatch` patterns) of files to compress on writing.
+
+    Matching files are gzip-compressed (``ovf:compression="gzip"``) in the
+    output unless already compressed. Set on an instance (as by the
+    ``--compress`` option of commands that write a package) or on the class
+    to change the behavior process-wide.
+    """
+
+    chunk_size = None
+    """Split files larger than this many bytes into chunks on writing.
+
+    If ``None`` (the default), files are not split. Files already chunked
+    in the input are written out with their existing chunk size regardless.
+    Set on an instance (as by the ``--chunk-size`` option of commands that
+    write a package) or on the class to change the behavior process-wide.
+    """
+
+    chunk_patterns = ('*',)
+    """Names (or :mod:`fnmatch` patterns) of files that :attr:`chunk_size`
+    applies to."""
+
     # API methods to be called by clients
 
     @staticmethod
@@ -89,6 +207,8 @@ class OVF(VMDescription, XML):
         have been seen in the wild.
 
         Does not check file contents, as the given filename may not yet exist.
+        A stream (:data:`STDIN`, :data:`STDOUT`, or a file object) can only
+        be an OVA.
 
         Args:
           filename (str): File name/path
@@ -99,6 +219,9 @@ class OVF(VMDescription, XML):
         Raises:
           ValueUnsupportedError: if filename doesn't match ovf/ova
         """
+        if (_input_stream(filename) is not None or
+                _output_stream(filename) is not None):
+            return '.ova'
         # We don't care about any directory path
         filename = os.path.basename(filename)
         extension = os.path.splitext(filename)[1]
@@ -125,33 +248,73 @@ class OVF(VMDescription, XML):
         """Get the OVF descriptor for the given file.
 
         1. The file may be an OVF descriptor itself.
-        2. The file may be an OVA, in which case we need to untar it and
-           return the path to the extracted OVF descriptor.
+        2. The file may be an OVA, in which case we need to locate the OVF
+           descriptor within it and return its path relative to the OVA,
+           such as ``/path/to/foo.ova/foo.ovf``.
+        3. The file may be an OVA stream, in which case the OVF descriptor
+           is read from the stream into the :attr:`working_dir` (see
+           :meth:`untar_stream`) and that path is returned.
 
         Args:
-          input_file (str): Path to an OVF descriptor or OVA file.
+          input_file (str): Path to an OVF descriptor or OVA file,
+            or an OVA stream.
 
         Returns:
           str: OVF descriptor path
         """
+        stream = _input_stream(input_file)
+        if stream is not None:
+            return self.untar_stream(stream)
         extension = self.detect_type_from_name(input_file)
         if extension == '.ova' or extension == '.box':
-            # Untar the ova to our working directory
+            # Find the descriptor within the OVA
             return self.untar(input_file)
         elif extension == '.ovf':
             return input_file
         else:
             return None
 
-    def __init__(self, input_file, output_file):
+    @property
+    def _input_container(self):
+        """Absolute path to the directory or OVA containing the descriptor.
+
+        For an OVA read from a stream, this is the :class:`TARStream` itself.
+        """
+        if self._input_stream is not None:
+            return self._input_stream
+        if self.input_file == self.ovf_descriptor:
+            # Directory referenced by the OVF descriptor
+            return os.path.dirname(os.path.abspath(self.ovf_descriptor))
+        # OVA
+        return os.path.abspath(self.input_file)
+
+    @property
+    def _metadata_container(self):
+        """Absolute path to the container of the descriptor and manifest.
+
+        The same as :attr:`_input_container`, except for an OVA stream,
+        whose descriptor and manifest are read into the :attr:`working_dir`.
+        """
+        if self._input_stream is not None:
+            return self.working_dir
+        return self._input_container
+
+    def __init__(self, input_file, output_file,
+                 verify=VMDescription.VERIFY_ON_LOAD):
         """Open the specified OVF and read its XML into memory.
 
         Args:
-          input_file (str): Data file to read in.
+          input_file (str): Data file to read in. May also be :data:`STDIN`
+              or a readable binary file object, from which an OVA will be
+              read sequentially.
           output_file (str): File name to write to. If this VM is read-only,
               (there will never be an output file) this value should be
               ``None``; if the output filename is not yet known, use ``""``
               and subsequently set :attr:`output_file` when it is determined.
+              May also be :data:`STDOUT` or a writable binary file object,
+              to which an OVA will be streamed.
+          verify (str): When to verify file checksums against the manifest,
+              one of :attr:`~VMDescription.VERIFY_POLICIES`.
 
         Raises:
           VMInitError:
@@ -159,12 +322,15 @@ class OVF(VMDescription, XML):
               * if an XML parsing error occurs
               * if the XML is not actually an OVF descriptor
               * if the OVF hardware validation fails
+          ValueUnsupportedError: if ``verify`` is not a known policy.
           Exception: will call :meth:`destroy` to clean up before reraising
               any exception encountered.
         """
         try:
             self.output_extension = None
-            VMDescription.__init__(self, input_file, output_file)
+            self._deferred_checksums = {}
+            self._input_stream = None
+            VMDescription.__init__(self, input_file, output_file, verify)
 
             # Make sure we know how to read the input
             self.ovf_descriptor = self._ovf_descriptor_from_name(input_file)
@@ -175,9 +341,13 @@ class OVF(VMDescription, XML):
                     "File does not appear to be an OVA or OVF",
                     input_file)
 
-            # Open the provided OVF
+            # Open the provided OVF - reading directly from an OVA if needed
+            descriptor_ref = FileReference.create(
+                self._metadata_container,
+                os.path.basename(self.ovf_descriptor))
             try:
-                XML.__init__(self, self.ovf_descriptor)
+                with descriptor_ref.open('rb') as file_obj:
+                    XML.__init__(self, file_obj)
             except ParseError as exc:
                 raise VMInitError(2,
                                   "XML error in parsing file: " + str(exc),
@@ -243,6 +413,10 @@ class OVF(VMDescription, XML):
                 self.VIRTUAL_HW_SECTION,
                 attrib=self.VIRTUAL_HW_SECTION_ATTRIB,
                 required=True)
+            self._index_sections(self.references, self.disk_section,
+                                 self.network_section,
+                                 self.deploy_opt_section,
+                                 self.product_section)
 
             # Initialize various caches
             self._configuration_profiles = None
@@ -250,7 +424,7 @@ class OVF(VMDescription, XML):
             self._platform = None
 
             try:
-                self.hardware = OVFHardware(self)
+                self.hardware = self._init_hardware()
             except OVFHardwareDataError as exc:
                 raise VMInitError(1,
                                   "OVF descriptor is invalid: {0}".format(exc),
@@ -263,10 +437,33 @@ class OVF(VMDescription, XML):
 
             Does not include the manifest file."""
 
+            if self._input_stream is not None:
+                self._input_stream.wanted = self._stream_member_wanted
+
         except Exception:
             self.destroy()
             raise
 
+    def _init_hardware(self):
+        """Build the hardware model, or restore it from the model cache.
+
+        Returns:
+          OVFHardware: Hardware described by this OVF.
+
+        Raises:
+          OVFHardwareDataError: if the hardware definition is not sane.
+        """
+        cache = OVFModelCache.get()
+        if cache is None:
+            return OVFHardware(self)
+        key = cache.key(self._source.data)
+        state = cache.lookup(key)
+        if state is not None:
+            return OVFHardware(self, state)
+        hardware = OVFHardware(self)
+        cache.store(key, hardware.state())
+        return hardware
+
     def _compare_file_lists(self, descriptor_file_list, manifest_file_list):
         """Helper for _init_check_file_entries method.
 
@@ -311,15 +508,13 @@ class OVF(VMDescription, XML):
               Note that this does *not* include the OVF manifest file.
         """
         descriptor_files = dict(
-            [(elem.get(self.FILE_HREF), elem.get(self.FILE_SIZE)) for
-             elem in self.references.findall(self.FILE)])
+            [(elem.get(self.FILE_HREF), (elem.get(self.FILE_SIZE),
+                                         elem.get(self.FILE_COMPRESSION),
+                                         elem.get(self.FILE_CHUNK_SIZE)))
+             for elem in self.references.findall(self.FILE)])
 
-        if self.input_file == self.ovf_descriptor:
-            # Check files in the directory referenced by the OVF descriptor
-            input_path = os.path.dirname(os.path.abspath(self.ovf_descriptor))
-        else:
-            # OVA - check contents of TAR file.
-            input_path = os.path.abspath(self.input_file)
+        input_path = self._input_container
+        metadata_path = self._metadata_container
 
         file_references = {}
 
@@ -331,48 +526,194 @@ class OVF(VMDescription, XML):
             # as it's basically a read-once file and storing it in the file
             # references causes much confusion when writing back out to
             # generate the OVF descriptor and manifest file.
-            manifest_file = FileReference.create(input_path, mf_filename)
+            manifest_file = FileReference.create(metadata_path, mf_filename)
             with manifest_file.open('rb') as file_obj:
                 manifest_text = file_obj.read().decode()
             manifest_entries = parse_manifest(manifest_text)
         except IOError:
             logger.debug("Manifest file is missing or unreadable.")
 
-        self._compare_file_lists(descriptor_files.keys(),
+        # Each chunk of a chunked file is listed in the manifest separately
+        descriptor_file_list = []
+        for file_href, (file_size, _, chunk_size) in descriptor_files.items():
+            descriptor_file_list.extend(
+                self._chunk_names(file_href, file_size, chunk_size))
+        self._compare_file_lists(descriptor_file_list,
                                  manifest_entries.keys())
 
         # Check the checksum of the descriptor itself
         # We don't store this in file_references as that would be
         # prone to self-recursion.
-        m_algo, m_cksum = manifest_entries.get(
-            os.path.basename(self.ovf_descriptor), (None, None))
-        if m_algo and m_algo != self.checksum_algorithm:
-            # TODO: log a warning? Discard the checksum?
-            pass
-        FileReference.create(
-            input_path, os.path.basename(self.ovf_descriptor),
-            checksum_algorithm=self.checksum_algorithm,
-            expected_checksum=m_cksum)
-
-        # Now check the checksum of the other files
-        for file_href, file_size in descriptor_files.items():
-            m_algo, m_cksum = manifest_entries.get(file_href, (None, None))
-            if m_algo and m_algo != self.checksum_algorithm:
-                # TODO: log a warning? Discard the checksum?
-                pass
+        # Checksums are verified according to self.verify, below.
+        expected_checksums = {}
+        descriptor_ref = FileReference.create(
+            metadata_path, os.path.basename(self.ovf_descriptor),
+            checksum_algorithm=self.checksum_algorithm)
+        expected = self._manifest_checksum(manifest_entries,
+                                           descriptor_ref.filename)
+        if expected is not None:
+            expected_checksums[descriptor_ref] = expected
+
+        # Now check the other files
+        for (file_href,
+             (file_size, compression, chunk_size)) in descriptor_files.items():
             try:
-                file_references[file_href] = FileReference.create(
-                    input_path, file_href,
-                    checksum_algorithm=self.checksum_algorithm,
-                    expected_checksum=m_cksum,
-                    expected_size=file_size)
+                if chunk_size:
+                    file_ref = ChunkedFile(
+                        input_path, file_href, chunk_size,
+                        checksum_algorithm=self.checksum_algorithm,
+                        expected_size=file_size,
+                        compression=compression)
+                else:
+                    file_ref = FileReference.create(
+                        input_path, file_href,
+                        checksum_algorithm=self.checksum_algorithm,
+                        expected_size=file_size,
+                        compression=compression)
             except IOError:
                 logger.error("File '%s' referenced in the OVF descriptor "
                              "does not exist.", file_href)
                 continue
+            file_references[file_href] = file_ref
+            for name, part_ref in zip(
+                    self._chunk_names(file_href, file_ref.size, chunk_size),
+                    getattr(file_ref, 'chunks', [file_ref])):
+                expected = self._manifest_checksum(manifest_entries, name)
+                if expected is not None:
+                    expected_checksums[part_ref] = expected
+
+        self._schedule_verification(expected_checksums, descriptor_ref)
 
         return file_references
 
+    @staticmethod
+    def _chunk_names(file_href, file_size, chunk_size):
+        """Get the names of the files making up the given referenced file.
+
+        Args:
+          file_href (str): File name.
+          file_size (int): Size of the whole file, if known.
+          chunk_size (int): Chunk size, if the file is chunked.
+
+        Returns:
+          list: Name of each chunk, or just ``[file_href]`` if not chunked
+          (or if the number of chunks is unknown).
+        """
+        if not chunk_size or file_size is None:
+            return [file_href]
+        count = max(1, -(-int(file_size) // int(chunk_size)))
+        return [ChunkedFile.chunk_name(file_href, index)
+                for index in range(count)]
+
+    @staticmethod
+    def _manifest_checksum(manifest_entries, filename):
+        """Get the expected checksum of the given file from the manifest.
+
+        The manifest may use a different checksum type than
+        :attr:`checksum_algorithm`; if so, the file references compute both
+        types of checksum from a single read of each file.
+
+        Args:
+          manifest_entries (dict): Result of :func:`parse_manifest`.
+          filename (str): File name to look up.
+
+        Returns:
+          tuple: ``(checksum, algorithm)``, or ``None`` if the manifest does
+          not list this file or uses an unsupported checksum type for it.
+        """
+        m_algo, m_cksum = manifest_entries.get(filename, (None, None))
+        if m_cksum is None:
+            return None
+        try:
+            checksum_hash(m_algo.lower())
+        except NotImplementedError:
+            logger.warning("Unable to verify the %s checksum of file '%s'"
+                           " listed in the manifest", m_algo, filename)
+            return None
+        return (m_cksum, m_algo.lower())
+
+    def _schedule_verification(self, expected_checksums, descriptor_ref):
+        """Verify checksums now or later, according to :attr:`verify`.
+
+        Helper for :meth:`_init_check_file_entries`.
+
+        Args:
+          expected_checksums (dict): :class:`~COT.FileReference` -->
+            (expected checksum, algorithm), as read from the manifest.
+          descriptor_ref (FileReference): Reference to the OVF descriptor.
+        """
+        verify = self.verify
+        if self._input_stream is not None and verify != self.VERIFY_NEVER:
+            # Files in a stream can only be read once, so verify them then
+            # rather than spilling them all to disk to verify them sooner.
+            verify = self.VERIFY_ON_USE
+        if verify == self.VERIFY_ON_LOAD:
+            self._verify_checksums(expected_checksums)
+        elif verify == self.VERIFY_ON_USE:
+            # The descriptor has just been read in full anyway
+            if descriptor_ref in expected_checksums:
+                descriptor_ref.verify_checksum(
+                    *expected_checksums.pop(descriptor_ref))
+            for file_ref, expected in expected_checksums.items():
+                file_ref.defer_verification(*expected)
+        elif verify == self.VERIFY_ON_WRITE:
+            self._deferred_checksums = expected_checksums
+
+    def _stream_member_wanted(self, name):
+        """Check whether a file in the input stream is still needed.
+
+        Used as :attr:`TARStream.wanted` for the input stream, if any.
+
+        Args:
+          name (str): File name within the stream.
+
+        Returns:
+          bool: True if a file reference still points to the file, so it
+          must be spilled to disk rather than skipped over.
+        """
+        name = os.path.normpath(name)
+        return any(isinstance(file_ref, FileInStream) and
+                   file_ref.stream is self._input_stream and
+                   file_ref.filename == name
+                   for _, file_ref in self._package_files())
+
+    def _package_files(self):
+        """List the files in this package, in the order they are referenced.
+
+        Each chunk of a :class:`~COT.file_reference.ChunkedFile` is listed
+        individually, as it is a separate file in the package and manifest.
+        Files that are referenced but missing are omitted.
+
+        Returns:
+          list: (file name, :class:`~COT.FileReference`) pairs.
+        """
+        files = []
+        for file_obj in self.references.findall(self.FILE):
+            file_name = file_obj.get(self.FILE_HREF)
+            file_ref = self.file_references.get(file_name)
+            if isinstance(file_ref, ChunkedFile):
+                files.extend((ChunkedFile.chunk_name(file_name, index), chunk)
+                             for index, chunk in enumerate(file_ref.chunks))
+            elif file_ref is not None:
+                files.append((file_name, file_ref))
+        return files
+
+    @staticmethod
+    def _verify_checksums(expected_checksums):
+        """Verify the given files against their expected checksums.
+
+        Args:
+          expected_checksums (dict): :class:`~COT.FileReference` -->
+            (expected checksum, algorithm).
+
+        Returns:
+          list: Result of :meth:`~COT.FileReference.verify_checksum` for each
+          file, in no particular order.
+        """
+        return TransferScheduler().map(
+            lambda ref: ref.verify_checksum(*expected_checksums[ref]),
+            expected_checksums.keys())
+
     @property
     def output_file(self):
         """OVF or OVA file that will be created or updated by :meth:`write`.
@@ -384,8 +725,11 @@ class OVF(VMDescription, XML):
 
     @output_file.setter
     def output_file(self, output_file):
+        # A stream can only sensibly receive a single-file OVA
+        if _output_stream(output_file) is not None:
+            self.output_extension = '.ova'
         # Make sure we can write the requested output format, or abort:
-        if output_file:
+        elif output_file:
             self.output_extension = self.detect_type_from_name(output_file)
         super(OVF, self.__class__).output_file.fset(self, output_file)
 
@@ -765,45 +1109,85 @@ class OVF(VMDescription, XML):
         is approximately the same for both OVF and OVA output. Thus we can
         provide this value even if :attr:`output_file` is ``None``.
 
-        In the TAR format, each file in the archive has a 512-byte header
-        and its total size is rounded up to a multiple of 512 bytes. The
-        archive is terminated by 2 512-byte blocks filled with zero, and
-        the overall archive file size is a multiple of 10 kiB.
+        This is the exact size of the OVA that :meth:`write` would create
+        from the current state of the OVF (see :meth:`output_layout`).
 
         Returns:
           int: Estimated number of bytes consumed when writing out to
             :attr:`output_file` (plus any associated files).
         """
-        # Size of the OVF descriptor
-        needed = tar_entry_size(len(ET.tostring(self.root)))
-
-        # Account for the size of all the referenced files
-        manifest_size = 0
-        for href, file_ref in self.file_references.items():
-            # Approximate size of a manifest entry for this file
-            if self.ovf_version >= 2.0:
-                # SHA256(href)= <64 hex digits>
-                # so 64 + href length + ~12 other characters
-                manifest_size += 76 + len(href)
-            else:
-                # SHA1(href)= <40 hex digits>
-                # so 40 + href length + ~10 other characters
-                manifest_size += 50 + len(href)
+        needed = self.output_layout().size
+        logger.debug("Estimated output size is %s", pretty_bytes(needed))
+        return needed
 
-            # Size of the file proper
-            needed += tar_entry_size(file_ref.size)
+    def output_layout(self, descriptor_size=None, descriptor_name=None):
+        """Plan the exact layout of the OVA that :meth:`tar` writes.
 
-        # Manifest file
-        needed += tar_entry_size(manifest_size)
+        In the TAR format, each file in the archive has a header (512 bytes,
+        or more for very long file names or very large files) and its data
+        is padded to a multiple of 512 bytes. The archive is terminated by
+        two 512-byte blocks filled with zeros, and the overall archive size
+        is a multiple of 10 kiB. The OVF descriptor comes first, followed by
+        the manifest and then each referenced file (or chunk) in order.
 
-        # Archive end - two 512-byte records filled with zeros
-        needed += 1024
+        Args:
+          descriptor_size (int): Size of the OVF descriptor, if already
+            written out. By default, the size it would have if written now.
+          descriptor_name (str): Name of the OVF descriptor in the OVA.
+            By default, derived from :attr:`output_file`.
 
-        # Overall size must be a multiple of 10 kiB
-        needed += (10240 - needed) % 10240
+        Returns:
+          COT.file_transfer.TARLayout: Planned layout of the OVA.
+        """
+        if descriptor_name is None:
+            descriptor_name = self._output_descriptor_name()
+        if descriptor_size is None:
+            descriptor_size = self.xml_size()
+        layout = TARLayout()
+        layout.add(descriptor_name, descriptor_size)
+        layout.add(os.path.splitext(descriptor_name)[0] + '.mf',
+                   self._manifest_size(descriptor_name))
+        for file_name, file_ref in self._package_files():
+            layout.add(file_name, file_ref.size)
+        return layout
+
+    def _output_descriptor_name(self):
+        """Get the name of the OVF descriptor as written by :meth:`write`.
 
-        logger.debug("Estimated output size is %s", pretty_bytes(needed))
-        return needed
+        Returns:
+          str: Descriptor file name, without any directory.
+        """
+        if self.output_file and _output_stream(self.output_file) is None:
+            prefix = os.path.splitext(self.output_file)[0]
+        else:
+            # Name the streamed OVA's contents after the input package
+            prefix = os.path.splitext(self.ovf_descriptor)[0]
+        return "{0}.ovf".format(os.path.basename(prefix))
+
+    def in_place_update_size(self, output_file):
+        """Estimate the disk space needed to update the output OVA in place.
+
+        See :meth:`tar` for when an in-place update is possible.
+
+        Args:
+          output_file (str): Output file path to consider.
+
+        Returns:
+          int: Estimated number of additional bytes consumed when updating
+          ``output_file`` in place, or ``None`` if this is not possible.
+        """
+        tail_offset = self._in_place_layout(output_file)
+        if tail_offset is None:
+            return None
+        layout = self.output_layout()
+        metadata_size = (layout.entries[2][1] if len(layout.entries) > 2
+                         else layout.end)
+        if metadata_size > tail_offset:
+            logger.verbose("OVF descriptor and manifest will not fit in front"
+                           " of the other files in %s", output_file)
+            return None
+        # Only the existing space at the start of the OVA is overwritten
+        return 0
 
     def write(self):
         """Write OVF or OVA to :attr:`output_file`, if set."""
@@ -812,7 +1196,7 @@ class OVF(VMDescription, XML):
 
         logger.info("Updating and validating internal data before writing"
                     " out to disk")
-        prefix = os.path.splitext(self.output_file)[0]
+        stream = _output_stream(self.output_file)
         extension = self.output_extension
 
         # Update the XML ElementTree to reflect any hardware changes
@@ -821,9 +1205,21 @@ class OVF(VMDescription, XML):
         # Validate the hardware to be written
         self.validate_hardware()
 
+        # Verify any input files whose verification was deferred until now
+        # (skipping any that have since been deleted from disk):
+        deferred = self._deferred_checksums
+        self._deferred_checksums = {}
+        self._verify_checksums(dict(
+            (ref, cksum) for ref, cksum in deferred.items() if ref.exists))
+
         # Make sure file references are correct:
         self._refresh_file_references()
 
+        # Compress any files that should be, now that they're validated,
+        # and split any that should be into chunks:
+        self._compress_files()
+        self._chunk_files()
+
         # Make sure all defined networks are actually used by NICs,
         # and delete any networks that are unused.
         self._refresh_networks()
@@ -831,21 +1227,34 @@ class OVF(VMDescription, XML):
         logger.info("Writing out to file %s", self.output_file)
 
         if extension == '.ova':
-            ovf_file = os.path.join(self.working_dir, "{0}.ovf"
-                                    .format(os.path.basename(prefix)))
-            self.write_xml(ovf_file)
-            self.generate_manifest(ovf_file)
-            self.tar(ovf_file, self.output_file)
+            # The descriptor is serialized once, in memory, and written
+            # straight into the OVA; tar() generates the manifest once the
+            # file checksums are known.
+            self.tar(self._output_descriptor_name(),
+                     stream or self.output_file,
+                     descriptor_data=self.xml_bytes())
         elif extension == '.ovf':
             self.write_xml(self.output_file)
             # Copy all files from working directory to destination
             dest_dir = os.path.dirname(os.path.abspath(self.output_file))
 
-            for file_ref in self.file_references.values():
-                file_ref.copy_to(dest_dir)
+            package_files = self._package_files()
+            file_refs = [file_ref for _, file_ref in package_files]
+            strategies = TransferScheduler().copy_all(file_refs, dest_dir)
+            for file_ref, strategy in zip(file_refs, strategies):
+                if strategy:
+                    logger.verbose("Copied %s to %s (%s)",
+                                   file_ref.filename, dest_dir, strategy)
 
             # Generate manifest
             self.generate_manifest(self.output_file)
+
+            # Remember the checksums of the files we wrote
+            for (file_name, file_ref), strategy in zip(package_files,
+                                                       strategies):
+                if strategy:
+                    file_ref.cache_checksums(os.path.join(dest_dir,
+                                                          file_name))
         else:
             # We should never get here, but to be safe:
             raise NotImplementedError("Not sure how to write a '{0}' file"
@@ -859,9 +1268,7 @@ class OVF(VMDescription, XML):
         # Refresh the file references
         to_delete = []
         for filename, file_ref in self.file_references.items():
-            if file_ref.exists:
-                file_ref.refresh()
-            else:
+            if not file_ref.exists:
                 # file used to exist but no longer does??
                 logger.error("Referenced file '%s' does not exist!", filename)
                 to_delete.append(filename)
@@ -869,12 +1276,15 @@ class OVF(VMDescription, XML):
         for filename in to_delete:
             del self.file_references[filename]
 
+        TransferScheduler().map(lambda ref: ref.refresh(),
+                                self.file_references.values())
+
         for file_elem in self.references.findall(self.FILE):
             href = file_elem.get(self.FILE_HREF)
             if href not in self.file_references:
                 # TODO this should probably have a confirm() check...
                 logger.notice("Removing reference to missing file %s", href)
-                self.references.remove(file_elem)
+                self.remove_child(self.references, file_elem)
                 # TODO remove references to this file from Disk, Item?
 
         for filename, file_ref in self.file_references.items():
@@ -892,7 +1302,9 @@ class OVF(VMDescription, XML):
                 # We can't check disk capacity inside a tar file.
                 # It seems wasteful to extract the disk file (could be
                 # quite large) from the TAR just to check, so we don't.
-                if file_ref.file_path is not None:
+                # Likewise for a compressed disk file.
+                if (file_ref.file_path is not None and
+                        file_ref.compression is None):
                     diskrep = DiskRepresentation.from_file(file_ref.file_path)
                     real_capacity = diskrep.capacity
 
@@ -907,6 +1319,64 @@ class OVF(VMDescription, XML):
                         filename, reported_capacity, real_capacity)
                     self.set_capacity_of_disk(disk_item, real_capacity)
 
+    def _compress_files(self):
+        """Compress any files matching :attr:`compress_patterns`.
+
+        Each such file is gzip-compressed into the :attr:`working_dir`, and
+        its File element updated to match, with the compressed size.
+        Helper method for :func:`write`.
+        """
+        for filename, file_ref in list(self.file_references.items()):
+            if file_ref.compression is not None:
+                continue
+            if not any(fnmatch.fnmatch(filename, pattern)
+                       for pattern in self.compress_patterns):
+                continue
+            dest_dir = os.path.join(self.working_dir, "compressed")
+            dest_path = os.path.join(dest_dir, filename)
+            if not os.path.isdir(os.path.dirname(dest_path)):
+                os.makedirs(os.path.dirname(dest_path))
+            logger.info("Compressing %s", filename)
+            with file_ref.open('rb') as src, open(dest_path, 'wb') as dst:
+                (size, compressed_size) = gzip_compress(src, dst.write)
+            logger.verbose("Compressed %s from %s to %s", filename,
+                           pretty_bytes(size), pretty_bytes(compressed_size))
+            self.file_references[filename] = FileOnDisk(
+                dest_dir, filename,
+                checksum_algorithm=self.checksum_algorithm,
+                compression="gzip")
+            file_elem = self.find_child(self.references, self.FILE,
+                                        {self.FILE_HREF: filename})
+            file_elem.set(self.FILE_SIZE, str(compressed_size))
+            file_elem.set(self.FILE_COMPRESSION, "gzip")
+            # Any existing chunks are replaced by the compressed file
+            file_elem.attrib.pop(self.FILE_CHUNK_SIZE, None)
+
+    def _chunk_files(self):
+        """Split files larger than :attr:`chunk_size` into chunks.
+
+        Only files matching :attr:`chunk_patterns` that are not already
+        chunked are split. No data is copied here; the chunks are views onto
+        the original file, written out (in parallel) along with the rest of
+        the package. Helper method for :func:`write`.
+        """
+        if not self.chunk_size:
+            return
+        for filename, file_ref in list(self.file_references.items()):
+            if (isinstance(file_ref, ChunkedFile) or
+                    file_ref.size <= self.chunk_size):
+                continue
+            if not any(fnmatch.fnmatch(filename, pattern)
+                       for pattern in self.chunk_patterns):
+                continue
+            chunked = ChunkedFile.split(file_ref, self.chunk_size)
+            logger.verbose("Splitting %s into %d chunks of %s", filename,
+                           len(chunked.chunks), pretty_bytes(self.chunk_size))
+            self.file_references[filename] = chunked
+            file_elem = self.find_child(self.references, self.FILE,
+                                        {self.FILE_HREF: filename})
+            file_elem.set(self.FILE_CHUNK_SIZE, str(self.chunk_size))
+
     def _refresh_networks(self):
         """Make sure all defined networks are actually used by NICs.
 
@@ -927,7 +1397,7 @@ class OVF(VMDescription, XML):
             name = net.get(self.NETWORK_NAME)
             if name not in connected_networks:
                 logger.notice("Removing unused network %s", name)
-                self.network_section.remove(net)
+                self.remove_child(self.network_section, net)
         # If all networks were removed, remove the NetworkSection too
         if not self.network_section.findall(self.NETWORK):
             logger.notice("No networks left - removing NetworkSection")
@@ -1583,7 +2053,7 @@ class OVF(VMDescription, XML):
             item.remove_profile(profile, split_default=False)
 
         # Delete the profile declaration itself
-        self.deploy_opt_section.remove(cfg)
+        self.remove_child(self.deploy_opt_section, cfg)
 
         if not self.deploy_opt_section.findall(self.CONFIG):
             self.envelope.remove(self.deploy_opt_section)
@@ -2381,6 +2851,7 @@ class OVF(VMDescription, XML):
         file_obj.set(self.FILE_ID, file_id)
         file_obj.set(self.FILE_HREF, file_name)
         file_obj.set(self.FILE_SIZE, file_size_string)
+        self.reindex_child(self.references, file_obj)
 
         # Make a note of the file's location - we'll copy it at write time.
         # The file_path is always a FileOnDisk
@@ -2403,11 +2874,11 @@ class OVF(VMDescription, XML):
           ValueUnsupportedError: If the ``disk_drive`` is a device type other
               than 'cdrom' or 'harddisk'
         """
-        self.references.remove(file_obj)
+        self.remove_child(self.references, file_obj)
         del self.file_references[file_obj.get(self.FILE_HREF)]
 
         if disk is not None:
-            self.disk_section.remove(disk)
+            self.remove_child(self.disk_section, disk)
 
         if disk_drive is not None:
             # For a CD-ROM drive, we can simply unmap the file.
@@ -2440,7 +2911,7 @@ class OVF(VMDescription, XML):
                 logger.notice("CD-ROMs do not require a Disk element. "
                               "Existing element will be deleted.")
                 if self.disk_section is not None:
-                    self.disk_section.remove(disk)
+                    self.remove_child(self.disk_section, disk)
                     if not self.disk_section.findall(self.DISK):
                         logger.notice("No Disks left - removing DiskSection")
                         self.envelope.remove(self.disk_section)
@@ -2473,6 +2944,7 @@ class OVF(VMDescription, XML):
         disk.set(self.DISK_FORMAT,
                  ("http://www.vmware.com/interfaces/"
                   "specifications/vmdk.html#streamOptimized"))
+        self.reindex_child(self.disk_section, disk)
         return disk
 
     def add_controller_device(self, device_type, subtype, address,
@@ -2628,79 +3100,113 @@ class OVF(VMDescription, XML):
     # Helper methods - for internal use only
 
     def untar(self, file_path):
-        """Untar the OVF descriptor from an .ova to the working directory.
+        """Locate and validate the OVF descriptor within an .ova.
+
+        Despite the name, nothing is extracted - the descriptor will be read
+        directly from the OVA.
 
         Args:
           file_path (str): OVA file path
 
         Returns:
-          str: Path to extracted OVF descriptor
+          str: Path to the OVF descriptor within the OVA
 
         Raises:
           VMInitError: if the given file doesn't represent a valid OVA archive.
         """
-        logger.verbose("Untarring %s to working directory %s",
-                       file_path, self.working_dir)
+        logger.verbose("Examining contents of %s", file_path)
 
         try:
-            tarf = tarfile.open(file_path, 'r')
+            index = TARIndex.get(file_path)
         except (EOFError, tarfile.TarError) as exc:
             raise VMInitError(1, "Could not untar file: {0}".format(exc.args),
                               file_path)
 
+        # The OVF standard says, with regard to OVAs:
+        # ...the files shall be in the following order inside the archive:
+        # 1) OVF descriptor
+        # 2) OVF manifest (optional)
+        # 3) OVF certificate (optional)
+        # 4) The remaining files shall be in the same order as listed
+        #    in the References section...
+        # 5) OVF manifest (optional)
+        # 6) OVF certificate (optional)
+        #
+        # For now we just validate #1.
+        members = list(index.members.values())
+        if not members:
+            raise VMInitError(1, "No files to untar", file_path)
+        # Make sure the provided file doesn't contain any malicious paths
+        # that could escape the working directory if later extracted there.
+        # http://stackoverflow.com/questions/8112742/
+        for pathname in index.names:
+            logger.debug("Examining path of %s", pathname)
+            if (os.path.isabs(pathname) or
+                    os.path.normpath(pathname).split(os.sep)[0] == os.pardir):
+                raise VMInitError(1, "Tar file contains malicious/unsafe "
+                                  "file path '{0}'!".format(pathname),
+                                  file_path)
+
+        ovf_descriptor = members[0]
+        if os.path.splitext(ovf_descriptor.name)[1] != '.ovf':
+            # Do we have an OVF descriptor elsewhere in the file?
+            candidates = [mem for mem in members if
+                          os.path.splitext(mem.name)[1] == '.ovf']
+            if not candidates:
+                raise VMInitError(1,
+                                  "TAR file does not seem to contain any"
+                                  " .ovf file to serve as OVF descriptor"
+                                  " - OVA is invalid!",
+                                  file_path)
+            ovf_descriptor = candidates[0]
+            logger.error(
+                "OVF file %s found, but is not the first file in the TAR "
+                "as it should be - OVA is not standard-compliant!",
+                ovf_descriptor.name)
+
+        return os.path.join(file_path, ovf_descriptor.name)
+
+    def untar_stream(self, stream):
+        """Read the OVF descriptor and manifest from the head of an OVA stream.
+
+        These files are saved to the :attr:`working_dir`, while the rest of
+        the stream is left unread until the files in it are actually needed.
+
+        Args:
+          stream (file): Readable binary file object containing an OVA.
+
+        Returns:
+          str: Path to the OVF descriptor in the :attr:`working_dir`.
+
+        Raises:
+          VMInitError: if the stream doesn't contain a valid TAR archive
+            beginning with an OVF descriptor.
+        """
+        tar_stream = None
+        name = getattr(stream, 'name', "<stream>")
+        logger.verbose("Reading OVA from %s", name)
         try:
-            # The OVF standard says, with regard to OVAs:
-            # ...the files shall be in the following order inside the archive:
-            # 1) OVF descriptor
-            # 2) OVF manifest (optional)
-            # 3) OVF certificate (optional)
-            # 4) The remaining files shall be in the same order as listed
-            #    in the References section...
-            # 5) OVF manifest (optional)
-            # 6) OVF certificate (optional)
-            #
-            # For now we just validate #1.
-            if not tarf.getmembers():
-                raise VMInitError(1, "No files to untar", file_path)
-            # Make sure the provided file doesn't contain any malicious paths
-            # http://stackoverflow.com/questions/8112742/
-            for pathname in tarf.getnames():
-                logger.debug("Examining path of %s prior to untar", pathname)
-                if not (os.path.abspath(os.path.join(self.working_dir,
-                                                     pathname))
-                        .startswith(self.working_dir)):
-                    raise VMInitError(1, "Tar file contains malicious/unsafe "
-                                      "file path '{0}'!".format(pathname),
-                                      file_path)
-
-            ovf_descriptor = tarf.getmembers()[0]
-            if os.path.splitext(ovf_descriptor.name)[1] != '.ovf':
-                # Do we have an OVF descriptor elsewhere in the file?
-                candidates = [mem for mem in tarf.getmembers() if
-                              os.path.splitext(mem.name)[1] == '.ovf']
-                if not candidates:
-                    raise VMInitError(1,
-                                      "TAR file does not seem to contain any"
-                                      " .ovf file to serve as OVF descriptor"
-                                      " - OVA is invalid!",
-                                      file_path)
-                ovf_descriptor = candidates[0]
-                logger.error(
-                    "OVF file %s found, but is not the first file in the TAR "
-                    "as it should be - OVA is not standard-compliant!",
-                    ovf_descriptor.name)
-
-            # TODO: In theory we could read the ovf descriptor XML directly
-            # from the TAR and not need to even extract this file to disk...
-            tarf.extract(ovf_descriptor, path=self.working_dir)
-            logger.debug(
-                "Extracted OVF descriptor from %s to working dir %s",
-                file_path, self.working_dir)
-        finally:
-            tarf.close()
-
-        # Find the OVF file
-        return os.path.join(self.working_dir, ovf_descriptor.name)
+            tar_stream = TARStream(stream, self.working_dir)
+            # As described in untar(), the descriptor, manifest, and
+            # certificate should come first. A stream can't be rewound,
+            # so a descriptor anywhere else is not supported.
+            while (tar_stream.current is not None and
+                   os.path.splitext(tar_stream.current.name)[1] in
+                   ['.ovf', '.mf', '.cert']):
+                tar_stream.spill(tar_stream.current.name)
+        except IOError as exc:
+            raise VMInitError(1, "Could not untar stream: {0}".format(exc),
+                              name)
+
+        descriptors = [path for path in tar_stream.spilled.values() if
+                       os.path.splitext(path)[1] == '.ovf']
+        if not descriptors:
+            raise VMInitError(1,
+                              "TAR stream does not begin with a .ovf file to"
+                              " serve as OVF descriptor - OVA is invalid!",
+                              name)
+        self._input_stream = tar_stream
+        return descriptors[0]
 
     def generate_manifest(self, ovf_file):
         """Construct the manifest file for this package, if possible.
@@ -2719,81 +3225,387 @@ class OVF(VMDescription, XML):
         with open(ovf_file, 'rb') as ovfobj:
             checksum = file_checksum(ovfobj, self.checksum_algorithm)
         with open(manifest, 'wb') as mfobj:
-            mfobj.write("{algo}({file})= {sum}\n"
-                        .format(algo=self.checksum_algorithm.upper(),
-                                file=os.path.basename(ovf_file),
-                                sum=checksum)
-                        .encode('utf-8'))
-            # Checksum all referenced files as well
-            for file_obj in self.references.findall(self.FILE):
-                file_name = file_obj.get(self.FILE_HREF)
-                file_ref = self.file_references[file_name]
-
-                mfobj.write("{algo}({file})= {sum}\n"
-                            .format(algo=self.checksum_algorithm.upper(),
-                                    file=file_name, sum=file_ref.checksum)
-                            .encode('utf-8'))
+            mfobj.write(self._manifest_data(os.path.basename(ovf_file),
+                                            checksum))
 
         logger.debug("Manifest generated successfully")
         return True
 
-    def tar(self, ovf_descriptor, tar_file):
+    def _manifest_data(self, descriptor_name, descriptor_checksum):
+        """Construct the contents of the manifest file for this package.
+
+        Args:
+          descriptor_name (str): OVF descriptor file name
+          descriptor_checksum (str): Checksum of the OVF descriptor
+
+        Returns:
+          bytes: Manifest file contents.
+        """
+        data = self._manifest_entry(descriptor_name, descriptor_checksum)
+        # Checksum all referenced files as well
+        for file_name, file_ref in self._package_files():
+            data += self._manifest_entry(file_name, file_ref.checksum)
+        return data
+
+    def _manifest_entry(self, file_name, checksum):
+        """Construct the manifest line for the given file.
+
+        Args:
+          file_name (str): File name
+          checksum (str): Checksum of the file
+
+        Returns:
+          bytes: Manifest line, including trailing newline.
+        """
+        return ("{algo}({file})= {sum}\n"
+                .format(algo=self.checksum_algorithm.upper(),
+                        file=file_name, sum=checksum)
+                .encode('utf-8'))
+
+    def _manifest_size(self, ovf_file):
+        """Get the exact size of the manifest :meth:`generate_manifest` writes.
+
+        Args:
+          ovf_file (str): OVF descriptor file path
+
+        Returns:
+          int: Size of the manifest, in bytes.
+        """
+        placeholder = '0' * (checksum_hash(self.checksum_algorithm)
+                             .digest_size * 2)
+        size = len(self._manifest_entry(os.path.basename(ovf_file),
+                                        placeholder))
+        for file_name, _ in self._package_files():
+            size += len(self._manifest_entry(file_name, placeholder))
+        return size
+
+    def tar(self, ovf_descriptor, tar_file, descriptor_data=None):
         """Create a .ova tar file based on the given OVF descriptor.
 
+        The manifest is generated as part of this process; any file whose
+        checksum is not already known is checksummed as it is written.
+        When writing to a stream, or when the exact size of some file isn't
+        known until it is read (such as a file still in an input stream),
+        the OVA is written strictly sequentially, so all checksums are
+        computed up front instead.
+
         Args:
-          ovf_descriptor (str): File path for an OVF descriptor
-          tar_file (str): File path for the desired OVA archive.
+          ovf_descriptor (str): File path for an OVF descriptor, or just its
+            name within the OVA if ``descriptor_data`` is given.
+          tar_file (str): File path for the desired OVA archive, or a
+            writable binary file object to stream the OVA to.
+          descriptor_data (bytes): Contents of the OVF descriptor, if not to
+            be read from ``ovf_descriptor``.
+
+        Raises:
+          ValueMismatchError: if the OVA as written doesn't match its
+            planned layout (see :meth:`output_layout`).
         """
         logger.verbose("Creating tar file %s", tar_file)
 
-        (prefix, _) = os.path.splitext(ovf_descriptor)
-
-        # Issue #66 - need to detect any of the possible scenarios:
-        # 1) output path and input path are the same real path
-        #    (not just string-equal!)
-        # 2) output file and input file are the same file (including links)
-        # but not error out if (common case) output_file doesn't exist yet.
-        if (os.path.realpath(self.input_file) == os.path.realpath(tar_file) or
-            (os.path.exists(tar_file) and
-             os.path.samefile(self.input_file, tar_file))):
-            # We're about to overwrite the input OVA with a new OVA.
-            # (Python tarfile module doesn't support in-place edits.)
-            # Any files that we need to carry over need to be extracted NOW!
-            logger.info(
-                "Input OVA will be overwritten. Extracting files from %s to"
-                " working directory before overwriting it.", self.input_file)
-            for filename in self.file_references:
-                file_ref = self.file_references[filename]
-                if file_ref.file_path is None:
-                    file_ref.copy_to(self.working_dir)
-                    self.file_references[filename] = FileReference.create(
-                        self.working_dir, filename,
-                        checksum_algorithm=self.checksum_algorithm,
-                        expected_checksum=file_ref.checksum,
-                        expected_size=file_ref.size)
+        if descriptor_data is None:
+            with open(ovf_descriptor, 'rb') as fileobj:
+                descriptor_data = fileobj.read()
+            metadata_dir = os.path.dirname(ovf_descriptor)
+        else:
+            metadata_dir = self._working_dir
+        descriptor_name = os.path.basename(ovf_descriptor)
+        hash_obj = checksum_hash(self.checksum_algorithm)
+        hash_obj.update(descriptor_data)
+        descriptor_checksum = hash_obj.hexdigest()
+        (prefix, _) = os.path.splitext(descriptor_name)
+        manifest_name = prefix + '.mf'
+
+        if self._overwrite_input_ova(descriptor_name, descriptor_data,
+                                     tar_file):
+            return
 
-        # Be sure to dereference any links to the actual file content!
-        with tarfile.open(tar_file, 'w', dereference=True) as tarf:
+        layout = self.output_layout(len(descriptor_data), descriptor_name)
+        sequential = not self._sizes_known()
+        if sequential:
+            logger.debug("Not all file sizes are known in advance, so"
+                         " writing %s sequentially", tar_file)
+
+        # TARWriter always dereferences links to the actual file content
+        with TARWriter(tar_file, sequential=sequential) as tarf:
+            # Allocate space for everything up front, so we fail now rather
+            # than part way through if there isn't room. Holes in sparse
+            # files are left unallocated.
+            tarf.preallocate(layout, skip=set(
+                name for name, file_ref in self._package_files()
+                if self._may_be_sparse(file_ref)))
             # OVF is always first
             logger.debug("Adding OVF descriptor %s to %s",
-                         ovf_descriptor, tar_file)
-            tarf.add(ovf_descriptor, os.path.basename(ovf_descriptor))
-            # Add manifest if present
-            manifest_path = prefix + '.mf'
-            if os.path.exists(manifest_path):
-                logger.debug("Adding manifest to %s", tar_file)
-                tarf.add(manifest_path, os.path.basename(manifest_path))
-            if os.path.exists("{0}.cert".format(prefix)):
+                         descriptor_name, tarf.path)
+            tarf.add_data(descriptor_name, descriptor_data)
+            # Manifest is second, but its contents depend on the checksums
+            # of the files that follow.
+            if tarf.sequential:
+                # No going back later, so get all the checksums now.
+                TransferScheduler().map(lambda ref: ref.checksum,
+                                        [ref for _, ref in
+                                         self._package_files()])
+                tarf.add_data(manifest_name,
+                              self._manifest_data(descriptor_name,
+                                                  descriptor_checksum))
+            else:
+                # Leave room for it and fill it in later.
+                manifest_size = self._manifest_size(descriptor_name)
+                manifest_offset = tarf.reserve(manifest_name, manifest_size)
+                _check_layout(manifest_name + " offset",
+                              layout.entries[1][2], manifest_offset)
+            if metadata_dir and os.path.exists(
+                    os.path.join(metadata_dir, prefix + ".cert")):
                 logger.warning("COT doesn't know how to re-sign a certificate"
                                " file, so the existing certificate will be"
-                               " omitted from %s.", tar_file)
+                               " omitted from %s.", tarf.path)
             # Add all other files mentioned in the OVF
             for file_obj in self.references.findall(self.FILE):
                 file_name = file_obj.get(self.FILE_HREF)
                 file_ref = self.file_references[file_name]
                 logger.debug("Adding associated file %s to %s",
-                             file_name, tar_file)
+                             file_name, tarf.path)
                 file_ref.add_to_archive(tarf)
+            if not tarf.sequential:
+                logger.debug("Adding manifest to %s", tar_file)
+                manifest = self._manifest_data(descriptor_name,
+                                               descriptor_checksum)
+                _check_layout(manifest_name + " size",
+                              manifest_size, len(manifest))
+                tarf.fill(manifest_offset, manifest)
+        if _output_stream(tar_file) is None:
+            TARIndex.invalidate(tar_file)
+            if not sequential:
+                _check_layout(tar_file + " size", layout.size, tarf.offset)
+            self._cache_checksums(tar_file)
+
+    def _overwrite_input_ova(self, descriptor_name, descriptor_data,
+                             tar_file):
+        """Prepare to overwrite the input OVA, if that's what we're doing.
+
+        If possible, the OVA is updated in place instead (see
+        :meth:`_update_ova_in_place`); otherwise, the input files are
+        extracted from it before it is overwritten.
+
+        Args:
+          descriptor_name (str): Name of the OVF descriptor in the OVA.
+          descriptor_data (bytes): Contents of the OVF descriptor.
+          tar_file (str): File path or stream for the OVA to write.
+
+        Returns:
+          bool: True if the OVA was updated in place and there is nothing
+          more to write.
+        """
+        if (_output_stream(tar_file) is not None or
+                self._input_stream is not None or
+                not _same_file(self.input_file, tar_file)):
+            return False
+        if self._update_ova_in_place(descriptor_name, descriptor_data,
+                                     tar_file):
+            self._cache_checksums(tar_file)
+            return True
+        self._extract_input_files()
+        return False
+
+    def _cache_checksums(self, tar_file):
+        """Remember the checksums of the files just written to an OVA.
+
+        See :meth:`COT.file_reference.FileReference.cache_checksums`.
+
+        Args:
+          tar_file (str): File path of the OVA.
+        """
+        for file_name, file_ref in self._package_files():
+            file_ref.cache_checksums(tar_file, file_name)
+
+    def _sizes_known(self):
+        """Check whether the exact size of every file in the package is known.
+
+        A file still in an input stream reports its expected size (from the
+        input descriptor) until it is actually read, which may turn out to
+        be wrong.
+
+        Returns:
+          bool: False if any file's size is only an expectation.
+        """
+        return not any(isinstance(file_ref, FileInStream) and
+                       file_ref.file_path is None
+                       for _, file_ref in self._package_files())
+
+    @staticmethod
+    def _may_be_sparse(file_ref):
+        """Check whether the given file's data may contain holes.
+
+        Args:
+          file_ref (FileReference): File to check.
+
+        Returns:
+          bool: True if the file containing the data is sparse.
+        """
+        location = file_ref.data_location
+        if location is None:
+            return False
+        stat_info = os.stat(location[0])
+        blocks = getattr(stat_info, 'st_blocks', None)
+        return blocks is not None and blocks * 512 < stat_info.st_size
+
+    def _extract_input_files(self):
+        """Copy files out of the input OVA before it is overwritten.
+
+        Helper for :meth:`tar`. The file references are updated to point to
+        the extracted copies in the :attr:`working_dir`.
+        """
+        # (Python tarfile module doesn't support in-place edits.)
+        # Any files that we need to carry over need to be extracted NOW!
+        logger.info(
+            "Input OVA will be overwritten. Extracting files from %s to"
+            " working directory before overwriting it.", self.input_file)
+        extract = dict(
+            (filename, file_ref)
+            for filename, file_ref in self.file_references.items()
+            if any(part.file_path is None for part in
+                   getattr(file_ref, 'chunks', [file_ref])))
+        TransferScheduler().copy_all(
+            [part for file_ref in extract.values() for part in
+             getattr(file_ref, 'chunks', [file_ref])],
+            self.working_dir)
+        for filename, file_ref in extract.items():
+            if isinstance(file_ref, ChunkedFile):
+                self.file_references[filename] = ChunkedFile(
+                    self.working_dir, filename, file_ref.chunk_size,
+                    checksum_algorithm=self.checksum_algorithm,
+                    expected_size=file_ref.size,
+                    compression=file_ref.compression)
+            else:
+                self.file_references[filename] = FileReference.create(
+                    self.working_dir, filename,
+                    checksum_algorithm=self.checksum_algorithm,
+                    expected_checksum=file_ref.checksum,
+                    expected_size=file_ref.size,
+                    compression=file_ref.compression)
+
+    def _in_place_layout(self, tar_file):
+        """Check whether the given OVA can be updated in place.
+
+        This is possible only if ``tar_file`` is our input OVA, and the
+        files we reference are all already present in it, unchanged and in
+        the same order as in the References section, immediately following
+        the OVF descriptor, manifest, and certificate (if any).
+
+        Args:
+          tar_file (str): File path for the desired OVA archive.
+
+        Returns:
+          int: Offset in ``tar_file`` at which the first referenced file
+          begins, or ``None`` if an in-place update is not possible.
+        """
+        if (not tar_file or _output_stream(tar_file) is not None or
+                self._input_stream is not None or
+                self.input_file == self.ovf_descriptor or
+                os.path.splitext(tar_file)[1] != '.ova' or
+                not _same_file(self.input_file, tar_file)):
+            return None
+        try:
+            index = TARIndex.get(tar_file)
+        except (OSError, EOFError, tarfile.TarError):
+            return None
+
+        members = list(index.members.values())
+        leading = 0
+        while (leading < len(members) and
+               os.path.splitext(members[leading].name)[1] in
+               ['.ovf', '.mf', '.cert']):
+            leading += 1
+        if leading == 0:
+            return None
+
+        files = self._package_files()
+        tail = members[leading:]
+        if ([os.path.normpath(mem.name) for mem in tail] !=
+                [os.path.normpath(href) for href, _ in files]):
+            logger.verbose("Contents of %s differ from the files to be"
+                           " written, so it cannot be updated in place",
+                           tar_file)
+            return None
+        for (href, file_ref), member in zip(files, tail):
+            if (not isinstance(file_ref, FileInTAR) or
+                    os.path.realpath(file_ref.container_path) != index.path or
+                    file_ref.member != member):
+                logger.verbose("File %s is not unchanged from %s, so the OVA"
+                               " cannot be updated in place", href, tar_file)
+                return None
+
+        if tail:
+            return tail[0].header_offset
+        last = members[-1]
+        return last.data_offset + last.size + ((512 - last.size) % 512)
+
+    def _update_ova_in_place(self, descriptor_name, descriptor_data,
+                             tar_file):
+        """Replace the OVF descriptor and manifest in an existing OVA.
+
+        The other files in the OVA are left untouched, so the new descriptor
+        and manifest must exactly fill the space taken up by the old ones.
+        Whitespace after the root element of an XML document is
+        insignificant, so if they are smaller, the descriptor is padded with
+        whitespace (before computing its checksum for the manifest) to take
+        up the slack; the OVA remains a plain USTAR archive.
+
+        Args:
+          descriptor_name (str): Name of the OVF descriptor in the OVA.
+          descriptor_data (bytes): Contents of the OVF descriptor.
+          tar_file (str): File path for the OVA archive to update.
+
+        Returns:
+          bool: True if the OVA was updated, False if an in-place update is
+          not possible and the OVA needs to be rebuilt instead.
+        """
+        tail_offset = self._in_place_layout(tar_file)
+        if tail_offset is None:
+            return False
+
+        manifest_name = os.path.splitext(descriptor_name)[0] + '.mf'
+        manifest_size = self._manifest_size(descriptor_name)
+        # The manifest's size doesn't depend on the checksums in it, so we
+        # know how much room is left for the descriptor data
+        room = (tail_offset - len(tar_header(descriptor_name, 0)) -
+                len(tar_header(manifest_name, manifest_size)) -
+                tar_entry_size(manifest_size) + 512)
+        if room < len(descriptor_data):
+            logger.verbose("OVF descriptor and manifest no longer fit in front"
+                           " of the other files in %s, so it must be rebuilt",
+                           tar_file)
+            return False
+        if room > len(descriptor_data):
+            descriptor_data += (b' ' * (room - len(descriptor_data) - 1) +
+                                b'\n')
+        hash_obj = checksum_hash(self.checksum_algorithm)
+        hash_obj.update(descriptor_data)
+        manifest_data = self._manifest_data(descriptor_name,
+                                            hash_obj.hexdigest())
+
+        if any(os.path.splitext(name)[1] == '.cert' for
+               name in TARIndex.get(tar_file).names):
+            logger.warning("COT doesn't know how to re-sign a certificate"
+                           " file, so the existing certificate will be"
+                           " omitted from %s.", tar_file)
+
+        metadata = []
+        for name, data in [(descriptor_name, descriptor_data),
+                           (manifest_name, manifest_data)]:
+            metadata.append(tar_header(name, len(data)))
+            metadata.append(data)
+            metadata.append(b'\0' * ((512 - len(data)) % 512))
+        metadata = b''.join(metadata)
+        # Check before touching the OVA, as a mistake here would corrupt it
+        _check_layout(tar_file + " metadata size", tail_offset, len(metadata))
+
+        logger.info("Updating OVF descriptor and manifest in %s in place",
+                    tar_file)
+        with open(tar_file, 'r+b') as tarf:
+            tarf.write(metadata)
+        TARIndex.invalidate(tar_file)
+        return True
 
     def _ensure_section(self, section_tag, info_string,
                         attrib=None, parent=None):
@@ -2815,6 +3627,7 @@ class OVF(VMDescription, XML):
             parent = self.envelope
         section = self.find_child(parent, section_tag, attrib=attrib)
         if section is not None:
+            self._index_sections(section)
             return section
 
         logger.notice("No existing %s. Creating it.",
@@ -2836,8 +3649,33 @@ class OVF(VMDescription, XML):
         # All Sections must have an Info child
         self.set_or_make_child(section, self.INFO, info_string)
 
+        self._index_sections(section)
         return section
 
+    def _index_sections(self, *sections):
+        """Index the children of the given sections that are looked up by ID.
+
+        Files, Disks, Networks, configurations, and Properties are looked up
+        by identifier throughout; with an index (see
+        :meth:`~COT.xml_file.XML.index_children`) each lookup no longer has
+        to examine every sibling.
+
+        Args:
+          *sections (xml.etree.ElementTree.Element): Section elements, any
+              of which may be ``None``.
+        """
+        indexes = {
+            self.REFERENCES: (self.FILE, [self.FILE_ID, self.FILE_HREF]),
+            self.DISK_SECTION: (self.DISK, [self.DISK_ID, self.DISK_FILE_REF]),
+            self.NETWORK_SECTION: (self.NETWORK, [self.NETWORK_NAME]),
+            self.DEPLOY_OPT_SECTION: (self.CONFIG, [self.CONFIG_ID]),
+            self.PRODUCT_SECTION: (self.PROPERTY, [self.PROP_KEY]),
+        }
+        for section in sections:
+            if section is not None and section.tag in indexes:
+                tag, attrs = indexes[section.tag]
+                self.index_children(section, tag, attrs)
+
     def _set_product_section_child(self, child_tag, child_text):
         """Update or create the given child of the ProductSection.
 
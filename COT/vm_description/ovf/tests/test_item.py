@@ -18,10 +18,10 @@
 
 import tempfile
 import shutil
-import xml.etree.ElementTree as ET
 
 from COT.tests import COTTestCase
 
+from COT.xml_file import ET
 from COT.vm_description.ovf import OVF
 from COT.vm_description.ovf.name_helper import OVFNameHelper1
 from COT.vm_description.ovf.item import OVFItem
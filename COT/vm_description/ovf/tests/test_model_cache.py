@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# test_model_cache.py - Unit test cases for OVFModelCache class
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Unit test cases for COT.vm_description.ovf.model_cache module."""
+
+import marshal
+import os
+
+import mock
+
+from COT.tests import COTTestCase
+from COT.vm_description.ovf import OVF
+from COT.vm_description.ovf.item import OVFItem
+from COT.vm_description.ovf.model_cache import OVFModelCache
+
+
+class TestOVFModelCache(COTTestCase):
+    """Test cases for OVFModelCache class."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestOVFModelCache, self).setUp()
+        for attr in ('enabled', 'directory'):
+            self.addCleanup(setattr, OVFModelCache, attr,
+                            getattr(OVFModelCache, attr))
+        OVFModelCache.enabled = True
+        OVFModelCache.directory = os.path.join(self.temp_dir, "models")
+        with open(self.input_ovf, 'rb') as fileobj:
+            self.key = OVFModelCache.key(fileobj.read())
+        self.path = os.path.join(OVFModelCache.directory, self.key)
+
+    def test_get(self):
+        """The process-wide cache is disabled by default."""
+        OVFModelCache.enabled = False
+        self.assertIsNone(OVFModelCache.get())
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': '/foo/bar'}):
+            self.assertEqual(OVFModelCache.default_directory(),
+                             os.path.join('/foo/bar', 'cot', 'ovf-models'))
+
+    def test_restore(self):
+        """An unchanged descriptor's hardware is restored, not rebuilt."""
+        with OVF(self.input_ovf, None) as ovf:
+            expected = dict((instance, str(ovfitem)) for (instance, ovfitem)
+                            in ovf.hardware.item_dict.items())
+        self.assertTrue(os.path.exists(self.path))
+
+        with mock.patch.object(OVFItem, 'add_item',
+                               side_effect=AssertionError):
+            with OVF(self.input_ovf, None) as ovf:
+                self.assertEqual(
+                    dict((instance, str(ovfitem)) for (instance, ovfitem)
+                         in ovf.hardware.item_dict.items()),
+                    expected)
+
+    def test_edit(self):
+        """Edits to restored hardware give the same XML as when rebuilt."""
+        outputs = []
+        for enabled in (False, True, True):
+            OVFModelCache.enabled = enabled
+            with OVF(self.input_ovf, None) as ovf:
+                ovf.set_nic_count(4, ["4CPU-4GB-3NIC"])
+                ovf.set_memory(8192, None)
+                ovf.hardware.update_xml()
+                outputs.append(ovf.xml_bytes())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+
+    def test_stale_entry(self):
+        """Entries from other COT versions, or unreadable, are ignored."""
+        cache = OVFModelCache.get()
+        cache.store(self.key, [])
+        self.assertEqual(cache.lookup(self.key), [])
+
+        with open(self.path, 'wb') as fileobj:
+            marshal.dump((("0.0.1", (2, 7)), []), fileobj)
+        self.assertIsNone(cache.lookup(self.key))
+        with OVF(self.input_ovf, None) as ovf:
+            self.assertEqual(13, len(ovf.hardware.item_dict))
+        self.assertIsNotNone(cache.lookup(self.key))
+
+        with open(self.path, 'wb') as fileobj:
+            fileobj.write(b"garbage")
+        self.assertIsNone(cache.lookup(self.key))
+        with OVF(self.input_ovf, None) as ovf:
+            self.assertEqual(13, len(ovf.hardware.item_dict))
@@ -17,6 +17,7 @@
 """Unit test cases for COT.vm_description.ovf.OVF class."""
 
 import filecmp
+import io
 import logging
 import os
 import os.path
@@ -24,12 +25,16 @@ import tempfile
 import shutil
 import subprocess
 import tarfile
+import threading
 import mock
 
 from COT.tests import COTTestCase
 from COT.vm_description.ovf import OVF
 from COT.vm_description import VMInitError
-from COT.data_validation import ValueUnsupportedError
+from COT.data_validation import (
+    ValueMismatchError, ValueUnsupportedError, file_checksum,
+)
+from COT.file_transfer import TARWriter
 from COT.helpers import helpers, HelperError
 
 logger = logging.getLogger(__name__)
@@ -348,6 +353,376 @@ ovf:size="{cfg_size}" />
                 self.fail("KeyError: {0}\n Tarfile members = {1}"
                           .format(exc, tarf.getnames()))
 
+    def test_ova_read_only(self):
+        """Reading an OVA does not extract anything to the working dir."""
+        ova_file = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_file, 'w') as tarf:
+            for path in [self.input_ovf, self.input_manifest,
+                         self.input_vmdk, self.input_iso, self.sample_cfg]:
+                tarf.add(path, os.path.basename(path))
+
+        with mock.patch("tempfile.mkdtemp") as mkdtemp:
+            with OVF(ova_file, None) as ova:
+                self.assertEqual(ova.ovf_descriptor,
+                                 os.path.join(ova_file, "input.ovf"))
+                self.assertEqual(ova.product, "PRODUCT")
+                self.assertEqual(sorted(ova.file_references.keys()),
+                                 ['input.iso', 'input.vmdk', 'sample_cfg.txt'])
+                ova.info_string()
+            mkdtemp.assert_not_called()
+
+    def check_ova_contents(self, ova_file, product):
+        """Check that the given OVA is intact and has the given product."""
+        # The first raw header is the descriptor's own, not an extension
+        with open(ova_file, 'rb') as fileobj:
+            header = fileobj.read(512)
+        self.assertEqual(header[:100].rstrip(b'\0'), b'input.ovf')
+        self.assertEqual(header[156:157], tarfile.REGTYPE)
+        with tarfile.open(ova_file, 'r') as tarf:
+            self.assertEqual(tarf.getnames(),
+                             ['input.ovf', 'input.mf', 'input.vmdk',
+                              'input.iso', 'sample_cfg.txt'])
+            with open(self.input_vmdk, 'rb') as fileobj:
+                self.assertEqual(tarf.extractfile('input.vmdk').read(),
+                                 fileobj.read())
+        with OVF(ova_file, None) as ova:
+            self.assertEqual(ova.product, product)
+
+    def test_ova_stream(self):
+        """Write an OVA sequentially to a stream or to stdout."""
+        ova_file = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_file, 'w') as tarf:
+            for path in [self.input_ovf, self.input_manifest,
+                         self.input_vmdk, self.input_iso, self.sample_cfg]:
+                tarf.add(path, os.path.basename(path))
+        out_file = os.path.join(self.temp_dir, "out.ova")
+
+        stream = io.BytesIO()
+        with OVF(ova_file, stream) as ova:
+            self.assertEqual(ova.output_extension, '.ova')
+            self.assertIsNone(ova.in_place_update_size(stream))
+            ova.product = "streamed"
+        self.assertFalse(stream.closed)
+        with open(out_file, 'wb') as fileobj:
+            fileobj.write(stream.getvalue())
+        self.check_ova_contents(out_file, "streamed")
+
+        with mock.patch('sys.stdout') as stdout:
+            stdout.buffer = io.BytesIO()
+            with OVF(out_file, "-") as ova:
+                ova.product = "stdout"
+            with open(out_file, 'wb') as fileobj:
+                fileobj.write(stdout.buffer.getvalue())
+        self.check_ova_contents(out_file, "stdout")
+
+    def test_ova_input_stream(self):
+        """Read an OVA sequentially from a pipe or from stdin."""
+        ova_file = os.path.join(self.temp_dir, "input.ova")
+        extra = os.path.join(self.temp_dir, "extra.txt")
+        with open(extra, 'w') as fileobj:
+            fileobj.write("not referenced by the OVF\n")
+        # sample_cfg.txt is out of order, so will need to be spilled
+        with tarfile.open(ova_file, 'w') as tarf:
+            for path in [self.input_ovf, self.input_manifest, self.sample_cfg,
+                         extra, self.input_vmdk, self.input_iso]:
+                tarf.add(path, os.path.basename(path))
+        out_file = os.path.join(self.temp_dir, "out.ova")
+
+        read_fd, write_fd = os.pipe()
+
+        def writer():
+            """Feed the OVA into the pipe."""
+            with io.open(write_fd, 'wb') as dst, open(ova_file, 'rb') as src:
+                shutil.copyfileobj(src, dst)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        stream = io.BytesIO()
+        with io.open(read_fd, 'rb') as pipe:
+            with OVF(pipe, stream) as ova:
+                self.assertEqual(ova.output_extension, '.ova')
+                self.assertIsNone(ova.in_place_update_size(out_file))
+                self.assertEqual(sorted(os.listdir(ova.working_dir)),
+                                 ['input.mf', 'input.ovf'])
+                ova.product = "piped"
+                ova.write()
+                self.assertEqual(sorted(os.listdir(ova.working_dir)),
+                                 ['input.mf', 'input.ovf', 'sample_cfg.txt'])
+                ova.output_file = None
+        thread.join()
+        with open(out_file, 'wb') as fileobj:
+            fileobj.write(stream.getvalue())
+        self.check_ova_contents(out_file, "piped")
+
+        # Stream to an OVF and its associated files
+        out_ovf = os.path.join(self.temp_dir, "out.ovf")
+        with open(out_file, 'rb') as fileobj:
+            with mock.patch('sys.stdin') as stdin:
+                stdin.buffer = fileobj
+                with OVF("-", out_ovf) as ova:
+                    self.assertEqual(ova.input_file, "-")
+                    ova.product = "stdin"
+        for path in [self.input_vmdk, self.input_iso, self.sample_cfg]:
+            self.assertTrue(filecmp.cmp(path, os.path.join(
+                self.temp_dir, os.path.basename(path)), shallow=False))
+        with OVF(out_ovf, None) as ova:
+            self.assertEqual(ova.product, "stdin")
+
+    def test_ova_input_stream_to_file(self):
+        """Files whose size is not yet known are written sequentially."""
+        ova_file = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_file, 'w') as tarf:
+            for path in [self.input_ovf, self.input_manifest,
+                         self.input_vmdk, self.input_iso, self.sample_cfg]:
+                tarf.add(path, os.path.basename(path))
+        os.mkdir(os.path.join(self.temp_dir, "out"))
+        out_file = os.path.join(self.temp_dir, "out", "input.ova")
+        with open(ova_file, 'rb') as fileobj:
+            with OVF(fileobj, out_file) as ova:
+                self.assertFalse(ova._sizes_known())
+                ova.product = "piped"
+                with mock.patch("COT.vm_description.ovf.ovf.TARWriter",
+                                wraps=TARWriter) as writer:
+                    ova.write()
+                    writer.assert_called_once_with(out_file,
+                                                   sequential=True)
+                ova.output_file = None
+        self.check_ova_contents(out_file, "piped")
+
+    def test_output_layout_mismatch(self):
+        """Writing an OVA that doesn't match its planned layout fails."""
+        ova_file = os.path.join(self.temp_dir, "out.ova")
+        with OVF(self.minimal_ovf, ova_file) as ovf:
+            self.assertTrue(ovf._sizes_known())
+            manifest_data = ovf._manifest_data
+            with mock.patch.object(
+                    ovf, '_manifest_data',
+                    side_effect=lambda *args: manifest_data(*args) + b"\n"):
+                with self.assertRaises(ValueMismatchError):
+                    ovf.write()
+            ovf.output_file = None
+
+    def test_compressed_files(self):
+        """Compress selected files on write, and read them back."""
+        self.addCleanup(setattr, OVF, 'compress_patterns',
+                        OVF.compress_patterns)
+        OVF.compress_patterns = ('*.txt',)
+        ova_file = os.path.join(self.temp_dir, "out.ova")
+        with OVF(self.input_ovf, ova_file) as ova:
+            ova.write()
+            elem = ova.find_child(ova.references, ova.FILE,
+                                  {ova.FILE_HREF: 'sample_cfg.txt'})
+            self.assertEqual(elem.get(ova.FILE_COMPRESSION), "gzip")
+            size = int(elem.get(ova.FILE_SIZE))
+            ova.output_file = None
+        OVF.compress_patterns = ()
+
+        with tarfile.open(ova_file, 'r') as tarf:
+            member = tarf.getmember('sample_cfg.txt')
+            self.assertEqual(member.size, size)
+            self.assertEqual(tarf.extractfile(member).read(2), b'\x1f\x8b')
+
+        # Compressed file is passed through as-is, but readable on demand
+        out_ovf = os.path.join(self.temp_dir, "out.ovf")
+        with OVF(ova_file, out_ovf) as ova:
+            file_ref = ova.file_references['sample_cfg.txt']
+            self.assertEqual(file_ref.compression, "gzip")
+            self.assertEqual(file_ref.size, size)
+            with file_ref.open_payload() as obj:
+                with open(self.sample_cfg, 'rb') as expected:
+                    self.assertEqual(obj.read(), expected.read())
+        self.assertEqual(
+            os.path.getsize(os.path.join(self.temp_dir, 'sample_cfg.txt')),
+            size)
+        with open(out_ovf) as fileobj:
+            self.assertIn('ovf:compression="gzip"', fileobj.read())
+
+    def test_chunked_files(self):
+        """Split files into chunks on write, and read them back."""
+        self.addCleanup(setattr, OVF, 'chunk_size', OVF.chunk_size)
+        self.addCleanup(setattr, OVF, 'chunk_patterns', OVF.chunk_patterns)
+        OVF.chunk_size = 16
+        OVF.chunk_patterns = ('*.txt',)
+        with open(self.sample_cfg, 'rb') as fileobj:
+            data = fileobj.read()
+        count = -(-len(data) // 16)
+        names = ["sample_cfg.txt.{0:09d}".format(i) for i in range(count)]
+
+        ova_file = os.path.join(self.temp_dir, "out.ova")
+        with OVF(self.input_ovf, ova_file) as ova:
+            ova.write()
+            ova.output_file = None
+        OVF.chunk_size = None
+
+        with tarfile.open(ova_file, 'r') as tarf:
+            self.assertEqual(tarf.getnames()[-count:], names)
+            self.assertEqual(b"".join(tarf.extractfile(name).read()
+                                      for name in names), data)
+            manifest = tarf.extractfile("out.mf").read().decode()
+        for name in names:
+            self.assertIn("({0})=".format(name), manifest)
+        self.assertNotIn("(sample_cfg.txt)=", manifest)
+
+        # Chunks are verified and passed through, but readable as one file
+        out_ovf = os.path.join(self.temp_dir, "out.ovf")
+        with OVF(ova_file, out_ovf) as ova:
+            file_ref = ova.file_references['sample_cfg.txt']
+            self.assertEqual(file_ref.size, len(data))
+            self.assertEqual(len(file_ref.chunks), count)
+            with file_ref.open('rb') as obj:
+                self.assertEqual(obj.read(), data)
+        for name in names:
+            self.assertTrue(os.path.exists(os.path.join(self.temp_dir, name)))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir,
+                                                     'sample_cfg.txt')))
+        with open(out_ovf) as fileobj:
+            self.assertIn('ovf:chunkSize="16"', fileobj.read())
+
+    def test_ova_input_stream_invalid(self):
+        """An OVA stream must begin with an OVF descriptor."""
+        ova_file = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_file, 'w') as tarf:
+            for path in [self.input_vmdk, self.input_ovf]:
+                tarf.add(path, os.path.basename(path))
+        with open(ova_file, 'rb') as fileobj:
+            self.assertRaises(VMInitError, OVF, fileobj, None)
+        with open(self.input_ovf, 'rb') as fileobj:
+            self.assertRaises(VMInitError, OVF, fileobj, None)
+
+    def test_ova_in_place(self):
+        """Overwriting an OVA with only OVF changes updates it in place."""
+        ova_file = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_file, 'w') as tarf:
+            for path in [self.input_ovf, self.input_manifest,
+                         self.input_vmdk, self.input_iso, self.sample_cfg]:
+                tarf.add(path, os.path.basename(path))
+        inode = os.stat(ova_file).st_ino
+
+        size = os.stat(ova_file).st_size
+
+        # Descriptor shrinks - it is padded with whitespace to fill the space
+        with OVF(ova_file, ova_file) as ova:
+            self.assertEqual(ova.in_place_update_size(ova_file), 0)
+            ova.product = "P"
+            with mock.patch("COT.vm_description.ovf.ovf.TARWriter") as writer:
+                ova.write()
+                writer.assert_not_called()
+        self.assertEqual(os.stat(ova_file).st_ino, inode)
+        self.assertEqual(os.stat(ova_file).st_size, size)
+        self.check_ova_contents(ova_file, "P")
+        with tarfile.open(ova_file, 'r') as tarf:
+            descriptor = tarf.extractfile('input.ovf').read()
+        self.assertTrue(descriptor.rstrip().endswith(b'</ovf:Envelope>'))
+
+        # Descriptor grows, but still fits
+        with OVF(ova_file, ova_file) as ova:
+            ova.product = "P" * 8
+            with mock.patch("COT.vm_description.ovf.ovf.TARWriter") as writer:
+                ova.write()
+                writer.assert_not_called()
+        self.assertEqual(os.stat(ova_file).st_size, size)
+        self.check_ova_contents(ova_file, "P" * 8)
+
+        # Descriptor no longer fits - the OVA is rebuilt instead
+        with OVF(ova_file, ova_file) as ova:
+            ova.product = "P" * 16000
+            self.assertIsNone(ova.in_place_update_size(ova_file))
+            ova.write()
+        self.assertGreater(os.stat(ova_file).st_size, size)
+        self.check_ova_contents(ova_file, "P" * 16000)
+
+    def test_ova_in_place_not_possible(self):
+        """Overwriting an OVA with new files falls back to a full rewrite."""
+        ova_file = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_file, 'w') as tarf:
+            for path in [self.input_ovf, self.input_manifest,
+                         self.input_vmdk, self.input_iso, self.sample_cfg]:
+                tarf.add(path, os.path.basename(path))
+
+        extra_file = os.path.join(self.temp_dir, "extra.iso")
+        shutil.copy(self.input_iso, extra_file)
+        with OVF(ova_file, ova_file) as ova:
+            ova.add_file(extra_file, "file2")
+            self.assertIsNone(ova.in_place_update_size(ova_file))
+            ova.write()
+        with tarfile.open(ova_file, 'r') as tarf:
+            self.assertEqual(tarf.getnames(),
+                             ['input.ovf', 'input.mf', 'input.vmdk',
+                              'input.iso', 'sample_cfg.txt', 'extra.iso'])
+
+        # Writing to a different file is never done in place
+        with OVF(ova_file, os.path.join(self.temp_dir, "out.ova")) as ova:
+            self.assertIsNone(ova.in_place_update_size(
+                os.path.join(self.temp_dir, "out.ova")))
+
+    CHECKSUM_MISMATCH = {
+        'levelname': 'ERROR',
+        'msg': "The %s checksum for file '%s' is expected to be",
+    }
+
+    def test_verify_policies(self):
+        """Checksums can be verified at load, on use, at write, or never."""
+        self.staging_dir = tempfile.mkdtemp(prefix="cot_ut_ovfio_stage")
+        for path in [self.input_ovf, self.input_manifest,
+                     self.input_vmdk, self.input_iso]:
+            shutil.copy(path, self.staging_dir)
+        # Same size as the original, but different contents
+        with open(self.sample_cfg, 'rb') as fileobj:
+            data = fileobj.read()
+        with open(os.path.join(self.staging_dir, "sample_cfg.txt"),
+                  'wb') as fileobj:
+            fileobj.write(data[::-1])
+        ovf_file = os.path.join(self.staging_dir, "input.ovf")
+
+        with OVF(ovf_file, None):
+            self.assertLogged(**self.CHECKSUM_MISMATCH)
+
+        for policy in [OVF.VERIFY_ON_USE, OVF.VERIFY_ON_WRITE,
+                       OVF.VERIFY_NEVER]:
+            with OVF(ovf_file, None, verify=policy) as ovf:
+                self.assertNoLogsOver(logging.INFO, policy)
+                ovf.info_string()
+
+        with OVF(ovf_file, None, verify=OVF.VERIFY_ON_USE) as ovf:
+            file_ref = ovf.file_references['sample_cfg.txt']
+            self.assertIsNotNone(file_ref.checksum)
+            self.assertLogged(**self.CHECKSUM_MISMATCH)
+            self.assertIsNotNone(file_ref.checksum)
+
+        with OVF(ovf_file, self.temp_file, verify=OVF.VERIFY_ON_WRITE):
+            self.assertNoLogsOver(logging.INFO)
+        self.assertLogged(**self.CHECKSUM_MISMATCH)
+
+        with OVF(ovf_file, self.temp_file, verify=OVF.VERIFY_NEVER):
+            pass
+
+        with self.assertRaises(ValueUnsupportedError):
+            OVF(ovf_file, None, verify="sometimes")
+
+    def test_manifest_checksum_type(self):
+        """Files are verified using the checksum type in the manifest."""
+        self.staging_dir = tempfile.mkdtemp(prefix="cot_ut_ovfio_stage")
+        paths = [self.input_ovf, self.input_vmdk, self.input_iso,
+                 self.sample_cfg]
+        for path in paths:
+            shutil.copy(path, self.staging_dir)
+        # OVF 1.x prefers SHA1, but this manifest uses SHA256
+        with open(os.path.join(self.staging_dir, "input.mf"), 'w') as mfobj:
+            for path in paths:
+                mfobj.write("SHA256({0})= {1}\n".format(
+                    os.path.basename(path), file_checksum(path, 'sha256')))
+
+        with OVF(os.path.join(self.staging_dir, "input.ovf"), None) as ovf:
+            self.assertEqual(ovf.checksum_algorithm, 'sha1')
+            file_ref = ovf.file_references['input.vmdk']
+            # Both checksums were computed by the same read
+            with mock.patch("COT.file_reference.file_checksums") as cksum:
+                self.assertEqual(file_ref.checksum,
+                                 file_checksum(self.input_vmdk, 'sha1'))
+                self.assertEqual(file_ref.get_checksum('sha256'),
+                                 file_checksum(self.input_vmdk, 'sha256'))
+                cksum.assert_not_called()
+
     def test_invalid_ovf_file(self):
         """Check that various invalid input OVF files result in VMInitError."""
         fake_file = os.path.join(self.temp_dir, "foo.ovf")
@@ -517,6 +892,37 @@ class TestOVFAPI(COTTestCase):
                 "predicted output size of {0} was {1} but actual size is {2}"
                 .format(input_file, predicted, actual))
 
+    def test_output_layout(self):
+        """The planned layout of an OVA matches the OVA actually written."""
+        ova_file = os.path.join(self.temp_dir, "out.ova")
+        with OVF(self.input_ovf, ova_file) as ovf:
+            self.assertEqual(ovf.output_layout().entries[0][0], "out.ovf")
+            with mock.patch("COT.vm_description.ovf.ovf.TARWriter.preallocate",
+                            autospec=True) as preallocate:
+                ovf.write()
+            ovf.output_file = None
+        layout = preallocate.call_args[0][1]
+        self.assertEqual(os.path.getsize(ova_file), layout.size)
+        with tarfile.open(ova_file, 'r') as tarf:
+            self.assertEqual(
+                layout.entries,
+                [(member.name, member.offset, member.offset_data, member.size)
+                 for member in tarf.getmembers()])
+
+    def test_descriptor_written_once(self):
+        """The descriptor goes straight into the OVA, not via a file."""
+        ova_file = os.path.join(self.temp_dir, "out.ova")
+        with OVF(self.minimal_ovf, ova_file) as ovf:
+            ovf.write()
+            self.assertEqual([], os.listdir(ovf.working_dir))
+            ovf.output_file = None
+        with tarfile.open(ova_file, 'r') as tarf:
+            self.assertEqual(tarf.getnames(), ["out.ovf", "out.mf"])
+            descriptor = tarf.extractfile("out.ovf").read()
+            manifest = tarf.extractfile("out.mf").read()
+        self.assertEqual(manifest.decode(), "SHA1(out.ovf)= {0}\n".format(
+            file_checksum(io.BytesIO(descriptor), 'sha1')))
+
     def test_configuration_profiles(self):
         """Check profile id list APIs."""
         # No profiles defined
@@ -42,17 +42,25 @@ class TestVMDescription(unittest.TestCase):
     def test_context_manager(self, write, rmtree, *_):
         """Verify context manager logic."""
         # Successful exit - write() is called and working_dir is cleaned up
-        with VMDescription("foo.txt", None):
-            pass
+        with VMDescription("foo.txt", None) as ins:
+            self.assertEqual(ins.working_dir, "/foo/bar")
         write.assert_called_once()
         rmtree.assert_called_once_with("/foo/bar")
 
+        rmtree.reset_mock()
+
+        # working_dir is only created (and cleaned up) if actually used
+        with VMDescription("foo.txt", None):
+            pass
+        rmtree.assert_not_called()
+
         write.reset_mock()
         rmtree.reset_mock()
 
         # Error exit - cleanup still happens but write() is not called
         with self.assertRaises(RuntimeError):
-            with VMDescription("foo.txt", None):
+            with VMDescription("foo.txt", None) as ins:
+                self.assertEqual(ins.working_dir, "/foo/bar")
                 raise RuntimeError("Gotcha!")
         write.assert_not_called()
         rmtree.assert_called_once_with("/foo/bar")
@@ -66,6 +74,7 @@ class TestVMDescription(unittest.TestCase):
     def test_abstract_io_apis(self):
         """Get NotImplementedError from abstract I/O APIs."""
         ins = VMDescription(self.TEXT_FILE, self.TEXT_FILE)
+        working_dir = ins.working_dir
 
         self.assertRaises(NotImplementedError,
                           ins.write)
@@ -73,11 +82,12 @@ class TestVMDescription(unittest.TestCase):
         self.assertRaises(NotImplementedError, ins.predicted_output_size)
 
         ins.destroy()
-        self.assertFalse(os.path.exists(ins.working_dir))
+        self.assertFalse(os.path.exists(working_dir))
 
     def test_abstract_info_apis(self):
         """Get NotImplementedError from abstract info APIs."""
         ins = VMDescription(self.TEXT_FILE, None)
+        working_dir = ins.working_dir
 
         with self.assertRaises(NotImplementedError):
             assert ins.platform
@@ -87,11 +97,12 @@ class TestVMDescription(unittest.TestCase):
                           ins.profile_info_string)
 
         ins.destroy()
-        self.assertFalse(os.path.exists(ins.working_dir))
+        self.assertFalse(os.path.exists(working_dir))
 
     def test_abstract_disk_file_apis(self):
         """Get NotImplementedError from abstract disk and file APIs."""
         ins = VMDescription(self.TEXT_FILE, None)
+        working_dir = ins.working_dir
 
         self.assertRaises(NotImplementedError,
                           ins.search_from_filename, self.TEXT_FILE)
@@ -133,11 +144,12 @@ class TestVMDescription(unittest.TestCase):
                           ins.find_empty_drive, None)
 
         ins.destroy()
-        self.assertFalse(os.path.exists(ins.working_dir))
+        self.assertFalse(os.path.exists(working_dir))
 
     def test_abstract_hardware_apis(self):
         """Get NotImplementedError from abstract hardware APIs."""
         ins = VMDescription(self.TEXT_FILE, None)
+        working_dir = ins.working_dir
 
         with self.assertRaises(NotImplementedError):
             ins.validate_hardware()
@@ -194,11 +206,12 @@ class TestVMDescription(unittest.TestCase):
                           ins.find_device_location, None)
 
         ins.destroy()
-        self.assertFalse(os.path.exists(ins.working_dir))
+        self.assertFalse(os.path.exists(working_dir))
 
     def test_abstract_product_apis(self):
         """Get NotImplementedError from abstract product APIs."""
         ins = VMDescription(self.TEXT_FILE, None)
+        working_dir = ins.working_dir
 
         with self.assertRaises(NotImplementedError):
             assert ins.version_short
@@ -210,11 +223,12 @@ class TestVMDescription(unittest.TestCase):
             ins.version_long = "hello world!"
 
         ins.destroy()
-        self.assertFalse(os.path.exists(ins.working_dir))
+        self.assertFalse(os.path.exists(working_dir))
 
     def test_abstract_property_apis(self):
         """Get NotImplementedError from abstract property APIs."""
         ins = VMDescription(self.TEXT_FILE, None)
+        working_dir = ins.working_dir
 
         with self.assertRaises(NotImplementedError):
             assert ins.environment_properties
@@ -230,11 +244,12 @@ class TestVMDescription(unittest.TestCase):
                           ins.config_file_to_properties, self.TEXT_FILE)
 
         ins.destroy()
-        self.assertFalse(os.path.exists(ins.working_dir))
+        self.assertFalse(os.path.exists(working_dir))
 
     def test_generic_instance_apis(self):
         """Verify APIs with generic implementations."""
         ins = VMDescription(self.TEXT_FILE, None)
+        working_dir = ins.working_dir
         self.assertEqual(ins.input_file, self.TEXT_FILE)
         self.assertEqual(ins.output_file, None)
         self.assertTrue(os.path.exists(ins.working_dir))
@@ -249,4 +264,4 @@ class TestVMDescription(unittest.TestCase):
         self.assertEqual(out, self.TEXT_FILE)
 
         ins.destroy()
-        self.assertFalse(os.path.exists(ins.working_dir))
+        self.assertFalse(os.path.exists(working_dir))
@@ -47,7 +47,7 @@ class VMDescription(object):
     """Abstract class for reading, editing, and writing VM definitions.
 
     Examples:
-      Because instantiating this class creates a temporary directory
+      Because this class may create a temporary directory
       (:attr:`working_dir`), it's important to always clean up.
       This can be done explicitly::
 
@@ -105,6 +105,18 @@ class VMDescription(object):
     # pylint: disable=redundant-returns-doc
     # pylint: disable=no-self-use, unused-argument
 
+    VERIFY_ON_LOAD = "load"
+    """Verify file checksums as soon as the input is loaded."""
+    VERIFY_ON_USE = "use"
+    """Verify each file's checksum when it is first computed for other use."""
+    VERIFY_ON_WRITE = "write"
+    """Verify file checksums only when :meth:`write` is called."""
+    VERIFY_NEVER = "never"
+    """Never verify file checksums against the input manifest."""
+    VERIFY_POLICIES = (VERIFY_ON_LOAD, VERIFY_ON_USE,
+                       VERIFY_ON_WRITE, VERIFY_NEVER)
+    """Supported values for the ``verify`` argument of :meth:`__init__`."""
+
     @classmethod
     def detect_type_from_name(cls, filename):
         """Check the given filename to see if it looks like a type we support.
@@ -169,10 +181,11 @@ class VMDescription(object):
 
         return vm
 
-    def __init__(self, input_file, output_file=None):
+    def __init__(self, input_file, output_file=None, verify=VERIFY_ON_LOAD):
         """Read the given VM description file into memory.
 
-        Also creates a temporary directory as a working directory.
+        The temporary working directory (:attr:`working_dir`) is not
+        created until it is first needed.
 
         Args:
           input_file (str): Data file to read in.
@@ -182,12 +195,20 @@ class VMDescription(object):
                 this value should be ``None``
               * If the output filename is not yet known, use ``""`` and
                 subsequently set :attr:`output` when it is determined.
+          verify (str): When to verify the checksums of the files in the
+              input, one of :attr:`VERIFY_POLICIES`.
+
+        Raises:
+          ValueUnsupportedError: if ``verify`` is not a known policy.
         """
         self._input_file = input_file
         self._product_class = None
-        logger.verbose("Creating temporary working directory for this VM")
-        self._working_dir = tempfile.mkdtemp(prefix="cot")
-        logger.debug("Working directory: %s", self.working_dir)
+        self._working_dir = None
+        if verify not in self.VERIFY_POLICIES:
+            raise ValueUnsupportedError("verify", verify,
+                                        self.VERIFY_POLICIES)
+        self.verify = verify
+        """Checksum verification policy, one of :attr:`VERIFY_POLICIES`."""
         self._output_file = None
         self.output_file = output_file
         atexit.register(self.destroy)
@@ -213,19 +234,17 @@ class VMDescription(object):
 
         Deletes :attr:`self.working_dir` and its contents.
         """
-        try:
-            if hasattr(self,
-                       'working_dir') and os.path.exists(self.working_dir):
-                logger.verbose("Removing working directory")
-                total_size = directory_size(self.working_dir)
-                logger.debug("Size of working directory '%s', prior to"
-                             " removal, is %s",
-                             self.working_dir,
-                             pretty_bytes(total_size))
-                # Clean up
-                shutil.rmtree(self.working_dir)
-        except AttributeError:
-            pass
+        # Don't use self.working_dir here, as that would create the directory
+        working_dir = getattr(self, '_working_dir', None)
+        if working_dir and os.path.exists(working_dir):
+            logger.verbose("Removing working directory")
+            total_size = directory_size(working_dir)
+            logger.debug("Size of working directory '%s', prior to"
+                         " removal, is %s",
+                         working_dir,
+                         pretty_bytes(total_size))
+            # Clean up
+            shutil.rmtree(working_dir)
 
     @property
     def input_file(self):
@@ -245,8 +264,14 @@ class VMDescription(object):
     def working_dir(self):
         """Temporary directory this instance can use for storage.
 
-        Will be automatically erased when :meth:`destroy` is called.
+        Created on first access, so that read-only operations need not touch
+        the filesystem at all. Will be automatically erased when
+        :meth:`destroy` is called.
         """
+        if self._working_dir is None:
+            logger.verbose("Creating temporary working directory for this VM")
+            self._working_dir = tempfile.mkdtemp(prefix="cot")
+            logger.debug("Working directory: %s", self._working_dir)
         return self._working_dir
 
     def write(self):
@@ -367,6 +392,22 @@ class VMDescription(object):
         """
         raise NotImplementedError("predicted_output_size not implemented")
 
+    def in_place_update_size(self, output_file):
+        """Estimate the disk space needed to update the output in place.
+
+        Some formats allow the input file to be updated without rewriting
+        all of its contents, in which case far less free disk space is needed
+        than :meth:`predicted_output_size` would suggest.
+
+        Args:
+          output_file (str): Output file path to consider.
+
+        Returns:
+          int: Estimated number of additional bytes consumed when updating
+          ``output_file`` in place, or ``None`` if this is not possible.
+        """
+        return None
+
     # API methods needed for add-disk
     def convert_disk_if_needed(self,   # pylint: disable=no-self-use
                                disk_image,
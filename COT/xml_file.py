@@ -14,18 +14,590 @@
 # of COT, including this file, may be copied, modified, propagated, or
 # distributed except according to the terms contained in the LICENSE.txt file.
 
-"""Reading, editing, and writing XML files."""
+"""Reading, editing, and writing XML files.
 
-import xml.etree.ElementTree as ET
+XML is handled by :mod:`lxml.etree` if it is installed, as its parsing,
+searching, and serialization are implemented in C and are much faster on
+large documents, or by the standard :mod:`xml.etree.ElementTree`
+otherwise. The two have the same API for everything COT does with XML, so
+the rest of COT should use :data:`ET` (and :data:`ParseError`) from this
+module rather than importing either one directly, to avoid mixing elements
+from both. Set the environment variable ``COT_XML_BACKEND`` to ``etree``
+(or ``lxml``) to choose one explicitly.
+
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  XML
+
+**Constants**
+
+.. autosummary::
+  BACKEND
+  ET
+  ParseError
+"""
+
+import io
+import itertools
 import logging
+import os
 import re
+import weakref
+from xml.parsers import expat
 
 logger = logging.getLogger(__name__)
 
 
+def _import_backend():
+    """Import the XML library to use, preferring :mod:`lxml.etree`.
+
+    Returns:
+      tuple: (name, module) - ("lxml", :mod:`lxml.etree`) or
+      ("etree", :mod:`xml.etree.ElementTree`).
+
+    Raises:
+      ImportError: if ``COT_XML_BACKEND`` is "lxml" but it isn't installed.
+    """
+    choice = os.environ.get("COT_XML_BACKEND", "").strip().lower()
+    if choice != "etree":
+        try:
+            from lxml import etree
+            return ("lxml", etree)
+        except ImportError:
+            if choice == "lxml":
+                raise
+    import xml.etree.ElementTree as etree
+    return ("etree", etree)
+
+
+_BACKEND = _import_backend()
+
+BACKEND = _BACKEND[0]
+"""Name of the XML library in use, "lxml" or "etree"."""
+
+ET = _BACKEND[1]
+""":mod:`lxml.etree` or :mod:`xml.etree.ElementTree`, as used by COT."""
+
+ParseError = ET.ParseError
+"""Exception raised by :data:`ET` (and by :class:`XML`) for invalid XML."""
+
+
+def _parser():
+    """Create a parser for :func:`ET.parse`, if the default won't do.
+
+    Returns:
+      object: An :class:`lxml.etree.XMLParser` (which can't be shared
+      between threads) that parses the same content that ElementTree
+      would - dropping comments and processing instructions - and never
+      fetches or expands external entities; or ``None`` for ElementTree.
+    """
+    if BACKEND != "lxml":
+        return None
+    return ET.XMLParser(remove_comments=True, remove_pis=True,
+                        resolve_entities=False, no_network=True)
+
+
+class _ByteCounter(object):
+    """Write-only file-like object that just counts the bytes written."""
+
+    def __init__(self):
+        """Start counting from zero."""
+        self.count = 0
+
+    def write(self, data):
+        """Count the given data.
+
+        Args:
+          data (bytes): Data "written".
+        """
+        self.count += len(data)
+
+
+_UNPREFIXED_TAG = re.compile(b"<[^/?!:\\s>]+[\\s/>]")
+"""Matches the start tag of an element without a namespace prefix."""
+
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+"""The namespace of ``xml:`` attributes, which never needs declaring."""
+
+
+_LXML_DECLARATION = b"<?xml version='1.0' encoding='UTF-8'?>"
+_ETREE_DECLARATION = b"<?xml version='1.0' encoding='utf-8'?>"
+
+_LXML_EMPTY_TAG_END = re.compile(b"(?<=[^\\s/])/>")
+"""Matches the end of an empty element as written by lxml, ``<a/>``."""
+
+_GENERATED_PREFIX = re.compile(r"ns[0-9]+$")
+"""Matches the namespace prefixes that lxml and ElementTree make up."""
+
+
+def _lxml_write(tree, fileobj, namespaces=()):
+    """Serialize a tree with lxml exactly as ElementTree would.
+
+    ElementTree declares every namespace on the root element, and writes
+    empty elements as ``<a />``, while lxml declares each namespace on the
+    first element that uses it (making up a new prefix each time for
+    unregistered namespaces) and writes ``<a/>``. COT's output shouldn't
+    depend on which library is installed.
+
+    Args:
+      tree (lxml.etree._ElementTree): Tree to serialize.
+      fileobj (file): File object to write bytes to.
+      namespaces (set): Namespaces to declare on the root element even if
+        not used in the tree.
+    """
+    root = tree.getroot()
+    nsmap = dict(root.nsmap)
+    declared = set(nsmap.values())
+    declared.add(XML_NS)
+    for _, (prefix, uri) in ET.iterwalk(root, events=('start-ns',)):
+        if uri in declared:
+            continue
+        declared.add(uri)
+        if not prefix or prefix in nsmap or _GENERATED_PREFIX.match(prefix):
+            index = len(nsmap)
+            while "ns{0}".format(index) in nsmap:
+                index += 1
+            prefix = "ns{0}".format(index)
+        nsmap[prefix] = uri
+    ET.cleanup_namespaces(tree, top_nsmap=nsmap, keep_ns_prefixes=[
+        prefix for prefix, uri in nsmap.items()
+        if prefix and uri in namespaces])
+    buf = io.BytesIO()
+    tree.write(buf, xml_declaration=True, encoding='utf-8')
+    data = buf.getvalue()
+    if data.startswith(_LXML_DECLARATION):
+        data = _ETREE_DECLARATION + data[len(_LXML_DECLARATION):]
+    fileobj.write(_LXML_EMPTY_TAG_END.sub(b" />", data))
+
+
+def _snapshot(elem):
+    """Capture everything ElementTree knows about the given element.
+
+    Args:
+      elem (xml.etree.ElementTree.Element): Element to capture.
+
+    Returns:
+      list: (tag, attributes, text, tail) for the element and each of its
+      descendants, in document order.
+    """
+    return [(child.tag, dict(child.attrib), child.text, child.tail)
+            for child in elem.iter()]
+
+
+def _matches_snapshot(elem, snapshot):
+    """Check whether the given element is exactly as captured.
+
+    Args:
+      elem (xml.etree.ElementTree.Element): Element to check.
+      snapshot (list): Its :func:`_snapshot`. The element's own tail, which
+          lies outside it, is disregarded.
+
+    Returns:
+      bool: True if neither the element nor its descendants have changed.
+    """
+    children = elem.iter()
+    (tag, attrib, text, _) = snapshot[0]
+    first = next(children)
+    if first.tag != tag or first.text != text or first.attrib != attrib:
+        return False
+    count = 1
+    for (tag, attrib, text, tail), child in zip(
+            itertools.islice(snapshot, 1, None), children):
+        if (child.tag != tag or child.text != text or child.tail != tail or
+                child.attrib != attrib):
+            return False
+        count += 1
+    return count == len(snapshot) and next(children, None) is None
+
+
+def _namespaces(snapshot):
+    """Get the namespaces used by the element captured in a snapshot.
+
+    Args:
+      snapshot (list): A :func:`_snapshot`.
+
+    Returns:
+      set: Namespaces of element tags and attribute names, except the
+      ``xml:`` namespace, which never needs declaring.
+    """
+    namespaces = set()
+    for tag, attrib, _, _ in snapshot:
+        for name in [tag] + list(attrib):
+            if isinstance(name, str) and name.startswith("{"):
+                namespaces.add(name[1:].split("}", 1)[0])
+    namespaces.discard(XML_NS)
+    return namespaces
+
+
+class _ElementScanner(object):
+    """Finds where elements near the root of an XML document start and end.
+
+    ElementTree doesn't keep track of this, so the document is parsed again
+    with :mod:`xml.parsers.expat`. Each element ends where the next parser
+    event (of any kind) after its end tag begins.
+    """
+
+    def __init__(self, depth):
+        """Prepare to scan a document.
+
+        Args:
+          depth (int): How many levels below the root element to scan.
+        """
+        self.depth = depth
+        self.spans = []
+        """List of [start, end, scoped] for each element, in document order,
+        where ``scoped`` is True if an ancestor other than the root declares
+        namespaces (which the element's bytes may rely on)."""
+        self.root_namespaces = {}
+        """Dict of prefix to namespace declared on the root element."""
+        self.usable = True
+        """False if the original bytes of the document can't be reused."""
+        self._parser = None
+        self._level = 0
+        self._open = []
+        self._pending = None
+        self._declares = False
+
+    def scan(self, data):
+        """Scan the given document.
+
+        Args:
+          data (bytes): XML document.
+
+        Raises:
+          xml.parsers.expat.ExpatError: if the document is invalid.
+        """
+        self._parser = expat.ParserCreate(namespace_separator=" ")
+        self._parser.XmlDeclHandler = self._xml_decl
+        self._parser.StartDoctypeDeclHandler = self._doctype
+        self._parser.StartNamespaceDeclHandler = self._namespace_decl
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._mark
+        self._parser.CommentHandler = self._mark
+        self._parser.ProcessingInstructionHandler = self._mark
+        self._parser.DefaultHandlerExpand = self._mark
+        self._parser.Parse(data, True)
+
+    def _mark(self, *_):
+        """Note the end of the element (if any) that has just closed."""
+        if self._pending is not None:
+            self.spans[self._pending][1] = self._parser.CurrentByteIndex
+            self._pending = None
+
+    def _xml_decl(self, _version, encoding, _standalone):
+        """Check the document's encoding."""
+        self._mark()
+        if encoding and encoding.lower().replace("_", "-") not in (
+                "utf-8", "utf8", "us-ascii", "ascii"):
+            self.usable = False
+
+    def _doctype(self, *_):
+        """Give up on documents with a DTD."""
+        self._mark()
+        self.usable = False
+
+    def _namespace_decl(self, prefix, uri):
+        """Note namespaces declared by the element about to start."""
+        self._mark()
+        if self._level == 0:
+            self.root_namespaces[prefix or ""] = uri
+        else:
+            self._declares = True
+
+    def _start(self, *_):
+        """Note where an element starts."""
+        self._mark()
+        declares = self._declares
+        self._declares = False
+        if 1 <= self._level <= self.depth:
+            scoped = any(declared for _, declared in self._open)
+            self.spans.append([self._parser.CurrentByteIndex, None, scoped])
+            if self._level < self.depth:
+                self._open.append((len(self.spans) - 1, declares))
+        self._level += 1
+
+    def _end(self, *_):
+        """Note that an element has just closed."""
+        self._mark()
+        self._level -= 1
+        if 1 <= self._level < self.depth:
+            self._pending = self._open.pop()[0]
+        elif self._level == self.depth:
+            self._pending = len(self.spans) - 1
+
+
+class _SourceDocument(object):
+    """The original bytes of a parsed XML document, for writing back.
+
+    Records a :func:`_snapshot` of each child and grandchild of the root
+    element as parsed. When writing, any of these that still match their
+    snapshot can be written out as the exact bytes they were read from
+    (including any comments, formatting, and choice of character escapes)
+    rather than being re-indented and re-serialized, which is both faster
+    and keeps the output as close to the input as possible.
+    """
+
+    DEPTH = 2
+    """How many levels below the root element to consider reusing."""
+
+    def __init__(self, data, root):
+        """Record the state of the given document as parsed.
+
+        Args:
+          data (bytes): The document as read.
+          root (xml.etree.ElementTree.Element): Root element parsed from it.
+        """
+        self.data = data
+        self.elements = []
+        """Elements that may be reused, in document order."""
+        self.snapshots = {}
+        """Dict of element to its :func:`_snapshot` as parsed."""
+        self._namespaces = {}
+        self._spans = None
+        self._root_namespaces = None
+        self._add(root, 1)
+
+    def _add(self, parent, depth, snapshot=None):
+        """Snapshot the children of the given element, and theirs.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element.
+          depth (int): Depth of its children below the root.
+          snapshot (list): The parent's :func:`_snapshot`, if taken, of which
+              those of its children are just slices.
+        """
+        position = 1
+        for child in parent:
+            if snapshot is None:
+                child_snapshot = _snapshot(child)
+            else:
+                size = sum(1 for _ in child.iter())
+                child_snapshot = snapshot[position:position + size]
+                position += size
+            self.elements.append(child)
+            self.snapshots[child] = child_snapshot
+            if depth < self.DEPTH:
+                self._add(child, depth + 1, child_snapshot)
+
+    def namespaces(self, elem):
+        """Get the namespaces used within the given element as parsed.
+
+        Args:
+          elem (xml.etree.ElementTree.Element): Element parsed.
+
+        Returns:
+          set: Namespace names.
+        """
+        if elem not in self._namespaces:
+            self._namespaces[elem] = _namespaces(self.snapshots[elem])
+        return self._namespaces[elem]
+
+    def _scan(self):
+        """Find the bytes that each element of interest was read from.
+
+        Returns:
+          tuple: (spans, namespaces) - dict of element to (start, end)
+          offsets, for each element whose bytes can be reused, and dict of
+          prefix to namespace declared on the root element. Both are empty
+          if no bytes can be reused at all - for a document with a DTD
+          (which may define entities used within), carriage returns (which
+          would leave mixed line endings), or an encoding other than UTF-8.
+        """
+        scanner = _ElementScanner(self.DEPTH)
+        try:
+            scanner.scan(self.data)
+        except expat.ExpatError as exc:
+            logger.debug("Unable to locate elements in original XML: %s",
+                         exc)
+            return ({}, {})
+        if (not scanner.usable or b"\r" in self.data or
+                len(scanner.spans) != len(self.elements)):
+            return ({}, {})
+        return (dict((elem, (span[0], span[1]))
+                     for elem, span in zip(self.elements, scanner.spans)
+                     if not span[2]),
+                scanner.root_namespaces)
+
+    def spans(self):
+        """Get the byte offsets of each reusable element in :attr:`data`.
+
+        Returns:
+          dict: Element to (start, end) offsets.
+        """
+        if self._spans is None:
+            (self._spans, self._root_namespaces) = self._scan()
+        return self._spans
+
+    def unchanged(self, elem):
+        """Check whether the given element is reusable and unchanged.
+
+        Args:
+          elem (xml.etree.ElementTree.Element): Element to check.
+
+        Returns:
+          bool: True if the element's original bytes can be written as-is.
+        """
+        if elem not in self.spans():
+            return False
+        return _matches_snapshot(elem, self.snapshots[elem])
+
+    def compatible(self, elem, namespaces):
+        """Check the element's original bytes are valid with the given root.
+
+        Args:
+          elem (xml.etree.ElementTree.Element): Unchanged element.
+          namespaces (dict): Prefix to namespace, as declared by the root
+              element of the output.
+
+        Returns:
+          bool: True unless the element's original bytes use a namespace
+          prefix from the original root element that doesn't mean the same
+          in the output.
+        """
+        used = self.namespaces(elem)
+        for prefix, uri in self._root_namespaces.items():
+            if prefix:
+                needed = uri in used
+            else:
+                # Only element names (not attributes) use the default
+                needed = bool(_UNPREFIXED_TAG.search(self.original(elem)))
+            if needed and namespaces.get(prefix) != uri:
+                logger.debug("Namespace prefix '%s' for %s isn't declared"
+                             " in the output; re-serializing <%s>",
+                             prefix, uri, elem.tag)
+                return False
+        return True
+
+    def original(self, elem):
+        """Get the original bytes of the given element.
+
+        Args:
+          elem (xml.etree.ElementTree.Element): Element to get.
+
+        Returns:
+          bytes: Bytes from :attr:`data`.
+        """
+        (start, end) = self.spans()[elem]
+        return self.data[start:end]
+
+
+class _ChildIndex(object):
+    """Index of the children of an element with a given tag, by attributes.
+
+    Maps each attribute value to the matching children so that looking one
+    up doesn't have to examine every child. Kept up to date by the
+    :class:`XML` methods that add, change, or remove children; as a safety
+    net, if the parent has gained or lost children behind its back, or an
+    indexed child's attribute no longer matches, the index is rebuilt.
+    """
+
+    def __init__(self, parent, tag, attrs):
+        """Index the children of the given parent.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          tag (str): Tag of the children to index
+          attrs (list): Attribute names to index them by
+        """
+        self.tag = tag
+        self.attrs = tuple(attrs)
+        self.length = 0
+        """Number of children the parent had when last indexed."""
+        self.values = {}
+        """Dict of indexed child to the tuple of its attribute values."""
+        self.matches = {}
+        """Dict of attribute name to dict of value to list of children."""
+        self.rebuild(parent)
+
+    def rebuild(self, parent):
+        """Re-index all children of the given parent.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+        """
+        self.length = len(parent)
+        self.values = {}
+        self.matches = dict((attr, {}) for attr in self.attrs)
+        for child in parent:
+            if child.tag == self.tag:
+                self._add(child)
+
+    def _add(self, child):
+        """Add the given child to the index."""
+        values = tuple(child.get(attr) for attr in self.attrs)
+        self.values[child] = values
+        for attr, value in zip(self.attrs, values):
+            if value is not None:
+                self.matches[attr].setdefault(value, []).append(child)
+
+    def _discard(self, child):
+        """Remove the given child from the index, if present.
+
+        Returns:
+          bool: Whether the child was indexed.
+        """
+        values = self.values.pop(child, None)
+        if values is None:
+            return False
+        for attr, value in zip(self.attrs, values):
+            if value is not None:
+                children = self.matches[attr][value]
+                children.remove(child)
+                if not children:
+                    del self.matches[attr][value]
+        return True
+
+    def update(self, parent, child, removed=False):
+        """Update the index after the given child was added/changed/removed.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          child (xml.etree.ElementTree.Element): Child element
+          removed (bool): Whether the child was removed from the parent.
+        """
+        if removed:
+            expected = self.length - 1
+            self._discard(child)
+        else:
+            expected = self.length if self._discard(child) else self.length + 1
+            if child.tag == self.tag:
+                self._add(child)
+        if len(parent) == expected or child.tag != self.tag:
+            self.length = len(parent)
+        else:
+            # Other children were added or removed without telling us
+            self.rebuild(parent)
+
+    def find(self, parent, attr, value):
+        """Find the children of the given parent with the given attribute.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          attr (str): Indexed attribute name
+          value (str): Attribute value to match
+
+        Returns:
+          list: Matching children.
+        """
+        if len(parent) != self.length:
+            self.rebuild(parent)
+        children = self.matches[attr].get(value, [])
+        if any(child.get(attr) != value for child in children):
+            self.rebuild(parent)
+            children = self.matches[attr].get(value, [])
+        return list(children)
+
+
 class XML(object):
     """Class capable of reading, editing, and writing XML files."""
 
+    _indexed_documents = weakref.WeakSet()
+    """Instances that have indexed children, for :meth:`_index` to search."""
+
     @staticmethod
     def get_ns(text):
         """Get the namespace prefix from an XML element or attribute name.
@@ -67,16 +639,29 @@ class XML(object):
         :attr:`root`.
 
         Args:
-          xml_file (str): File path to read.
+          xml_file (str): File path or (binary) file object to read.
 
         Raises:
-          xml.etree.ElementTree.ParseError: if parsing fails
+          ParseError: if parsing fails
         """
+        if hasattr(xml_file, 'read'):
+            data = xml_file.read()
+        else:
+            with open(xml_file, 'rb') as fileobj:
+                data = fileobj.read()
         # Parse the XML into memory
-        self.tree = ET.parse(xml_file)
+        self.tree = ET.parse(io.BytesIO(data), _parser())
         """:class:`xml.etree.ElementTree.ElementTree` describing this file."""
         self.root = self.tree.getroot()
         """Root :class:`xml.etree.ElementTree.Element` instance of the tree."""
+        self._source = _SourceDocument(data, self.root)
+        self._child_indexes = {}
+        """Dict of parent element to dict of child tag to :class:`_ChildIndex`.
+
+        Holding the parents (rather than weak references to them) also keeps
+        :mod:`lxml`'s element proxies, which can't be weakly referenced, the
+        same objects for as long as they are indexed.
+        """
 
     def write_xml(self, xml_file):
         """Write pretty XML out to the given file.
@@ -85,36 +670,161 @@ class XML(object):
           xml_file (str): Filename to write to
         """
         logger.verbose("Writing XML to %s", xml_file)
+        with open(xml_file, 'wb') as fileobj:
+            self._write(fileobj)
+
+    def xml_bytes(self):
+        """Get the contents of the file that :meth:`write_xml` would write.
+
+        Returns:
+          bytes: Serialized XML.
+        """
+        buf = io.BytesIO()
+        self._write(buf)
+        return buf.getvalue()
+
+    def xml_size(self):
+        """Get the exact size of the file that :meth:`write_xml` would write.
+
+        The XML is serialized to a byte counter rather than to memory.
+
+        Returns:
+          int: Size in bytes.
+        """
+        counter = _ByteCounter()
+        self._write(counter)
+        return counter.count
+
+    def _write(self, fileobj):
+        """Write pretty XML out to the given file object.
+
+        Elements near the top of the tree that are unchanged since parsing
+        are written out as the bytes they were parsed from; only the rest
+        is re-indented and re-serialized.
+
+        Args:
+          fileobj (file): File object to write bytes to.
+        """
+        unchanged = []
+        for position, child in enumerate(self.root):
+            if self._source.unchanged(child):
+                unchanged.append((self.root, position, child))
+                continue
+            for sub_position, grandchild in enumerate(child):
+                if self._source.unchanged(grandchild):
+                    unchanged.append((child, sub_position, grandchild))
+        logger.spam("Reusing original XML for %s elements", len(unchanged))
 
         # Pretty-print the XML for readability
-        self.xml_reindent(self.root, 0)
-
-        # We could make cleaner XML by passing "default_namespace=NSM['ovf']",
-        # which will leave off the "ovf:" prefix on elements and attributes in
-        # the main OVF namespace, but unfortunately, this cleaner XML is not
-        # recognized as valid by ElementTree, resulting in a "write-once" OVF -
-        # subsequent attempts to read and re-write the XML will give the error:
-        #
-        # ValueError: cannot use non-qualified names with default_namespace
-        # option
-        #
-        # This is a bug - see http://bugs.python.org/issue17088
-        self.tree.write(xml_file, xml_declaration=True, encoding='utf-8')
+        self._reindent(set(elem for _, _, elem in unchanged))
+
+        while True:
+            output = self._serialize(unchanged)
+            if not unchanged:
+                fileobj.write(output)
+                return
+            # The reused elements rely on the namespace prefixes declared
+            # on the original root element meaning the same in the output.
+            root_tag = re.search(b"<[^?!][^>]*>", output).group(0)
+            namespaces = dict(
+                (prefix.decode(), uri.decode()) for prefix, uri in
+                re.findall(b'xmlns(?::([^=]+))?="([^"]*)"', root_tag))
+            compatible = [entry for entry in unchanged
+                          if self._source.compatible(entry[2], namespaces)]
+            if len(compatible) == len(unchanged):
+                break
+            unchanged = compatible
+            self._reindent(set(elem for _, _, elem in unchanged))
+
+        pieces = re.split(b'<[^<>]* cot-reuse="([0-9]+)"[^<>]*>', output)
+        for index, piece in enumerate(pieces):
+            if index % 2:
+                fileobj.write(self._source.original(
+                    unchanged[int(piece)][2]))
+            else:
+                fileobj.write(piece)
+
+    def _serialize(self, unchanged):
+        """Serialize the tree, leaving placeholders for unchanged elements.
+
+        Args:
+          unchanged (list): (parent, position, element) tuples for the
+              elements to leave out.
+
+        Returns:
+          bytes: The serialized XML.
+        """
+        swapped = []
+        namespaces = set()
+        try:
+            for index, (parent, position, elem) in enumerate(unchanged):
+                if BACKEND == "lxml":
+                    # lxml keeps the prefixes the element had in scope,
+                    # so just make sure they're declared on the root.
+                    placeholder = ET.Element(
+                        "cot-reuse", {"cot-reuse": str(index)},
+                        nsmap=dict((prefix, uri) for prefix, uri
+                                   in elem.nsmap.items() if prefix))
+                    namespaces.update(self._source.namespaces(elem))
+                else:
+                    # Make sure the placeholder uses all the namespaces the
+                    # element does, so they're declared on the root element.
+                    placeholder = ET.Element(elem.tag, dict(
+                        [("{" + uri + "}_", "")
+                         for uri in self._source.namespaces(elem)] +
+                        [("cot-reuse", str(index))]))
+                placeholder.tail = elem.tail
+                parent[position] = placeholder
+                swapped.append((parent, position, elem))
+            buf = io.BytesIO()
+            if BACKEND == "lxml":
+                _lxml_write(self.tree, buf, namespaces)
+                return buf.getvalue()
+            # We could make cleaner XML by passing
+            # "default_namespace=NSM['ovf']", which will leave off the "ovf:"
+            # prefix on elements and attributes in the main OVF namespace,
+            # but unfortunately, this cleaner XML is not recognized as valid
+            # by ElementTree, resulting in a "write-once" OVF - subsequent
+            # attempts to read and re-write the XML will give the error:
+            #
+            # ValueError: cannot use non-qualified names with
+            # default_namespace option
+            #
+            # This is a bug - see http://bugs.python.org/issue17088
+            self.tree.write(buf, xml_declaration=True, encoding='utf-8')
+            return buf.getvalue()
+        finally:
+            for parent, position, elem in swapped:
+                parent[position] = elem
+
+    def _reindent(self, skip):
+        """Indent the tree, natively if the XML library can.
+
+        Args:
+          skip (set): Elements whose contents are to be left alone.
+        """
+        if not skip and BACKEND == "lxml" and hasattr(ET, 'indent'):
+            ET.indent(self.tree, space="  ")
+        else:
+            self.xml_reindent(self.root, 0, skip)
 
     @staticmethod
-    def xml_reindent(parent, depth=0):
+    def xml_reindent(parent, depth=0, skip=()):
         """Recursively add indentation to XML to make it look nice.
 
         Args:
           parent (xml.etree.ElementTree.Element): Current parent element
           depth (int): How far down the rabbit hole we have recursed.
               Increments by 2 for each successive level of nesting.
+          skip (set): Elements to indent, but whose contents are to be left
+              alone.
         """
         depth += 2
         last = None
         for elem in list(parent):
             elem.tail = "\n" + (" " * depth)
-            XML.xml_reindent(elem, depth)
+            if elem not in skip:
+                XML.xml_reindent(elem, depth, skip)
             last = elem
 
         if last is not None:
@@ -177,12 +887,14 @@ class XML(object):
         """
         assert parent is not None
         if isinstance(tag, str):
-            elements = parent.findall(tag)
+            elements = cls._indexed_children(parent, tag, attrib)
+            if elements is None:
+                elements = cls._children(parent, tag)
             label = tag
         else:
             elements = []
             for tag_entry in tag:
-                elements.extend(parent.findall(tag_entry))
+                elements.extend(cls._children(parent, tag_entry))
             label = [XML.strip_ns(t) for t in tag]
 
         if not elements:
@@ -211,6 +923,118 @@ class XML(object):
         logger.spam("Found %s matching %s elements", len(child_list), label)
         return child_list
 
+    @staticmethod
+    def _children(parent, tag):
+        """Get the child elements of the given parent with the given tag.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          tag (str): Tag to match on
+
+        Returns:
+          list: Matching child elements, in document order.
+        """
+        if hasattr(parent, 'iterchildren'):
+            # lxml can do this entirely in C, unlike findall()
+            return list(parent.iterchildren(tag))
+        return parent.findall(tag)
+
+    @staticmethod
+    def _index(parent, tag):
+        """Get the index of the given parent's children, if there is one.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          tag (str): Child tag
+
+        Returns:
+          _ChildIndex: Index, or ``None``.
+        """
+        for document in XML._indexed_documents:
+            # pylint: disable=protected-access
+            indexes = document._child_indexes.get(parent)
+            if indexes is not None:
+                return indexes.get(tag)
+        return None
+
+    @classmethod
+    def _indexed_children(cls, parent, tag, attrib):
+        """Look up children by an indexed attribute, if possible.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          tag (str): Child tag to match on
+          attrib (dict): Child attributes to match on
+
+        Returns:
+          list: Children with the given tag that have the value of (at
+          least) one of the given attributes, or ``None`` if none of the
+          attributes are indexed.
+        """
+        if not attrib:
+            return None
+        index = cls._index(parent, tag)
+        if index is None:
+            return None
+        for attr in index.attrs:
+            if attr in attrib:
+                return index.find(parent, attr, attrib[attr])
+        return None
+
+    def index_children(self, parent, tag, attrs):
+        """Index the children of the given parent by the given attributes.
+
+        Subsequent calls to :meth:`find_child` and :meth:`find_all_children`
+        that match on any of these attributes no longer have to examine every
+        child. The index is kept up to date by :meth:`add_child`,
+        :meth:`set_or_make_child`, and :meth:`remove_child`; callers that
+        change an indexed attribute of an existing child directly must then
+        call :meth:`reindex_child`. The index lasts as long as this instance,
+        or until the parent is removed with :meth:`remove_child`.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element in
+              :attr:`tree`
+          tag (str): Tag of the children to index
+          attrs (list): Attribute names to index them by
+        """
+        indexes = self._child_indexes.setdefault(parent, {})
+        XML._indexed_documents.add(self)
+        index = indexes.get(tag)
+        if index is None or set(index.attrs) != set(attrs):
+            indexes[tag] = _ChildIndex(parent, tag, attrs)
+
+    @classmethod
+    def reindex_child(cls, parent, child):
+        """Update any index of the parent's children for the given child.
+
+        Needed only if the child was added or its attributes changed other
+        than through the methods of this class.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          child (xml.etree.ElementTree.Element): Added or changed child
+        """
+        index = cls._index(parent, child.tag)
+        if index is not None:
+            index.update(parent, child)
+
+    @classmethod
+    def remove_child(cls, parent, child):
+        """Remove the given child element from the given parent element.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          child (xml.etree.ElementTree.Element): Child element to remove
+        """
+        parent.remove(child)
+        index = cls._index(parent, child.tag)
+        if index is not None:
+            index.update(parent, child, removed=True)
+        for document in XML._indexed_documents:
+            # pylint: disable=protected-access
+            document._child_indexes.pop(child, None)
+
     @classmethod
     def add_child(cls, parent, new_child, ordering=None,
                   known_namespaces=None):
@@ -276,6 +1100,7 @@ class XML(object):
                 parent.insert(index, new_child)
             else:
                 parent.append(new_child)
+        cls.reindex_child(parent, new_child)
 
     @classmethod
     def set_or_make_child(cls, parent, tag, text=None, attrib=None,
@@ -307,4 +1132,6 @@ class XML(object):
             element.text = str(text)
         for attr in attrib:
             element.set(attr, attrib[attr])
+        if attrib:
+            cls.reindex_child(parent, element)
         return element
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#
+# ova_write.py - Benchmark for writing file data into an OVA
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Compare tarfile against TARWriter for building OVAs.
+
+Creates a large file on disk, then archives it (file-to-TAR) and repacks the
+resulting archive (TAR-to-TAR) with each method, reporting MB/s and the CPU
+time consumed::
+
+    python benchmarks/ova_write.py --size 4096
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+from COT.file_reference import FileInTAR
+from COT.file_transfer import TARWriter
+
+
+def make_file(directory, size_mb):
+    """Create a file of random data of the given size.
+
+    Args:
+      directory (str): Directory to create the file in.
+      size_mb (int): Size of the file, in MiB.
+
+    Returns:
+      str: Path to the file.
+    """
+    path = os.path.join(directory, "disk.img")
+    chunk = os.urandom(1024 * 1024)
+    with open(path, 'wb') as fileobj:
+        for _ in range(size_mb):
+            fileobj.write(chunk)
+    return path
+
+
+def tarfile_from_file(src, dst):
+    """Archive a file the way COT did before TARWriter.
+
+    Args:
+      src (str): File to archive.
+      dst (str): TAR file to create.
+    """
+    with tarfile.open(dst, 'w', dereference=True) as tarf:
+        tarf.add(src, "disk.img")
+
+
+def tarfile_from_tar(src, dst):
+    """Repack a TAR member the way COT did before TARWriter.
+
+    Args:
+      src (str): TAR file to copy from.
+      dst (str): TAR file to create.
+    """
+    with tarfile.open(src, 'r') as src_tarf:
+        with tarfile.open(dst, 'w') as tarf:
+            member = src_tarf.getmember("disk.img")
+            tarf.addfile(member, src_tarf.extractfile(member))
+
+
+def writer_from_file(src, dst):
+    """Archive a file with :class:`TARWriter`.
+
+    Args:
+      src (str): File to archive.
+      dst (str): TAR file to create.
+    """
+    with TARWriter(dst) as tarw:
+        tarw.add(src, "disk.img")
+
+
+def writer_from_tar(src, dst):
+    """Repack a TAR member with :class:`TARWriter`.
+
+    Args:
+      src (str): TAR file to copy from.
+      dst (str): TAR file to create.
+    """
+    with TARWriter(dst) as tarw:
+        FileInTAR(src, "disk.img").add_to_archive(tarw)
+
+
+def measure(func, src, dst, repeat):
+    """Run the given function several times and report the best results.
+
+    Args:
+      func (function): Function to call with ``src`` and ``dst``.
+      src (str): Source path.
+      dst (str): Destination path.
+      repeat (int): Number of runs.
+
+    Returns:
+      tuple: (wall clock seconds, CPU seconds) of the fastest run.
+    """
+    best = None
+    for _ in range(repeat):
+        if os.path.exists(dst):
+            os.remove(dst)
+        cpu_start = sum(os.times()[:2])
+        start = time.time()
+        func(src, dst)
+        result = (time.time() - start, sum(os.times()[:2]) - cpu_start)
+        if best is None or result[0] < best[0]:
+            best = result
+    return best
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=2048,
+                        help="File size in MiB (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per method; best is reported")
+    parser.add_argument('--dir', default=None,
+                        help="Directory to work in (default: system temp)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="cot_bench", dir=args.dir)
+    try:
+        src_file = make_file(directory, args.size)
+        src_tar = os.path.join(directory, "src.ova")
+        writer_from_file(src_file, src_tar)
+        dst = os.path.join(directory, "dst.ova")
+        print("{0:28} {1:>10} {2:>10}".format("", "MB/s", "CPU s"))
+        for label, func, src in [
+                ("file -> TAR (tarfile)", tarfile_from_file, src_file),
+                ("file -> TAR (TARWriter)", writer_from_file, src_file),
+                ("TAR -> TAR (tarfile)", tarfile_from_tar, src_tar),
+                ("TAR -> TAR (TARWriter)", writer_from_tar, src_tar),
+        ]:
+            elapsed, cpu = measure(func, src, dst, args.repeat)
+            print("{0:28} {1:10.1f} {2:10.2f}".format(
+                label, args.size / elapsed, cpu))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
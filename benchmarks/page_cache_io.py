@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+# page_cache_io.py - Benchmark for streaming reads with a hot or cold cache
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Compare plain reads against SequentialReader with a hot or cold cache.
+
+Creates a large file, then reads (and optionally hashes) it with plain
+buffered reads and with :class:`COT.stream_io.SequentialReader` in each of
+its modes, with and without reading ahead in a background thread while the
+data is hashed, reporting MB/s. For the "cold" case the file is evicted from
+the page cache before every run; for the "hot" case it is read once
+beforehand (which the drop-behind and direct modes deliberately don't
+benefit from)::
+
+    python benchmarks/page_cache_io.py --size 4096 --algorithm sha1
+
+Put the file on the storage of interest with ``--dir``; a file on tmpfs is
+always cached and can't be read with direct I/O.
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from COT.stream_io import SequentialReader, fadvise
+
+
+def make_file(directory, size_mb):
+    """Create a file of random data of the given size.
+
+    Args:
+      directory (str): Directory to create the file in.
+      size_mb (int): Size of the file, in MiB.
+
+    Returns:
+      str: Path to the file.
+    """
+    path = os.path.join(directory, "disk.img")
+    chunk = os.urandom(1024 * 1024)
+    with open(path, 'wb') as fileobj:
+        for _ in range(size_mb):
+            fileobj.write(chunk)
+        fileobj.flush()
+        os.fsync(fileobj.fileno())
+    return path
+
+
+def evict(path):
+    """Drop the given (fully written back) file from the page cache.
+
+    Args:
+      path (str): Path to the file.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fadvise(fd, 0, 0, "DONTNEED")
+    finally:
+        os.close(fd)
+
+
+def plain_read(path, algorithm, buffer_size):
+    """Read the file the way COT did before SequentialReader.
+
+    Args:
+      path (str): Path to the file.
+      algorithm (str): Hash algorithm, or ``None`` to only read.
+      buffer_size (int): Bytes to read at a time.
+    """
+    hash_obj = hashlib.new(algorithm) if algorithm else None
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(path, 'rb') as fileobj:
+        while True:
+            count = fileobj.readinto(buf)
+            if not count:
+                break
+            if hash_obj:
+                hash_obj.update(view[:count])
+
+
+def sequential_read(path, algorithm, buffer_size):
+    """Read the file with a :class:`SequentialReader`.
+
+    Args:
+      path (str): Path to the file.
+      algorithm (str): Hash algorithm, or ``None`` to only read.
+      buffer_size (int): Bytes to read at a time.
+    """
+    SequentialReader.buffer_size = buffer_size
+    hash_obj = hashlib.new(algorithm) if algorithm else None
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        with SequentialReader(fd, path=path) as reader:
+            for data in reader:
+                if hash_obj:
+                    hash_obj.update(data)
+    finally:
+        os.close(fd)
+
+
+MODES = [
+    # label, function, SequentialReader attributes
+    ("plain read", plain_read, {}),
+    ("sequential", sequential_read,
+     dict(drop_behind=False, direct=False, pipeline_depth=1)),
+    ("sequential+read-ahead", sequential_read,
+     dict(drop_behind=False, direct=False, pipeline_depth=4)),
+    ("sequential+drop-behind", sequential_read,
+     dict(drop_behind=True, direct=False, pipeline_depth=4)),
+    ("direct I/O", sequential_read,
+     dict(drop_behind=False, direct=True, pipeline_depth=1)),
+    ("direct I/O+read-ahead", sequential_read,
+     dict(drop_behind=False, direct=True, pipeline_depth=4)),
+]
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=2048,
+                        help="File size in MiB (default: %(default)s)")
+    parser.add_argument('--buffer', type=int, default=1024,
+                        help="Read buffer size in KiB (default: %(default)s)")
+    parser.add_argument('--algorithm', default=None,
+                        choices=['md5', 'sha1', 'sha256'],
+                        help="Also hash the data (default: read only)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per method; best is reported")
+    parser.add_argument('--dir', default=None,
+                        help="Directory to create the test file in")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="cot_bench", dir=args.dir)
+    try:
+        path = make_file(directory, args.size)
+        print("{0:24} {1:>10} {2:>10}".format("", "cold", "hot"))
+        SequentialReader.drop_behind_min_size = 0
+        for label, func, settings in MODES:
+            for attr, value in settings.items():
+                setattr(SequentialReader, attr, value)
+            results = []
+            for hot in (False, True):
+                best = None
+                for _ in range(args.repeat):
+                    evict(path)
+                    if hot:
+                        plain_read(path, None, 1024 * 1024)
+                    start = time.time()
+                    func(path, args.algorithm, args.buffer * 1024)
+                    elapsed = time.time() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                results.append(args.size / best)
+            print("{0:24} {1:5.1f} MB/s {2:5.1f} MB/s"
+                  .format(label, results[0], results[1]))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
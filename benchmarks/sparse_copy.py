@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+#
+# sparse_copy.py - Benchmark for copying a mostly-empty raw disk image
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Compare dense and sparse-aware copies of a thin raw disk image.
+
+Creates a sparse raw disk image of the given size with a little data
+scattered through it, then copies it (and adds it to a TAR archive) with and
+without skipping holes, reporting elapsed time and disk space allocated to
+the result::
+
+    python benchmarks/sparse_copy.py --size 8192 --data 256 --algorithm sha1
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from COT.file_transfer import copy_range, TARWriter
+
+
+def make_disk(directory, size_mb, data_mb):
+    """Create a sparse raw disk image with some data scattered through it.
+
+    Args:
+      directory (str): Directory to create the file in.
+      size_mb (int): Apparent size of the image, in MiB.
+      data_mb (int): Amount of actual data in the image, in MiB.
+
+    Returns:
+      str: Path to the disk image.
+    """
+    path = os.path.join(directory, "disk.img")
+    chunk = os.urandom(1024 * 1024)
+    with open(path, 'wb') as fileobj:
+        fileobj.truncate(size_mb * 1024 * 1024)
+        stride = size_mb // max(data_mb, 1)
+        for i in range(data_mb):
+            fileobj.seek(i * stride * 1024 * 1024)
+            fileobj.write(chunk)
+    return path
+
+
+def copy_file(src_path, dst_path, algorithm, sparse):
+    """Copy a file with :func:`copy_range`.
+
+    Args:
+      src_path (str): File to copy.
+      dst_path (str): Path of the copy.
+      algorithm (str): Hash algorithm, or ``None`` to only copy.
+      sparse (bool): Whether to skip holes.
+    """
+    hash_obj = hashlib.new(algorithm) if algorithm else None
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        copy_range(src.fileno(), 0, dst.fileno(), 0,
+                   os.fstat(src.fileno()).st_size, hash_obj=hash_obj,
+                   sparse=sparse)
+
+
+def tar_file(src_path, dst_path, algorithm, sparse):
+    """Add a file to a new TAR archive with :class:`TARWriter`.
+
+    Args:
+      src_path (str): File to add.
+      dst_path (str): Path of the TAR archive.
+      algorithm (str): Hash algorithm, or ``None`` to only copy.
+      sparse (bool): Whether to skip holes.
+    """
+    hash_obj = hashlib.new(algorithm) if algorithm else None
+    if sparse:
+        with TARWriter(dst_path) as tarw:
+            tarw.add(src_path, "disk.img", hash_obj=hash_obj)
+        return
+    # TARWriter always skips holes, so emulate a dense copy into a TAR
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        dst.write(b'\0' * 512)
+        dst.flush()
+        copy_range(src.fileno(), 0, dst.fileno(), 512,
+                   os.fstat(src.fileno()).st_size, hash_obj=hash_obj)
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=4096,
+                        help="Disk image size in MiB (default: %(default)s)")
+    parser.add_argument('--data', type=int, default=64,
+                        help="MiB of actual data in the disk image"
+                        " (default: %(default)s)")
+    parser.add_argument('--algorithm', default=None,
+                        choices=['md5', 'sha1', 'sha256'],
+                        help="Also hash the data (default: copy only)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per method; best is reported")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="cot_bench")
+    try:
+        disk = make_disk(directory, args.size, args.data)
+        dest = os.path.join(directory, "dest")
+        for label, func, sparse in [("copy (dense)", copy_file, False),
+                                    ("copy (sparse)", copy_file, True),
+                                    ("TAR (dense)", tar_file, False),
+                                    ("TAR (sparse)", tar_file, True)]:
+            best = None
+            for _ in range(args.repeat):
+                if os.path.exists(dest):
+                    os.remove(dest)
+                start = time.time()
+                func(disk, dest, args.algorithm, sparse)
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            allocated = os.stat(dest).st_blocks * 512 / (1024.0 * 1024.0)
+            print("{0:16} {1:8.2f} s {2:10.1f} MiB allocated"
+                  .format(label, best, allocated))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# tar_member_read.py - Benchmark for reading file data out of an OVA
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Compare tarfile.extractfile against FileInTAR offset-based reads.
+
+Builds a TAR archive containing a single large member, then reads (and
+optionally hashes) that member with each method, reporting MB/s::
+
+    python benchmarks/tar_member_read.py --size 4096 --algorithm sha1
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+from COT.data_validation import file_checksum
+from COT.file_reference import FileInTAR
+
+
+def make_archive(directory, size_mb):
+    """Create a TAR file containing a single member of the given size.
+
+    Args:
+      directory (str): Directory to create files in.
+      size_mb (int): Size of the member, in MiB.
+
+    Returns:
+      str: Path to the TAR file.
+    """
+    payload = os.path.join(directory, "disk.img")
+    chunk = os.urandom(1024 * 1024)
+    with open(payload, 'wb') as fileobj:
+        for _ in range(size_mb):
+            fileobj.write(chunk)
+    tar_path = os.path.join(directory, "bench.ova")
+    with tarfile.open(tar_path, 'w') as tarf:
+        tarf.add(payload, "disk.img")
+    os.remove(payload)
+    return tar_path
+
+
+def legacy_read(tar_path, algorithm):
+    """Read the member the way COT did before offset-based reads.
+
+    Args:
+      tar_path (str): Path to the TAR file.
+      algorithm (str): Hash algorithm, or ``None`` to only read.
+    """
+    hash_obj = hashlib.new(algorithm) if algorithm else None
+    with tarfile.open(tar_path, 'r') as tarf:
+        obj = tarf.extractfile("disk.img")
+        while True:
+            buf = obj.read(65536)
+            if not buf:
+                break
+            if hash_obj:
+                hash_obj.update(buf)
+
+
+def offset_read(tar_path, algorithm):
+    """Read the member through :meth:`FileInTAR.open`.
+
+    Args:
+      tar_path (str): Path to the TAR file.
+      algorithm (str): Hash algorithm, or ``None`` to only read.
+    """
+    ref = FileInTAR(tar_path, "disk.img")
+    with ref.open('rb') as obj:
+        if algorithm:
+            file_checksum(obj, algorithm)
+        else:
+            buf = bytearray(65536)
+            while obj.readinto(buf):
+                pass
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=2048,
+                        help="Member size in MiB (default: %(default)s)")
+    parser.add_argument('--algorithm', default=None,
+                        choices=['md5', 'sha1', 'sha256'],
+                        help="Also hash the data (default: read only)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per method; best is reported")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="cot_bench")
+    try:
+        tar_path = make_archive(directory, args.size)
+        for label, func in [("tarfile.extractfile", legacy_read),
+                            ("FileInTAR.open", offset_read)]:
+            best = None
+            for _ in range(args.repeat):
+                start = time.time()
+                func(tar_path, args.algorithm)
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print("{0:24} {1:8.1f} MB/s".format(label, args.size / best))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# xml_backend.py - Benchmark for parsing and writing large OVF descriptors
+#
+# Copyright (c) 2018 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Compare the ElementTree and lxml XML backends on a large descriptor.
+
+Generates an OVF descriptor with many hardware Items and environment
+Properties, then times parsing it, looking up every Property by key (with
+and without :meth:`COT.xml_file.XML.index_children`), computing its
+serialized size, and writing it out unchanged and after editing one
+Property, with each XML backend available (see :mod:`COT.xml_file`)::
+
+    python benchmarks/xml_backend.py --items 2000 --properties 2000
+
+Each backend is run in a separate process, as the backend is chosen when
+COT is first imported.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+OVF_NS = "http://schemas.dmtf.org/ovf/envelope/1"
+RASD_NS = ("http://schemas.dmtf.org/wbem/wscim/1/cim-schema/2/"
+           "CIM_ResourceAllocationSettingData")
+
+
+def make_descriptor(path, items, properties):
+    """Write a synthetic OVF descriptor of the given size.
+
+    Args:
+      path (str): Path to write to.
+      items (int): Number of hardware Items.
+      properties (int): Number of environment Properties.
+    """
+    with open(path, 'w') as fileobj:
+        fileobj.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<ovf:Envelope xmlns:ovf="{0}" xmlns:rasd="{1}">\n'
+                      '  <ovf:References/>\n'
+                      '  <ovf:VirtualSystem ovf:id="bench">\n'
+                      '    <ovf:Info>Benchmark</ovf:Info>\n'
+                      '    <ovf:ProductSection>\n'
+                      '      <ovf:Info>Product</ovf:Info>\n'
+                      .format(OVF_NS, RASD_NS))
+        for i in range(properties):
+            fileobj.write('      <ovf:Property ovf:key="prop{0}" '
+                          'ovf:type="string" ovf:value="value {0}">\n'
+                          '        <ovf:Label>Property {0}</ovf:Label>\n'
+                          '      </ovf:Property>\n'.format(i))
+        fileobj.write('    </ovf:ProductSection>\n'
+                      '    <ovf:VirtualHardwareSection>\n'
+                      '      <ovf:Info>Hardware</ovf:Info>\n')
+        for i in range(items):
+            fileobj.write('      <ovf:Item>\n'
+                          '        <rasd:ElementName>NIC {0}'
+                          '</rasd:ElementName>\n'
+                          '        <rasd:InstanceID>{0}</rasd:InstanceID>\n'
+                          '        <rasd:ResourceType>10</rasd:ResourceType>\n'
+                          '      </ovf:Item>\n'.format(i + 1))
+        fileobj.write('    </ovf:VirtualHardwareSection>\n'
+                      '  </ovf:VirtualSystem>\n'
+                      '</ovf:Envelope>\n')
+
+
+def run_backend(path, properties, repeat):
+    """Time each operation with the XML backend of this process.
+
+    Args:
+      path (str): Path to the descriptor.
+      properties (int): Number of Properties in it.
+      repeat (int): Runs per operation; best is reported.
+    """
+    from COT.xml_file import BACKEND, ET, XML
+
+    # As COT.vm_description.ovf.OVF does
+    ET.register_namespace("ovf", OVF_NS)
+    ET.register_namespace("rasd", RASD_NS)
+    ovf = "{" + OVF_NS + "}"
+    timings = {}
+
+    def timed(label, func):
+        """Record the best time taken by the given function."""
+        best = None
+        for _ in range(repeat):
+            start = time.time()
+            result = func()
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best
+        return result
+
+    xml = timed("parse", lambda: XML(path))
+    section = xml.root.find(ovf + "VirtualSystem").find(ovf + "ProductSection")
+
+    def lookups():
+        """Look up every Property by its key."""
+        for i in range(properties):
+            XML.find_child(section, ovf + "Property",
+                           attrib={ovf + "key": "prop{0}".format(i)})
+
+    timed("find_child", lookups)
+    xml.index_children(section, ovf + "Property", [ovf + "key"])
+    timed("indexed", lookups)
+    timed("xml_size", xml.xml_size)
+    output = path + "." + BACKEND
+    timed("write_xml", lambda: xml.write_xml(output))
+    section[1].set(ovf + "value", "edited")
+    timed("edit+write", lambda: xml.write_xml(output))
+    print("{0:8} ".format(BACKEND) +
+          " ".join("{0:>10.3f}".format(timings[label])
+                   for label in ("parse", "find_child", "indexed",
+                                 "xml_size", "write_xml", "edit+write")))
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=2000,
+                        help="Number of hardware Items (default: %(default)s)")
+    parser.add_argument('--properties', type=int, default=2000,
+                        help="Number of Properties (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per operation; best is reported")
+    parser.add_argument('--run', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_backend(args.run, args.properties, args.repeat)
+        return
+
+    directory = tempfile.mkdtemp(prefix="cot_bench")
+    try:
+        path = os.path.join(directory, "bench.ovf")
+        make_descriptor(path, args.items, args.properties)
+        print("{0:8} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10} {6:>10}"
+              "  (seconds)".format("", "parse", "find_child", "indexed",
+                                   "xml_size", "write_xml", "edit+write"))
+        for backend in ("etree", "lxml"):
+            if backend == "lxml":
+                try:
+                    import lxml  # noqa: F401 pylint: disable=unused-import
+                except ImportError:
+                    print("{0:8} not installed".format(backend))
+                    continue
+            env = dict(os.environ, COT_XML_BACKEND=backend)
+            subprocess.check_call([sys.executable, __file__, '--run', path,
+                                   '--properties', str(args.properties),
+                                   '--repeat', str(args.repeat)], env=env)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()